@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地 HTTP 接口 - 把分析引擎包装成 JSON 接口，多个用户共用一个进程：
+同一股票同一数据源的并发抓取、同一份研报的并发生成都只访问一次上游
+
+用法：python run.py serve [--port 8600]
+
+    GET /api/lookup?q=茅台                       检索股票（快照行情 + 候选）
+    GET /api/valuation?code=600519               价格区间、分红、财报与估值
+    GET /api/report?code=600519[&model=...&force_refresh=1]
+                                                  流式研报（NDJSON：{"delta"} ... {"done"}）
+    GET /api/stats                               请求合并、缓存、上游容错与行情快照统计
+    GET /api/warm                                自选股预热覆盖率与各项数据年龄
+    GET /api/fundamentals?where=roe>15&years=5   财务数据仓库：年报连续多年满足条件的股票（多个条件用逗号分隔）
+    GET /metrics                                 分阶段计时指标（Prometheus 文本格式）
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from config import API_PORT, REPLAY_DIR, REPLAY_LATENCY, WATCHLIST_PATH
+from engine import get_engine
+from fundamentals import get_fundamentals
+from tracing import default_registry
+from warmer import CacheWarmer
+
+MODELS = ("deepseek-chat", "deepseek-reasoner")
+
+
+def _jsonable(value):
+    """转成标准 JSON：NaN / inf 变为 null，numpy 标量转为 Python 数值"""
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _snapshot_row(row):
+    return {
+        "code": str(row['代码']),
+        "name": row['名称'],
+        "price": row['最新价'],
+        "pe": row['市盈率-动态'],
+        "change_pct": row['涨跌幅'],
+    }
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """JSON 接口；研报使用 HTTP/1.1 分块传输逐段返回"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        routes = {
+            "/api/lookup": self._lookup,
+            "/api/valuation": self._valuation,
+            "/api/report": self._report,
+            "/api/stats": self._stats,
+            "/api/warm": self._warm,
+            "/api/fundamentals": self._fundamentals,
+            "/metrics": self._metrics,
+        }
+        route = routes.get(url.path.rstrip("/"))
+        if route is None:
+            self._send_json({"error": f"未知接口：{url.path}"}, status=404)
+            return
+        try:
+            route(params)
+        except KeyError as e:
+            # KeyError 也是 LookupError 的子类，但它表示数据结构异常而不是“未找到股票”
+            self._send_json({"error": f"KeyError: {e}"}, status=502)
+        except LookupError as e:
+            self._send_json({"error": str(e)}, status=404)
+        except ValueError as e:
+            self._send_json({"error": str(e)}, status=400)
+        except Exception as e:
+            self._send_json({"error": f"{type(e).__name__}: {e}"}, status=502)
+
+    # ------------------------------------------------------------------
+
+    def _lookup(self, params):
+        query = params.get("q") or params.get("code")
+        if not query:
+            raise ValueError("缺少参数 q")
+        row, candidates = self.server.engine.lookup(query, limit=int(params.get("limit", 10)))
+        if row is None:
+            raise LookupError(f"未找到匹配的股票：{query}")
+        self._send_json({"stock": _snapshot_row(row), "candidates": candidates})
+
+    def _valuation(self, params):
+        result = self._analyze(params)
+        payload = result.to_dict()
+        del payload["report"], payload["report_cached"]
+        self._send_json(payload)
+
+    def _report(self, params):
+        api_key = self.headers.get("X-DeepSeek-Key") or self.server.api_key
+        if not api_key:
+            raise ValueError("生成 AI 报告需要 DeepSeek API Key（服务端 DEEPSEEK_API_KEY 或请求头 X-DeepSeek-Key）")
+        model = params.get("model", MODELS[0])
+        if model not in MODELS:
+            raise ValueError(f"不支持的模型：{model}")
+
+        result = self._analyze(params)
+        stream = self.server.engine.stream_report(result.messages, api_key, model,
+                                                  force_refresh=params.get("force_refresh") in ("1", "true"))
+        deltas = iter(stream)
+        # 先取第一段再发响应头：上游报错时仍可返回普通的错误响应
+        first = next(deltas, None)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            if first is not None:
+                self._write_line({"delta": first})
+            for delta in deltas:
+                self._write_line({"delta": delta})
+            self._write_line({"done": True, "code": result.code, "name": result.name,
+                              "cached": stream.cached, "usage": stream.usage})
+        except (BrokenPipeError, ConnectionResetError):
+            return  # 客户端已断开；报告在后台照常生成完并写入缓存，其他请求不受影响
+        except Exception as e:
+            self._write_line({"error": f"{type(e).__name__}: {e}"})
+        finally:
+            deltas.close()
+        self._write_chunk(b"")  # 分块传输的结束块
+
+    def _stats(self, params):
+        self._send_json(self.server.engine.stats())
+
+    def _warm(self, params):
+        warmer = self.server.warmer
+        if warmer is None:
+            raise LookupError("未启用缓存预热（没有自选股列表）")
+        codes = warmer.watchlist()
+        self._send_json({**warmer.status(codes), "entries": warmer.coverage(codes).to_dict(orient="records")})
+
+    def _fundamentals(self, params):
+        conditions = [c for c in params.get("where", "").split(",") if c.strip()]
+        if not conditions:
+            raise ValueError("缺少参数 where（如 roe>15）")
+        result = get_fundamentals().consecutive(conditions, int(params.get("years", 5)),
+                                                latest=params.get("anytime") not in ("1", "true"))
+        limit = int(params.get("limit", 200))
+        self._send_json({"total": len(result), "stocks": result.head(limit).to_dict(orient="records")})
+
+    def _metrics(self, params):
+        body = default_registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # ------------------------------------------------------------------
+
+    def _analyze(self, params):
+        query = params.get("code") or params.get("q")
+        if not query:
+            raise ValueError("缺少参数 code")
+        return self.server.engine.analyze(query)
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(_jsonable(payload), ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_line(self, payload):
+        self._write_chunk((json.dumps(_jsonable(payload), ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def make_api_server(port=API_PORT, engine=None, host="127.0.0.1", api_key=None, warmer=None):
+    """创建接口服务（未启动）；api_key 默认读取环境变量 DEEPSEEK_API_KEY"""
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    server.engine = engine or get_engine()
+    server.api_key = api_key if api_key is not None else os.getenv("DEEPSEEK_API_KEY", "")
+    server.warmer = warmer
+    return server
+
+
+def start_api_server(port=API_PORT, engine=None, host="127.0.0.1", api_key=None, warmer=None):
+    """在后台线程启动接口服务，返回 server；用完调用 server.shutdown()"""
+    server = make_api_server(port, engine, host, api_key, warmer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    """命令行入口：python run.py serve [--host 127.0.0.1] [--port 8600]"""
+    parser = argparse.ArgumentParser(prog="run.py serve", description="本地 HTTP 分析接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args(argv)
+
+    if REPLAY_DIR:
+        from replay import ReplaySource, install_replay
+        install_replay(ReplaySource(REPLAY_DIR, latency=REPLAY_LATENCY))
+    engine = get_engine()
+    engine.snapshot_store.start_background_refresh()
+    warmer = None
+    if os.path.exists(WATCHLIST_PATH):
+        warmer = CacheWarmer(engine=engine)
+        warmer.start()
+
+    server = make_api_server(args.port, engine, args.host, warmer=warmer)
+    print(f"🌐 分析接口已启动：http://{args.host}:{args.port}/api/lookup?q=600519（Ctrl+C 退出）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,13 +5,28 @@
 """
 
 import streamlit as st
-import akshare as ak
-from openai import OpenAI  
-from datetime import datetime, timedelta
+from datetime import datetime
 import pandas as pd
 import numpy as np
 import os
+import time
 from dotenv import load_dotenv
+from snapshot_store import decode_snapshot, format_age
+from valuation import (
+    screen_market, ASSESSMENT_LABELS, VALUATION_MODELS,
+    calculate_dividend_yield, analyze_dividend_percentile, valuation_columns,
+)
+from prompts import build_report_messages, compose_report_messages, select_finance_for_ai
+from engine import AnalysisEngine, format_stale
+from report_engine import generate_reports, estimate_tokens
+from report_cache import get_report_cache
+from stream_renderer import StreamRenderer
+from replay import ReplaySource, install_replay
+from config import REPLAY_DIR, REPLAY_LATENCY, METRICS_PORT, WATCHLIST_PATH
+from tracing import Trace, annotate, mark_cache_miss, start_metrics_server
+from batch_analysis import run_batch, parse_code_list, read_codes_from_csv
+from fetchers import EMPTY_PRICE_RANGE, EMPTY_TREND, EMPTY_DIVIDEND
+from warmer import CacheWarmer, format_warm_status
 
 # 加载 .env 文件中的环境变量
 load_dotenv()
@@ -39,370 +54,344 @@ selected_model = st.sidebar.selectbox(
     help="💡 deepseek-chat (V3): 快速响应，适合快速分析\n🧠 deepseek-reasoner (R1): 深度推理，适合复杂决策"
 )
 
+# 分析模式
+analysis_mode = st.sidebar.radio(
+    "分析模式",
+    ["单股深度分析", "批量分析", "全市场估值筛选"],
+    help="📋 批量分析：一次抓取整个自选股列表的价格、分红与财报数据，不调用 AI\n🔎 全市场估值筛选：基于行情快照对全部 A 股做 PE/PEG/PB 估值"
+)
+
 base_url = "https://api.deepseek.com"
 
+@st.cache_resource
+def install_replay_mode(replay_dir, latency):
+    """离线回放模式：akshare 接口改为读取录制数据（每个进程只安装一次）"""
+    install_replay(ReplaySource(replay_dir, latency=latency))
+    return True
+
+@st.cache_resource
+def start_metrics_endpoint(port):
+    """Prometheus 指标端点（每个进程只启动一次）"""
+    return start_metrics_server(port)
+
+if METRICS_PORT:
+    start_metrics_endpoint(METRICS_PORT)
+
+if REPLAY_DIR:
+    install_replay_mode(REPLAY_DIR, REPLAY_LATENCY)
+    st.sidebar.caption(f"🧪 离线回放模式：{REPLAY_DIR}（模拟延迟 {REPLAY_LATENCY:g} 秒）")
+
 # ============================================================================
 # 数据获取函数集
 # ============================================================================
 
+# 2.0 分析引擎（进程内共享一份：行情快照后台定时增量刷新，检索索引按快照版本重建）
+@st.cache_resource
+def get_engine():
+    """创建分析引擎并启动行情快照后台刷新"""
+    return AnalysisEngine(base_url=base_url, background_refresh=True)
+
+def get_snapshot_store():
+    return get_engine().snapshot_store
+
+# 2.0.1 自选股缓存预热（配置了自选股列表时在后台按收盘后的时间定时运行，新进程启动时补跑错过的一轮）
+@st.cache_resource
+def start_cache_warmer():
+    warmer = CacheWarmer(engine=get_engine())
+    warmer.start()
+    return warmer
+
+if os.path.exists(WATCHLIST_PATH):
+    st.sidebar.caption(format_warm_status(start_cache_warmer().status()))
+
 # 2.1 获取近一年最高/最低价
 @st.cache_data(ttl=3600)
 def get_52week_price_range(stock_code):
     """获取近一年（52周）的最高价和最低价"""
+    mark_cache_miss()
     try:
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=365)
-        
-        hist_df = ak.stock_zh_a_hist(symbol=stock_code, 
-                                      start_date=start_date.strftime("%Y%m%d"),
-                                      end_date=end_date.strftime("%Y%m%d"),
-                                      adjust="")
-        
-        if hist_df is not None and not hist_df.empty:
-            # 使用位置索引而不是列名，避免中文编码问题
-            # 第3列是最高价（高），第4列是最低价（低）
-            high_52w = hist_df.iloc[:, 2].max()
-            low_52w = hist_df.iloc[:, 3].min()
-            return {
-                "high_52w": high_52w,
-                "low_52w": low_52w,
-                "range": high_52w - low_52w,
-                "ratio": (high_52w - low_52w) / low_52w * 100 if low_52w > 0 else 0
-            }
+        return get_engine().fetch_price_range(stock_code)
     except Exception as e:
         st.warning(f"⚠️ 获取近一年价格范围失败: {str(e)}")
     
-    return {"high_52w": None, "low_52w": None, "range": None, "ratio": None}
+    return EMPTY_PRICE_RANGE
 
 # 2.2 获取最新股息数据
 @st.cache_data(ttl=3600)
 def get_dividend_data(stock_code):
     """获取最新的每股股息数据"""
+    mark_cache_miss()
     try:
-        dividend_df = ak.stock_dividend_cninfo(symbol=stock_code)
-        
-        if dividend_df is not None and not dividend_df.empty:
-            if '公告日期' in dividend_df.columns:
-                dividend_df['公告日期'] = pd.to_datetime(dividend_df['公告日期'], errors='coerce')
-                dividend_df = dividend_df.sort_values('公告日期', ascending=False)
-            
-            latest_dividend = dividend_df.iloc[0]
-            
-            result = {
-                "dividend_per_share": None,
-                "transfer_share": None,
-                "payout_ratio": None,
-                "record_date": None,
-                "history": []
-            }
-            
-            for col in dividend_df.columns:
-                if '派息' in col or '每股' in col:
-                    val = latest_dividend[col]
-                    # 类型检查：只接受数字类型
-                    if isinstance(val, (int, float)):
-                        if '派息' in col and '转增' not in col:
-                            result["dividend_per_share"] = val
-                        if '转增' in col:
-                            result["transfer_share"] = val
-                    elif val is not None:
-                        # 尝试转换为 float
-                        try:
-                            float_val = float(str(val).replace('元', '').strip())
-                            if '派息' in col and '转增' not in col:
-                                result["dividend_per_share"] = float_val
-                            if '转增' in col:
-                                result["transfer_share"] = float_val
-                        except (ValueError, TypeError):
-                            pass
-                
-                if '派息率' in col or '分配率' in col:
-                    result["payout_ratio"] = latest_dividend[col]
-                
-                if '记录日' in col or '除权日' in col:
-                    result["record_date"] = latest_dividend[col]
-            
-            # 提取历史派息数据用于分位分析（与财报数据保持10年）
-            dividend_values = []
-            for idx, row in dividend_df.iterrows():
-                try:
-                    for col in dividend_df.columns:
-                        if '派息' in col and '转增' not in col:
-                            val = row[col]
-                            # 检查是否为数字类型
-                            if isinstance(val, (int, float)) and not isinstance(val, bool):
-                                if val > 0:  # 只记录有效派息
-                                    dividend_values.append(float(val))
-                                break
-                            elif val is not None:
-                                # 尝试转换
-                                try:
-                                    str_val = str(val).replace('元', '').strip()
-                                    if str_val and str_val.replace('.', '', 1).isdigit():
-                                        float_val = float(str_val)
-                                        if float_val > 0:  # 只记录有效派息
-                                            dividend_values.append(float_val)
-                                        break
-                                except (ValueError, TypeError):
-                                    pass
-                except:
-                    pass
-            
-            # 保留10年历史数据（与财报数据一致）
-            if len(dividend_values) >= 1:
-                result["history"] = dividend_values[:10]  # 最多保留10年
-                result["history_years"] = len(result["history"])  # 记录实际年数
-                
-            return result
+        return get_engine().fetch_dividend(stock_code)
     except Exception as e:
         st.warning(f"⚠️ 获取分红数据失败: {str(e)}")
     
-    return {"dividend_per_share": None, "transfer_share": None, "payout_ratio": None, "history": []}
-
-# 2.3 计算股息率
-def calculate_dividend_yield(dividend_per_share, current_price):
-    """计算股息率（年度分红 / 现价）"""
-    # 类型检查和转换
-    if dividend_per_share is None or current_price is None:
-        return None
-    
+    return EMPTY_DIVIDEND
+
+# 2.3 历史股息率（除权日收盘价对齐）
+@st.cache_data(ttl=3600)
+def get_yield_history(stock_code, _dividend_data):
+    """获取每个除权日的历史股息率序列（分红数据已取过，不参与缓存键）"""
+    mark_cache_miss()
     try:
-        div_value = float(dividend_per_share)
-        price_value = float(current_price)
-        
-        if price_value > 0:
-            return (div_value / price_value) * 100
-    except (ValueError, TypeError):
-        pass
+        return get_engine().fetch_yield_history(stock_code, _dividend_data)
+    except Exception as e:
+        st.warning(f"⚠️ 计算历史股息率失败: {str(e)}")
     
     return None
 
-# 2.4 股息率分位分析
-def analyze_dividend_percentile(dividend_history, current_yield):
-    """分析当前股息率在历史中的分位"""
-    if not dividend_history or len(dividend_history) < 3 or current_yield is None:
-        return None
-    
-    div_array = np.array(dividend_history)
+# 2.4 趋势指标（滚动高低点 / 均线 / ATR）
+@st.cache_data(ttl=3600)
+def get_trend_signals(stock_code):
+    """获取 20 / 60 / 250 日高低点、均线、ATR 与突破信号"""
+    mark_cache_miss()
+    try:
+        return get_engine().fetch_trend(stock_code)
+    except Exception as e:
+        st.warning(f"⚠️ 计算趋势指标失败: {str(e)}")
     
-    # 基于历史派息计算的平均股息率（需要当前价格，这里简化处理）
-    return {
-        "mean_dividend": float(np.mean(div_array)),
-        "median_dividend": float(np.median(div_array)),
-        "q25_dividend": float(np.percentile(div_array, 25)),
-        "q75_dividend": float(np.percentile(div_array, 75)),
-        "max_dividend": float(np.max(div_array)),
-        "min_dividend": float(np.min(div_array)),
-    }
+    return EMPTY_TREND
+
+# 使用旧数据时需要清掉的页面缓存（分红变化会带动历史股息率）
+STALE_CACHED_FUNCS = {
+    "price_range": (get_52week_price_range,),
+    "trend": (get_trend_signals,),
+    "dividend": (get_dividend_data, get_yield_history),
+}
 
 # ============================================================================
-# 估值模型函数集
+# AI 分析函数
 # ============================================================================
 
-def estimate_by_pe_model(current_pe, current_price):
-    """PE 倍数估值（调整阈值适配A股市场）"""
-    # A股市场PE阈值：参考历史数据和价值投资理念
-    # 低估：<15（格雷厄姆标准）
-    # 合理：15-25（巴菲特可接受范围）
-    # 偏高：25-35（成长股可接受）
-    # 高估：>35（需要高成长支撑）
-    if current_pe < 15:
-        assessment = "低估"
-    elif current_pe < 25:
-        assessment = "合理"
-    elif current_pe < 35:
-        assessment = "偏高"
-    else:
-        assessment = "高估"
-    
-    return {
-        "model": "PE倍数法",
-        "current_pe": current_pe,
-        "assessment": assessment,
-        "reference_range": "低估<15 | 合理15-25 | 偏高25-35 | 高估>35",
-        "market_avg": 25,  # A股市场平均PE约25
-        "premium": ((current_pe - 25) / 25 * 100) if current_pe > 0 else 0
-    }
+def format_report_cache_stats(stats):
+    """研报缓存统计的一行说明"""
+    return (f"📦 研报缓存：命中 {stats['hits']} 次 / 未命中 {stats['misses']} 次，"
+            f"已缓存 {stats['entries']} 份（{stats['bytes'] / 1024:.0f} KB）")
 
-def estimate_by_pb_model(current_price, book_value_per_share=None):
-    """PB 倍数估值"""
-    if book_value_per_share is None or book_value_per_share <= 0:
-        return None
-    
-    pb = current_price / book_value_per_share
-    return {
-        "model": "PB倍数法",
-        "current_pb": pb,
-        "assessment": "极低" if pb < 0.8 else "低" if pb < 1.2 else "中" if pb < 2 else "高",
-    }
+def format_prompt_stats(stats):
+    """提示词紧凑化前后 token 数的一行说明"""
+    line = f"🧮 提示词约 {stats.tokens_after} tokens（紧凑化前 {stats.tokens_before}）"
+    if stats.trimmed:
+        line += f"，为满足 {stats.budget} tokens 预算已精简：{'、'.join(stats.trimmed)}"
+    if stats.over_budget:
+        line += "（必需内容仍超出预算）"
+    return line
+
+# ============================================================================
+# 批量分析
+# ============================================================================
+
+def build_batch_valuation_models(pe, price, finance_df):
+    """批量模式使用的估值模型（注册表中的全部模型，与单股分析一致），没有 PE 时返回空结果"""
+    if pe is None or pd.isna(pe):
+        return [None] * len(VALUATION_MODELS)
+    return get_engine().valuate(pe, price, finance_df.head(10) if finance_df is not None else None)
+
+def build_batch_report_messages(item, spot_row, current_date):
+    """用批量抓取结果构建与单股深度分析相同的研报提示词"""
+    finance_df = item["data"]["finance"]
+    data_string = select_finance_for_ai(finance_df)[1] if finance_df is not None else "数据暂无"
+    dividend = item["data"]["dividend"] or EMPTY_DIVIDEND
+    try:
+        yield_history = get_engine().fetch_yield_history(item["code"], dividend)
+    except Exception:
+        yield_history = None
+    return build_report_messages(
+        stock_name=spot_row['名称'],
+        data_string=data_string,
+        current_date=current_date,
+        current_price=spot_row['最新价'],
+        current_pe=spot_row['市盈率-动态'],
+        current_change_pct=spot_row['涨跌幅'],
+        price_range_data=item["data"]["price_range"] or EMPTY_PRICE_RANGE,
+        dividend_data=dividend,
+        valuation_models=build_batch_valuation_models(spot_row['市盈率-动态'], spot_row['最新价'], finance_df),
+        yield_history=yield_history,
+        trend=item["data"]["trend"],
+    )
 
-def estimate_by_roe_model(roe, eps, current_price):
-    """ROE 倍数估值"""
-    if not roe or roe <= 0 or not eps:
-        return None
+def build_batch_row(item, spot_row):
+    """把一只股票的批量抓取结果整理成汇总表的一行"""
+    price_range = item["data"]["price_range"] or EMPTY_PRICE_RANGE
+    trend = item["data"]["trend"] or EMPTY_TREND
+    dividend = item["data"]["dividend"] or EMPTY_DIVIDEND
+    finance_df = item["data"]["finance"]
     
-    reasonable_pe = 10 + (roe - 8) * 2
-    reasonable_price = eps * reasonable_pe
+    price = spot_row['最新价'] if spot_row is not None else None
+    pe = spot_row['市盈率-动态'] if spot_row is not None else None
+    valuation_models = build_batch_valuation_models(pe, price, finance_df)
+    
+    high_52w = price_range.high_52w
+    div_yield = calculate_dividend_yield(dividend.dividend_per_share, price)
     
     return {
-        "model": "ROE倍数法",
-        "roe": roe,
-        "reasonable_pe": reasonable_pe,
-        "reasonable_price": reasonable_price,
-        "discount_or_premium": ((current_price - reasonable_price) / reasonable_price * 100)
+        "代码": item["code"],
+        "名称": spot_row['名称'] if spot_row is not None else None,
+        "最新价": price,
+        "市盈率-动态": pe,
+        "52周最高": high_52w,
+        "52周最低": price_range.low_52w,
+        "距52周高点%": (price - high_52w) / high_52w * 100 if price and high_52w else None,
+        "均线排列": trend.alignment,
+        "突破信号": trend.breakout_label,
+        "每股派息": dividend.dividend_per_share,
+        "股息率%": div_yield,
+        **valuation_columns(valuation_models),
+        "耗时(秒)": round(item["elapsed"], 2),
+        "重试次数": item["retries"],
+        "失败数据源": "、".join(item["errors"]) or None,
+        "旧数据源": "、".join(item["stale"]) or None,
     }
 
-def estimate_by_peg_model(current_pe, growth_rate=None, finance_df=None):
-    """PEG 估值（尝试从财务数据提取真实增长率）"""
-    # 尝试从财务数据计算真实净利润增长率
-    calculated_growth = None
-    if finance_df is not None and not finance_df.empty:
-        try:
-            # 查找净利润相关列
-            for col in finance_df.columns:
-                if '净利润' in col and '增长率' in col:
-                    # 获取最近的增长率数据
-                    growth_val = finance_df.iloc[0][col]
-                    if isinstance(growth_val, (int, float)):
-                        calculated_growth = abs(float(growth_val))  # 取绝对值
-                        break
-                    elif growth_val is not None:
-                        try:
-                            # 去除%符号并转换
-                            str_val = str(growth_val).replace('%', '').strip()
-                            calculated_growth = abs(float(str_val))
-                            break
-                        except:
-                            pass
-        except:
-            pass
+def render_batch_mode():
+    """批量分析界面：输入列表或上传 CSV，并发抓取，结果逐行填入汇总表"""
+    st.subheader("📋 自选股批量分析")
+    codes_text = st.text_area("输入股票代码或名称（逗号、空格或换行分隔）", value="600519, 000858, 601318")
+    uploaded = st.file_uploader("或上传 CSV 文件（读取“代码”列，没有表头时读取第一列）", type=["csv"])
+    with_reports = st.checkbox("同时生成 AI 研报（多份并发生成，各自流式输出）", value=False)
+    force_refresh = st.checkbox("重新生成研报（忽略缓存）", value=False, disabled=not with_reports)
     
-    # 使用计算出的增长率，如果没有则使用传入的growth_rate，都没有则默认10%
-    final_growth = calculated_growth if calculated_growth and calculated_growth > 0 else (growth_rate if growth_rate else 10)
+    if not st.button("开始批量分析"):
+        return
     
-    if current_pe <= 0 or final_growth <= 0:
-        return None
+    inputs = parse_code_list(codes_text)
+    if uploaded is not None:
+        inputs += read_codes_from_csv(uploaded)
     
-    peg = current_pe / final_growth
+    snapshot_store = get_snapshot_store()
+    symbol_index = get_engine().symbol_index()
     
-    # PEG判断标准：<1优秀，1-1.5合理，1.5-2偏高，>2高估
-    if peg < 1:
-        assessment = "低估"
-    elif peg < 1.5:
-        assessment = "合理"
-    elif peg < 2:
-        assessment = "偏高"
-    else:
-        assessment = "高估"
+    codes, unresolved = [], []
+    for query in inputs:
+        hit = symbol_index.resolve(query)
+        if hit:
+            codes.append(hit['code'])
+        else:
+            unresolved.append(query)
+    codes = list(dict.fromkeys(codes))
     
-    return {
-        "model": "PEG模型",
-        "peg": peg,
-        "growth_rate": final_growth,
-        "growth_source": "财报数据" if calculated_growth else "预估值",
-        "assessment": assessment,
-        "reference": "低估<1 | 合理1-1.5 | 偏高1.5-2 | 高估>2"
-    }
-
-# ============================================================================
-# AI 分析函数
-# ============================================================================
-
-def call_deepseek_agent(api_key, stock_name, data_string, current_date, current_price, 
-                        current_pe, current_change_pct, price_range_data, dividend_data, valuation_models, ai_model="deepseek-chat"):
-    """调用 DeepSeek 进行 AI 分析"""
-    client = OpenAI(api_key=api_key, base_url=base_url)
+    if unresolved:
+        st.warning(f"⚠️ 以下输入未匹配到股票：{'、'.join(unresolved)}")
+    if not codes:
+        st.error("❌ 没有可分析的股票")
+        return
+    if with_reports and not api_key:
+        st.error("❌ 生成 AI 研报需要先输入 DeepSeek API Key！")
+        return
     
-    # 构建估值信息（包含详细标准）
-    valuation_info = "【多维度估值模型结论】\n"
-    for model in valuation_models:
-        if model:
-            assessment = model['assessment']
-            if model['model'] == "PE倍数法":
-                valuation_info += f"- PE倍数法: {assessment} (当前PE={model['current_pe']:.2f}, 参考: {model['reference_range']})\n"
-            elif model['model'] == "PEG模型":
-                growth_source = model.get('growth_source', '预估值')
-                valuation_info += f"- PEG模型: {assessment} (PEG={model['peg']:.2f}, 增长率={model['growth_rate']:.1f}% [{growth_source}], 参考: {model['reference']})\n"
-            else:
-                valuation_info += f"- {model['model']}: {assessment}\n"
+    progress = st.progress(0.0, text=f"正在分析 0/{len(codes)}")
+    table_placeholder = st.empty()
+    rows, failures, report_inputs = [], [], []
+    batch_start = datetime.now()
     
-    # 安全处理 None 值
-    high_52w = price_range_data.get('high_52w') if price_range_data else None
-    low_52w = price_range_data.get('low_52w') if price_range_data else None
+    for done, item in enumerate(run_batch(codes), start=1):
+        spot_row = snapshot_store.row(item["code"])
+        rows.append(build_batch_row(item, spot_row))
+        if spot_row is not None:
+            report_inputs.append((item, spot_row))
+        if item["errors"]:
+            failures.append(item)
+        
+        table_placeholder.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        progress.progress(done / len(codes), text=f"正在分析 {done}/{len(codes)}")
     
-    # 构建价格范围信息
-    price_info = ""
-    if high_52w is not None and low_52w is not None:
-        price_info = f"近一年高：{high_52w:.2f} 元 | 低：{low_52w:.2f} 元"
-    else:
-        price_info = "近一年高：数据暂无 | 低：数据暂无"
+    elapsed = (datetime.now() - batch_start).total_seconds()
+    progress.progress(1.0, text=f"✅ 完成 {len(codes)} 只股票，用时 {elapsed:.1f} 秒")
     
-    # 构建股息分位信息
-    dividend_percentile_info = ""
-    dividend_history = dividend_data.get("history") if dividend_data else None
-    dividend_per_share = dividend_data.get("dividend_per_share") if dividend_data else None
+    latencies = [row["耗时(秒)"] for row in rows]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("单只平均耗时", f"{np.mean(latencies):.2f} 秒")
+    col2.metric("单只最慢耗时", f"{np.max(latencies):.2f} 秒")
+    col3.metric("失败 / 重试", f"{len(failures)} / {sum(row['重试次数'] for row in rows)}")
     
-    if dividend_history and len(dividend_history) >= 3:
-        div_yield = calculate_dividend_yield(dividend_per_share, current_price)
-        percentile_data = analyze_dividend_percentile(dividend_history, div_yield)
-        
-        if percentile_data:
-            dividend_percentile_info = f"""
-    【历史股息率分位分析】
-    - 历史平均派息: {percentile_data['mean_dividend']:.2f} 元
-    - 历史中位派息: {percentile_data['median_dividend']:.2f} 元
-    - 历史最高派息: {percentile_data['max_dividend']:.2f} 元
-    - 历史最低派息: {percentile_data['min_dividend']:.2f} 元
-    """
+    if failures:
+        with st.expander(f"⚠️ 查看失败明细（{len(failures)} 只）"):
+            for item in failures:
+                for source, error in item["errors"].items():
+                    st.write(f"- {item['code']} [{source}]：{error}")
     
-    # 安全处理 PE 值
-    pe_str = f"{current_pe:.2f}" if current_pe is not None else "数据暂无"
-    change_str = f"{current_change_pct}%" if current_change_pct is not None else "数据暂无"
+    if with_reports and report_inputs:
+        render_batch_reports(report_inputs, force_refresh)
+
+def render_batch_reports(report_inputs, force_refresh=False):
+    """并发生成批量研报：每只股票一个折叠面板，生成内容流式写入各自的占位符"""
+    st.subheader("💡 AI 研报")
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    jobs, renderers = [], []
+    for item, spot_row in report_inputs:
+        with st.expander(f"{spot_row['名称']} ({item['code']})", expanded=len(report_inputs) <= 3):
+            placeholder = st.empty()
+            placeholder.caption("⏳ 排队中...")
+        renderers.append(StreamRenderer(placeholder))
+        jobs.append({
+            "key": item["code"],
+            "messages": build_batch_report_messages(item, spot_row, current_date),
+            "sink": renderers[-1].write,
+        })
     
-    prompt = f"""
-    你是顶级对冲基金经理，今天是 {current_date}，标的：{stock_name}。
-    现价：{current_price} 元 | PE：{pe_str} | 涨跌：{change_str}
+    start = datetime.now()
+    report_cache = get_report_cache()
+    results = generate_reports(jobs, api_key=api_key, base_url=base_url, model=selected_model,
+                               force_refresh=force_refresh, cache=report_cache)
+    elapsed = (datetime.now() - start).total_seconds()
+    for renderer, r in zip(renderers, results):
+        if r["error"]:
+            renderer.placeholder.markdown("❌ 生成失败")
+        else:
+            renderer.close()
     
-    【关键数据】
-    {price_info}
-    当前派息：{dividend_per_share if dividend_per_share else 'N/A'} 元
-    {dividend_percentile_info}
-    {valuation_info}
+    errors = [r for r in results if r["error"]]
+    total_tokens = sum(r["usage"]["total_tokens"] for r in results if r["usage"] and not r["cached"])
+    cached = sum(r["cached"] for r in results)
+    st.caption(f"✅ 生成 {len(results) - len(errors)}/{len(results)} 份研报（其中 {cached} 份来自缓存），"
+               f"用时 {elapsed:.1f} 秒，共消耗 {total_tokens} tokens")
+    st.caption(format_report_cache_stats(report_cache.stats()))
+    for r in errors:
+        st.warning(f"⚠️ {r['key']} 研报生成失败：{r['error']}")
+
+# ============================================================================
+# 全市场估值筛选
+# ============================================================================
+
+def render_screener_mode():
+    """全市场估值筛选：一次列式计算整张行情快照的估值，再按条件过滤"""
+    st.subheader("🔎 全市场估值筛选")
+    st.caption("PEG 使用默认增长率 10%（行情快照不含财报增长率），精确 PEG 请用单股深度分析")
     
-    【估值标准说明】
-    - PE估值: A股市场调整后标准 (低估<15 | 合理15-25 | 偏高25-35 | 高估>35)
-    - PEG估值: 基于真实财报增长率或预估值 (低估<1 | 合理1-1.5 | 偏高1.5-2 | 高估>2)
-    - 股息数据: 最多包含近10年历史数据（与财报周期一致），数据不足时会提示
+    col1, col2, col3 = st.columns(3)
+    pe_levels = col1.multiselect("PE 估值", ASSESSMENT_LABELS, default=["低估"])
+    max_peg = col2.number_input("PEG 上限", min_value=0.0, value=1.0, step=0.1)
+    min_pb = col3.number_input("PB 下限（0 表示不限）", min_value=0.0, value=0.0, step=0.1)
     
-    【财务数据】
-    {data_string}
+    snapshot_store = get_snapshot_store()
+    start = datetime.now()
+    screen_df = screen_market(decode_snapshot(snapshot_store.get()))
     
-    【报告要求】
-    1. 给出【核心量化指标清单】：ROE、毛利率、PE、PB、PEG、股息率等
-    2. 给出【多维度估值对比】：综合分析 PE/PEG/股息率 等模型，解释估值结论合理性
-    3. 给出【利弗莫尔趋势信号】：价格位置、高低点距离
-    4. 给出【股息策略分析】：分红吸引力、历史分位（注意数据年限）
-    5. 给出【风险与不买入理由】：至少 3 条
-    6. 给出【投资建议】：买入/观望/卖出
-    7. 用具体数字论证，严禁空泛形容词
-    """
+    mask = screen_df["peg"] < max_peg
+    if pe_levels:
+        mask &= screen_df["pe_assessment"].isin(pe_levels)
+    if min_pb > 0 and "pb" in screen_df.columns:
+        mask &= screen_df["pb"] >= min_pb
+    result = screen_df[mask].sort_values("peg")
+    elapsed_ms = (datetime.now() - start).total_seconds() * 1000
     
-    response = client.chat.completions.create(
-        model=ai_model,
-        messages=[
-            {"role": "system", "content": "你是硬核资深投研专家，数据驱动、逻辑严谨。"},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.3,  # 降低随机性，确保结果更一致（0-2之间，越低越确定）
-        stream=True
-    )
-    return response
+    st.write(f"共 {len(screen_df)} 只股票，符合条件 {len(result)} 只（计算用时 {elapsed_ms:.0f} 毫秒，"
+             f"行情快照更新于 {format_age(snapshot_store.age_seconds())}前）")
+    st.dataframe(result, hide_index=True, use_container_width=True)
 
 # ============================================================================
 # 主应用界面
 # ============================================================================
 
-user_input = st.text_input("请输入企业名称", value="贵州茅台")
+if analysis_mode == "批量分析":
+    render_batch_mode()
+    st.stop()
+elif analysis_mode == "全市场估值筛选":
+    render_screener_mode()
+    st.stop()
+
+user_input = st.text_input("请输入企业名称 / 股票代码 / 拼音首字母", value="贵州茅台")
+force_refresh = st.checkbox("重新生成研报（忽略缓存）", value=False)
 
 if st.button("开始深度分析"):
     if not api_key:
@@ -411,49 +400,44 @@ if st.button("开始深度分析"):
         with st.status("正在执行多智能体协作分析...", expanded=True) as status:
             # 第一步：匹配股票
             st.write("🔍 正在检索股票代码...")
-            stock_df = ak.stock_zh_a_spot_em()
-            match = stock_df[stock_df['名称'].str.contains(user_input)]
+            trace = Trace("单股深度分析", query=user_input, model=selected_model)
+            engine = get_engine()
+            try:
+                with trace.span("检索"):
+                    stock_row, candidates = engine.lookup(user_input)
+                    snapshot_store = engine.snapshot_store
+                    annotate(snapshot_age=round(snapshot_store.age_seconds(), 1))
+            except Exception as e:
+                # 冷启动时本地没有行情快照且上游不可用
+                status.update(label="❌ 行情快照获取失败", state="error")
+                st.error(f"❌ 获取行情快照失败，请稍后重试: {str(e)}")
+                st.stop()
+            st.write(f"🕒 行情快照更新于 {format_age(snapshot_store.age_seconds())}前")
+            if len(candidates) > 1:
+                st.caption("其他候选：" + "、".join(f"{c['name']}({c['code']})" for c in candidates[1:]))
             
-            if not match.empty:
-                target_code = match.iloc[0]['代码']
-                target_name = match.iloc[0]['名称']
-                current_price = match.iloc[0]['最新价']
-                current_pe = match.iloc[0]['市盈率-动态']
-                current_change_pct = match.iloc[0]['涨跌幅']
+            if stock_row is not None:
+                target_code = stock_row['代码']
+                target_name = stock_row['名称']
+                current_price = stock_row['最新价']
+                current_pe = stock_row['市盈率-动态']
+                current_change_pct = stock_row['涨跌幅']
                 current_date = datetime.now().strftime("%Y-%m-%d")
                 
                 status.update(label=f"已找到：{target_name} ({target_code})", state="running")
                 
                 # 第二步：获取财务数据
                 st.write("📂 正在抓取财报数据...")
-                finance_df = ak.stock_financial_abstract_ths(symbol=target_code, indicator="主要指标")
-                date_col = finance_df.columns[0]
-                finance_df = finance_df.sort_values(by=date_col, ascending=False)
-                
                 # 优化：减少数据量从20条到10条，且筛选关键指标
-                finance_recent = finance_df.head(10)
-                
-                # 筛选关键指标列（如果存在）
-                key_indicators = [date_col]  # 先加入日期列
-                possible_indicators = [
-                    'ROE', '净资产收益率', '净利润', '营业收入', '营业总收入',
-                    '毛利率', '净利率', '资产负债率', '每股收益', 'EPS',
-                    '净利润增长率', '营收增长率', '流动比率'
-                ]
-                
-                for indicator in possible_indicators:
-                    for col in finance_df.columns:
-                        if indicator in col and col not in key_indicators:
-                            key_indicators.append(col)
-                            break
-                
-                # 如果有关键指标，只使用这些；否则使用全部
-                if len(key_indicators) > 1:
-                    finance_for_ai = finance_recent[key_indicators]
-                else:
-                    finance_for_ai = finance_recent
-                
-                core_data_for_ai = finance_for_ai.to_string()
+                try:
+                    with trace.span("财报"):
+                        finance_recent, finance_for_ai, finance_columns = engine.fetch_finance(target_code)
+                except Exception as e:
+                    st.warning(f"⚠️ 获取财报数据失败: {str(e)}")
+                    finance_recent = finance_for_ai = pd.DataFrame()
+                    finance_columns = None
+                if finance_columns is not None and finance_columns.missing:
+                    st.caption(f"⚠️ 财报数据未识别字段：{'、'.join(finance_columns.missing)}（上游表结构可能已变化）")
                 
                 # 显示财务摘要（在 status 内可以使用普通组件）
                 st.subheader(f"{target_name} 财务摘要（最近10期）")
@@ -461,34 +445,67 @@ if st.button("开始深度分析"):
                 
                 # 第三步：获取额外数据
                 st.write("📊 正在获取价格和股息数据...")
-                price_range_data = get_52week_price_range(target_code)
-                dividend_data = get_dividend_data(target_code)
+                # 缓存函数体执行时会把阶段标记为 miss
+                with trace.span("日线", cache="hit"):
+                    price_range_data = get_52week_price_range(target_code)
+                with trace.span("趋势", cache="hit"):
+                    trend = get_trend_signals(target_code)
+                with trace.span("分红", cache="hit"):
+                    dividend_data = get_dividend_data(target_code)
+                with trace.span("股息率分位", cache="hit"):
+                    yield_history = get_yield_history(target_code, dividend_data)
+                
+                stale = engine.stale_sources(target_code)
+                if stale:
+                    st.warning(f"⚠️ 上游暂不可用，以下数据使用旧数据：{format_stale(stale)}")
+                    # 旧数据不留在页面缓存里，下一次分析重新访问上游
+                    for source, cached_funcs in STALE_CACHED_FUNCS.items():
+                        for cached_func in cached_funcs if source in stale else ():
+                            cached_func.clear()
                 
                 # 第四步：计算估值模型
                 st.write("🔢 正在计算多维度估值模型...")
-                valuation_models = [
-                    estimate_by_pe_model(current_pe, current_price),
-                    estimate_by_peg_model(current_pe, growth_rate=None, finance_df=finance_recent),  # 传入财务数据
-                ]
+                with trace.span("估值"):
+                    valuation_models = engine.valuate(current_pe, current_price, finance_recent)
                 
                 # 显示数据面板
                 col1, col2, col3 = st.columns(3)
                 with col1:
                     st.subheader("📈 利弗莫尔趋势")
-                    if price_range_data.get("high_52w"):
-                        st.metric("52周最高价", f"{price_range_data['high_52w']:.2f} 元")
-                        st.metric("52周最低价", f"{price_range_data['low_52w']:.2f} 元")
+                    if price_range_data.high_52w:
+                        st.metric("52周最高价", f"{price_range_data.high_52w:.2f} 元")
+                        st.metric("52周最低价", f"{price_range_data.low_52w:.2f} 元")
                         st.metric("当前PE", f"{current_pe:.2f}x")
+                    if trend.available:
+                        distance = trend.distance_from_high(250, current_price)
+                        st.metric("距250日高点", f"{distance:+.1f}%" if distance is not None else "N/A",
+                                  help=f"距20日高点 {trend.distance_from_high(20, current_price):+.1f}%，"
+                                       f"距60日高点 {trend.distance_from_high(60, current_price):+.1f}%")
+                        st.metric("均线排列", trend.alignment or "数据不足",
+                                  help=" / ".join(f"MA{w} {ma:.2f}" for w, ma in
+                                                  ((20, trend.ma_20), (60, trend.ma_60), (250, trend.ma_250)) if ma is not None))
+                        if trend.atr_14 is not None:
+                            st.metric("ATR(14)", f"{trend.atr_14:.2f} 元")
+                        if trend.breakout_label:
+                            st.caption(f"🚀 {trend.breakout_label}" if trend.breakout_label.startswith("收盘突破")
+                                       else f"⚠️ {trend.breakout_label}")
                 
                 with col2:
                     st.subheader("💰 股息率模型")
-                    if dividend_data.get("dividend_per_share"):
-                        div_yield = calculate_dividend_yield(dividend_data["dividend_per_share"], current_price)
-                        st.metric("每股派息", f"{dividend_data['dividend_per_share']:.2f} 元")
+                    if dividend_data.dividend_per_share:
+                        div_yield = calculate_dividend_yield(dividend_data.dividend_per_share, current_price)
+                        st.metric("每股派息", f"{dividend_data.dividend_per_share:.2f} 元")
                         if div_yield:
                             st.metric("当前股息率", f"{div_yield:.2f}%")
-                        history_years = dividend_data.get("history_years", len(dividend_data.get("history", [])))
+                        history_years = dividend_data.history_years
                         st.metric("历史数据", f"{history_years} 年" if history_years else "数据不足")
+                        if yield_history is not None:
+                            percentile = analyze_dividend_percentile(yield_history.yields,
+                                                                     yield_history.current_yield(current_price))
+                            if percentile:
+                                st.metric("近12月股息率历史分位", f"{percentile.percentile:.0f}%",
+                                          help=f"近12月股息率 {percentile.current_yield:.2f}%，"
+                                               f"近 {percentile.samples} 个除权日中位数 {percentile.median_yield:.2f}%")
                     else:
                         st.info("⚠️ 暂无分红数据")
                 
@@ -496,39 +513,64 @@ if st.button("开始深度分析"):
                     st.subheader("📊 估值对比")
                     for model in valuation_models:
                         if model:
-                            st.metric(model['model'], model['assessment'])
+                            st.metric(model.model, model.summary)
                 
                 # 第五步：AI 分析
                 st.write("🤖 正在调用 AI 进行深度分析...")
                 st.subheader("💡 专家级价值评估报告")
                 
-                report_placeholder = st.empty()
-                full_content = ""
+                # 增量文本攒批后再刷新，避免每个分片都重新渲染整篇报告
+                report_renderer = StreamRenderer(st.empty())
                 
-                response_stream = call_deepseek_agent(
-                    api_key=api_key,
-                    stock_name=target_name,
-                    data_string=core_data_for_ai,
-                    current_date=current_date,
-                    current_price=current_price,
-                    current_pe=current_pe,
-                    current_change_pct=current_change_pct,
-                    price_range_data=price_range_data,
-                    dividend_data=dividend_data,
-                    valuation_models=valuation_models,
-                    ai_model=selected_model
-                )
+                with trace.span("提示词"):
+                    messages, prompt_stats = compose_report_messages(
+                        stock_name=target_name,
+                        data_string=finance_for_ai,
+                        current_date=current_date,
+                        current_price=current_price,
+                        current_pe=current_pe,
+                        current_change_pct=current_change_pct,
+                        price_range_data=price_range_data,
+                        dividend_data=dividend_data,
+                        valuation_models=valuation_models,
+                        yield_history=yield_history,
+                        trend=trend,
+                    )
+                st.caption(format_prompt_stats(prompt_stats))
+                # 相同提示词命中缓存时直接回放
+                response_stream = engine.stream_report(messages, api_key, selected_model, force_refresh=force_refresh)
+                if response_stream.cached:
+                    st.caption(f"📦 命中研报缓存（生成于 {format_age(time.time() - response_stream.created_at)}前），勾选“重新生成研报”可强制刷新")
                 
-                for chunk in response_stream:
-                    if chunk.choices[0].delta.content:
-                        full_content += chunk.choices[0].delta.content
-                        report_placeholder.markdown(full_content + "▌")
-                
-                report_placeholder.markdown(full_content)
+                with trace.span("AI 报告") as report_span:
+                    report_start = time.perf_counter()
+                    ttft = None
+                    for delta in response_stream:
+                        if ttft is None:
+                            ttft = time.perf_counter() - report_start
+                        report_renderer.write(delta)
+                    report_content = report_renderer.close()
+                    
+                    # 生成速度按首字之后的耗时计算；接口没有返回用量时按字数估算。缓存回放不计入模型指标
+                    if report_span.attrs.get("cache") == "miss":
+                        completion_tokens = report_span.attrs.get("completion_tokens") or estimate_tokens(report_content)
+                        generation_time = time.perf_counter() - report_start - (ttft or 0)
+                        annotate(
+                            ttft=round(ttft, 3) if ttft is not None else None,
+                            completion_tokens=completion_tokens,
+                            tokens_per_second=round(completion_tokens / generation_time, 1) if generation_time > 0 else None,
+                        )
+                st.caption(f"🖥️ 报告刷新 {report_renderer.render_count} 次，共发送 {report_renderer.bytes_sent / 1024:.0f} KB")
+                st.caption(format_report_cache_stats(get_report_cache().stats()))
                 status.update(label="✅ 分析完成！", state="complete")
             else:
                 st.error("❌ 未找到匹配的股票")
         
+        trace.finish()
+        with st.expander("⏱️ 本次分析各阶段耗时"):
+            st.dataframe(pd.DataFrame(trace.records()).drop(columns=["trace_id", "trace", "query", "model"], errors="ignore"),
+                         hide_index=True, use_container_width=True)
+        
         # 显示给AI的简化数据（必须在 status 外使用 expander）
         if 'finance_for_ai' in locals():
             with st.expander("🤖 查看 AI 分析用数据（已精简）"):
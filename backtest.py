@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+估值信号回测 - 用本地日线（price_store）与财务数据仓库（fundamentals）回放历史：每个调仓日按当时已公布的财报重算估值输入，
+套用注册表中现有的估值规则分档，统计各档之后 N 个交易日的收益，用来检验 PE / PEG 等阈值是否有区分度
+
+- 时点：财报在法定披露截止日（一季报 4-30、半年报 8-31、三季报 10-31、年报次年 4-30）之后才参与计算，不用未来数据
+- 估值输入与行情快照、单股分析同口径：动态市盈率 = 收盘价 / 年化每股收益（最近一期累计每股收益 × 12 / 报告期月数），
+  净利润增长率取最近一期，ROE / 每股收益 / 每股净资产取最近一份年报，市净率 = 收盘价 / 每股净资产
+- 收益：后复权收盘价（本地没有时退回不复权）的 close[t + h] / close[t] - 1，h 为交易日；调仓日没有收盘价（停牌）的股票不参与当期
+- 向量化：一批股票的日线拼成 (交易日 × 代码) 矩阵，财报按 (代码, 可用日) merge_asof 到全部调仓日，估值整批走 screen_models；
+  股票按批分给多个进程（读 Parquet 与计算都在子进程内完成），子进程只返回调仓日的观测，由主进程汇总；
+  交易日历取全部股票日线日期的并集，各批共用（调仓日与持有期的交易日数不随分批变化）
+
+用法：python run.py backtest [代码 ...] [--watchlist] [--start 2015-01-01] [--freq M] [--horizons 20,60,120,250] [--workers 4]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from config import BACKTEST_CHUNK, BACKTEST_WORKERS, BARS_DIR, WATCHLIST_PATH
+from price_store import PriceStore
+from valuation import VALUATION_MODELS, screen_models
+
+# 报告期月份 -> (年份偏移, 月, 日)：法定披露截止日
+DISCLOSURE_DEADLINES = {3: (0, 4, 30), 6: (0, 8, 31), 9: (0, 10, 31), 12: (1, 4, 30)}
+# 非季末的报告期按报告期后 120 天可用
+DISCLOSURE_FALLBACK_DAYS = 120
+
+DEFAULT_HORIZONS = (20, 60, 120, 250)
+RETURN_ADJUST = "hfq"
+PRICE_COLUMNS = ["date", "close"]
+FREQUENCIES = {"W": "周", "M": "月", "Q": "季"}
+
+# 观测中保留的估值输入（可据此换一套阈值重新分档，不必重跑回测）
+OBSERVED_INPUTS = ("pe", "pb", "net_profit_growth", "roe")
+
+
+def _models(models):
+    """参与回测的模型：screen 结果中有分档列的（models 为名称列表时只取这些）"""
+    selected = VALUATION_MODELS.values() if models is None else [VALUATION_MODELS[name] for name in models]
+    return [model for model in selected if model.screen is not None and model.assessment]
+
+
+# ============================================================================
+# 时点数据
+# ============================================================================
+
+def available_dates(report_dates):
+    """报告期 -> 可用日（法定披露截止日）"""
+    dates = pd.DatetimeIndex(report_dates)
+    month = dates.month.to_numpy()
+    quarter_end = dates.is_month_end & np.isin(month, list(DISCLOSURE_DEADLINES))
+    deadline = np.array([DISCLOSURE_DEADLINES.get(m, (0, 1, 1)) for m in range(13)])[np.where(quarter_end, month, 0)]
+    legal = pd.to_datetime(pd.DataFrame({
+        "year": dates.year.to_numpy() + deadline[:, 0], "month": deadline[:, 1], "day": deadline[:, 2],
+    }))
+    fallback = pd.Series(dates + pd.Timedelta(days=DISCLOSURE_FALLBACK_DAYS))
+    return pd.DatetimeIndex(legal.where(quarter_end, fallback))
+
+
+def point_in_time(reports, keys):
+    """keys（date, code，按 date 升序）-> 当日已可用的财报指标，与 keys 逐行对应
+
+    eps_annualized / net_profit_growth 取最近一期；roe / eps / bvps 取最近一份年报。
+    """
+    reports = reports.assign(available=available_dates(reports["report_date"]))
+    reports["eps_annualized"] = reports["eps"] * 12 / reports["report_date"].dt.month
+    # 同一天可用的报告期（年报与次年一季报都在 4-30）以较新的一期为准
+    reports = reports.sort_values(["available", "report_date"], kind="stable")
+    latest = pd.merge_asof(
+        keys, reports[["available", "code", "eps_annualized", "net_profit_growth"]],
+        left_on="date", right_on="available", by="code",
+    )
+    annual = pd.merge_asof(
+        keys, reports.loc[reports["annual"], ["available", "code", "roe", "eps", "bvps"]],
+        left_on="date", right_on="available", by="code",
+    )
+    return pd.DataFrame({
+        "eps_annualized": latest["eps_annualized"].to_numpy(),
+        "net_profit_growth": latest["net_profit_growth"].to_numpy(),
+        "roe": annual["roe"].to_numpy(),
+        "eps": annual["eps"].to_numpy(),
+        "bvps": annual["bvps"].to_numpy(),
+    })
+
+
+def _price_matrix(frames, calendar):
+    """{代码: 日线} -> (交易日 × 代码) 收盘价矩阵，没有数据的格为 NaN"""
+    matrix = np.full((len(calendar), len(frames)), np.nan)
+    for j, bars in enumerate(frames):
+        dates = bars["date"].to_numpy(dtype="datetime64[ns]")
+        rows = np.minimum(np.searchsorted(calendar, dates), len(calendar) - 1)
+        hit = calendar[rows] == dates
+        matrix[rows[hit], j] = bars["close"].to_numpy(dtype=float)[hit]
+    return matrix
+
+
+def _hold_prices(matrix):
+    """持有期末的价格：停牌日沿用之前的收盘价，最后一根日线之后（退市或数据截止）为 NaN"""
+    held = pd.DataFrame(matrix).ffill().to_numpy()
+    listed = ~np.isnan(matrix)
+    last = len(matrix) - 1 - np.argmax(listed[::-1], axis=0)
+    held[np.arange(len(matrix))[:, None] > np.where(listed.any(axis=0), last, -1)] = np.nan
+    return held
+
+
+def rebalance_rows(calendar, freq="M", start=None, end=None):
+    """每个周期的最后一个交易日所在行，返回 (行号, 周期末日期)"""
+    periods = pd.DatetimeIndex(calendar).to_period(freq)
+    rows = np.append(np.flatnonzero(periods[1:] != periods[:-1]), len(periods) - 1) if len(periods) else np.array([], int)
+    dates = calendar[rows]
+    keep = np.ones(len(rows), dtype=bool)
+    if start is not None:
+        keep &= dates >= np.datetime64(pd.Timestamp(start))
+    if end is not None:
+        keep &= dates <= np.datetime64(pd.Timestamp(end))
+    rows = rows[keep]
+    return rows, periods[rows].end_time.normalize()
+
+
+# ============================================================================
+# 一批股票（子进程内执行）
+# ============================================================================
+
+def chunk_dates(codes, price_dir=BARS_DIR):
+    """一批股票本地日线出现过的全部交易日（升序、去重，只读日期列）"""
+    store = PriceStore(root_dir=price_dir)
+    frames = [store.local_bars(code, columns=["date"]) for code in codes]
+    dates = [frame["date"].to_numpy(dtype="datetime64[ns]") for frame in frames if frame is not None and not frame.empty]
+    return np.unique(np.concatenate(dates)) if dates else np.array([], dtype="datetime64[ns]")
+
+
+def _union_dates(parts):
+    return np.unique(np.concatenate([np.array([], dtype="datetime64[ns]"), *parts]))
+
+
+def chunk_observations(codes, reports, freq="M", start=None, end=None, horizons=DEFAULT_HORIZONS, models=None,
+                       price_dir=BARS_DIR, return_adjust=RETURN_ADJUST, calendar=None):
+    """一批股票在全部调仓日的观测：period / code / 各模型分档 / OBSERVED_INPUTS / fwd_{h}（收益为小数）
+
+    reports 为这批股票在财务数据仓库中的行（FundamentalsWarehouse.table() 的子集）。
+    calendar 为全部股票共用的交易日（升序）；为 None 时用这批股票日线日期的并集。
+    """
+    store = PriceStore(root_dir=price_dir)
+    bars = {code: store.local_bars(code, columns=PRICE_COLUMNS) for code in codes}
+    bars = {code: frame for code, frame in bars.items() if frame is not None and not frame.empty}
+    if not bars:
+        return _empty_observations(horizons, models)
+    codes = np.array(list(bars), dtype=object)
+    if calendar is None:
+        calendar = np.unique(np.concatenate([frame["date"].to_numpy(dtype="datetime64[ns]") for frame in bars.values()]))
+
+    close = _price_matrix(bars.values(), calendar)
+    if return_adjust:
+        adjusted = [store.local_bars(code, return_adjust, columns=PRICE_COLUMNS) for code in codes]
+        adjusted = [frame if frame is not None and not frame.empty else bars[code] for code, frame in zip(codes, adjusted)]
+        entry = _price_matrix(adjusted, calendar)
+    else:
+        entry = close
+    held = _hold_prices(entry)
+
+    rows, period_ends = rebalance_rows(calendar, freq, start, end)
+    valid = (close[rows] > 0) & (entry[rows] > 0)
+    r, j = np.nonzero(valid)
+    keys = pd.DataFrame({"date": calendar[rows[r]], "code": codes[j]})
+    price = close[rows[r], j]
+
+    facts = point_in_time(reports, keys)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pe = np.where(facts["eps_annualized"] != 0, price / facts["eps_annualized"], np.nan)
+        pb = np.where(facts["bvps"] > 0, price / facts["bvps"], np.nan)
+    inputs = pd.DataFrame({
+        "price": price, "pe": pe, "pb": pb, "net_profit_growth": facts["net_profit_growth"],
+        "roe": facts["roe"], "eps": facts["eps"],
+    })
+    screened = screen_models(inputs, models)
+
+    observations = pd.DataFrame({"period": period_ends[r], "code": keys["code"]})
+    for model in _models(models):
+        if model.assessment in screened.columns:
+            observations[model.assessment] = pd.Categorical(screened[model.assessment], categories=model.labels)
+    for name in OBSERVED_INPUTS:
+        observations[name] = inputs[name].to_numpy(dtype=np.float32)
+    for h in horizons:
+        ahead = rows[r] + h
+        exit_price = np.where(ahead < len(calendar), held[np.minimum(ahead, len(calendar) - 1), j], np.nan)
+        observations[f"fwd_{h}"] = (exit_price / entry[rows[r], j] - 1).astype(np.float32)
+    return observations
+
+
+def _empty_observations(horizons, models):
+    observations = pd.DataFrame({"period": pd.Series(dtype="datetime64[ns]"), "code": pd.Series(dtype=object)})
+    for model in _models(models):
+        observations[model.assessment] = pd.Categorical([], categories=model.labels)
+    for name in [*OBSERVED_INPUTS, *(f"fwd_{h}" for h in horizons)]:
+        observations[name] = pd.Series(dtype=np.float32)
+    return observations
+
+
+# ============================================================================
+# 全部股票
+# ============================================================================
+
+def local_codes(price_dir=BARS_DIR):
+    """本地有不复权日线的全部代码"""
+    directory = os.path.join(price_dir, "none")
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len(".parquet")] for name in os.listdir(directory) if name.endswith(".parquet"))
+
+
+def run_backtest(codes=None, start=None, end=None, freq="M", horizons=DEFAULT_HORIZONS, models=None, workers=None,
+                 chunk_size=BACKTEST_CHUNK, price_dir=BARS_DIR, warehouse=None, return_adjust=RETURN_ADJUST, stats=None):
+    """回测全部（或 codes 指定的）股票，返回观测表（见 chunk_observations），按 period、code 排序
+
+    codes 为 None 时取本地有日线且仓库中有财报的全部股票；workers 为进程数（None 取 BACKTEST_WORKERS，0 为 CPU 核数），
+    只有一批或 workers <= 1 时在当前进程内计算。stats 为 dict 时写入股票数、批数、进程数与耗时。
+    """
+    if warehouse is None:
+        from fundamentals import get_fundamentals
+        warehouse = get_fundamentals()
+    started = time.perf_counter()
+    table = warehouse.table()
+    if codes is None:
+        codes = sorted(set(local_codes(price_dir)) & set(table["code"]))
+    codes = list(dict.fromkeys(str(code) for code in codes))
+    horizons = tuple(sorted(set(int(h) for h in horizons)))
+
+    reports = table[table["code"].isin(codes)]
+    by_code = dict(tuple(reports.groupby("code", sort=False)))
+    chunks = [codes[i:i + chunk_size] for i in range(0, len(codes), chunk_size)]
+    jobs = [
+        (chunk, pd.concat([by_code[c] for c in chunk if c in by_code]) if any(c in by_code for c in chunk) else table.iloc[:0])
+        for chunk in chunks
+    ]
+    options = dict(freq=freq, start=start, end=end, horizons=horizons, models=models,
+                   price_dir=price_dir, return_adjust=return_adjust)
+
+    workers = BACKTEST_WORKERS if workers is None else workers
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    # 多批时先取全部股票共用的交易日历，停牌、退市的股票所在的批与其他批按同样的交易日调仓和计算持有期
+    if workers <= 1:
+        if len(jobs) > 1:
+            options["calendar"] = _union_dates(chunk_dates(chunk, price_dir) for chunk in chunks)
+        parts = [chunk_observations(chunk, chunk_reports, **options) for chunk, chunk_reports in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            options["calendar"] = _union_dates(pool.map(chunk_dates, chunks, [price_dir] * len(chunks)))
+            futures = [pool.submit(chunk_observations, chunk, chunk_reports, **options) for chunk, chunk_reports in jobs]
+            parts = [future.result() for future in futures]
+
+    parts = [part for part in parts if not part.empty]
+    observations = (pd.concat(parts, ignore_index=True) if parts else _empty_observations(horizons, models))
+    observations = observations.sort_values(["period", "code"], ignore_index=True)
+    if stats is not None:
+        stats.update(codes=len(codes), chunks=len(jobs), workers=max(workers, 1), rows=len(observations),
+                     periods=int(observations["period"].nunique()), seconds=time.perf_counter() - started)
+    return observations
+
+
+def summarize(observations, models=None):
+    """观测 -> 各模型各分档在各持有期的表现（收益为百分数）
+
+    periods 为出现该分档的调仓期数，observations 为观测数；mean_return 为各期该档等权收益的平均，
+    excess_return 为相对同期全部股票等权收益的超额（取平均），win_rate 为收益为正的观测占比。
+    """
+    horizons = [int(c[len("fwd_"):]) for c in observations.columns if c.startswith("fwd_")]
+    rows = []
+    for model in _models(models):
+        if model.assessment not in observations.columns:
+            continue
+        for h in horizons:
+            column = f"fwd_{h}"
+            data = observations[["period", model.assessment, column]].dropna()
+            universe = observations[["period", column]].dropna().groupby("period")[column].mean()
+            grouped = data.groupby(["period", model.assessment], observed=True)[column]
+            bucket = grouped.mean().rename("mean").reset_index()
+            bucket["excess"] = bucket["mean"] - universe.reindex(bucket["period"]).to_numpy()
+            per_label = bucket.groupby(model.assessment, observed=True).agg(
+                periods=("mean", "size"), mean_return=("mean", "mean"), excess_return=("excess", "mean"))
+            pooled = data.groupby(model.assessment, observed=True)[column].agg(
+                observations="size", win_rate=lambda values: (values > 0).mean())
+            for label in model.labels:
+                if label not in per_label.index:
+                    continue
+                rows.append({
+                    "model": model.name,
+                    "assessment": label,
+                    "horizon": h,
+                    "periods": int(per_label.at[label, "periods"]),
+                    "observations": int(pooled.at[label, "observations"]),
+                    "mean_return": float(per_label.at[label, "mean_return"]) * 100,
+                    "excess_return": float(per_label.at[label, "excess_return"]) * 100,
+                    "win_rate": float(pooled.at[label, "win_rate"]) * 100,
+                })
+    return pd.DataFrame(rows, columns=["model", "assessment", "horizon", "periods", "observations",
+                                       "mean_return", "excess_return", "win_rate"])
+
+
+# ============================================================================
+# 命令行
+# ============================================================================
+
+def _print_summary(summary):
+    for name, table in summary.groupby("model", sort=False):
+        print(f"\n📈 {name}（超额收益% / 胜率% / 观测数）")
+        horizons = sorted(table["horizon"].unique())
+        print(f"   {'分档':<6}" + "".join(f"{f'{h}日':>24}" for h in horizons))
+        for label, rows in table.groupby("assessment", sort=False):
+            cells = rows.set_index("horizon")
+            line = "".join(
+                f"{cells.at[h, 'excess_return']:>+9.2f} {cells.at[h, 'win_rate']:>5.1f} {cells.at[h, 'observations']:>8d}"
+                if h in cells.index else f"{'--':>24}"
+                for h in horizons
+            )
+            print(f"   {label:<6}{line}")
+
+
+def main(argv=None):
+    """命令行入口：python run.py backtest [代码 ...] [选项]"""
+    parser = argparse.ArgumentParser(prog="run.py backtest", description="估值信号回测（只使用本地日线与财务数据仓库）")
+    parser.add_argument("codes", nargs="*", help="股票代码（默认本地有日线且仓库中有财报的全部股票）")
+    parser.add_argument("--watchlist", nargs="?", const=WATCHLIST_PATH, help="从自选股列表读取代码")
+    parser.add_argument("--start", help="第一个调仓日不早于该日期，如 2015-01-01")
+    parser.add_argument("--end", help="最后一个调仓日不晚于该日期")
+    parser.add_argument("--freq", choices=list(FREQUENCIES), default="M", help="调仓频率：W 周 / M 月 / Q 季")
+    parser.add_argument("--horizons", default=",".join(map(str, DEFAULT_HORIZONS)), help="持有期（交易日），逗号分隔")
+    parser.add_argument("--models", nargs="+", choices=[m.name for m in _models(None)], help="只回测这些模型")
+    parser.add_argument("--workers", type=int, help="进程数（0 为 CPU 核数）")
+    parser.add_argument("--output", help="汇总表另存为 CSV")
+    args = parser.parse_args(argv)
+
+    codes = list(args.codes)
+    if args.watchlist:
+        from warmer import load_watchlist
+        codes += [c for c in load_watchlist(args.watchlist) if c.isdigit()]
+    try:
+        horizons = [int(h) for h in args.horizons.split(",") if h.strip()]
+    except ValueError:
+        print(f"❌ 无法解析的持有期：{args.horizons}", file=sys.stderr)
+        return 1
+
+    stats = {}
+    observations = run_backtest(codes or None, start=args.start, end=args.end, freq=args.freq, horizons=horizons,
+                                models=args.models, workers=args.workers, stats=stats)
+    if observations.empty:
+        print("❌ 没有可回测的数据：请先用 python run.py warm / fundamentals ingest 把日线与财报存到本地", file=sys.stderr)
+        return 1
+    periods = observations["period"]
+    print(f"🧪 {stats['codes']} 只股票，{stats['periods']} 个调仓{FREQUENCIES[args.freq]}"
+          f"（{periods.min():%Y-%m} ~ {periods.max():%Y-%m}），{stats['rows']} 个观测；"
+          f"{stats['chunks']} 批 × {stats['workers']} 个进程，用时 {stats['seconds']:.1f} 秒")
+    summary = summarize(observations, args.models)
+    _print_summary(summary)
+    if args.output:
+        summary.to_csv(args.output, index=False, encoding="utf-8-sig")
+        print(f"\n💾 汇总表已保存：{args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量分析 - 线程池并发抓取自选股数据，按数据源主机限速，逐只产出结果
+"""
+
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from config import BATCH_MAX_WORKERS, BATCH_HOST_RATE
+from fetchers import (
+    SOURCE_ENDPOINTS, fetch_52week_price_range, fetch_trend_signals, fetch_dividend_data, fetch_financial_abstract,
+)
+from resilience import counting_retries, get_upstream
+
+# 数据源名称 -> (所在主机, 抓取函数)；同一主机共用一个限速配额
+DATA_SOURCES = {
+    "price_range": ("push2his.eastmoney.com", fetch_52week_price_range),
+    "trend": ("push2his.eastmoney.com", fetch_trend_signals),
+    "dividend": ("webapi.cninfo.com.cn", fetch_dividend_data),
+    "finance": ("basic.10jqka.com.cn", fetch_financial_abstract),
+}
+
+
+class HostRateLimiter:
+    """按主机限速：同一主机相邻两次请求至少间隔 1/rate 秒（线程安全）"""
+
+    def __init__(self, rate=BATCH_HOST_RATE):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host):
+        """预约该主机的下一个请求时间片，必要时等待"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, 0.0))
+            self._next_slot[host] = slot + self.interval
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+
+
+# 进程内共享的限速器：多个会话同时跑批量分析时也不会超过主机配额
+default_limiter = HostRateLimiter()
+
+
+def _fetch_source(code, source, host, fetch_func, limiter):
+    """抓取单个数据源；重试与熔断由上游调用层负责，这里只记录它的重试次数。无论成败都返回记录，不向外抛异常"""
+    start = time.perf_counter()
+    limiter.acquire(host)
+    with counting_retries() as counter:
+        try:
+            data, error = fetch_func(code), None
+        except Exception as e:
+            data, error = None, str(e)
+
+    return {
+        "code": code,
+        "source": source,
+        "data": data,
+        "error": error,
+        "retries": counter["retries"],
+        "stale": error is None and source in SOURCE_ENDPOINTS and get_upstream().is_stale(SOURCE_ENDPOINTS[source], code),
+        "latency": time.perf_counter() - start,
+    }
+
+
+def run_batch(codes, sources=None, max_workers=BATCH_MAX_WORKERS, limiter=None):
+    """并发抓取一批股票的全部数据源，每只股票的数据源全部完成后立即 yield 一条结果
+
+    每个 (股票, 数据源) 是一个独立任务，慢股票只占用一个线程，不会拖住整批。
+    结果格式：{"code", "data": {源: 数据}, "errors": {源: 错误}, "stale": [使用旧数据的源],
+              "retries": 上游重试次数之和, "latency": {源: 秒}, "elapsed"}
+    """
+    sources = sources or DATA_SOURCES
+    limiter = limiter or default_limiter
+    codes = list(dict.fromkeys(codes))  # 去重并保持顺序
+    pending = {code: {} for code in codes}
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch")
+    try:
+        # 按股票顺序提交，靠前的股票先完成，表格可以尽早出结果
+        futures = [
+            pool.submit(_fetch_source, code, source, host, fetch_func, limiter)
+            for code in codes
+            for source, (host, fetch_func) in sources.items()
+        ]
+        for future in as_completed(futures):
+            record = future.result()
+            parts = pending[record["code"]]
+            parts[record["source"]] = record
+            if len(parts) == len(sources):
+                yield _combine(record["code"], pending.pop(record["code"]))
+    finally:
+        # 调用方提前结束迭代时，取消尚未开始的任务
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _combine(code, parts):
+    """把同一只股票的各数据源记录合并为一条结果"""
+    return {
+        "code": code,
+        "data": {s: r["data"] for s, r in parts.items()},
+        "errors": {s: r["error"] for s, r in parts.items() if r["error"]},
+        "stale": [s for s, r in parts.items() if r["stale"]],
+        "retries": sum(r["retries"] for r in parts.values()),
+        "latency": {s: r["latency"] for s, r in parts.items()},
+        # 各数据源并发执行，单只股票耗时取最慢的数据源
+        "elapsed": max(r["latency"] for r in parts.values()),
+    }
+
+
+# ============================================================================
+# 输入解析
+# ============================================================================
+
+def parse_code_list(text):
+    """把逗号 / 空格 / 换行分隔的输入拆成列表"""
+    return [item for item in re.split(r"[\s,，;；、]+", text or "") if item]
+
+
+def read_codes_from_csv(file):
+    """从 CSV 读取股票列表：表头含“代码”/“code”时取该列，否则取第一列（视为无表头）"""
+    df = pd.read_csv(file, dtype=str, header=None)
+    if df.empty:
+        return []
+    header = [str(v).strip().lower() for v in df.iloc[0]]
+    column = next((i for i, h in enumerate(header) if h in ("代码", "code", "symbol")), None)
+    values = df.iloc[1:, column] if column is not None else df.iloc[:, 0]
+    values = values.dropna().str.strip()
+    # Excel 会吃掉代码前导零，纯数字补齐到 6 位
+    return [v.zfill(6) if v.isdigit() else v for v in values if v]
@@ -0,0 +1,1086 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+性能基准 - 离线合成 / 回放数据上的基准，不访问网络
+
+用法：
+    python benchmark.py                              # 全部基准（合成数据）
+    python benchmark.py pipeline --fixtures fixtures # 只跑分析流程，使用录制的回放数据
+    python benchmark.py pipeline --json result.json --baseline baseline.json  # CI：p95 超过基线 1.5 倍时返回非 0
+    python benchmark.py records                      # 只跑结果记录内存对比
+    python benchmark.py yields                       # 只跑自选股股息率分位排名
+    python benchmark.py trend                        # 只跑趋势指标（滚动最值 / 增量更新）
+    python benchmark.py prompt                       # 只跑提示词紧凑化与 token 预算
+    python benchmark.py faults                       # 只跑注入故障下的上游容错（重试 / 熔断 / 旧数据回退）
+    python benchmark.py warm                         # 只跑新进程首次分析：冷启动 vs 自选股预热后
+    python benchmark.py fundamentals                 # 只跑财务数据仓库的全市场多年条件筛选
+    python benchmark.py numeric                      # 只跑带单位字符串的数值换算
+    python benchmark.py models                       # 只跑估值模型注册表：逐只 vs 整批向量化，按模型计时
+    python benchmark.py snapshot                     # 只跑行情快照内存：原始整表 vs 紧凑只读表
+    python benchmark.py backtest                     # 只跑估值信号回测：标量核对 + 单进程 vs 多进程
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from fetchers import parse_dividend_data, fetch_dividend_data, fetch_financial_abstract
+from backtest import DISCLOSURE_DEADLINES, DISCLOSURE_FALLBACK_DAYS, FREQUENCIES, run_backtest, summarize
+from engine import AnalysisEngine
+from fundamentals import FundamentalsWarehouse
+from numeric import make_unit_frame, normalize_frame
+from prompts import build_report_messages, compose_report_messages, select_finance_for_ai
+from records import PriceRange, DividendInfo, PEValuation, PEGValuation, RecordArray, YieldHistory
+from tracing import frame_bytes
+from resilience import (
+    ENDPOINTS, CircuitBreaker, FaultSchedule, LastGoodStore, RetryPolicy, Upstream, refreshing, set_upstream,
+)
+from price_store import PriceStore
+from replay import (
+    make_dividend_history, make_financial_abstract, make_price_history, make_spot_snapshot, load_manifest, replaying,
+    write_synthetic_fixtures,
+)
+from snapshot_store import SnapshotStore, compact_snapshot, decode_snapshot
+from symbol_index import SymbolIndex
+from trend import TREND_WINDOWS, TrendTracker, latest_signals, rolling_max, trend_frame
+from valuation import (
+    estimate_by_roe_model, historical_dividend_yields, analyze_dividend_percentile,
+    rank_dividend_yields, screen_market, screen_roe, YIELD_TTM_DAYS, VALUATION_MODELS, evaluate_models, resolve_valuation_inputs,
+    screen_models,
+)
+from mock_openai_server import start_mock_server
+from report_engine import generate_reports
+from stream_renderer import StreamRenderer
+
+
+def _timeit(func, *args, repeat=5):
+    """多次运行取最短耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# ============================================================================
+# 分红数据解析
+# ============================================================================
+
+def legacy_parse_dividend_data(dividend_df):
+    """重写前的分红解析（iterrows + 逐单元格字符串解析），仅作为基准对照"""
+    if '公告日期' in dividend_df.columns:
+        dividend_df['公告日期'] = pd.to_datetime(dividend_df['公告日期'], errors='coerce')
+        dividend_df = dividend_df.sort_values('公告日期', ascending=False)
+
+    latest_dividend = dividend_df.iloc[0]
+
+    result = {
+        "dividend_per_share": None,
+        "transfer_share": None,
+        "payout_ratio": None,
+        "record_date": None,
+        "history": []
+    }
+
+    for col in dividend_df.columns:
+        if '派息' in col or '每股' in col:
+            val = latest_dividend[col]
+            if isinstance(val, (int, float)):
+                if '派息' in col and '转增' not in col:
+                    result["dividend_per_share"] = val
+                if '转增' in col:
+                    result["transfer_share"] = val
+            elif val is not None:
+                try:
+                    float_val = float(str(val).replace('元', '').strip())
+                    if '派息' in col and '转增' not in col:
+                        result["dividend_per_share"] = float_val
+                    if '转增' in col:
+                        result["transfer_share"] = float_val
+                except (ValueError, TypeError):
+                    pass
+
+        if '派息率' in col or '分配率' in col:
+            result["payout_ratio"] = latest_dividend[col]
+
+        if '记录日' in col or '除权日' in col:
+            result["record_date"] = latest_dividend[col]
+
+    dividend_values = []
+    for idx, row in dividend_df.iterrows():
+        try:
+            for col in dividend_df.columns:
+                if '派息' in col and '转增' not in col:
+                    val = row[col]
+                    if isinstance(val, (int, float)) and not isinstance(val, bool):
+                        if val > 0:
+                            dividend_values.append(float(val))
+                        break
+                    elif val is not None:
+                        try:
+                            str_val = str(val).replace('元', '').strip()
+                            if str_val and str_val.replace('.', '', 1).isdigit():
+                                float_val = float(str_val)
+                                if float_val > 0:
+                                    dividend_values.append(float_val)
+                                break
+                        except (ValueError, TypeError):
+                            pass
+        except:
+            pass
+
+    if len(dividend_values) >= 1:
+        result["history"] = dividend_values[:10]
+        result["history_years"] = len(result["history"])
+
+    return result
+
+
+def bench_dividend_parsing(sizes=(10, 100, 1000, 10000)):
+    """对比新旧分红解析在不同历史长度下的耗时，并校验结果一致"""
+    print("=" * 50)
+    print("💰 分红数据解析：iterrows 版本 vs 向量化版本")
+    print("=" * 50)
+    print(f"{'行数':>8} {'类型':>6} {'旧版(ms)':>10} {'新版(ms)':>10} {'加速比':>8}  结果一致")
+
+    for rows in sizes:
+        for text_values in (False, True):
+            df = make_dividend_history(rows, text_values=text_values)
+            old = legacy_parse_dividend_data(df.copy())
+            new = parse_dividend_data(df.copy())
+            # 旧版直接使用“派息比例”（每 10 股派息），新版换算为每股派息；最新一期不分配时两边都是 None / NaN
+            old_latest = old["dividend_per_share"]
+            same = (np.allclose(np.divide(old["history"], 10), new.history)
+                    and old.get("history_years", 0) == new.history_years
+                    and str(old_latest if old_latest is None else np.round(old_latest / 10, 6)) == str(new.dividend_per_share)
+                    and str(old["record_date"]) == str(new.record_date))
+
+            repeat = 3 if rows >= 10000 else 5
+            old_t = _timeit(lambda: legacy_parse_dividend_data(df.copy()), repeat=repeat)
+            new_t = _timeit(lambda: parse_dividend_data(df.copy()), repeat=repeat)
+            kind = "字符串" if text_values else "数值"
+            print(f"{rows:>8} {kind:>6} {old_t * 1000:>10.2f} {new_t * 1000:>10.2f} "
+                  f"{old_t / new_t:>7.1f}x  {'✓' if same else '✗'}")
+
+
+# ============================================================================
+# 异步研报生成
+# ============================================================================
+
+def bench_report_engine(reports=8, concurrency_levels=(1, 4, 8)):
+    """在本地模拟服务上对比不同并发数下生成多份流式报告的总耗时与新建连接数"""
+    print("=" * 50)
+    print(f"🤖 研报生成：{reports} 份报告，本地模拟服务（首字 50ms，20 段 × 20ms）")
+    print("=" * 50)
+    print(f"{'并发数':>6} {'总耗时(s)':>10} {'平均首字(ms)':>12} {'新建连接':>8}")
+
+    server, base_url = start_mock_server(chunk_count=20, chunk_delay=0.02, first_token_delay=0.05)
+    try:
+        for concurrency in concurrency_levels:
+            jobs = [{"key": i, "messages": [{"role": "user", "content": "分析贵州茅台"}], "sink": lambda delta: None}
+                    for i in range(reports)]
+            server.connections = 0
+            start = time.perf_counter()
+            results = generate_reports(jobs, api_key="mock", base_url=base_url, concurrency=concurrency)
+            elapsed = time.perf_counter() - start
+            ttft = np.mean([r["ttft"] for r in results if r["ttft"] is not None]) * 1000
+            print(f"{concurrency:>6} {elapsed:>10.2f} {ttft:>12.0f} {server.connections:>8}")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# ============================================================================
+# 流式报告渲染
+# ============================================================================
+
+class _CountingPlaceholder:
+    """模拟 st.empty()：只统计 markdown 调用次数与发送的字节数"""
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+
+    def markdown(self, body):
+        self.calls += 1
+        self.bytes += len(body.encode("utf-8"))
+
+
+def bench_stream_render(report_chars=(5000, 20000, 60000), delta_chars=4, delta_interval=0.02):
+    """对比逐分片刷新与攒批刷新：模拟模型每 20ms 返回 4 个字符"""
+    print("=" * 50)
+    print("🖥️ 流式报告渲染：逐分片刷新 vs 攒批刷新")
+    print("=" * 50)
+    print(f"{'报告字数':>8} {'逐片刷新次数':>12} {'逐片发送(KB)':>12} {'攒批刷新次数':>12} {'攒批发送(KB)':>12}")
+
+    for chars in report_chars:
+        deltas = ["价值投资"[:delta_chars]] * (chars // delta_chars)
+
+        naive = _CountingPlaceholder()
+        full_content = ""
+        for delta in deltas:
+            full_content += delta
+            naive.markdown(full_content + "▌")
+        naive.markdown(full_content)
+
+        # 用模拟时钟复现真实的分片间隔
+        now = [0.0]
+        renderer = StreamRenderer(_CountingPlaceholder(), clock=lambda: now[0])
+        for delta in deltas:
+            now[0] += delta_interval
+            renderer.write(delta)
+        assert renderer.close() == full_content
+
+        print(f"{chars:>8} {naive.calls:>12} {naive.bytes / 1024:>12.0f} "
+              f"{renderer.render_count:>12} {renderer.bytes_sent / 1024:>12.0f}")
+
+
+# ============================================================================
+# 结果记录内存：字典 vs __slots__ 记录 vs 列式数组
+# ============================================================================
+
+def _legacy_result_dicts(high, low, dividend, history, pe, peg, growth):
+    """重写前各函数返回的字典（键与结构保持原样），仅作为基准对照"""
+    return [
+        {"high_52w": high, "low_52w": low, "range": high - low, "ratio": (high - low) / low * 100},
+        {"dividend_per_share": dividend, "transfer_share": None, "payout_ratio": None, "record_date": None,
+         "history": history, "history_years": len(history)},
+        {"model": "PE倍数法", "current_pe": pe, "assessment": "合理",
+         "reference_range": "低估<15 | 合理15-25 | 偏高25-35 | 高估>35", "market_avg": 25, "premium": (pe - 25) / 25 * 100},
+        {"model": "PEG模型", "peg": peg, "growth_rate": growth, "growth_source": "财报数据", "assessment": "合理",
+         "reference": "低估<1 | 合理1-1.5 | 偏高1.5-2 | 高估>2"},
+    ]
+
+
+def _typed_records(high, low, dividend, history, pe, peg, growth):
+    return [
+        PriceRange(high_52w=high, low_52w=low, range=high - low, ratio=(high - low) / low * 100),
+        DividendInfo(dividend_per_share=dividend, history=tuple(history)),
+        PEValuation(current_pe=pe, assessment="合理", market_avg=25, premium=(pe - 25) / 25 * 100),
+        PEGValuation(peg=peg, growth_rate=growth, growth_source="财报数据", assessment="合理"),
+    ]
+
+
+def _retained_kb(build):
+    """build() 返回的对象在构建结束后仍占用的内存（KB）"""
+    tracemalloc.start()
+    try:
+        kept = build()
+        current = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    return current / 1024
+
+
+def bench_record_memory(rows=5000, history_years=10):
+    """全市场一轮分析（每只股票 价格区间 + 分红 + PE + PEG 四条结果）在三种表示下的常驻内存"""
+    print("=" * 50)
+    print(f"🧱 结果记录内存：全市场 {rows} 只股票 × 4 条结果")
+    print("=" * 50)
+
+    spot = make_spot_snapshot(rows)
+    price = spot["最新价"].to_numpy(dtype=float)
+    pe = spot["市盈率-动态"].to_numpy(dtype=float)
+    rng = np.random.default_rng(7)
+    growth = rng.uniform(1, 40, rows)
+    dividend = rng.uniform(0.1, 5, rows)
+    # 输入数据先转成 Python 对象，三种表示都只计自身新分配的内存
+    inputs = [
+        (float(p * 1.3), float(p * 0.7), float(d), [float(d) * (1 - y * 0.03) for y in range(history_years)],
+         float(e), float(e / g), float(g))
+        for p, d, e, g in zip(price, dividend, pe, growth)
+    ]
+
+    def build_arrays():
+        records = [_typed_records(*args) for args in inputs]
+        return [RecordArray.from_records(kind, (r[i] for r in records))
+                for i, kind in enumerate((PriceRange, DividendInfo, PEValuation, PEGValuation))]
+
+    dict_kb = _retained_kb(lambda: [_legacy_result_dicts(*args) for args in inputs])
+    record_kb = _retained_kb(lambda: [_typed_records(*args) for args in inputs])
+    array_kb = _retained_kb(build_arrays)
+
+    dicts = [_legacy_result_dicts(*args) for args in inputs]
+    arrays = build_arrays()
+    dict_frame_t = _timeit(lambda: pd.DataFrame([d[3] for d in dicts]), repeat=3)
+    array_frame_t = _timeit(lambda: arrays[3].to_frame(), repeat=3)
+
+    print(f"{'表示':<14} {'常驻内存(KB)':>12} {'相对字典':>8}")
+    for name, kb in (("字典", dict_kb), ("__slots__ 记录", record_kb), ("列式数组", array_kb)):
+        print(f"{name:<14} {kb:>12.0f} {kb / dict_kb:>7.0%}")
+    print(f"PEG 结果转 DataFrame：字典列表 {dict_frame_t * 1000:.2f}ms，列式数组 {array_frame_t * 1000:.2f}ms")
+    return {"dict_kb": dict_kb, "record_kb": record_kb, "array_kb": array_kb}
+
+
+def bench_snapshot_memory(rows=5000, sessions=20):
+    """全市场行情快照：原始整表（全部列、object 字符串）vs 紧凑只读表（只留用到的列、Arrow 字符串、float32），
+    多个会话各持一份副本 vs 共用一份，以及检索、取行、全市场筛选的耗时"""
+    print("=" * 50)
+    print(f"🗂️ 行情快照内存：{rows} 只股票，{sessions} 个会话")
+    print("=" * 50)
+    spot = make_spot_snapshot(rows)
+    # 改动前 SnapshotStore 常驻的表示：去掉序号，其余列原样保留
+    legacy = spot.drop(columns=["序号"]).set_index("代码", drop=False).rename_axis(None)
+    compact = compact_snapshot(spot)
+
+    # 还原后的数值与原始快照一致；共用的表不可原地修改
+    decoded = decode_snapshot(compact)
+    for column in compact.columns:
+        assert decoded[column].tolist() == legacy[column].tolist(), column
+    try:
+        compact.loc[compact.index[0], "最新价"] = 0.0
+        raise AssertionError("紧凑快照应为只读")
+    except ValueError:
+        pass
+
+    legacy_bytes, compact_bytes = frame_bytes(legacy), frame_bytes(compact)
+    print(f"{'表示':<16} {'列数':>4} {'单份(KB)':>10} {f'{sessions} 个会话(KB)':>16}")
+    print(f"{'原始整表（各持副本）':<12} {len(legacy.columns):>4} {legacy_bytes / 1024:>10.0f} {legacy_bytes * sessions / 1024:>16.0f}")
+    print(f"{'紧凑只读（共用）':<13} {len(compact.columns):>4} {compact_bytes / 1024:>10.0f} {compact_bytes / 1024:>16.0f}"
+          f"（单份 {compact_bytes / legacy_bytes:.0%}）")
+    print("  " + "，".join(f"{c} {t}" for c, t in compact.dtypes.astype(str).items()))
+
+    # 刷新：没有变化时不换表、版本不变；改一只股票的价格只算一行变化
+    feed = {"df": spot}
+    store = SnapshotStore(fetch_func=lambda: feed["df"], cache_dir=tempfile.mkdtemp(prefix="stockagent-snapshot-"))
+    store.refresh()
+    version = store.version
+    assert store.refresh() == 0 and store.version == version
+    code = legacy.index[rows // 2]
+    moved = spot.copy()
+    moved.loc[moved["代码"] == code, "最新价"] += 1.0
+    feed["df"] = moved
+    assert store.refresh() == 1 and store.version == version + 1
+    assert store.row(code)["最新价"] == round(legacy.loc[code, "最新价"] + 1.0, 2)
+    assert store.row("999999") is None
+    print(f"刷新：无变化 0 行，改价 1 行；status bytes={store.status()['bytes']}，source_bytes={store.status()['source_bytes']}")
+
+    timings = {
+        "取行": (_timeit(lambda: legacy.loc[code]), _timeit(store.row, code)),
+        "建检索索引": (_timeit(SymbolIndex.from_snapshot, legacy, repeat=3), _timeit(SymbolIndex.from_snapshot, compact, repeat=3)),
+        "全市场筛选": (_timeit(screen_market, legacy, repeat=3), _timeit(lambda: screen_market(decode_snapshot(compact)), repeat=3)),
+    }
+    pd.testing.assert_frame_equal(screen_market(legacy), screen_market(decode_snapshot(compact)), check_index_type=False,
+                                  check_dtype=False)
+    print(f"{'操作':<10} {'原始整表(ms)':>12} {'紧凑只读(ms)':>12}")
+    for name, (legacy_t, compact_t) in timings.items():
+        print(f"{name:<10} {legacy_t * 1000:>12.2f} {compact_t * 1000:>12.2f}")
+    return {"legacy_kb": legacy_bytes / 1024, "compact_kb": compact_bytes / 1024, "sessions": sessions,
+            **{f"{name}_ms": [t * 1000 for t in pair] for name, pair in timings.items()}}
+
+
+# ============================================================================
+# 自选股股息率分位排名
+# ============================================================================
+
+def _synthetic_watchlist(codes, years=10, seed=11):
+    """合成自选股：每只 years 年交易日收盘价 + 每年一次派息（除权日可能落在非交易日）"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end="2024-06-28", periods=years * 250)
+    code_list = [f"{600000 + i:06d}" for i in range(codes)]
+    close = np.exp(np.cumsum(rng.normal(0, 0.015, (codes, len(dates))), axis=1)) * rng.uniform(5, 100, (codes, 1))
+    bars = pd.DataFrame({
+        "code": np.repeat(code_list, len(dates)),
+        "date": np.tile(dates, codes),
+        "close": close.ravel(),
+    })
+    ex_dates = pd.to_datetime([f"{2024 - k}-06-{rng.integers(1, 29):02d}" for k in range(years)])
+    events = pd.DataFrame({
+        "code": np.repeat(code_list, years),
+        "ex_date": np.tile(ex_dates, codes),
+        "dividend": (close[:, -1:] * rng.uniform(0.01, 0.05, (codes, years))).ravel(),
+    })
+    prices = pd.Series(close[:, -1] * rng.uniform(0.8, 1.2, codes), index=code_list)
+    return events, bars, prices
+
+
+def _loop_yield_rank(events, bars, prices):
+    """逐只股票、逐个除权日查找收盘价与近 12 个月派息（对照组）"""
+    rows = {}
+    bars_by_code = dict(tuple(bars.groupby("code")))
+    for code, code_events in events.groupby("code"):
+        code_bars = bars_by_code[code]
+        yields = []
+        for ex_date in code_events["ex_date"]:
+            before = code_bars[code_bars["date"] <= ex_date]
+            if before.empty:
+                continue
+            window = code_events[(code_events["ex_date"] <= ex_date)
+                                 & (code_events["ex_date"] > ex_date - pd.Timedelta(days=YIELD_TTM_DAYS))]
+            yields.append(window["dividend"].sum() / before["close"].iloc[-1] * 100)
+        latest = code_events["ex_date"].max()
+        ttm = code_events[code_events["ex_date"] > latest - pd.Timedelta(days=YIELD_TTM_DAYS)]["dividend"].sum()
+        result = analyze_dividend_percentile(yields, ttm / prices[code] * 100)
+        if result:
+            rows[code] = {"current_yield": result.current_yield, "percentile": result.percentile}
+    return pd.DataFrame.from_dict(rows, orient="index").sort_values("percentile", ascending=False)
+
+
+def _vectorized_yield_rank(events, bars, prices):
+    history = historical_dividend_yields(events, bars)
+    histories = [
+        YieldHistory(code=code, ex_dates=tuple(group["ex_date"]), yields=tuple(group["yield"]),
+                     ttm_dividend=float(group["ttm_dividend"].iloc[-1]))
+        for code, group in history.groupby("code", sort=False)
+    ]
+    return rank_dividend_yields(histories, prices)
+
+
+def bench_yield_rank(watchlist_sizes=(50, 500)):
+    """整份自选股的历史股息率分位：逐只逐日查找 vs 按代码 as-of 对齐 + 向量化排名"""
+    print("=" * 50)
+    print("📐 自选股股息率分位排名（10 年日线 + 每年一次派息）")
+    print("=" * 50)
+    print(f"{'股票数':>6} {'逐只查找(ms)':>12} {'向量化(ms)':>10} {'加速':>7}")
+    results = {}
+    for size in watchlist_sizes:
+        events, bars, prices = _synthetic_watchlist(size)
+        loop = _loop_yield_rank(events, bars, prices)
+        fast = _vectorized_yield_rank(events, bars, prices)
+        # 两种算法的分位必须一致
+        assert np.allclose(loop["percentile"].sort_index(), fast["percentile"].sort_index())
+        loop_t = _timeit(_loop_yield_rank, events, bars, prices, repeat=1)
+        fast_t = _timeit(_vectorized_yield_rank, events, bars, prices, repeat=3)
+        results[size] = {"loop_ms": loop_t * 1000, "vectorized_ms": fast_t * 1000}
+        print(f"{size:>6} {loop_t * 1000:>12.1f} {fast_t * 1000:>10.1f} {loop_t / fast_t:>6.1f}x")
+    return results
+
+
+# ============================================================================
+# 趋势指标
+# ============================================================================
+
+def _synthetic_bars(tickers, days, seed=5):
+    """合成规范化日线：每只 days 根 K 线（date / high / low / close）"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end="2024-06-28", periods=days)
+    close = np.exp(np.cumsum(rng.normal(0, 0.02, (tickers, days)), axis=1)) * rng.uniform(5, 100, (tickers, 1))
+    spread = rng.uniform(0, 0.02, (tickers, days))
+    return [pd.DataFrame({"date": dates, "high": c * (1 + s), "low": c * (1 - s), "close": c})
+            for c, s in zip(close, spread)]
+
+
+def bench_trend(tickers=2000, days=300):
+    """滚动最值三种算法；以及每天新到一根 K 线时，整段重算 vs 按代码增量追加"""
+    print("=" * 50)
+    print(f"📈 趋势指标：{tickers} 只股票 × {days} 根日线")
+    print("=" * 50)
+
+    values = np.random.default_rng(3).normal(0, 1, 100_000).cumsum()
+    window = max(TREND_WINDOWS)
+    strided = lambda: np.lib.stride_tricks.sliding_window_view(values, window).max(axis=1)
+    pandas_t = _timeit(lambda: pd.Series(values).rolling(window, min_periods=1).max().to_numpy())
+    strided_t = _timeit(strided)
+    blocked_t = _timeit(rolling_max, values, window)
+    assert np.allclose(rolling_max(values, window)[window - 1:], strided())
+    print(f"{window} 日滚动最高（10 万根）：pandas rolling {pandas_t * 1000:.2f}ms，"
+          f"滑窗视图 O(n·w) {strided_t * 1000:.2f}ms，分块前缀/后缀 O(n) {blocked_t * 1000:.2f}ms")
+
+    bars = _synthetic_bars(tickers, days + 1)
+    history = [b.iloc[:-1] for b in bars]
+    today = pd.Timestamp("2030-01-01")  # 全部视为已收盘
+
+    def full_recompute():
+        return [latest_signals(b) for b in bars]
+
+    tracker = TrendTracker()
+    for code, b in enumerate(history):
+        tracker.update(code, b, today=today)
+
+    def incremental():
+        return [tracker.update(code, b, today=today) for code, b in enumerate(bars)]
+
+    expected = full_recompute()
+    got = incremental()
+    for a, b in zip(expected, got):
+        assert all(np.isclose(getattr(a, k) or 0, getattr(b, k) or 0) for k in ("high_250", "low_20", "ma_60", "atr_14"))
+        assert (a.breakout_20, a.breakout_60, a.breakout_250) == (b.breakout_20, b.breakout_60, b.breakout_250)
+
+    full_t = _timeit(full_recompute, repeat=1)
+    tracker = TrendTracker()
+    for code, b in enumerate(history):
+        tracker.update(code, b, today=today)
+    start = time.perf_counter()
+    incremental()
+    append_t = time.perf_counter() - start
+    noop_t = _timeit(incremental, repeat=3)  # 状态已是最新：只做衔接校验
+    frame_t = _timeit(trend_frame, bars[0])
+    print(f"单只整段向量化（{days} 根）：{frame_t * 1000:.2f}ms")
+    print(f"新到一根 K 线：整段重算 {full_t * 1000:.0f}ms，增量追加 {append_t * 1000:.0f}ms，"
+          f"无新 K 线 {noop_t * 1000:.0f}ms（{tickers} 只）")
+    return {"full_ms": full_t * 1000, "incremental_ms": append_t * 1000}
+
+
+# ============================================================================
+# 数值换算
+# ============================================================================
+
+def _loop_parse_frame(df):
+    """逐单元格去掉单位字符后 float()（换算前各处的写法），仅作为基准对照"""
+    out = {}
+    for col in df.columns:
+        values = []
+        for value in df[col]:
+            try:
+                text = str(value).strip()
+                scale = 1e12 if text.endswith("万亿") else 1e8 if text.endswith("亿") else 1e4 if text.endswith("万") else 1.0
+                values.append(float(text.rstrip("万亿%元")) * scale)
+            except ValueError:
+                values.append(np.nan)
+        out[col] = values
+    return pd.DataFrame(out)
+
+
+def _extract_parse_frame(df):
+    """逐列 str.extract + pd.to_numeric（按列向量化，但每列一遍正则）"""
+    out = {}
+    for col in df.columns:
+        parts = df[col].astype("string").str.extract(r"^\s*([-+]?\d+(?:\.\d+)?)\s*(万亿|亿|万|%|元)?\s*$")
+        scales = parts[1].map({"万亿": 1e12, "亿": 1e8, "万": 1e4}).fillna(1.0).to_numpy(dtype=float)
+        out[col] = pd.to_numeric(parts[0], errors="coerce").to_numpy(dtype=float) * scales
+    return pd.DataFrame(out)
+
+
+def bench_numeric(rows=(1_000, 10_000, 100_000), columns=12):
+    """带单位字符串表的换算：逐单元格 float() vs 逐列正则 vs numeric.normalize_frame（整表一遍）；
+    以及全市场 ROE 倍数法：逐只 estimate_by_roe_model vs screen_roe 直接吃字符串列"""
+    print("=" * 50)
+    print(f"🔢 数值换算（万 / 亿 / % / 元、负数、“--”，{columns} 列）")
+    print("=" * 50)
+    print(f"{'行数':>8} {'逐单元格(ms)':>12} {'逐列正则(ms)':>12} {'整表一遍(ms)':>12} {'加速':>7}")
+    results = {}
+    for n in rows:
+        text, expected = make_unit_frame(n, columns, seed=n)
+        assert np.allclose(_extract_parse_frame(text).to_numpy(), expected.to_numpy(), equal_nan=True)
+        repeat = 1 if n >= 100_000 else 3
+        loop_t = _timeit(_loop_parse_frame, text, repeat=repeat)
+        extract_t = _timeit(_extract_parse_frame, text, repeat=repeat)
+        frame_t = _timeit(normalize_frame, text, repeat=repeat)
+        results[n] = {"loop_ms": loop_t * 1000, "extract_ms": extract_t * 1000, "normalize_ms": frame_t * 1000}
+        print(f"{n:>8} {loop_t * 1000:>12.1f} {extract_t * 1000:>12.1f} {frame_t * 1000:>12.1f} "
+              f"{min(loop_t, extract_t) / frame_t:>6.1f}x")
+
+    # 最近一期年报的 ROE / 每股收益（“%”与纯数字字符串）
+    codes = 5000
+    abstracts = [make_financial_abstract(years=1, seed=i) for i in range(codes)]
+    latest = pd.concat(abstracts, ignore_index=True).set_axis([f"{600000 + i:06d}" for i in range(codes)])
+    prices = pd.Series(np.random.default_rng(1).uniform(5, 300, codes), index=latest.index)
+    scalar = lambda: [estimate_by_roe_model(r, e, p) for r, e, p in zip(latest["净资产收益率"], latest["基本每股收益"], prices)]
+    vector = lambda: screen_roe(latest["净资产收益率"], latest["基本每股收益"], prices)
+    by_model = [m.reasonable_price if m else np.nan for m in scalar()]
+    assert np.allclose(by_model, vector()["reasonable_price"], equal_nan=True)
+    scalar_t, vector_t = _timeit(scalar, repeat=3), _timeit(vector, repeat=3)
+    print(f"ROE 倍数法 {codes} 只：逐只 {scalar_t * 1000:.1f}ms，向量化 {vector_t * 1000:.1f}ms"
+          f"（{scalar_t / vector_t:.0f}x，结果一致）")
+    results["roe"] = {"scalar_ms": scalar_t * 1000, "vectorized_ms": vector_t * 1000}
+    return results
+
+
+# ============================================================================
+# 估值模型注册表
+# ============================================================================
+
+def bench_models(codes=3000, years=3):
+    """注册表中的全部估值模型：逐只（输入解析一次 + 各模型一趟算完）vs 整批向量化，按模型分别计时，并核对两者结论一致"""
+    print("=" * 50)
+    print(f"🧮 估值模型注册表：{codes} 只股票 × {len(VALUATION_MODELS)} 个模型（{' / '.join(VALUATION_MODELS)}）")
+    print("=" * 50)
+    rng = np.random.default_rng(0)
+    index = [f"{600000 + i:06d}" for i in range(codes)]
+    # 财报按报告期倒序（与 select_finance_for_ai 一致）；约 5% 没有财报、约 3% 亏损（PE 为负）
+    finances = [make_financial_abstract(years=years, seed=i).iloc[::-1].reset_index(drop=True) for i in range(codes)]
+    for i in rng.choice(codes, codes // 20, replace=False):
+        finances[i] = pd.DataFrame()
+    pe = np.round(rng.uniform(5, 80, codes) * np.where(rng.random(codes) < 0.03, -1, 1), 2)
+    price = np.round(rng.uniform(3, 300, codes), 2)
+
+    scalar_timings = dict.fromkeys(VALUATION_MODELS, 0.0)
+    start = time.perf_counter()
+    resolved = [resolve_valuation_inputs(pe[i], price[i], finances[i]) for i in range(codes)]
+    resolve_t = time.perf_counter() - start
+    start = time.perf_counter()
+    records = []
+    for inputs in resolved:
+        timings = {}
+        records.append(evaluate_models(inputs, timings=timings))
+        for name, seconds in timings.items():
+            scalar_timings[name] += seconds
+    evaluate_t = time.perf_counter() - start
+
+    inputs_df = pd.DataFrame(resolved, index=index).astype(float)
+    vector_timings = {}
+    screened = screen_models(inputs_df, timings=vector_timings)
+    vector_t = _timeit(screen_models, inputs_df, repeat=3)
+
+    # 逐只与向量化的结论一致（列名为“模型前缀_assessment”）
+    prefixes = {"PE倍数法": "pe", "PEG模型": "peg", "ROE倍数法": "roe", "PB倍数法": "pb"}
+    for j, name in enumerate(VALUATION_MODELS):
+        column = f"{prefixes.get(name)}_assessment"
+        if column not in screened.columns:
+            continue
+        scalar = [r[j].assessment if r[j] else None for r in records]
+        assert scalar == screened[column].tolist(), name
+
+    print(f"逐只：输入解析 {resolve_t * 1000:.0f}ms，模型计算 {evaluate_t * 1000:.0f}ms；整批向量化 {vector_t * 1000:.1f}ms（结论一致）")
+    print(f"{'模型':<8} {'输入':<28} {'逐只合计(ms)':>12} {'向量化(ms)':>10} {'有结果':>6}")
+    results = {"resolve_ms": resolve_t * 1000, "evaluate_ms": evaluate_t * 1000, "vectorized_ms": vector_t * 1000, "models": {}}
+    for j, (name, model) in enumerate(VALUATION_MODELS.items()):
+        available = sum(r[j] is not None for r in records)
+        print(f"{name:<8} {', '.join(model.inputs):<28} {scalar_timings[name] * 1000:>12.1f} "
+              f"{vector_timings.get(name, float('nan')) * 1000:>10.2f} {available:>6}")
+        results["models"][name] = {"scalar_ms": scalar_timings[name] * 1000,
+                                   "vectorized_ms": vector_timings.get(name, float("nan")) * 1000, "available": available}
+    return results
+
+
+# ============================================================================
+# 财务数据仓库
+# ============================================================================
+
+def _loop_consecutive_roe(abstracts, threshold, years):
+    """逐只解析原表：按报告期倒序取最近 years 期，去掉“%”后逐个比较（不入库时的做法）"""
+    hits = []
+    for code, df in abstracts.items():
+        recent = df.sort_values(by=df.columns[0], ascending=False).head(years)
+        values = [float(str(v).replace("%", "")) for v in recent["净资产收益率"]]
+        if len(values) == years and all(v > threshold for v in values):
+            hits.append(code)
+    return hits
+
+
+def bench_fundamentals(codes=3000, years=12, streak=5):
+    """全市场“ROE 连续 N 年 > 15%”：每次逐只解析原表 vs 入库一次后在年报矩阵上查询"""
+    print("=" * 50)
+    print(f"📚 财务数据仓库：{codes} 只股票 × {years} 年年报")
+    print("=" * 50)
+    abstracts = {f"{600000 + i:06d}": make_financial_abstract(years=years, seed=i) for i in range(codes)}
+    warehouse = FundamentalsWarehouse(tempfile.mkdtemp(prefix="stockagent-fundamentals-"))
+
+    start = time.perf_counter()
+    warehouse.ingest_many(abstracts)
+    ingest_t = time.perf_counter() - start
+    start = time.perf_counter()
+    fresh = FundamentalsWarehouse(warehouse.root_dir)
+    fresh.table()
+    load_t = time.perf_counter() - start
+
+    expected = sorted(_loop_consecutive_roe(abstracts, 15, streak))
+    start = time.perf_counter()
+    got = fresh.consecutive([("roe", ">", 15)], streak)
+    first_t = time.perf_counter() - start
+    assert sorted(got["code"]) == expected
+    loop_t = _timeit(_loop_consecutive_roe, abstracts, 15, streak, repeat=1)
+    query_t = _timeit(fresh.consecutive, ["roe>15", "debt_ratio<60"], streak)
+    section_t = _timeit(fresh.cross_section, "net_profit")
+    stats = fresh.stats()
+    print(f"入库（单位换算 + 分桶写盘）：{ingest_t * 1000:.0f}ms，{stats['rows']} 行，内存 {stats['memory_bytes'] / 1e6:.1f}MB")
+    print(f"新进程读入：{load_t * 1000:.0f}ms")
+    print(f"ROE>15% 连续 {streak} 年（{len(expected)} 只）：逐只解析 {loop_t * 1000:.0f}ms，"
+          f"仓库首次 {first_t * 1000:.1f}ms（含展开矩阵），加条件再查 {query_t * 1000:.2f}ms")
+    print(f"最近一年净利润横截面：{section_t * 1000:.2f}ms")
+    return {"ingest_ms": ingest_t * 1000, "load_ms": load_t * 1000, "loop_ms": loop_t * 1000,
+            "first_query_ms": first_t * 1000, "query_ms": query_t * 1000}
+
+
+def _synthetic_quarterly_abstract(years, seed):
+    """年报 + 一季报 / 半年报 / 三季报的合成财务摘要（与年报同结构），用于覆盖回测的披露时点"""
+    annual = make_financial_abstract(years=years, seed=seed)
+    quarters = make_financial_abstract(years=years * 3, seed=seed + 1)
+    first = int(annual["报告期"].iloc[0])
+    quarters["报告期"] = [f"{first + i // 3}-{('03-31', '06-30', '09-30')[i % 3]}" for i in range(years * 3)]
+    return pd.concat([annual, quarters], ignore_index=True)
+
+
+def _available_on(report_date):
+    """报告期 -> 法定披露截止日（逐个计算，与 backtest.available_dates 对照）"""
+    if report_date.is_month_end and report_date.month in DISCLOSURE_DEADLINES:
+        years, month, day = DISCLOSURE_DEADLINES[report_date.month]
+        return pd.Timestamp(report_date.year + years, month, day)
+    return report_date + pd.Timedelta(days=DISCLOSURE_FALLBACK_DAYS)
+
+
+def _reference_observation(bars, history, period, freq, horizons):
+    """一只股票一个调仓期的标量回测：逐行筛选已披露的财报，evaluate_models 逐个模型估值，逐个持有期算收益"""
+    in_period = np.flatnonzero(bars["date"].dt.to_period(freq) == period.to_period(freq))
+    i = in_period[-1]
+    day, price = bars["date"].iloc[i], float(bars["close"].iloc[i])
+    known = [row for row in history.itertuples() if _available_on(row.report_date) <= day]
+    latest = max(known, key=lambda row: (_available_on(row.report_date), row.report_date), default=None)
+    annual = max((row for row in known if row.annual), key=lambda row: row.report_date, default=None)
+
+    def value(row, field):
+        number = getattr(row, field) if row is not None else None
+        return None if number is None or np.isnan(number) else float(number)
+
+    eps_annualized = value(latest, "eps") * 12 / latest.report_date.month if value(latest, "eps") is not None else None
+    bvps = value(annual, "bvps")
+    inputs = {
+        "price": price,
+        "pe": price / eps_annualized if eps_annualized else None,
+        "pb": price / bvps if bvps and bvps > 0 else None,
+        "net_profit_growth": value(latest, "net_profit_growth"),
+        "roe": value(annual, "roe"),
+        "eps": value(annual, "eps"),
+    }
+    records = evaluate_models(inputs)
+    closes = bars["close"].to_numpy()
+    returns = {h: closes[i + h] / closes[i] - 1 if i + h < len(closes) else np.nan for h in horizons}
+    return {model.assessment: (record.assessment if record else None)
+            for model, record in zip(VALUATION_MODELS.values(), records) if model.assessment}, returns
+
+
+def bench_backtest(codes=400, years=10, samples=300, freq="M", horizons=(20, 60, 120, 250)):
+    """估值信号回测：逐调仓期标量核对（抽样），单进程 vs 多进程整批回测的耗时，并外推到全市场 5000 只"""
+    print("=" * 50)
+    print(f"🧪 估值信号回测：{codes} 只股票 × {years} 年日线，按{FREQUENCIES[freq]}调仓")
+    print("=" * 50)
+    root = tempfile.mkdtemp(prefix="stockagent-backtest-")
+    code_list = [f"{600000 + i:06d}" for i in range(codes)]
+    start = time.perf_counter()
+    store = PriceStore(fetch_func=lambda code, *_: make_price_history(code, days=years * 365, seed=int(code)),
+                       root_dir=os.path.join(root, "bars"))
+    for code in code_list:
+        store.get_bars(code, datetime.now() - pd.Timedelta(days=years * 365))
+    warehouse = FundamentalsWarehouse(os.path.join(root, "fundamentals"))
+    warehouse.ingest_many({code: _synthetic_quarterly_abstract(years + 2, seed=int(code)) for code in code_list})
+    print(f"合成数据落盘：{time.perf_counter() - start:.1f} 秒")
+
+    options = dict(freq=freq, horizons=horizons, price_dir=store.root_dir, warehouse=warehouse)
+    serial, parallel = {}, {}
+    observations = run_backtest(workers=1, stats=serial, **options)
+    workers = max(2, os.cpu_count() or 1)
+    pd.testing.assert_frame_equal(
+        observations, run_backtest(workers=workers, chunk_size=-(-codes // workers), stats=parallel, **options))
+
+    # 抽样核对：向量化结果与逐只逐期的标量计算一致（分档完全相同，收益按 float32 精度）
+    rng = np.random.default_rng(0)
+    checked = observations.iloc[np.sort(rng.choice(len(observations), size=min(samples, len(observations)), replace=False))]
+    for row in checked.itertuples(index=False):
+        bars = store.local_bars(row.code)
+        labels, returns = _reference_observation(bars, warehouse.history(row.code), row.period, freq, horizons)
+        for column, label in labels.items():
+            got = getattr(row, column)
+            assert (None if pd.isna(got) else got) == label, (row.code, row.period, column, got, label)
+        for h, expected in returns.items():
+            got = getattr(row, f"fwd_{h}")
+            assert np.isnan(expected) == np.isnan(got) and (np.isnan(expected) or np.isclose(got, expected, rtol=1e-5)), \
+                (row.code, row.period, h, got, expected)
+
+    per_code = serial["seconds"] / codes
+    print(f"观测：{serial['rows']} 行（{serial['periods']} 个调仓期），抽样 {len(checked)} 行与标量计算一致")
+    print(f"{'方式':<14} {'批数':>4} {'进程':>4} {'耗时(s)':>9} {'每只(ms)':>9} {'全市场 5000 只外推(s)':>22}")
+    for name, stats in (("单进程", serial), (f"{workers} 进程", parallel)):
+        seconds = stats["seconds"]
+        print(f"{name:<14} {stats['chunks']:>4} {stats['workers']:>4} {seconds:>9.2f} {seconds / codes * 1000:>9.2f} "
+              f"{seconds / codes * 5000:>22.1f}")
+    if (os.cpu_count() or 1) < 2:
+        print("   （本机只有 1 个 CPU，多进程只验证结果一致，看不出加速）")
+
+    summary = summarize(observations)
+    print("60 日超额收益%（合成随机游走，各档应接近 0）：")
+    for name, rows in summary[summary["horizon"] == 60].groupby("model", sort=False):
+        print(f"   {name}：" + " | ".join(f"{r.assessment} {r.excess_return:+.2f}" for r in rows.itertuples()))
+    return {"rows": serial["rows"], "serial_s": serial["seconds"], "parallel_s": parallel["seconds"],
+            "per_code_ms": per_code * 1000, "full_market_s": per_code * 5000}
+
+
+# ============================================================================
+# 分析流程分阶段基准（回放数据）
+# ============================================================================
+
+def _percentiles(samples):
+    samples = np.asarray(samples) * 1000
+    return {"p50_ms": float(np.percentile(samples, 50)), "p95_ms": float(np.percentile(samples, 95))}
+
+
+def _peak_memory(func):
+    """单次运行的内存峰值（KB），与计时分开测量，避免 tracemalloc 影响耗时"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def pipeline_stages(fixtures_dir, code):
+    """按单股深度分析的顺序准备各阶段的调用，返回 [(阶段名, 函数)]"""
+    with replaying(fixtures_dir):
+        spot = pd.read_parquet(os.path.join(fixtures_dir, "stock_zh_a_spot_em", "all.parquet"))
+        dividend_df = pd.read_parquet(os.path.join(fixtures_dir, "stock_dividend_cninfo", f"{code}.parquet"))
+        finance_df = fetch_financial_abstract(code)
+
+    stock_df = spot.drop(columns=["序号"], errors="ignore").set_index("代码", drop=False).rename_axis(None)
+    row = stock_df.loc[code]
+    index = SymbolIndex.from_snapshot(stock_df)
+    finance_recent, finance_for_ai, _ = select_finance_for_ai(finance_df)
+    dividend = parse_dividend_data(dividend_df.copy())
+    models = AnalysisEngine.valuate(row["市盈率-动态"], row["最新价"], finance_recent)
+    price_range = PriceRange(high_52w=row["最新价"] * 1.2, low_52w=row["最新价"] * 0.8)
+
+    return [
+        ("检索", lambda: index.search(row["名称"], limit=10)),
+        ("财报筛选", lambda: select_finance_for_ai(finance_df)),
+        ("分红解析", lambda: parse_dividend_data(dividend_df.copy())),
+        ("估值", lambda: AnalysisEngine.valuate(row["市盈率-动态"], row["最新价"], finance_recent)),
+        ("提示词构建", lambda: build_report_messages(
+            row["名称"], finance_for_ai, datetime.now().strftime("%Y-%m-%d"), row["最新价"],
+            row["市盈率-动态"], row["涨跌幅"], price_range, dividend, models)),
+    ]
+
+
+def bench_prompt_tokens(fixtures_dir=None, budgets=(0, 600, 450)):
+    """提示词紧凑化前后的 token 数（本地估算），以及不同预算下被精简的段落"""
+    if fixtures_dir is None:
+        fixtures_dir = tempfile.mkdtemp(prefix="stockagent-fixtures-")
+        write_synthetic_fixtures(fixtures_dir)
+    manifest = load_manifest(fixtures_dir)
+
+    print("=" * 50)
+    print(f"🧮 提示词 token 数（{manifest['source']} 回放数据）")
+    print("=" * 50)
+    results = {}
+    for code in manifest["codes"]:
+        with replaying(fixtures_dir):
+            spot = pd.read_parquet(os.path.join(fixtures_dir, "stock_zh_a_spot_em", "all.parquet"))
+            dividend = fetch_dividend_data(code)
+            finance_recent, finance_for_ai, _ = select_finance_for_ai(fetch_financial_abstract(code))
+        row = spot.set_index("代码").loc[code]
+        models = AnalysisEngine.valuate(row["市盈率-动态"], row["最新价"], finance_recent)
+        price_range = PriceRange(high_52w=row["最新价"] * 1.2, low_52w=row["最新价"] * 0.8)
+        args = (row["名称"], finance_for_ai, datetime.now().strftime("%Y-%m-%d"), row["最新价"],
+                row["市盈率-动态"], row["涨跌幅"], price_range, dividend, models)
+        for budget in budgets:
+            messages, stats = compose_report_messages(*args, token_budget=budget)
+            results[f"{code}/{budget}"] = stats.to_dict()
+            print(f"{code:>8} 预算 {budget or '不限':>5}：{stats.tokens_before} → {stats.tokens_after} tokens"
+                  f"（-{1 - stats.tokens_after / stats.tokens_before:.0%}）"
+                  + (f"，精简：{'、'.join(stats.trimmed)}" if stats.trimmed else ""))
+    return results
+
+
+def bench_faults(fixtures_dir=None, calls=300, failure_rates=(0.0, 0.2, 0.5, 1.0), latency=0.002):
+    """按不同失败概率向上游注入故障，统计分红 / 财报抓取的成功率、旧数据比例、重试次数与耗时
+
+    每只股票先无故障抓取一次，留下可回退的数据；全程不使用落盘数据，每次都访问（回放的）上游。
+    退避与熔断时间按比例缩短，几秒内跑完。
+    """
+    if fixtures_dir is None:
+        fixtures_dir = tempfile.mkdtemp(prefix="stockagent-fixtures-")
+        write_synthetic_fixtures(fixtures_dir)
+    codes = load_manifest(fixtures_dir)["codes"]
+
+    print("=" * 50)
+    print(f"🛡️ 上游容错（注入故障，{calls} 次抓取）")
+    print("=" * 50)
+    print(f"{'失败概率':>8} {'直接调用':>8} {'新数据':>7} {'旧数据':>7} {'失败':>6} {'重试':>6} {'熔断':>5} {'p50(ms)':>9} {'p95(ms)':>9}")
+    results = {}
+    for rate in failure_rates:
+        upstream = Upstream(timeout=0.5, retry=RetryPolicy(retries=2, base=0.005, rng=random.Random(0)),
+                            last_good=LastGoodStore(tempfile.mkdtemp(prefix="stockagent-upstream-")),
+                            breaker_factory=lambda: CircuitBreaker(threshold=5, reset_after=0.05))
+        previous = set_upstream(upstream)
+        outcomes, samples = {"fresh": 0, "stale": 0, "failed": 0}, []
+        try:
+            with replaying(fixtures_dir, latency=latency), refreshing():
+                for code in codes:
+                    fetch_dividend_data(code)
+                    fetch_financial_abstract(code)
+                upstream.faults = FaultSchedule(rates=dict.fromkeys(ENDPOINTS, rate), seed=0)
+                for i in range(calls):
+                    code = codes[i % len(codes)]
+                    fetch, endpoint = ((fetch_dividend_data, "stock_dividend_cninfo") if i % 2 == 0
+                                       else (fetch_financial_abstract, "stock_financial_abstract_ths"))
+                    start = time.perf_counter()
+                    try:
+                        fetch(code)
+                        outcomes["stale" if upstream.is_stale(endpoint, code) else "fresh"] += 1
+                    except Exception:
+                        outcomes["failed"] += 1
+                    samples.append(time.perf_counter() - start)
+        finally:
+            set_upstream(previous)
+
+        endpoints = upstream.stats()["endpoints"]
+        stats = dict(_percentiles(samples), **{k: v / calls for k, v in outcomes.items()},
+                     retries=sum(e["retries"] for e in endpoints.values()),
+                     trips=sum(e["trips"] for e in endpoints.values()))
+        results[f"{rate:g}"] = stats
+        print(f"{rate:>8.0%} {1 - rate:>8.0%} {stats['fresh']:>7.0%} {stats['stale']:>7.0%} {stats['failed']:>6.0%} "
+              f"{stats['retries']:>6} {stats['trips']:>5} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f}")
+    return results
+
+
+def _fresh_process_analyze(code, env):
+    """在新进程里跑一次单股分析，返回各阶段耗时（ms）"""
+    out = subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "run.py"),
+                          "analyze", code, "--json"], env=env, capture_output=True, text=True, check=True).stdout
+    return {r["span"]: r["wall_ms"] for r in json.loads(out.splitlines()[-1])["timings"]}
+
+
+def bench_warm_start(fixtures_dir=None, latency=0.2):
+    """新进程首次分析的各阶段耗时：冷启动 vs 自选股预热之后（回放抓取附加 latency 秒模拟网络）"""
+    if fixtures_dir is None:
+        fixtures_dir = tempfile.mkdtemp(prefix="stockagent-fixtures-")
+        write_synthetic_fixtures(fixtures_dir)
+    codes = load_manifest(fixtures_dir)["codes"]
+    cache_dir = tempfile.mkdtemp(prefix="stockagent-cache-")
+    watchlist = os.path.join(cache_dir, "watchlist.txt")
+    with open(watchlist, "w", encoding="utf-8") as f:
+        f.write("\n".join(codes))
+    env = dict(os.environ, STOCKAGENT_CACHE_DIR=cache_dir, STOCKAGENT_REPLAY_DIR=fixtures_dir,
+               STOCKAGENT_REPLAY_LATENCY=str(latency), STOCKAGENT_WATCHLIST=watchlist, STOCKAGENT_TRACE_LOG="")
+
+    print("=" * 50)
+    print(f"🔥 新进程首次分析：冷启动 vs 预热后（模拟延迟 {latency:g} 秒）")
+    print("=" * 50)
+    # 行情快照先落盘，两组只比较单股数据的抓取
+    cold = _fresh_process_analyze(codes[0], env)
+    subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "run.py"),
+                    "warm", "--once", "--spread", "0"], env=env, capture_output=True, check=True)
+    warm = _fresh_process_analyze(codes[1 % len(codes)], env)
+    stages = ("财报", "日线", "趋势", "分红", "股息率分位")
+    print(f"{'阶段':<8} {'冷启动(ms)':>11} {'预热后(ms)':>11}")
+    for stage in stages:
+        print(f"{stage:<8} {cold.get(stage, 0):>11.0f} {warm.get(stage, 0):>11.0f}")
+    cold_total, warm_total = sum(cold.get(s, 0) for s in stages), sum(warm.get(s, 0) for s in stages)
+    print(f"{'合计':<8} {cold_total:>11.0f} {warm_total:>11.0f}（{cold_total / max(warm_total, 1e-9):.1f}x）")
+    return {"cold": cold, "warm": warm}
+
+
+def bench_pipeline(fixtures_dir=None, runs=200, latency=0.0):
+    """对分析流程各阶段计时（p50 / p95）并测量内存峰值；latency > 0 时附加回放抓取阶段"""
+    if fixtures_dir is None:
+        fixtures_dir = tempfile.mkdtemp(prefix="stockagent-fixtures-")
+        write_synthetic_fixtures(fixtures_dir)
+    manifest = load_manifest(fixtures_dir)
+
+    print("=" * 50)
+    print(f"🧪 分析流程分阶段耗时（{manifest['source']} 回放数据，{runs} 次）")
+    print("=" * 50)
+    print(f"{'代码':>8} {'阶段':<8} {'p50(ms)':>9} {'p95(ms)':>9} {'内存峰值(KB)':>12}")
+
+    results = {}
+    for code in manifest["codes"]:
+        stages = pipeline_stages(fixtures_dir, code)
+        if latency > 0:
+            def fetch_stage():
+                with replaying(fixtures_dir, latency=latency), refreshing():
+                    fetch_dividend_data(code)
+                    fetch_financial_abstract(code)
+            stages.append(("回放抓取", fetch_stage))
+
+        for name, func in stages:
+            stage_runs = runs if name != "回放抓取" else 5
+            samples = []
+            for _ in range(stage_runs):
+                start = time.perf_counter()
+                func()
+                samples.append(time.perf_counter() - start)
+            stats = dict(_percentiles(samples), peak_kb=_peak_memory(func))
+            results[f"{code}/{name}"] = stats
+            print(f"{code:>8} {name:<8} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} {stats['peak_kb']:>12.1f}")
+    return results
+
+
+def compare_with_baseline(results, baseline, tolerance=1.5, floor_ms=1.0):
+    """对比 p95 与基线，返回超出 tolerance 倍的阶段列表（亚毫秒级阶段按 floor_ms 计，避免计时抖动误报）"""
+    regressions = []
+    for key, stats in results.items():
+        if key not in baseline:
+            continue
+        limit = max(baseline[key]["p95_ms"], floor_ms) * tolerance
+        if stats["p95_ms"] > limit:
+            regressions.append((key, baseline[key]["p95_ms"], stats["p95_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StockAgent 离线性能基准")
+    parser.add_argument("suite", nargs="?", default="all", choices=["all", "pipeline", "records", "yields", "trend", "prompt", "faults", "warm", "fundamentals", "numeric", "models", "snapshot", "backtest"])
+    parser.add_argument("--fixtures", help="回放数据目录（默认临时生成合成数据）")
+    parser.add_argument("--runs", type=int, default=200, help="每个阶段的运行次数")
+    parser.add_argument("--latency", type=float, default=0.0, help="回放抓取的模拟延迟（秒）")
+    parser.add_argument("--json", help="把分阶段结果写入 JSON 文件")
+    parser.add_argument("--baseline", help="与基线 JSON 对比 p95，超过 --tolerance 倍时返回非 0")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args()
+
+    print("\n🔍 StockAgent 性能基准（离线）")
+    if args.suite == "records":
+        bench_record_memory()
+        return
+    if args.suite == "yields":
+        bench_yield_rank()
+        return
+    if args.suite == "trend":
+        bench_trend()
+        return
+    if args.suite == "prompt":
+        bench_prompt_tokens(args.fixtures)
+        return
+    if args.suite == "faults":
+        bench_faults(args.fixtures)
+        return
+    if args.suite == "warm":
+        bench_warm_start(args.fixtures)
+        return
+    if args.suite == "fundamentals":
+        bench_fundamentals()
+        return
+    if args.suite == "numeric":
+        bench_numeric()
+        return
+    if args.suite == "models":
+        bench_models()
+        return
+    if args.suite == "snapshot":
+        bench_snapshot_memory()
+        return
+    if args.suite == "backtest":
+        bench_backtest()
+        return
+    if args.suite == "all":
+        bench_dividend_parsing()
+        bench_report_engine()
+        bench_stream_render()
+        bench_record_memory()
+        bench_yield_rank()
+        bench_trend()
+        bench_prompt_tokens(args.fixtures)
+        bench_faults(args.fixtures)
+        bench_warm_start(args.fixtures)
+        bench_fundamentals()
+        bench_numeric()
+        bench_models()
+        bench_snapshot_memory()
+        bench_backtest()
+
+    results = bench_pipeline(args.fixtures, runs=args.runs, latency=args.latency)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_with_baseline(results, json.load(f), tolerance=args.tolerance)
+        for key, before, after in regressions:
+            print(f"❌ 性能回退 {key}：p95 {before:.3f}ms → {after:.3f}ms")
+        if regressions:
+            sys.exit(1)
+        print("✅ 未发现性能回退")
+
+
+if __name__ == "__main__":
+    main()
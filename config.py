@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+全局配置 - 本地缓存目录与数据刷新周期（均可在 .env 中覆盖）
+"""
+
+import os
+from dotenv import load_dotenv
+
+# 加载 .env 文件中的环境变量
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 本地缓存根目录（行情快照等持久化数据）
+CACHE_DIR = os.getenv("STOCKAGENT_CACHE_DIR", os.path.join(BASE_DIR, ".cache"))
+
+# 财务数据仓库目录（全部历史财务摘要，按代码分桶的 Parquet）
+FUNDAMENTALS_DIR = os.path.join(CACHE_DIR, "fundamentals")
+
+# 行情快照后台刷新间隔（秒）
+SNAPSHOT_REFRESH_INTERVAL = int(os.getenv("SNAPSHOT_REFRESH_INTERVAL", "300"))
+
+# 行情快照可直接使用的最大时长（秒），超过后查询仍返回旧数据，但会触发后台刷新
+SNAPSHOT_MAX_AGE = int(os.getenv("SNAPSHOT_MAX_AGE", "600"))
+
+# 批量分析：并发线程数、单个数据源每秒最多请求数（失败重试由上游容错层统一负责，见 UPSTREAM_RETRIES）
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))
+BATCH_HOST_RATE = float(os.getenv("BATCH_HOST_RATE", "3"))
+
+# 日线行情本地存储目录
+BARS_DIR = os.path.join(CACHE_DIR, "bars")
+
+# 估值信号回测：进程数（0 为 CPU 核数）、每个进程一次处理的股票数
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", "0"))
+BACKTEST_CHUNK = int(os.getenv("BACKTEST_CHUNK", "250"))
+
+# AI 研报异步生成：同时进行的生成数、每分钟 token 预算
+REPORT_CONCURRENCY = int(os.getenv("REPORT_CONCURRENCY", "4"))
+REPORT_TPM = int(os.getenv("REPORT_TPM", "120000"))
+
+# AI 研报缓存：目录、有效期（秒）、占用上限（MB，超出后淘汰最久未访问的报告）
+REPORTS_DIR = os.path.join(CACHE_DIR, "reports")
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", "86400"))
+REPORT_CACHE_MAX_BYTES = int(float(os.getenv("REPORT_CACHE_MAX_MB", "50")) * 1024 * 1024)
+
+# 离线回放：设置目录后 akshare 接口改为读取 replay.py 录制的数据，可附加模拟延迟（秒）
+REPLAY_DIR = os.getenv("STOCKAGENT_REPLAY_DIR", "")
+REPLAY_LATENCY = float(os.getenv("STOCKAGENT_REPLAY_LATENCY", "0"))
+
+# 分阶段计时：JSON Lines 日志路径（设为空字符串关闭），Prometheus 指标端口（0 表示不开启）
+TRACE_LOG_PATH = os.getenv("STOCKAGENT_TRACE_LOG", os.path.join(CACHE_DIR, "traces", "spans.jsonl"))
+METRICS_PORT = int(os.getenv("STOCKAGENT_METRICS_PORT", "0"))
+
+# 请求合并：抓取结果在进程内共享的有效期（秒），本地 HTTP 接口端口
+FETCH_CACHE_TTL = int(os.getenv("FETCH_CACHE_TTL", "300"))
+API_PORT = int(os.getenv("STOCKAGENT_API_PORT", "8600"))
+
+# 研报提示词输入 token 上限（本地估算，0 表示不限），超出时按优先级精简或省略段落
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2500"))
+
+# 上游容错：单次请求超时（秒）、网络错误重试次数与退避基数（秒），连续失败多少次熔断、熔断后多久试探（秒）
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "20"))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", "0.5"))
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "60"))
+
+# 上游不可用时回退使用的最近一次成功数据：目录、最长可用时长（秒，0 表示不限）
+UPSTREAM_DIR = os.path.join(CACHE_DIR, "upstream")
+UPSTREAM_STALE_MAX_AGE = int(os.getenv("UPSTREAM_STALE_MAX_AGE", str(7 * 86400)))
+
+# 故障注入（测试用）：接口=失败概率 或 接口=ok,error,timeout,...，多个接口用分号分隔
+UPSTREAM_FAULTS = os.getenv("STOCKAGENT_FAULTS", "")
+
+# 缓存预热：自选股列表文件（每行一个代码 / 名称，或带“代码”列的 CSV）、每天的预热时间（收盘后，逗号分隔），
+# 一轮预热的请求在多少秒内均匀摊开，预热覆盖的股票落盘的分红 / 财报在多久内直接使用（秒，不访问上游）
+WATCHLIST_PATH = os.getenv("STOCKAGENT_WATCHLIST", os.path.join(BASE_DIR, "watchlist.txt"))
+WARM_TIMES = os.getenv("WARM_TIMES", "15:45")
+WARM_SPREAD = float(os.getenv("WARM_SPREAD", "600"))
+WARM_MAX_AGE = int(os.getenv("WARM_MAX_AGE", "86400"))
+# 其余股票（交互分析、批量分析）落盘的分红 / 财报在多久内直接使用（秒，0 表示总是访问上游）
+FETCH_MAX_AGE = int(os.getenv("FETCH_MAX_AGE", "3600"))
+
+# A 股收盘时间：之后当天的日线视为已定，可以落盘
+MARKET_CLOSE = os.getenv("MARKET_CLOSE", "15:05")
@@ -0,0 +1,582 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+分析引擎 - 不依赖 Streamlit 的单股分析流程（检索 → 财报 → 价格 / 分红 → 估值 → 提示词 → AI 报告），
+页面、命令行与定时任务共用；akshare / openai / pypinyin 在首次用到时才导入
+
+    from engine import analyze
+    result = analyze("600519")
+    print(result.valuation_models)
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+
+from config import REPLAY_DIR, REPLAY_LATENCY, FETCH_CACHE_TTL
+from fetchers import (
+    EMPTY_PRICE_RANGE, EMPTY_TREND, EMPTY_DIVIDEND, SOURCE_ENDPOINTS,
+    fetch_52week_price_range, fetch_trend_signals, fetch_dividend_data, fetch_financial_abstract, fetch_yield_history,
+)
+from prompts import compose_report_messages, select_finance_for_ai, REPORT_TEMPERATURE
+from records import PriceRange, TrendSignals, DividendInfo, DividendPercentile, PromptStats, YieldHistory
+from report_cache import get_report_cache, report_key, replay_report
+from resilience import get_upstream
+from singleflight import SingleFlight, TTLCache
+from snapshot_store import SnapshotStore, decode_snapshot, format_age
+from tracing import Trace, annotate
+from valuation import (
+    calculate_dividend_yield, analyze_dividend_percentile, evaluate_models, rank_dividend_yields, resolve_valuation_inputs,
+)
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+
+# 数据源名称 -> 抓取函数（名称与 batch_analysis.DATA_SOURCES 一致）
+FETCHERS = {
+    "price_range": fetch_52week_price_range,
+    "trend": fetch_trend_signals,
+    "dividend": fetch_dividend_data,
+    "finance": fetch_financial_abstract,
+}
+
+_MISSING = object()
+
+
+@dataclass
+class AnalysisResult:
+    """一次单股分析的结果"""
+
+    code: str
+    name: str
+    price: Optional[float]
+    pe: Optional[float]
+    change_pct: Optional[float]
+    date: str
+    finance: pd.DataFrame = field(repr=False)            # 最近 10 期财报
+    finance_for_ai: pd.DataFrame = field(repr=False)     # 发给 AI 的关键指标
+    missing_fields: list = field(default_factory=list)   # 财报中未识别的必需字段
+    price_range: PriceRange = EMPTY_PRICE_RANGE
+    trend: TrendSignals = EMPTY_TREND                    # 20 / 60 / 250 日高低点、均线、ATR 与突破信号
+    dividend: DividendInfo = EMPTY_DIVIDEND
+    dividend_yield: Optional[float] = None
+    dividend_percentile: Optional[DividendPercentile] = None    # 当前股息率在历史股息率中的分位
+    valuation_models: list = field(default_factory=list)
+    candidates: list = field(default_factory=list)       # 检索到的其他候选
+    messages: list = field(default_factory=list, repr=False)
+    prompt_stats: Optional[PromptStats] = None          # 提示词紧凑化前后的 token 数
+    report: Optional[str] = None
+    report_cached: bool = False
+    stale: dict = field(default_factory=dict)            # 上游不可用、使用了旧数据的数据源 -> 数据年龄（秒，未知为 None）
+    errors: dict = field(default_factory=dict)           # 获取失败（按空数据继续分析）的数据源 -> 错误信息
+    trace: Optional[Trace] = field(default=None, repr=False)
+
+    def to_dict(self):
+        """可直接 json.dumps 的字典（DataFrame 转为记录列表）"""
+        return {
+            "code": self.code,
+            "name": self.name,
+            "price": self.price,
+            "pe": self.pe,
+            "change_pct": self.change_pct,
+            "date": self.date,
+            "finance": self.finance_for_ai.to_dict(orient="records"),
+            "missing_fields": self.missing_fields,
+            "price_range": self.price_range.to_dict(),
+            "trend": {**self.trend.to_dict(), "alignment": self.trend.alignment},
+            "dividend": self.dividend.to_dict(),
+            "dividend_yield": self.dividend_yield,
+            "dividend_percentile": self.dividend_percentile.to_dict() if self.dividend_percentile else None,
+            "valuation_models": [m.to_dict() for m in self.valuation_models if m],
+            "candidates": self.candidates,
+            "prompt": self.prompt_stats.to_dict() if self.prompt_stats else None,
+            "report": self.report,
+            "report_cached": self.report_cached,
+            "stale": self.stale,
+            "errors": self.errors,
+            "timings": self.trace.records() if self.trace else [],
+        }
+
+
+class _SharedStream:
+    """后台线程正在生成的报告：读取方先读到已生成的分片，再随生成逐段读取"""
+
+    def __init__(self):
+        self._parts = []
+        self._closed = False
+        self._error = None
+        self.usage = None
+        self._cond = threading.Condition()
+
+    def append(self, delta):
+        with self._cond:
+            self._parts.append(delta)
+            self._cond.notify_all()
+
+    def close(self, error=None):
+        with self._cond:
+            self._closed = True
+            self._error = error
+            self._cond.notify_all()
+
+    def follow(self):
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self._parts) and not self._closed:
+                    self._cond.wait()
+                new, closed, error = self._parts[i:], self._closed, self._error
+            i += len(new)
+            yield from new
+            if closed and i >= len(self._parts):
+                if error is not None:
+                    raise error
+                return
+
+
+class ReportStream:
+    """可迭代的报告流：逐段产出文本。cached / created_at 创建时即确定，usage 在读完后可用
+
+    同一份报告（提示词指纹相同）同时被多个请求生成时，只调用一次模型：模型输出在后台线程中读完并写入缓存，
+    发起生成的请求与其余请求一样只跟随共享的输出，任何一方中途断开（客户端关闭连接、会话结束）都不影响其他人。
+    """
+
+    def __init__(self, engine, messages, api_key, model, force_refresh=False):
+        self._engine = engine
+        self.messages = messages
+        self.api_key = api_key
+        self.model = model
+        self.usage = None
+        self.content = None
+        self._cache = engine.report_cache
+        self._key = report_key(model, messages, REPORT_TEMPERATURE)
+        self._entry = None if force_refresh else self._cache.get(self._key)
+        self.cached = self._entry is not None
+        self.created_at = self._entry["created_at"] if self.cached else None
+
+    def __iter__(self):
+        if self.cached:
+            annotate(cache="hit")
+            self.content = self._entry["content"]
+            self.usage = self._entry.get("usage")
+            yield from replay_report(self.content)
+            return
+
+        call, leader = self._engine.report_flight.join(self._key)
+        if leader:
+            annotate(cache="miss")
+            shared = _SharedStream()
+            call.resolve(shared)
+            threading.Thread(target=self._produce, args=(shared,), daemon=True, name="report-stream").start()
+        else:
+            annotate(cache="shared")
+            shared = call.wait()
+
+        parts = []
+        for delta in shared.follow():
+            parts.append(delta)
+            yield delta
+        self.content = "".join(parts)
+        self.usage = shared.usage
+        if leader and self.usage:
+            annotate(prompt_tokens=self.usage.get("prompt_tokens"), completion_tokens=self.usage.get("completion_tokens"))
+
+    def _produce(self, shared):
+        """后台线程：调用模型并逐段写入共享输出；失败时所有读取方收到同一个异常"""
+        error = None
+        try:
+            shared.usage = self._generate(shared)
+        except Exception as e:
+            error = e
+        except BaseException:
+            error = RuntimeError("报告生成已中断")
+            raise
+        finally:
+            # 先允许重新生成（完整的报告此时已在缓存中），再结束读取方的等待
+            self._engine.report_flight.forget(self._key)
+            shared.close(error)
+
+    def _generate(self, shared):
+        """读完模型的流式输出，完整生成的报告写入缓存，返回用量"""
+        response = self._engine.openai_client(self.api_key).chat.completions.create(
+            model=self.model,
+            messages=self.messages,
+            temperature=REPORT_TEMPERATURE,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        parts, usage = [], None
+        for chunk in response:
+            # 开启 include_usage 后最后一个分片只有用量、没有 choices
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage.model_dump()
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                shared.append(chunk.choices[0].delta.content)
+        # 只缓存完整生成的报告
+        self._cache.put(self._key, "".join(parts), model=self.model, usage=usage)
+        return usage
+
+
+class AnalysisEngine:
+    """单股分析引擎：各步骤可单独调用（页面逐步展示进度），也可用 analyze() 一次跑完
+
+    同一进程内的多个会话 / 请求共用一个引擎：同一股票同一数据源的并发抓取只访问一次上游，
+    结果在 fetch_cache_ttl 秒内直接复用。
+    """
+
+    def __init__(self, snapshot_store=None, report_cache=None, base_url=DEEPSEEK_BASE_URL, background_refresh=False,
+                 fetch_cache_ttl=FETCH_CACHE_TTL):
+        self._snapshot_store = snapshot_store
+        self._background_refresh = background_refresh
+        self.report_cache = report_cache or get_report_cache()
+        self.base_url = base_url
+        self._index = None
+        self._index_version = None
+        self._clients = {}
+        self._lock = threading.Lock()
+        self.fetch_flight = SingleFlight()
+        self.fetch_cache = TTLCache(fetch_cache_ttl)
+        self.report_flight = SingleFlight()
+        self.upstream = get_upstream()
+
+    # ------------------------------------------------------------------
+    # 行情快照与检索
+    # ------------------------------------------------------------------
+
+    @property
+    def snapshot_store(self):
+        with self._lock:
+            if self._snapshot_store is None:
+                self._snapshot_store = SnapshotStore()
+                if self._background_refresh:
+                    self._snapshot_store.start_background_refresh()
+            return self._snapshot_store
+
+    def symbol_index(self):
+        """按快照版本缓存的检索索引（pypinyin 词典较大，首次检索时才导入）"""
+        from symbol_index import SymbolIndex
+        store = self.snapshot_store
+        stock_df = store.get()
+        with self._lock:
+            if self._index is None or self._index_version != store.version:
+                self._index = SymbolIndex.from_snapshot(stock_df)
+                self._index_version = store.version
+            return self._index
+
+    def lookup(self, query, limit=10):
+        """检索股票，返回 (快照行 或 None, 候选列表)"""
+        candidates = self.symbol_index().search(query, limit=limit)
+        row = self.snapshot_store.row(candidates[0]['code']) if candidates else None
+        return row, candidates
+
+    # ------------------------------------------------------------------
+    # 数据与估值
+    # ------------------------------------------------------------------
+
+    def fetch(self, source, code):
+        """抓取一个数据源：先查共享缓存，未命中时合并同一 (数据源, 代码) 的并发请求；
+        上游不可用时得到的旧数据不进共享缓存，下一次请求会重新访问上游"""
+        code = str(code)
+        return self._cached((source, code), lambda: FETCHERS[source](code),
+                            keep=lambda: not self.upstream.is_stale(SOURCE_ENDPOINTS[source], code))
+
+    def _cached(self, key, loader, keep=None):
+        value = self.fetch_cache.get(key, _MISSING)
+        if value is not _MISSING:
+            annotate(cache="hit")
+            return value
+
+        def load():
+            data = loader()
+            if keep is None or keep():
+                self.fetch_cache.put(key, data)
+            return data
+
+        value, shared = self.fetch_flight.do(key, load)
+        annotate(cache="shared" if shared else "miss")
+        return value
+
+    def fetch_finance(self, code):
+        """财务摘要，返回 (最近 10 期, 发给 AI 的关键指标, 列名映射)"""
+        return select_finance_for_ai(self.fetch("finance", code))
+
+    def fetch_price_range(self, code):
+        """近一年最高 / 最低价"""
+        return self.fetch("price_range", code)
+
+    def fetch_trend(self, code):
+        """滚动高低点、均线、ATR 与突破信号"""
+        return self.fetch("trend", code)
+
+    def fetch_dividend(self, code):
+        """最新派息与历史派息"""
+        return self.fetch("dividend", code)
+
+    def fetch_yield_history(self, code, dividend=None):
+        """历史股息率序列（除权日与日线 as-of 对齐），按代码缓存"""
+        if dividend is None:
+            dividend = self.fetch_dividend(code)
+        return self._cached(("yield_history", str(code)), lambda: fetch_yield_history(str(code), dividend))
+
+    def rank_dividend_yields(self, codes, prices=None):
+        """自选股当前股息率的历史分位排名；prices 缺省时使用行情快照的最新价"""
+        if prices is None:
+            stock_df = decode_snapshot(self.snapshot_store.get()[["代码", "最新价"]])
+            prices = stock_df["最新价"].set_axis(stock_df["代码"].astype(str))
+        return rank_dividend_yields([self.fetch_yield_history(code) for code in codes], prices)
+
+    def stale_sources(self, code):
+        """上游不可用、当前使用旧数据的数据源 -> 数据年龄（秒，未知为 None）；行情快照刷新失败时也计入"""
+        code = str(code)
+        stale = {source: self.upstream.stale_age(endpoint, code)
+                 for source, endpoint in SOURCE_ENDPOINTS.items() if self.upstream.is_stale(endpoint, code)}
+        store = self.snapshot_store
+        if store.last_error is not None and store.is_stale():
+            stale["snapshot"] = store.age_seconds()
+        return stale
+
+    def stats(self):
+        """请求合并、共享缓存、上游容错与行情快照（已加载时）统计"""
+        return {
+            "fetch": {**self.fetch_flight.stats(), **self.fetch_cache.stats()},
+            "report": {**self.report_flight.stats(), **self.report_cache.stats()},
+            "upstream": self.upstream.stats(),
+            "snapshot": self._snapshot_store.status() if self._snapshot_store is not None else None,
+        }
+
+    @staticmethod
+    def valuate(pe, price, finance_recent):
+        """多维度估值：输入（PE、现价、最近年报的 ROE / 每股收益 / 每股净资产、最近一期增长率）只解析一次，
+        注册表中的全部模型一趟算完，各模型耗时（毫秒）记在当前阶段上"""
+        timings = {}
+        models = evaluate_models(resolve_valuation_inputs(pe, price, finance_recent), timings=timings)
+        annotate(**{f"{name}_ms": round(seconds * 1000, 3) for name, seconds in timings.items()})
+        return models
+
+    # ------------------------------------------------------------------
+    # AI 报告
+    # ------------------------------------------------------------------
+
+    def openai_client(self, api_key):
+        """按 API Key 复用同一个客户端（及其连接池）"""
+        with self._lock:
+            if api_key not in self._clients:
+                from openai import OpenAI
+                self._clients[api_key] = OpenAI(api_key=api_key, base_url=self.base_url)
+            return self._clients[api_key]
+
+    def stream_report(self, messages, api_key, model="deepseek-chat", force_refresh=False):
+        """返回报告流（相同提示词命中缓存时直接回放）"""
+        return ReportStream(self, messages, api_key, model, force_refresh=force_refresh)
+
+    # ------------------------------------------------------------------
+    # 完整流程
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _fetch_or(errors, source, default, fetch, *args):
+        """抓取失败时记录错误并返回 default：单个数据源不可用不影响其余分析"""
+        try:
+            return fetch(*args)
+        except Exception as e:
+            annotate(error=f"{type(e).__name__}: {e}")
+            errors[source] = str(e)
+            return default
+
+    def analyze(self, query, api_key=None, model="deepseek-chat", with_report=False,
+                force_refresh=False, on_delta=None):
+        """执行完整的单股分析；with_report=True 时生成 AI 报告，on_delta 逐段接收报告文本"""
+        trace = Trace("单股分析", query=query, model=model)
+
+        with trace.span("检索"):
+            row, candidates = self.lookup(query)
+        if row is None:
+            raise LookupError(f"未找到匹配的股票：{query}")
+
+        code = str(row['代码'])
+        errors = {}
+        with trace.span("财报"):
+            finance_recent, finance_for_ai, finance_columns = self._fetch_or(
+                errors, "finance", (pd.DataFrame(), pd.DataFrame(), None), self.fetch_finance, code)
+        with trace.span("日线"):
+            price_range = self._fetch_or(errors, "price_range", EMPTY_PRICE_RANGE, self.fetch_price_range, code)
+        with trace.span("趋势"):
+            trend = self._fetch_or(errors, "trend", EMPTY_TREND, self.fetch_trend, code)
+        with trace.span("分红"):
+            dividend = self._fetch_or(errors, "dividend", EMPTY_DIVIDEND, self.fetch_dividend, code)
+        with trace.span("股息率分位"):
+            yield_history = self._fetch_or(errors, "yield_history", YieldHistory(code=code),
+                                           self.fetch_yield_history, code, dividend)
+        with trace.span("估值"):
+            valuation_models = self.valuate(row['市盈率-动态'], row['最新价'], finance_recent)
+
+        result = AnalysisResult(
+            code=code,
+            name=row['名称'],
+            price=row['最新价'],
+            pe=row['市盈率-动态'],
+            change_pct=row['涨跌幅'],
+            date=datetime.now().strftime("%Y-%m-%d"),
+            finance=finance_recent,
+            finance_for_ai=finance_for_ai,
+            missing_fields=list(finance_columns.missing) if finance_columns is not None else [],
+            price_range=price_range,
+            trend=trend,
+            dividend=dividend,
+            dividend_yield=calculate_dividend_yield(dividend.dividend_per_share, row['最新价']),
+            dividend_percentile=analyze_dividend_percentile(yield_history.yields, yield_history.current_yield(row['最新价'])),
+            valuation_models=valuation_models,
+            candidates=candidates[1:],
+            stale=self.stale_sources(code),
+            errors=errors,
+            trace=trace,
+        )
+        with trace.span("提示词"):
+            result.messages, result.prompt_stats = compose_report_messages(
+                stock_name=result.name,
+                data_string=finance_for_ai,
+                current_date=result.date,
+                current_price=result.price,
+                current_pe=result.pe,
+                current_change_pct=result.change_pct,
+                price_range_data=price_range,
+                dividend_data=dividend,
+                valuation_models=valuation_models,
+                yield_history=yield_history,
+                trend=trend,
+            )
+
+        if with_report:
+            if not api_key:
+                raise ValueError("生成 AI 报告需要 DeepSeek API Key")
+            with trace.span("AI 报告"):
+                stream = self.stream_report(result.messages, api_key, model, force_refresh=force_refresh)
+                for delta in stream:
+                    if on_delta:
+                        on_delta(delta)
+                result.report = stream.content
+                result.report_cached = stream.cached
+
+        trace.finish()
+        return result
+
+
+_default_engine = None
+_default_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """进程内共享的分析引擎"""
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            _default_engine = AnalysisEngine()
+        return _default_engine
+
+
+def analyze(query, **kwargs):
+    """用共享引擎分析一只股票，参数见 AnalysisEngine.analyze"""
+    return get_engine().analyze(query, **kwargs)
+
+
+# ============================================================================
+# 命令行
+# ============================================================================
+
+SOURCE_LABELS = {"snapshot": "行情快照", "price_range": "价格区间", "trend": "趋势指标", "dividend": "分红",
+                 "yield_history": "历史股息率", "finance": "财报"}
+
+
+def format_stale(stale):
+    """“分红（2小时前）、财报（1天前）”形式的说明"""
+    return "、".join(f"{SOURCE_LABELS.get(source, source)}（{format_age(age)}前）" if age is not None
+                     else SOURCE_LABELS.get(source, source) for source, age in stale.items())
+
+
+def _print_summary(result):
+    print(f"📊 {result.name} ({result.code})  {result.date}")
+    print(f"   现价 {result.price} 元 | PE {result.pe} | 涨跌 {result.change_pct}%")
+    if result.price_range.available:
+        print(f"   52周最高 {result.price_range.high_52w:.2f} 元 | 最低 {result.price_range.low_52w:.2f} 元")
+    if result.trend.available:
+        t = result.trend
+        parts = [f"距250日高点 {t.distance_from_high(250, result.price):+.1f}%"]
+        if t.alignment:
+            parts.append(t.alignment)
+        if t.atr_14 is not None:
+            parts.append(f"ATR(14) {t.atr_14:.2f} 元")
+        if t.breakout_label:
+            parts.append(t.breakout_label)
+        print(f"   {' | '.join(parts)}")
+    if result.dividend_yield is not None and pd.notna(result.dividend_yield):
+        print(f"   每股派息 {result.dividend.dividend_per_share} 元 | 股息率 {result.dividend_yield:.2f}%")
+    if result.dividend_percentile:
+        p = result.dividend_percentile
+        print(f"   近12月股息率 {p.current_yield:.2f}%，处于近 {p.samples} 个除权日的 {p.percentile:.0f}% 分位")
+    for model in result.valuation_models:
+        if model:
+            print(f"   {model.model}: {model.summary}")
+    if result.prompt_stats:
+        stats = result.prompt_stats
+        trimmed = f"，为满足 {stats.budget} tokens 预算已精简：{'、'.join(stats.trimmed)}" if stats.trimmed else ""
+        print(f"   提示词 {stats.tokens_before} → {stats.tokens_after} tokens（本地估算{trimmed}）")
+    if result.stale:
+        print(f"   ⚠️ 上游暂不可用，以下数据使用旧数据：{format_stale(result.stale)}")
+    for source, error in result.errors.items():
+        print(f"   ⚠️ {SOURCE_LABELS.get(source, source)}获取失败，按无数据处理：{error}")
+    if result.missing_fields:
+        print(f"   ⚠️ 财报未识别字段：{'、'.join(result.missing_fields)}")
+    timings = "，".join(f"{r['span']} {r['wall_ms']:.0f}ms" for r in result.trace.records())
+    print(f"   ⏱️ {timings}")
+
+
+def main(argv=None):
+    """命令行入口：python run.py analyze 600519 [--report] [--json]"""
+    parser = argparse.ArgumentParser(prog="run.py analyze", description="无界面单股分析")
+    parser.add_argument("queries", nargs="+", help="股票代码 / 名称 / 拼音首字母")
+    parser.add_argument("--report", action="store_true", help="同时生成 AI 报告（需要 DEEPSEEK_API_KEY）")
+    parser.add_argument("--model", default="deepseek-chat", choices=["deepseek-chat", "deepseek-reasoner"])
+    parser.add_argument("--force-refresh", action="store_true", help="忽略研报缓存")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args(argv)
+
+    api_key = os.getenv("DEEPSEEK_API_KEY", "")
+    if REPLAY_DIR:
+        # 离线回放：行情与财报来自录制的数据，不访问网络
+        from replay import ReplaySource, install_replay
+        install_replay(ReplaySource(REPLAY_DIR, latency=REPLAY_LATENCY))
+    engine = get_engine()
+    failed = 0
+    for query in args.queries:
+        try:
+            # JSON 模式下报告只出现在结果里，文本模式逐段打印
+            on_delta = None if args.json else (lambda delta: print(delta, end="", flush=True))
+            start = time.perf_counter()
+            result = engine.analyze(query, api_key=api_key, model=args.model, with_report=args.report,
+                                    force_refresh=args.force_refresh, on_delta=on_delta)
+        except Exception as e:
+            failed += 1
+            print(f"❌ {query}: {e}", file=sys.stderr)
+            continue
+
+        if args.json:
+            print(json.dumps(result.to_dict(), ensure_ascii=False, default=str))
+        else:
+            if args.report:
+                print("\n")
+            _print_summary(result)
+            print(f"   总耗时 {time.perf_counter() - start:.2f} 秒\n")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
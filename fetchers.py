@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据抓取函数集 - 不依赖 Streamlit，失败时直接抛出异常，供页面和批量分析共用（akshare 在首次抓取时才导入）
+
+上游调用都经过 resilience.get_upstream()：超时、重试、熔断，网络不可用时返回最近一次成功的数据；
+分红与财报落盘后 FETCH_MAX_AGE 秒内直接使用；预热器覆盖的股票放宽到 WARM_MAX_AGE（见 warmer.py）。
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from config import FETCH_MAX_AGE, WARM_MAX_AGE
+from fundamentals import get_fundamentals
+from numeric import parse_number, parse_numbers
+from price_store import get_price_store, last_settled_day
+from records import PriceRange, TrendSignals, DividendInfo, YieldHistory
+from resilience import get_upstream
+from schema import resolve_columns
+from tracing import annotate, frame_bytes
+from trend import TREND_LOOKBACK_DAYS, get_trend_tracker
+from valuation import historical_dividend_yields
+
+# 预热器覆盖的股票（由 warmer.CacheWarmer 登记）及其落盘分红 / 财报的有效期（秒）
+_warm_codes = frozenset()
+_warm_max_age = WARM_MAX_AGE
+
+
+def set_warm_codes(codes, max_age=WARM_MAX_AGE):
+    """登记预热器覆盖的股票，替换之前的登记"""
+    global _warm_codes, _warm_max_age
+    _warm_codes, _warm_max_age = frozenset(str(code) for code in codes), max_age
+
+
+def _max_age(stock_code):
+    """落盘的分红 / 财报在多久内直接使用：预热覆盖的股票按预热的有效期，其余 FETCH_MAX_AGE"""
+    return _warm_max_age if str(stock_code) in _warm_codes else FETCH_MAX_AGE
+
+
+# 各数据源取不到数据时的默认返回值（记录不可变，可直接共用）
+EMPTY_PRICE_RANGE = PriceRange()
+EMPTY_TREND = TrendSignals()
+EMPTY_DIVIDEND = DividendInfo()
+
+# 派息金额只接受“元”（“10派x元”等说明文字、百分比不是每股派息）
+DIVIDEND_UNITS = ("元",)
+# 巨潮的“派息比例”为每 10 股派息（“10派X元”），解析时换算为每股派息；其余派息列按每股处理
+DIVIDEND_PER_TEN_COLUMNS = ("派息比例",)
+
+
+def _per_share(values, col):
+    """派息列的数值 -> 每股派息（每 10 股派息除以 10，取 6 位小数去掉浮点尾数）"""
+    return np.round(values / 10, 6) if col in DIVIDEND_PER_TEN_COLUMNS else values
+
+# 数据源名称 -> 背后的 akshare 接口（用于查询上游容错层的过期标记）
+SOURCE_ENDPOINTS = {
+    "price_range": "stock_zh_a_hist",
+    "trend": "stock_zh_a_hist",
+    "dividend": "stock_dividend_cninfo",
+    "finance": "stock_financial_abstract_ths",
+}
+
+
+# ============================================================================
+# 近一年最高/最低价
+# ============================================================================
+
+def fetch_52week_price_range(stock_code):
+    """获取近一年（52周）的最高价和最低价（日线走本地存储，只补抓缺失的日期）"""
+    end_date = date.today()
+    start_date = end_date - timedelta(days=365)
+
+    bars = get_price_store().get_bars(stock_code, start_date, end_date)
+    return parse_52week_price_range(bars)
+
+
+def parse_52week_price_range(bars):
+    """从规范化的日线数据（high / low 列）计算近一年价格范围"""
+    if bars is None or bars.empty:
+        return EMPTY_PRICE_RANGE
+
+    high_52w = float(bars["high"].max())
+    low_52w = float(bars["low"].min())
+    return PriceRange(
+        high_52w=high_52w,
+        low_52w=low_52w,
+        range=high_52w - low_52w,
+        ratio=(high_52w - low_52w) / low_52w * 100 if low_52w > 0 else 0,
+    )
+
+
+def fetch_trend_signals(stock_code):
+    """滚动高低点 / 均线 / ATR / 突破信号（日线走本地存储；趋势状态按代码保留，只补算新增的 K 线）"""
+    end_date = date.today()
+    bars = get_price_store().get_bars(stock_code, end_date - timedelta(days=TREND_LOOKBACK_DAYS), end_date)
+    # 收盘后当天的 K 线已定，直接并入趋势状态
+    return get_trend_tracker().update(str(stock_code), bars, today=last_settled_day() + timedelta(days=1))
+
+
+# ============================================================================
+# 分红数据
+# ============================================================================
+
+def fetch_dividend_data(stock_code):
+    """获取最新的每股股息数据"""
+    import akshare as ak
+    dividend_df = get_upstream().call("stock_dividend_cninfo", stock_code,
+                                      lambda: ak.stock_dividend_cninfo(symbol=stock_code),
+                                      max_age=_max_age(stock_code))
+    annotate(bytes=frame_bytes(dividend_df))
+    return parse_dividend_data(dividend_df)
+
+
+def _coerce_latest(val):
+    """最新一期单元格：数字直接使用，字符串按“元”换算（见 numeric.py），失败返回 None"""
+    if isinstance(val, (int, float)):
+        return val
+    return parse_number(val, units=DIVIDEND_UNITS)
+
+
+def _coerce_dividend_column(series, rows):
+    """把一列派息数据中 rows 位置的行向量化转为数值，返回 (数值数组, 该行是否以此列为准)
+
+    数值列直接使用（NaN 也算已判定，与逐行解析一致）；文本列整列按“元”换算，
+    只有非负有限数才算有效，日期、空值等无法解析的行留给下一列。
+    """
+    n = len(rows)
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+        return np.full(n, np.nan), np.zeros(n, dtype=bool)
+    if pd.api.types.is_integer_dtype(series):
+        values = series.to_numpy(dtype=float)[rows]
+        return values, values >= 0
+    if pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype=float)[rows], np.ones(n, dtype=bool)
+
+    values = parse_numbers(series.to_numpy(dtype=object)[rows], units=DIVIDEND_UNITS)
+    return values, np.isfinite(values) & (values >= 0)
+
+
+def parse_dividend_data(dividend_df):
+    """从分红记录中提取最新派息与历史派息序列"""
+    if dividend_df is None or dividend_df.empty:
+        return EMPTY_DIVIDEND
+
+    columns = resolve_columns("dividend", dividend_df.columns)
+
+    # 按公告日期倒序，第一行即最新一期（巨潮接口返回的是“实施方案公告日期”升序）；
+    # 无法识别的日期排最后，同一天的保持原顺序。只排日期一列得到行序，各列按行序取值，
+    # 不复制、重排整张表（一只股票只有几十条记录，整表操作的固定开销占大头）
+    order = np.arange(len(dividend_df))
+    if "announce_date" in columns:
+        dates = dividend_df[columns["announce_date"]]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates, errors='coerce')
+        stamps = dates.to_numpy(dtype="datetime64[ns]")
+        order = np.argsort(np.where(np.isnat(stamps), np.iinfo(np.int64).max, -stamps.view(np.int64)), kind="stable")
+
+    # 最新一期逐格取值（不为一个单元格构造整行）
+    latest_row = order[0]
+    latest = {}
+
+    # 与历史版本一致：同一字段有多列候选时，后出现的可用列覆盖前面的
+    for field, source in (("dividend_per_share", "per_share"), ("transfer_share", "transfer")):
+        for col in columns.get(source, []):
+            val = _coerce_latest(dividend_df[col].iloc[latest_row])
+            if val is not None:
+                latest[field] = float(_per_share(val, col)) if source == "per_share" else val
+
+    if "payout_ratio" in columns:
+        latest["payout_ratio"] = dividend_df[columns["payout_ratio"][-1]].iloc[latest_row]
+    if "record_date" in columns:
+        latest["record_date"] = dividend_df[columns["record_date"][-1]].iloc[latest_row]
+
+    # 提取历史派息数据用于分位分析（与财报数据保持10年）：
+    # 每行取第一个可判定的派息列，按列向量化合并，避免逐行逐列解析
+    values = np.full(len(dividend_df), np.nan)
+    decided = np.zeros(len(dividend_df), dtype=bool)
+    for col in columns.get("per_share", []):
+        # 只处理前面的列还没判定的行
+        pending = np.flatnonzero(~decided)
+        col_values, col_decided = _coerce_dividend_column(dividend_df[col], order[pending])
+        values[pending[col_decided]] = _per_share(col_values[col_decided], col)
+        decided[pending[col_decided]] = True
+        if decided.all():
+            break
+
+    # 只记录有效派息
+    valid = np.flatnonzero(decided & (values > 0))[:10]
+    dividend_values = values[valid].tolist()
+    if "ex_date" in columns:
+        ex_dates = pd.to_datetime(dividend_df[columns["ex_date"]].to_numpy()[order[valid]], errors='coerce')
+        history_dates = tuple(None if pd.isna(d) else d for d in ex_dates)
+    else:
+        history_dates = (None,) * len(dividend_values)
+
+    # 保留10年历史数据（与财报数据一致），history_years 即实际年数
+    return DividendInfo(history=tuple(dividend_values), history_dates=history_dates, **latest)
+
+
+# ============================================================================
+# 历史股息率
+# ============================================================================
+
+def dividend_events(code, dividend):
+    """DividendInfo -> 派息事件表 [code, ex_date, dividend]（丢弃没有除权日的记录）"""
+    events = pd.DataFrame({
+        "code": str(code),
+        "ex_date": pd.to_datetime(pd.Series(dividend.history_dates, dtype=object), errors='coerce'),
+        "dividend": pd.Series(dividend.history, dtype=float),
+    })
+    return events.dropna(subset=["ex_date"])
+
+
+def fetch_yield_history(stock_code, dividend=None):
+    """历史股息率序列：派息事件按除权日与（不复权）日线收盘价做 as-of 对齐；dividend 可传入已抓取的分红数据"""
+    if dividend is None:
+        dividend = fetch_dividend_data(stock_code)
+    events = dividend_events(stock_code, dividend)
+    if events.empty:
+        return YieldHistory(code=str(stock_code))
+
+    # 日线走本地存储：近一年的部分通常已随 52 周价格区间抓取过，只补抓更早的区间
+    start = events["ex_date"].min().date() - timedelta(days=10)
+    bars = get_price_store().get_bars(stock_code, start, date.today())
+    yields = historical_dividend_yields(events, bars.assign(code=str(stock_code)))
+    if yields.empty:
+        return YieldHistory(code=str(stock_code))
+    return YieldHistory(
+        code=str(stock_code),
+        ex_dates=tuple(yields["ex_date"]),
+        yields=tuple(yields["yield"].tolist()),
+        ttm_dividend=float(yields["ttm_dividend"].iloc[-1]),
+    )
+
+
+# ============================================================================
+# 财务摘要
+# ============================================================================
+
+def fetch_financial_abstract(stock_code):
+    """获取同花顺财务摘要（主要指标），按报告期倒序；全部历史交给后台写入财务数据仓库（见 fundamentals.py）"""
+    import akshare as ak
+    finance_df = get_upstream().call("stock_financial_abstract_ths", stock_code,
+                                     lambda: ak.stock_financial_abstract_ths(symbol=stock_code, indicator="主要指标"),
+                                     max_age=_max_age(stock_code))
+    annotate(bytes=frame_bytes(finance_df))
+    # 后台入库，不占用本次请求的时间
+    get_fundamentals().submit(stock_code, finance_df)
+    date_col = finance_df.columns[0]
+    return finance_df.sort_values(by=date_col, ascending=False)
@@ -0,0 +1,529 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+财务数据仓库 - 保存多只股票的全部历史财务摘要（同花顺主要指标），入库时一次性把“亿 / 万 / %”换算为数值（numeric.py），
+按列存储，支持全市场横截面查询（例如“ROE 连续 5 年 > 15%”）
+
+- 入库：每次抓取财务摘要（fetchers.fetch_financial_abstract）都交给后台线程写入（submit），不占用请求路径；
+  原表指纹（跨进程稳定）随桶写入 Parquet 元数据，内容没变时跳过，重启后也不必读入整个仓库
+- 存储：规范字段一列一个 float64，按代码分桶写 Parquet（入库一只股票只读写它所在的桶）
+- 查询：年报按 (代码, 年份) 展开成矩阵并缓存，连续年数等条件在 numpy 内整列计算
+
+数值约定：金额为元（“115.48亿” -> 1.1548e10），比率为百分数（“15.20%” -> 15.2），“--”等缺失值为 NaN。
+
+用法：python run.py fundamentals ingest 600519 000858 | --watchlist
+      python run.py fundamentals screen "roe>15" "debt_ratio<60" --years 5
+"""
+
+import argparse
+import atexit
+import hashlib
+import json
+import logging
+import operator
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import FUNDAMENTALS_DIR, REPLAY_DIR, REPLAY_LATENCY, WATCHLIST_PATH
+from numeric import parse_numbers
+from schema import resolve_columns
+
+logger = logging.getLogger(__name__)
+
+# 规范字段（均为 float64），与 schema.SCHEMAS["financial_abstract"] 的字段名一致
+FUNDAMENTAL_FIELDS = (
+    "roe", "net_profit", "net_profit_growth", "revenue", "revenue_growth", "gross_margin",
+    "net_margin", "debt_ratio", "eps", "bvps", "current_ratio",
+)
+FIELD_LABELS = {
+    "roe": "ROE(%)", "net_profit": "净利润(元)", "net_profit_growth": "净利润增长率(%)", "revenue": "营业收入(元)",
+    "revenue_growth": "营收增长率(%)", "gross_margin": "毛利率(%)", "net_margin": "净利率(%)",
+    "debt_ratio": "资产负债率(%)", "eps": "每股收益(元)", "bvps": "每股净资产(元)", "current_ratio": "流动比率",
+}
+# 仓库表的列：code / report_date / fiscal_year / annual + 规范字段
+TABLE_COLUMNS = ["code", "report_date", "fiscal_year", "annual", *FUNDAMENTAL_FIELDS]
+
+# 桶文件 Parquet 元数据中保存 {代码: 原表指纹} 的键
+FINGERPRINT_KEY = b"stockagent.fingerprints"
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+_CONDITION_PATTERN = re.compile(r"^\s*(\w+)\s*(>=|<=|>|<)\s*([-+]?\d+(?:\.\d+)?)\s*%?\s*$")
+
+
+# ============================================================================
+# 规范化（单位换算见 numeric.py）
+# ============================================================================
+
+def _parse_report_dates(series):
+    """报告期 -> Timestamp；只有年份的（按年度口径）视为当年 12-31"""
+    text = series.astype("string").str.strip()
+    text = text.where(~text.str.fullmatch(r"\d{4}").fillna(False), text + "-12-31")
+    return pd.to_datetime(text, errors="coerce", format="mixed")
+
+
+def normalize_abstract(code, raw_df):
+    """一只股票的财务摘要原表 -> 仓库表的行（按报告期升序，同一报告期保留第一行）"""
+    return normalize_abstracts({code: raw_df})
+
+
+def normalize_abstracts(frames):
+    """{代码: 财务摘要原表} -> 仓库表（按代码、报告期升序）
+
+    列结构相同的原表先拼成一张，每个字段整列只换算一次，避免逐只股票重复 pandas 的调用开销。
+    """
+    groups = {}
+    for code, raw_df in frames.items():
+        if raw_df is not None and not raw_df.empty:
+            groups.setdefault(tuple(raw_df.columns), []).append((str(code), raw_df))
+    parts = []
+    for items in groups.values():
+        raw = pd.concat([raw_df for _, raw_df in items], ignore_index=True) if len(items) > 1 else items[0][1]
+        codes = np.repeat(np.array([code for code, _ in items], dtype=object), [len(df) for _, df in items])
+        parts.append(_normalize(codes, raw))
+    if not parts:
+        return _empty_table()
+    frame = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    return frame.sort_values(["code", "report_date"], ignore_index=True)
+
+
+def _normalize(codes, raw_df):
+    columns = resolve_columns("financial_abstract", raw_df.columns)
+    date_col = columns.get("report_date", raw_df.columns[0])
+
+    dates = _parse_report_dates(raw_df[date_col])
+    frame = pd.DataFrame({"code": codes, "report_date": dates.to_numpy(dtype="datetime64[ns]")})
+    # 全部字段拼成一个数组，一次换算单位
+    present = [field for field in FUNDAMENTAL_FIELDS if field in columns]
+    values = parse_numbers(raw_df[[columns[field] for field in present]]) if present else None
+    for field in FUNDAMENTAL_FIELDS:
+        frame[field] = values[:, present.index(field)] if field in present else np.nan
+    frame = frame.dropna(subset=["report_date"]).drop_duplicates(["code", "report_date"])
+    frame.insert(2, "fiscal_year", frame["report_date"].dt.year.astype("int16"))
+    frame.insert(3, "annual", (frame["report_date"].dt.month == 12) & (frame["report_date"].dt.day == 31))
+    return frame
+
+
+def _empty_table():
+    return pd.DataFrame({
+        col: np.array([], dtype=dtype)
+        for col, dtype in zip(TABLE_COLUMNS, (object, "datetime64[ns]", "int16", bool, *(["float64"] * len(FUNDAMENTAL_FIELDS))))
+    })
+
+
+def parse_condition(text):
+    """“roe>15” / “debt_ratio<=60%” -> (字段, 运算符, 阈值)"""
+    match = _CONDITION_PATTERN.match(text or "")
+    if match is None:
+        raise ValueError(f"无法解析的条件：{text}（格式如 roe>15）")
+    field, op, threshold = match.groups()
+    if field not in FUNDAMENTAL_FIELDS:
+        raise ValueError(f"未知字段：{field}（可选：{', '.join(FUNDAMENTAL_FIELDS)}）")
+    return field, op, float(threshold)
+
+
+# ============================================================================
+# 仓库
+# ============================================================================
+
+class AnnualMatrix:
+    """年报展开为 (代码 × 连续年份) 的矩阵：codes[i] 行、years[j] 列，缺失的年份为 NaN"""
+
+    __slots__ = ("codes", "years", "present", "_rows", "_cols", "_table", "_fields")
+
+    def __init__(self, annual):
+        codes = annual["code"].astype("category")
+        self.codes = np.asarray(codes.cat.categories, dtype=object)
+        years = annual["fiscal_year"].to_numpy(dtype=int)
+        first = int(years.min()) if len(years) else 0
+        self.years = np.arange(first, int(years.max()) + 1 if len(years) else 0)
+        self._rows = codes.cat.codes.to_numpy()
+        self._cols = years - first
+        self.present = np.zeros((len(self.codes), len(self.years)), dtype=bool)
+        self.present[self._rows, self._cols] = True
+        self._table = annual
+        self._fields = {}
+
+    def field(self, name):
+        if name not in self._fields:
+            matrix = np.full(self.present.shape, np.nan)
+            matrix[self._rows, self._cols] = self._table[name].to_numpy(dtype=float)
+            self._fields[name] = matrix
+        return self._fields[name]
+
+    def last_year_index(self):
+        """每只股票最近一份年报所在的列（没有年报为 -1）"""
+        if not self.present.size:
+            return np.full(len(self.codes), -1)
+        last = self.present.shape[1] - 1 - np.argmax(self.present[:, ::-1], axis=1)
+        return np.where(self.present.any(axis=1), last, -1)
+
+
+def _run_lengths(condition):
+    """逐行的连续满足年数：run[:, j] 为截至第 j 列（含）连续为 True 的列数"""
+    run = np.zeros(condition.shape, dtype=np.int32)
+    for j in range(condition.shape[1]):
+        run[:, j] = (run[:, j - 1] + 1) * condition[:, j] if j else condition[:, j]
+    return run
+
+
+class FundamentalsWarehouse:
+    """多只股票的历史财务数据（线程安全）
+
+    按代码分成 buckets 个桶，每桶一个 Parquet 文件；首次查询时读入全部桶并拼成一张表，
+    入库只读写对应的桶并使合并表 / 年报矩阵失效。请求路径上用 submit() 交给后台线程入库。
+    """
+
+    def __init__(self, root_dir=FUNDAMENTALS_DIR, buckets=64):
+        self.root_dir = root_dir
+        self.buckets = buckets
+        self._frames = {}            # 桶号 -> DataFrame（已读入的桶）
+        self._complete = False       # 是否已读入全部桶
+        self._table = None
+        self._matrix = None
+        self._fingerprints = {}      # 桶号 -> {代码: 最近一次入库的原表指纹}（内容不变时跳过）
+        self._lock = threading.RLock()
+        # 后台入库队列：代码 -> 待入库的原表（同一股票只保留最新的一份）
+        self._pending = {}
+        self._busy = False
+        self._queue = threading.Condition()
+        self._worker = None
+        # 统计：实际入库 / 因内容未变跳过的次数，写盘的桶数
+        self.ingested = 0
+        self.skipped = 0
+        self.bucket_writes = 0
+
+    # ------------------------------------------------------------------
+    # 入库
+    # ------------------------------------------------------------------
+
+    def ingest(self, code, raw_df):
+        """写入一只股票的全部财务摘要（替换该股票已有的数据），返回入库行数；内容未变时返回 0"""
+        return self.ingest_many({code: raw_df})
+
+    def ingest_many(self, frames):
+        """批量写入 {代码: 财务摘要原表}：一次换算全部单位，每个受影响的桶只写一次盘"""
+        with self._lock:
+            changed = {}
+            for code, raw_df in frames.items():
+                code = str(code)
+                fingerprint = _fingerprint(raw_df)
+                if self._bucket_fingerprints(self._bucket_of(code)).get(code) == fingerprint:
+                    self.skipped += 1
+                else:
+                    changed[code] = (raw_df, fingerprint)
+            if not changed:
+                return 0
+
+            normalized = normalize_abstracts({code: raw_df for code, (raw_df, _) in changed.items()})
+            replaced = {}
+            for code in changed:
+                replaced.setdefault(self._bucket_of(code), []).append(code)
+            row_buckets = normalized["code"].map(self._bucket_of).to_numpy() if len(normalized) else np.array([])
+            for bucket, codes in replaced.items():
+                frame = self._frame(bucket)
+                parts = [frame[~frame["code"].isin(codes)], normalized[row_buckets == bucket]]
+                parts = [part for part in parts if not part.empty]
+                frame = pd.concat(parts, ignore_index=True) if parts else _empty_table()
+                fingerprints = dict(self._bucket_fingerprints(bucket))
+                fingerprints.update((code, changed[code][1]) for code in codes)
+                self._save(bucket, frame, fingerprints)
+                self._frames[bucket] = frame
+                self._fingerprints[bucket] = fingerprints
+            self.ingested += len(changed)
+            self._table = self._matrix = None
+            return len(normalized)
+
+    def submit(self, code, raw_df):
+        """把一只股票的财务摘要交给后台线程入库，立即返回；尚未入库的同一股票被新数据替换"""
+        with self._queue:
+            self._pending[str(code)] = raw_df
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._drain, daemon=True, name="fundamentals-ingest")
+                self._worker.start()
+                # 进程退出前把队列写完（命令行单次分析等短命进程）
+                atexit.register(self.flush)
+            self._queue.notify_all()
+
+    def flush(self, timeout=None):
+        """等待已提交的财务摘要全部入库；超时返回 False"""
+        with self._queue:
+            return self._queue.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def _drain(self):
+        while True:
+            with self._queue:
+                self._queue.wait_for(lambda: self._pending)
+                frames, self._pending = self._pending, {}
+                self._busy = True
+            try:
+                self.ingest_many(frames)
+            except Exception as e:
+                # 入库失败不影响分析，下次抓取会重新提交
+                logger.warning("财务数据入库失败 %s：%s", ",".join(frames), e)
+            finally:
+                with self._queue:
+                    self._busy = False
+                    self._queue.notify_all()
+
+    def _bucket_of(self, code):
+        return int(code) % self.buckets if code.isdigit() else zlib.crc32(code.encode("utf-8")) % self.buckets
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def table(self):
+        """全部财务数据（一行一个 代码 × 报告期，TABLE_COLUMNS 列）"""
+        with self._lock:
+            if self._table is None:
+                self._load()
+                frames = [f for f in self._frames.values() if not f.empty]
+                table = pd.concat(frames, ignore_index=True) if frames else _empty_table()
+                self._table = table.sort_values(["code", "report_date"], ignore_index=True)
+            return self._table
+
+    def annual_matrix(self):
+        with self._lock:
+            if self._matrix is None:
+                table = self.table()
+                self._matrix = AnnualMatrix(table[table["annual"]])
+            return self._matrix
+
+    def history(self, code):
+        """一只股票的全部报告期（升序）"""
+        table = self.table()
+        return table[table["code"] == str(code)].reset_index(drop=True)
+
+    def cross_section(self, field, year=None):
+        """某字段的横截面：year 为 None 时取每只股票最近一份年报，返回以代码为索引的 Series"""
+        matrix = self.annual_matrix()
+        values = matrix.field(field)
+        if year is None:
+            last = matrix.last_year_index()
+            picked = np.where(last >= 0, values[np.arange(len(last)), last], np.nan)
+        elif matrix.years.size and matrix.years[0] <= year <= matrix.years[-1]:
+            picked = values[:, year - matrix.years[0]]
+        else:
+            picked = np.full(len(matrix.codes), np.nan)
+        return pd.Series(picked, index=pd.Index(matrix.codes, name="code"), name=field).dropna()
+
+    def consecutive(self, conditions, years, latest=True):
+        """年报连续 years 年同时满足全部条件的股票
+
+        conditions 为 [(字段, 运算符, 阈值)] 或 “roe>15” 形式的字符串；latest=True 时连续区间须截至该股票最近一份年报，
+        否则历史上任意连续区间均可。返回 DataFrame[code, streak, last_year, 各条件字段在最近一份年报的值]，按连续年数倒序。
+        """
+        conditions = [parse_condition(c) if isinstance(c, str) else c for c in conditions]
+        if not conditions:
+            raise ValueError("至少需要一个条件")
+        matrix = self.annual_matrix()
+        satisfied = matrix.present.copy()
+        for field, op, threshold in conditions:
+            if op not in OPERATORS:
+                raise ValueError(f"不支持的运算符：{op}")
+            with np.errstate(invalid="ignore"):
+                satisfied &= OPERATORS[op](matrix.field(field), threshold)
+
+        run = _run_lengths(satisfied)
+        last = matrix.last_year_index()
+        rows = np.arange(len(last))
+        streak = np.where(last >= 0, run[rows, last], 0) if latest else run.max(axis=1, initial=0)
+        hit = np.flatnonzero(streak >= years)
+
+        result = pd.DataFrame({
+            "code": matrix.codes[hit],
+            "streak": streak[hit],
+            "last_year": matrix.years[last[hit]],
+        })
+        for field in dict.fromkeys(field for field, _, _ in conditions):
+            result[field] = matrix.field(field)[hit, last[hit]]
+        return result.sort_values(["streak", "code"], ascending=[False, True], ignore_index=True)
+
+    def stats(self):
+        table = self.table()
+        years = table.loc[table["annual"], "fiscal_year"]
+        return {
+            "codes": int(table["code"].nunique()),
+            "rows": len(table),
+            "annual_rows": len(years),
+            "years": [int(years.min()), int(years.max())] if len(years) else None,
+            "memory_bytes": int(table.memory_usage(deep=True).sum()),
+            "ingested": self.ingested,
+            "skipped": self.skipped,
+            "bucket_writes": self.bucket_writes,
+        }
+
+    # ------------------------------------------------------------------
+    # 读写
+    # ------------------------------------------------------------------
+
+    def _path(self, bucket):
+        return os.path.join(self.root_dir, f"bucket_{bucket:03d}.parquet")
+
+    def _load(self):
+        """读入全部桶（查询时）"""
+        if self._complete:
+            return
+        for bucket in range(self.buckets):
+            self._frame(bucket)
+        self._complete = True
+
+    def _frame(self, bucket):
+        """一个桶的数据（首次访问时读盘，同时记下元数据里的指纹）"""
+        if bucket not in self._frames:
+            frame, fingerprints = _empty_table(), {}
+            path = self._path(bucket)
+            if os.path.exists(path):
+                try:
+                    table = pq.read_table(path)
+                    frame, fingerprints = table.to_pandas(), _read_fingerprints(table.schema)
+                except Exception:
+                    # 文件损坏时当作没有数据，下次抓取会重新入库
+                    pass
+            self._frames[bucket] = frame
+            self._fingerprints[bucket] = fingerprints
+        return self._frames[bucket]
+
+    def _bucket_fingerprints(self, bucket):
+        """一个桶内各股票的原表指纹；桶还没读入时只读 Parquet 元数据，不读数据"""
+        if bucket not in self._fingerprints:
+            path = self._path(bucket)
+            try:
+                self._fingerprints[bucket] = _read_fingerprints(pq.read_schema(path)) if os.path.exists(path) else {}
+            except Exception:
+                self._fingerprints[bucket] = {}
+        return self._fingerprints[bucket]
+
+    def _save(self, bucket, frame, fingerprints):
+        path = self._path(bucket)
+        os.makedirs(self.root_dir, exist_ok=True)
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        metadata = {**(table.schema.metadata or {}), FINGERPRINT_KEY: json.dumps(fingerprints).encode("utf-8")}
+        pq.write_table(table.replace_schema_metadata(metadata), path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self.bucket_writes += 1
+
+
+def _fingerprint(raw_df):
+    """原表内容的指纹（列名与全部取值的 repr 取摘要，跨进程稳定，可以落盘比较）"""
+    if raw_df is None:
+        return ""
+    content = repr((list(raw_df.columns), raw_df.to_numpy(dtype=object).tolist()))
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _read_fingerprints(schema):
+    raw = (schema.metadata or {}).get(FINGERPRINT_KEY)
+    return json.loads(raw) if raw else {}
+
+
+_default_warehouse = None
+_default_warehouse_lock = threading.Lock()
+
+
+def get_fundamentals():
+    """进程内共享的财务数据仓库"""
+    global _default_warehouse
+    with _default_warehouse_lock:
+        if _default_warehouse is None:
+            _default_warehouse = FundamentalsWarehouse()
+        return _default_warehouse
+
+
+# ============================================================================
+# 命令行
+# ============================================================================
+
+def ingest_codes(codes, limiter=None):
+    """按主机限速逐只抓取财务摘要并等待写入共享仓库，返回 {代码: 错误}"""
+    from batch_analysis import DATA_SOURCES, default_limiter
+    from fetchers import fetch_financial_abstract
+
+    limiter = limiter or default_limiter
+    errors = {}
+    for code in codes:
+        limiter.acquire(DATA_SOURCES["finance"][0])
+        try:
+            fetch_financial_abstract(code)
+        except Exception as e:
+            errors[code] = str(e)
+    get_fundamentals().flush()
+    return errors
+
+
+def _format_value(field, value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return "--"
+    if field in ("net_profit", "revenue"):
+        return f"{value / 1e8:.2f}亿"
+    return f"{value:.2f}"
+
+
+def main(argv=None):
+    """命令行入口：python run.py fundamentals {ingest,screen,stats} ..."""
+    parser = argparse.ArgumentParser(prog="run.py fundamentals", description="财务数据仓库")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest = sub.add_parser("ingest", help="抓取财务摘要并入库")
+    ingest.add_argument("codes", nargs="*", help="股票代码")
+    ingest.add_argument("--watchlist", nargs="?", const=WATCHLIST_PATH, help="从自选股列表读取代码")
+    screen = sub.add_parser("screen", help="年报连续多年满足条件的股票")
+    screen.add_argument("conditions", nargs="+", help="条件，如 roe>15 debt_ratio<60")
+    screen.add_argument("--years", type=int, default=5, help="连续年数")
+    screen.add_argument("--anytime", action="store_true", help="历史上任意连续区间均可（默认须截至最近一份年报）")
+    screen.add_argument("--limit", type=int, default=50)
+    sub.add_parser("stats", help="仓库概况")
+    args = parser.parse_args(argv)
+
+    warehouse = get_fundamentals()
+    if args.command == "ingest":
+        codes = list(args.codes)
+        if args.watchlist:
+            from warmer import load_watchlist
+            codes += [c for c in load_watchlist(args.watchlist) if c.isdigit()]
+        codes = list(dict.fromkeys(codes))
+        if not codes:
+            print("❌ 没有要入库的股票代码", file=sys.stderr)
+            return 1
+        if REPLAY_DIR:
+            from replay import ReplaySource, install_replay
+            install_replay(ReplaySource(REPLAY_DIR, latency=REPLAY_LATENCY))
+        start = time.perf_counter()
+        errors = ingest_codes(codes)
+        print(f"📥 入库 {len(codes) - len(errors)} / {len(codes)} 只，用时 {time.perf_counter() - start:.1f} 秒")
+        for code, error in errors.items():
+            print(f"   ⚠️ {code}：{error}")
+        return 1 if len(errors) == len(codes) else 0
+
+    if args.command == "stats":
+        stats = warehouse.stats()
+        years = f"{stats['years'][0]}-{stats['years'][1]}" if stats["years"] else "无年报"
+        print(f"📚 {stats['codes']} 只股票，{stats['rows']} 个报告期（年报 {stats['annual_rows']}，{years}），"
+              f"内存 {stats['memory_bytes'] / 1024:.0f}KB")
+        return 0
+
+    start = time.perf_counter()
+    try:
+        result = warehouse.consecutive(args.conditions, args.years, latest=not args.anytime)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    elapsed = (time.perf_counter() - start) * 1000
+    fields = [c for c in result.columns if c in FUNDAMENTAL_FIELDS]
+    print(f"🔎 {' 且 '.join(args.conditions)}，连续 {args.years} 年：{len(result)} 只（{elapsed:.1f}ms）")
+    for row in result.head(args.limit).to_dict(orient="records"):
+        values = "，".join(f"{FIELD_LABELS[f]} {_format_value(f, row[f])}" for f in fields)
+        print(f"   {row['code']}：连续 {row['streak']} 年（截至 {row['last_year']}），{values}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地模拟大模型服务 - 兼容 OpenAI /chat/completions 流式接口，用于离线测试与基准，不消耗真实 API 额度
+
+用法：python mock_openai_server.py [端口]
+然后把 base_url 指向 http://127.0.0.1:端口/v1
+"""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPORT = (
+    "## 核心量化指标清单\n- ROE：25.3%\n- 毛利率：91.5%\n- PE：28.6x\n\n"
+    "## 多维度估值对比\nPE 处于偏高区间，PEG 接近合理上沿。\n\n"
+    "## 风险与不买入理由\n1. 估值偏高\n2. 增速放缓\n3. 行业政策风险\n\n"
+    "## 投资建议\n观望。\n"
+)
+
+
+def _split_chunks(text, chunk_count):
+    size = max(1, -(-len(text) // chunk_count))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class MockChatHandler(BaseHTTPRequestHandler):
+    """按 SSE 分块返回固定报告；使用 HTTP/1.1 分块传输，连接可被客户端复用"""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.stats_lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with self.server.stats_lock:
+            self.server.requests += 1
+
+        model = body.get("model", "mock-model")
+        content = self.server.report_text
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", []))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content),
+                 "total_tokens": prompt_tokens + len(content)}
+
+        if not body.get("stream"):
+            payload = json.dumps({
+                "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        time.sleep(self.server.first_token_delay)
+        for piece in _split_chunks(content, self.server.chunk_count):
+            self._send_event({"choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}, model)
+            time.sleep(self.server.chunk_delay)
+        self._send_event({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}, model)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._send_event({"choices": [], "usage": usage}, model)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")  # 分块传输的结束块
+
+    def _send_event(self, data, model):
+        data.update({"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model})
+        self._write_chunk(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_mock_server(port=0, report_text=DEFAULT_REPORT, chunk_count=20, chunk_delay=0.01, first_token_delay=0.05):
+    """在后台线程启动模拟服务，返回 (server, base_url)；用完调用 server.shutdown()
+
+    server.requests / server.connections 记录收到的请求数与新建连接数，可用来确认连接复用。
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockChatHandler)
+    server.daemon_threads = True
+    server.report_text = report_text
+    server.chunk_count = chunk_count
+    server.chunk_delay = chunk_delay
+    server.first_token_delay = first_token_delay
+    server.stats_lock = threading.Lock()
+    server.requests = 0
+    server.connections = 0
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    server, base_url = start_mock_server(port)
+    print(f"🧪 模拟大模型服务已启动：{base_url}（Ctrl+C 退出）")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数值换算 - 把 akshare 返回的“12.34亿 / 25.6% / 3.2万 / 20.53元 / --”等带中文单位的字符串整列（或整张表）换算为 float64
+
+约定（财报、分红、估值、财务数据仓库共用）：
+- 亿 ×1e8、万 ×1e4、万亿 ×1e12、元 ×1；% 保留为百分数（“25.6%” -> 25.6）
+- 负数、千分位逗号、数字与单位之间的空格照常解析
+- “--”、空串、None、NaN 等占位符与无法识别的文本为 NaN；布尔值视为缺失，数值列直接转为 float64
+
+字符串运算走 pyarrow.compute 的向量化内核（pandas 读写 parquet 已依赖 pyarrow）：整张表换算时先把各列拼成一个数组一次完成，
+不逐列、逐单元格调用。只有几十个单元格时（例如一只股票的分红记录）向量化的固定开销反而更大，逐个解析。
+"""
+
+import math
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# 单位 -> 倍数（较长的单位在前，“万亿”先于“万”匹配）
+UNIT_SCALES = {"万亿": 1e12, "亿": 1e8, "万": 1e4, "%": 1.0, "元": 1.0}
+UNITS = tuple(UNIT_SCALES)
+# 视为缺失的文本（None / NaN / pd.NA 转成字符串后的形式也在内）
+MISSING_TEXT = frozenset({"", "-", "--", "---", "nan", "NaN", "None", "<NA>", "NaT", "False"})
+
+# 不超过该数目的单元格逐个解析（约 1ms 的 arrow 固定开销大于逐个解析的耗时）
+SMALL_INPUT_CELLS = 64
+
+_NUMBER_PATTERN = re.compile(r"^[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?$")
+_MISSING_SET = pa.array(sorted(MISSING_TEXT))
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+
+# ============================================================================
+# 向量化
+# ============================================================================
+
+def _as_text(flat):
+    """object 一维数组 -> arrow 字符串数组；None / NaN 为 null，混有数值等非字符串时按 str() 转换"""
+    try:
+        return pa.array(flat, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array(flat.astype(str), type=pa.string())
+
+
+def _split(values, units):
+    """object 数组 -> (数值文本, 单位序号, 数值, 缺失)；数值文本为 arrow 数组，其余为展平的 numpy 数组
+
+    单位序号 0 表示没有单位，i 表示 units[i - 1]。
+    """
+    text = pc.utf8_trim_whitespace(_as_text(values.ravel()))
+    missing = pc.or_(pc.is_null(text), pc.is_in(text, value_set=_MISSING_SET)).to_numpy(zero_copy_only=False)
+    if pc.any(pc.match_substring(text, ",")).as_py():
+        text = pc.replace_substring(text, ",", "")
+
+    # 较长的单位在前：先匹配到的单位不再被后面的覆盖；每个单元格只去掉一个单位（“5元元”无法识别）
+    code = np.zeros(len(text), dtype=np.int8)
+    strip = np.zeros(len(text), dtype=np.int8)
+    for i, u in enumerate(units, 1):
+        matched = (code == 0) & pc.fill_null(pc.ends_with(text, u), False).to_numpy(zero_copy_only=False)
+        code[matched], strip[matched] = i, len(u)
+    body = text
+    for length in np.unique(strip[strip > 0]):
+        body = pc.if_else(pa.array(strip == length), pc.utf8_slice_codeunits(text, 0, -int(length)), body)
+    body = pc.utf8_rtrim_whitespace(body)
+
+    # 多数表格没有无法识别的文本，直接转换；转换失败时再按正则挑出能识别的单元格（arrow 接受的写法是正则的子集）
+    try:
+        numbers = pc.cast(pc.if_else(pa.array(~missing), body, None), pa.float64())
+    except pa.ArrowInvalid:
+        valid = pc.fill_null(pc.match_substring_regex(body, _NUMBER_PATTERN.pattern), False).to_numpy(zero_copy_only=False)
+        numbers = pc.cast(pc.if_else(pa.array(valid & ~missing), body, None), pa.float64())
+    numbers = numbers.to_numpy(zero_copy_only=False)
+    numbers = np.where(np.isfinite(numbers), numbers, np.nan)
+    return body, code, numbers, missing
+
+
+def _scales(code, units):
+    return np.array([1.0] + [UNIT_SCALES[u] for u in units])[code]
+
+
+def split_units(values, units=UNITS):
+    """字符串数组 -> (数值文本, 单位, 数值, 缺失)，形状与输入相同
+
+    数值文本为去掉单位、空格与千分位后的文本；单位没有时为 ""；数值未乘单位倍数，缺失或无法识别时为 NaN。
+    数值为 NaN 且不属于缺失的单元格即无法识别。
+    """
+    values = np.asarray(values, dtype=object)
+    body, code, numbers, missing = _split(values, units)
+    shape = values.shape
+    unit = np.array(("",) + tuple(units), dtype=object)[code]
+    return body.to_numpy(zero_copy_only=False).reshape(shape), unit.reshape(shape), numbers.reshape(shape), missing.reshape(shape)
+
+
+def parse_numbers(values, units=UNITS):
+    """一维 / 二维的值（Series、DataFrame、数组、列表）-> 同形状的 float64 数组（已乘单位倍数）
+
+    units 限定可接受的单位，例如派息金额只接受 ("元",)，其余带单位的文本为 NaN。
+    """
+    if isinstance(values, pd.DataFrame):
+        if all(pd.api.types.is_numeric_dtype(t) and not pd.api.types.is_bool_dtype(t) for t in values.dtypes):
+            return values.to_numpy(dtype=float)
+        values = values.to_numpy(dtype=object)
+    elif isinstance(values, pd.Series):
+        if pd.api.types.is_bool_dtype(values):
+            return np.full(len(values), np.nan)
+        if pd.api.types.is_numeric_dtype(values):
+            return values.to_numpy(dtype=float)
+        values = values.to_numpy(dtype=object)
+
+    values = np.asarray(values, dtype=object)
+    if values.size <= SMALL_INPUT_CELLS:
+        numbers = (parse_number(v, units) for v in values.ravel())
+        return np.fromiter((np.nan if v is None else v for v in numbers), dtype=float, count=values.size).reshape(values.shape)
+    _, code, numbers, _ = _split(values, units)
+    return (numbers * _scales(code, units)).reshape(values.shape)
+
+
+def normalize_frame(df, columns=None, exclude=(), units=UNITS, coerce=False):
+    """整张表换算：columns（默认全部非数值列，去掉 exclude）拼成一个数组一次解析
+
+    每列全部非缺失单元格都能识别时换成 float64 列；含无法识别的单元格（例如日期、名称）时原样保留，
+    coerce=True 则照样换算，无法识别的为 NaN。返回新的 DataFrame，不修改原表。
+    """
+    if columns is None:
+        columns = [c for c in df.columns if not pd.api.types.is_numeric_dtype(df[c]) or pd.api.types.is_bool_dtype(df[c])]
+    columns = [c for c in columns if c not in set(exclude)]
+    result = df.copy()
+    if not columns:
+        return result
+
+    block = df[columns].to_numpy(dtype=object)
+    _, code, numbers, missing = _split(block, units)
+    values = (numbers * _scales(code, units)).reshape(block.shape)
+    numbers, missing = numbers.reshape(block.shape), missing.reshape(block.shape)
+    convertible = ~(np.isnan(numbers) & ~missing).any(axis=0)
+    for i, col in enumerate(columns):
+        if coerce or convertible[i]:
+            result[col] = values[:, i]
+    return result
+
+
+# ============================================================================
+# 单个值
+# ============================================================================
+
+def parse_number(value, units=UNITS):
+    """单个单元格 -> float（已乘单位倍数），缺失或无法识别时返回 None；规则与 parse_numbers 一致"""
+    if value is None:
+        return None
+    if _is_number(value):
+        value = float(value)
+        return value if math.isfinite(value) else None
+    text = str(value).strip()
+    if text in MISSING_TEXT:
+        return None
+    text = text.replace(",", "")
+    unit = next((u for u in units if text.endswith(u)), "")
+    body = text[:len(text) - len(unit)].rstrip()
+    if not _NUMBER_PATTERN.match(body):
+        return None
+    number = float(body) * UNIT_SCALES.get(unit, 1.0)
+    return number if math.isfinite(number) else None
+
+
+# ============================================================================
+# 合成数据
+# ============================================================================
+
+# 合成单元格的单位与倍数（"" 为无单位）
+_UNIT_CELL_UNITS = ("亿", "万", "%", "元", "", "万亿")
+_UNIT_CELL_JUNK = ("--", "-", "", None, np.nan, "False", "abc", "1.2.3", "5元元", "亿5", "10派3元", "2024-12-31")
+
+
+def make_unit_frame(rows, columns, seed=0, missing=0.05, junk=0.0):
+    """合成带单位的字符串表（本模块的测试与基准用）：每列一种单位（部分列亿 / 万混用），
+    约 missing 比例为占位符，junk 比例为无法识别的文本
+
+    返回 (字符串表, 期望数值表)；期望值按两位小数的文本精确换算。
+    """
+    rng = np.random.default_rng(seed)
+    text, expected = {}, {}
+    for j in range(columns):
+        values = np.round(rng.normal(0, 500, rows), 2)
+        units = np.array([_UNIT_CELL_UNITS[j % len(_UNIT_CELL_UNITS)]] * rows, dtype=object)
+        if j % 3 == 0:
+            units[rng.random(rows) < 0.5] = "万"
+        scales = np.array([UNIT_SCALES.get(u, 1.0) for u in units])
+        cells = np.array([f"{v:.2f}{u}" for v, u in zip(values, units)], dtype=object)
+        want = values * scales
+        placeholder = rng.random(rows) < missing + junk
+        cells[placeholder] = rng.choice(np.array(_UNIT_CELL_JUNK[:5] if not junk else _UNIT_CELL_JUNK, dtype=object),
+                                        placeholder.sum())
+        want[placeholder] = np.nan
+        text[f"指标{j}"], expected[f"指标{j}"] = cells, want
+    return pd.DataFrame(text), pd.DataFrame(expected)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+日线行情本地存储 - 按 (代码, 复权方式) 保存列式日线数据，只抓取缺失的日期区间
+"""
+
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from config import BARS_DIR, MARKET_CLOSE
+from resilience import get_upstream, is_transient
+from schema import resolve_columns
+from tracing import add_to_span, frame_bytes
+
+# 存储使用的规范列（顺序固定）
+BAR_COLUMNS = ["date", "open", "high", "low", "close", "volume", "amount"]
+
+
+def _fetch_daily_bars(code, start_date, end_date, adjust):
+    """默认数据源：东方财富日线行情（本地已有的日线由 PriceStore 自己回退，失败时直接抛出）"""
+    import akshare as ak
+    return get_upstream().call(
+        "stock_zh_a_hist", code,
+        lambda: ak.stock_zh_a_hist(symbol=code, period="daily", start_date=start_date, end_date=end_date, adjust=adjust),
+        fallback=False,
+    )
+
+
+def last_settled_day(now=None):
+    """日线已定的最后一天：收盘（MARKET_CLOSE）之后为当天，之前为昨天"""
+    now = now or datetime.now()
+    closed = now.time() >= datetime.strptime(MARKET_CLOSE, "%H:%M").time()
+    return now.date() if closed else now.date() - timedelta(days=1)
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return pd.Timestamp(value).date()
+
+
+def normalize_bars(raw_df):
+    """把接口返回的日线表转换为规范列（date 为 datetime64，其余为 float）"""
+    if raw_df is None or raw_df.empty:
+        return pd.DataFrame({col: pd.Series(dtype="float64") for col in BAR_COLUMNS}).astype({"date": "datetime64[ns]"})
+
+    columns = resolve_columns("price_history", raw_df.columns)
+    bars = pd.DataFrame({
+        field: raw_df[columns[field]] if field in columns else float("nan")
+        for field in BAR_COLUMNS
+    })
+    bars["date"] = pd.to_datetime(bars["date"], errors="coerce")
+    for col in BAR_COLUMNS[1:]:
+        bars[col] = pd.to_numeric(bars[col], errors="coerce")
+    return bars.dropna(subset=["date"]).sort_values("date").reset_index(drop=True)
+
+
+class PriceStore:
+    """日线行情存储：每个 (代码, 复权方式) 一个 Parquet 文件 + 已覆盖日期区间的元数据"""
+
+    def __init__(self, fetch_func=None, root_dir=BARS_DIR):
+        self._fetch_func = fetch_func or _fetch_daily_bars
+        self.root_dir = root_dir
+        self._frames = {}
+        self._coverage = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        # 统计：实际请求的区间数 / 行数，便于观察增量抓取的效果
+        self.fetch_count = 0
+        self.fetched_rows = 0
+
+    def get_bars(self, code, start, end=None, adjust=""):
+        """返回 [start, end] 区间的日线，本地缺失的区间会先补齐"""
+        start = _to_date(start)
+        end = _to_date(end or date.today())
+        key = (str(code), adjust or "")
+
+        with self._lock_for(key):
+            bars, coverage = self._load(key)
+            try:
+                bars, coverage = self._fill_gaps(key, bars, coverage, start, end)
+            except Exception as e:
+                # 上游不可用：有本地日线时先用本地数据，并标记为过期
+                if bars.empty or not is_transient(e):
+                    raise
+                get_upstream().mark_stale("stock_zh_a_hist", code, self.saved_at(code, adjust))
+
+        mask = (bars["date"] >= pd.Timestamp(start)) & (bars["date"] <= pd.Timestamp(end))
+        return bars.loc[mask].reset_index(drop=True)
+
+    def local_bars(self, code, adjust="", columns=None):
+        """本地已保存的全部日线（只读 columns 中的列），没有或文件损坏时返回 None
+
+        不访问上游，也不放入内存缓存，供回测等一次读大量股票的离线计算使用。
+        """
+        data_path = self._paths((str(code), adjust or ""))[0]
+        if not os.path.exists(data_path):
+            return None
+        try:
+            return pd.read_parquet(data_path, columns=columns)
+        except Exception:
+            return None
+
+    def coverage(self, code, adjust=""):
+        """本地已覆盖的日期区间 (start, end)，没有数据时返回 None"""
+        key = (str(code), adjust or "")
+        with self._lock_for(key):
+            return self._load(key)[1]
+
+    # ------------------------------------------------------------------
+    # 增量抓取
+    # ------------------------------------------------------------------
+
+    def _fill_gaps(self, key, bars, coverage, start, end):
+        code, adjust = key
+        # 当天的K线在收盘前会变化，已覆盖区间收盘前最多记到昨天，保证当天数据总会重新抓取
+        settled_end = min(end, last_settled_day())
+
+        if coverage is None:
+            gaps = [(start, end)]
+        else:
+            covered_start, covered_end = coverage
+            gaps = []
+            if start < covered_start:
+                gaps.append((start, covered_start - timedelta(days=1)))
+            if end > covered_end:
+                # 复权数据会因除权而整体变化：从已覆盖的最后一天开始抓，用重叠的一天做校验
+                gaps.append((covered_end if adjust else covered_end + timedelta(days=1), end))
+
+        if not gaps:
+            return bars, coverage
+
+        chunks = []
+        for gap_start, gap_end in gaps:
+            raw = self._fetch_func(code, gap_start.strftime("%Y%m%d"), gap_end.strftime("%Y%m%d"), adjust)
+            add_to_span("bytes", frame_bytes(raw))
+            chunk = normalize_bars(raw)
+            self.fetch_count += 1
+            self.fetched_rows += len(chunk)
+            chunks.append(chunk)
+
+        if adjust and coverage is not None and not self._overlap_consistent(bars, chunks[-1]):
+            # 复权因子已变化，本地历史作废，整段重新抓取
+            new_start = min(start, coverage[0])
+            raw = self._fetch_func(code, new_start.strftime("%Y%m%d"), end.strftime("%Y%m%d"), adjust)
+            add_to_span("bytes", frame_bytes(raw))
+            bars = normalize_bars(raw)
+            self.fetch_count += 1
+            self.fetched_rows += len(bars)
+            coverage = None
+        else:
+            bars = pd.concat([bars] + chunks, ignore_index=True)
+            bars = bars.drop_duplicates(subset="date", keep="last").sort_values("date").reset_index(drop=True)
+            new_start = start if coverage is None else min(start, coverage[0])
+
+        new_end = settled_end if coverage is None else max(coverage[1], settled_end)
+        if new_start <= new_end:
+            coverage = (new_start, new_end)
+            self._save(key, bars, coverage)
+        else:
+            # 只请求了当天：数据留在内存里，不记为已覆盖
+            self._frames[key], self._coverage[key] = bars, coverage
+        return bars, coverage
+
+    @staticmethod
+    def _overlap_consistent(bars, chunk):
+        """校验新抓取数据与本地数据在重叠日期上的收盘价是否一致"""
+        if bars.empty or chunk.empty:
+            return True
+        merged = bars.merge(chunk, on="date", suffixes=("_old", "_new"))
+        if merged.empty:
+            return True
+        return bool(((merged["close_old"] - merged["close_new"]).abs() < 1e-6).all())
+
+    # ------------------------------------------------------------------
+    # 读写
+    # ------------------------------------------------------------------
+
+    def _lock_for(self, key):
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _paths(self, key):
+        code, adjust = key
+        directory = os.path.join(self.root_dir, adjust or "none")
+        return os.path.join(directory, f"{code}.parquet"), os.path.join(directory, f"{code}.json")
+
+    def _load(self, key):
+        if key in self._frames:
+            return self._frames[key], self._coverage[key]
+
+        data_path, meta_path = self._paths(key)
+        bars, coverage = normalize_bars(None), None
+        if os.path.exists(data_path) and os.path.exists(meta_path):
+            try:
+                bars = pd.read_parquet(data_path)
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                coverage = (date.fromisoformat(meta["start"]), date.fromisoformat(meta["end"]))
+            except Exception:
+                # 本地文件损坏时当作没有数据，重新抓取
+                bars, coverage = normalize_bars(None), None
+
+        self._frames[key], self._coverage[key] = bars, coverage
+        return bars, coverage
+
+    def saved_at(self, code, adjust=""):
+        """本地日线最近一次写盘的时间（没有写过盘时为 None）"""
+        data_path = self._paths((str(code), adjust or ""))[0]
+        return os.path.getmtime(data_path) if os.path.exists(data_path) else None
+
+    def _save(self, key, bars, coverage):
+        self._frames[key], self._coverage[key] = bars, coverage
+        data_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+
+        bars.to_parquet(data_path + ".tmp", index=False)
+        os.replace(data_path + ".tmp", data_path)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"start": coverage[0].isoformat(), "end": coverage[1].isoformat(),
+                       "rows": len(bars), "updated_at": datetime.now().isoformat(timespec="seconds")}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_price_store():
+    """进程内共享的日线存储"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = PriceStore()
+        return _default_store
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+研报提示词 - 构建发给大模型的 system / user 消息，供页面同步调用与异步批量生成共用
+
+提示词按段落组织：财报按紧凑 CSV（指标为行、报告期为列，单位并入表头）序列化，
+本地估算 token 数，超出预算时按优先级从低到高精简或省略段落。
+"""
+
+import re
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from config import PROMPT_TOKEN_BUDGET
+from numeric import split_units
+from records import PBValuation, PEValuation, PEGValuation, ROEValuation, PromptStats
+from schema import resolve_columns, KEY_FINANCE_FIELDS
+from tracing import annotate
+from valuation import analyze_dividend_percentile, valuation_standards
+
+SYSTEM_PROMPT = "你是硬核资深投研专家，数据驱动、逻辑严谨。"
+REPORT_TEMPERATURE = 0.3  # 降低随机性，确保结果更一致（0-2之间，越低越确定）
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中文约 1 字 1 token，其余约 4 字符 1 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_message_tokens(messages):
+    """估算一组 chat messages 的输入 token 数"""
+    return sum(estimate_tokens(m.get("content", "")) + 4 for m in messages)
+
+
+def select_finance_for_ai(finance_df, periods=10):
+    """取最近 periods 期财报并筛选关键指标列，返回 (最近数据, 发给 AI 的数据, 列名映射)"""
+    finance_columns = resolve_columns("financial_abstract", finance_df.columns)
+    date_col = finance_columns.get("report_date", finance_df.columns[0])
+    finance_recent = finance_df.head(periods)
+
+    # 筛选关键指标列（如果存在）：列名映射按表结构缓存，不再逐列匹配
+    key_indicators = [date_col] + [
+        col for col in finance_columns.columns(KEY_FINANCE_FIELDS) if col != date_col
+    ]
+    # 如果有关键指标，只使用这些；否则使用全部
+    finance_for_ai = finance_recent[key_indicators] if len(key_indicators) > 1 else finance_recent
+    return finance_recent, finance_for_ai, finance_columns
+
+
+# ============================================================================
+# 财报紧凑序列化
+# ============================================================================
+
+def _compact_column(values):
+    """一列指标 -> (单位, 去掉单位后的文本)；亿 / 万混用时统一换算为亿，含无法识别的值时整列原样返回"""
+    text, units, numbers, missing = split_units(values)
+    if (np.isnan(numbers) & ~missing).any():
+        return None, ["" if pd.isna(value) else str(value).strip() for value in values]
+    # 数值单元格（非字符串）按 4 位有效数字输出
+    text = [format(value, ".4g") if _is_number(value) else cell for value, cell in zip(values, text.tolist())]
+    present = set(units[~missing].tolist())
+
+    unit = None
+    if present == {"亿", "万"}:
+        unit = "亿"
+    elif len(present) == 1 and "" not in present:
+        unit = next(iter(present))
+    cells = []
+    for cell, cell_unit, number, is_missing in zip(text, units.tolist(), numbers.tolist(), missing.tolist()):
+        if is_missing:
+            cells.append("")
+        elif unit == "亿" and cell_unit == "万":
+            cells.append(format(number / 1e4, ".4g"))
+        elif unit is None and cell_unit:
+            cells.append(cell + cell_unit)
+        else:
+            cells.append(cell)
+    return unit, cells
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+
+def compact_finance_csv(finance_df, periods=None):
+    """财报 -> 紧凑 CSV：第一行为报告期，之后每行一个指标，单位写在指标名后，缺失值留空"""
+    if periods is not None:
+        finance_df = finance_df.head(periods)
+    date_col = finance_df.columns[0]
+    lines = ["指标," + ",".join(str(v).strip() for v in finance_df[date_col])]
+    for col in finance_df.columns[1:]:
+        unit, cells = _compact_column(list(finance_df[col]))
+        lines.append(f"{col}({unit})," if unit else f"{col},")
+        lines[-1] += ",".join(cells)
+    return "\n".join(lines)
+
+
+# ============================================================================
+# 段落与 token 预算
+# ============================================================================
+
+@dataclass(frozen=True, slots=True)
+class PromptSection:
+    """提示词的一个段落：versions 为从完整到精简的若干版本（每个版本是若干行）
+
+    超出预算时 priority 小的段落先降级到下一个版本，最后整段省略；required 的段落保留最精简的版本。
+    """
+
+    name: str
+    versions: tuple
+    priority: int = 0
+    required: bool = False
+    note: str = ""          # 标题后的补充说明
+    titled: bool = True     # 是否输出【标题】行
+
+    def render(self, level, indent=""):
+        if level >= len(self.versions):
+            return ""
+        heading = [f"【{self.name}】" + (f"（{self.note}）" if self.note else "")] if self.titled else []
+        lines = heading + list(self.versions[level])
+        return "\n".join(indent + line if line else line for line in lines)
+
+
+def _render_user_prompt(sections, levels, compact):
+    if compact:
+        return "\n\n".join(text for text in (s.render(l) for s, l in zip(sections, levels)) if text)
+    # 原格式：段落缩进 4 格、段落间空行（与紧凑前的提示词一致，用于对比 token 数）
+    texts = (s.render(l, indent="    ") for s, l in zip(sections, levels))
+    return "\n" + "\n    \n".join(text for text in texts if text) + "\n    "
+
+
+def _messages(user_prompt):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def fit_sections(sections, budget, compact=True):
+    """在 budget（token，None / 0 为不限）内渲染段落，返回 (messages, 被精简或省略的段落名)"""
+    levels = [0] * len(sections)
+    trimmed = []
+    messages = _messages(_render_user_prompt(sections, levels, compact))
+    while budget and estimate_message_tokens(messages) > budget:
+        candidates = [i for i, s in enumerate(sections)
+                      if levels[i] < len(s.versions) - (1 if s.required else 0)]
+        if not candidates:
+            break
+        i = min(candidates, key=lambda i: sections[i].priority)
+        levels[i] += 1
+        if sections[i].name not in trimmed:
+            trimmed.append(sections[i].name)
+        messages = _messages(_render_user_prompt(sections, levels, compact))
+    return messages, tuple(trimmed)
+
+
+# ============================================================================
+# 研报提示词
+# ============================================================================
+
+# 各估值模型的标准说明来自估值模型注册表，股息数据说明附在最后
+DIVIDEND_STANDARD = "- 股息数据: 最多包含近10年历史数据（与财报周期一致），数据不足时会提示"
+
+REPORT_REQUIREMENTS = (
+    "1. 给出【核心量化指标清单】：ROE、毛利率、PE、PB、PEG、股息率等",
+    "2. 给出【多维度估值对比】：综合分析 PE/PEG/股息率 等模型，解释估值结论合理性",
+    "3. 给出【利弗莫尔趋势信号】：价格位置、高低点距离、均线排列与突破信号",
+    "4. 给出【股息策略分析】：分红吸引力、历史分位（注意数据年限）",
+    "5. 给出【风险与不买入理由】：至少 3 条",
+    "6. 给出【投资建议】：买入/观望/卖出",
+    "7. 用具体数字论证，严禁空泛形容词",
+)
+
+# 紧凑格式下财报降级时保留的期数
+FINANCE_PERIODS_TRIMMED = 5
+
+
+def _valuation_lines(valuation_models, compact):
+    lines = []
+    for model in valuation_models:
+        if isinstance(model, PEValuation):
+            lines.append(f"- PE倍数法: {model.assessment} (PE={model.current_pe:.2f})" if compact else
+                         f"- PE倍数法: {model.assessment} (当前PE={model.current_pe:.2f}, 参考: {model.reference_range})")
+        elif isinstance(model, PEGValuation):
+            lines.append(f"- PEG模型: {model.assessment} (PEG={model.peg:.2f}, 增长率={model.growth_rate:.1f}% [{model.growth_source}])"
+                         if compact else
+                         f"- PEG模型: {model.assessment} (PEG={model.peg:.2f}, 增长率={model.growth_rate:.1f}% [{model.growth_source}], 参考: {model.reference})")
+        elif isinstance(model, ROEValuation):
+            lines.append(f"- ROE倍数法: ROE={model.roe:.1f}%, 合理价={model.reasonable_price:.2f}, "
+                         f"溢价={model.discount_or_premium:+.1f}%" if compact else
+                         f"- ROE倍数法: ROE={model.roe:.1f}%, 合理PE={model.reasonable_pe:.1f}, "
+                         f"合理价={model.reasonable_price:.2f}, 溢价={model.discount_or_premium:+.1f}%")
+        elif isinstance(model, PBValuation):
+            lines.append(f"- PB倍数法: {model.assessment} (PB={model.current_pb:.2f})")
+        elif model:
+            lines.append(f"- {model.model}: {model.assessment}")
+    return lines
+
+
+def _trend_lines(trend, current_price):
+    distances = " / ".join(
+        f"{d:+.1f}%" if d is not None else "N/A"
+        for d in (trend.distance_from_high(w, current_price) for w in (20, 60, 250))
+    )
+    averages = " / ".join(f"{ma:.2f}" if ma is not None else "N/A" for ma in (trend.ma_20, trend.ma_60, trend.ma_250))
+    lines = [
+        f"- 距20/60/250日高点: {distances}",
+        f"- 20/60/250日均线: {averages} 元{f'（{trend.alignment}）' if trend.alignment else ''}",
+    ]
+    if trend.atr_14 is not None:
+        lines.append(f"- ATR(14): {trend.atr_14:.2f} 元（收盘价的 {trend.atr_14 / trend.close * 100:.1f}%）")
+    lines.append(f"- 突破信号: {trend.breakout_label or '无'}")
+    return lines
+
+
+def _percentile_lines(percentile_data, compact):
+    if compact:
+        return [
+            f"- 当前 {percentile_data.current_yield:.2f}%，历史 {percentile_data.percentile:.0f}% 分位",
+            f"- 均值 / 中位 / 最高 / 最低: {percentile_data.mean_yield:.2f}% / {percentile_data.median_yield:.2f}% / "
+            f"{percentile_data.max_yield:.2f}% / {percentile_data.min_yield:.2f}%",
+        ]
+    return [
+        f"- 当前股息率: {percentile_data.current_yield:.2f}%，处于历史 {percentile_data.percentile:.0f}% 分位",
+        f"- 历史平均股息率: {percentile_data.mean_yield:.2f}%",
+        f"- 历史中位股息率: {percentile_data.median_yield:.2f}%",
+        f"- 历史最高股息率: {percentile_data.max_yield:.2f}%",
+        f"- 历史最低股息率: {percentile_data.min_yield:.2f}%",
+    ]
+
+
+def report_sections(stock_name, data_string, current_date, current_price, current_pe, current_change_pct,
+                    price_range_data, dividend_data, valuation_models, yield_history=None, trend=None, compact=True):
+    """研报提示词的各个段落（compact=False 为紧凑化之前的原格式）"""
+    pe_str = f"{current_pe:.2f}" if current_pe is not None else "数据暂无"
+    change_str = f"{current_change_pct}%" if current_change_pct is not None else "数据暂无"
+    sections = [PromptSection("标的", ((
+        f"你是顶级对冲基金经理，今天是 {current_date}，标的：{stock_name}。",
+        f"现价：{current_price} 元 | PE：{pe_str} | 涨跌：{change_str}",
+    ),), required=True, titled=False)]
+
+    # 关键数据：价格范围与派息
+    high_52w = price_range_data.high_52w if price_range_data else None
+    low_52w = price_range_data.low_52w if price_range_data else None
+    if high_52w is not None and low_52w is not None:
+        price_info = f"近一年高：{high_52w:.2f} 元 | 低：{low_52w:.2f} 元"
+    else:
+        price_info = "近一年高：数据暂无 | 低：数据暂无"
+    dividend_per_share = dividend_data.dividend_per_share if dividend_data else None
+    sections.append(PromptSection("关键数据", ((
+        price_info,
+        f"当前派息：{dividend_per_share if dividend_per_share else 'N/A'} 元",
+    ),), required=True))
+
+    if trend is not None and trend.available:
+        sections.append(PromptSection("趋势指标", (tuple(_trend_lines(trend, current_price)),), priority=4,
+                                      note=f"近 {trend.bars} 个交易日"))
+
+    if yield_history is not None:
+        percentile_data = analyze_dividend_percentile(yield_history.yields, yield_history.current_yield(current_price))
+        if percentile_data:
+            sections.append(PromptSection(
+                "历史股息率分位分析", (tuple(_percentile_lines(percentile_data, compact)),), priority=3,
+                note=f"近 {percentile_data.samples} 个除权日，按近 12 个月派息 / 除权日收盘价计算"))
+
+    sections.append(PromptSection("多维度估值模型结论", (tuple(_valuation_lines(valuation_models, compact)),), priority=5))
+    sections.append(PromptSection("估值标准说明", ((*valuation_standards(), DIVIDEND_STANDARD),), priority=1))
+
+    # 财务数据：DataFrame 按紧凑 CSV 序列化，降级时只保留最近几期；财报抓取失败时为空表
+    if isinstance(data_string, pd.DataFrame) and data_string.empty:
+        versions = ("数据暂无",)
+    elif isinstance(data_string, pd.DataFrame):
+        if compact:
+            versions = (compact_finance_csv(data_string), compact_finance_csv(data_string, FINANCE_PERIODS_TRIMMED))
+        else:
+            versions = (data_string.to_string(),)
+    else:
+        versions = (str(data_string),)
+    sections.append(PromptSection("财务数据", tuple(tuple(v.split("\n")) for v in versions),
+                                  priority=2, required=True))
+
+    sections.append(PromptSection("报告要求", (REPORT_REQUIREMENTS,), required=True))
+    return sections
+
+
+def compose_report_messages(stock_name, data_string, current_date, current_price,
+                            current_pe, current_change_pct, price_range_data, dividend_data, valuation_models,
+                            yield_history=None, trend=None, compact=True, token_budget=None):
+    """渲染研报提示词，返回 (chat messages, PromptStats)
+
+    data_string 为财报关键指标（DataFrame 按紧凑 CSV 序列化，也可传入已格式化的文本）；
+    token_budget 为输入 token 上限（None 时读取配置 PROMPT_TOKEN_BUDGET，0 为不限）。
+    token 数为本地估算，同时记录到当前计时阶段。
+    """
+    budget = PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    args = (stock_name, data_string, current_date, current_price, current_pe, current_change_pct,
+            price_range_data, dividend_data, valuation_models, yield_history, trend)
+    before = report_sections(*args, compact=False)
+    tokens_before = estimate_message_tokens(_messages(_render_user_prompt(before, [0] * len(before), False)))
+
+    messages, trimmed = fit_sections(report_sections(*args, compact=compact) if compact else before, budget, compact)
+    stats = PromptStats(tokens_before=tokens_before, tokens_after=estimate_message_tokens(messages),
+                        budget=budget or None, trimmed=trimmed)
+    annotate(prompt_tokens_before=stats.tokens_before, prompt_tokens=stats.tokens_after,
+             **({"prompt_trimmed": "、".join(trimmed)} if trimmed else {}))
+    return messages, stats
+
+
+def build_report_messages(stock_name, data_string, current_date, current_price,
+                          current_pe, current_change_pct, price_range_data, dividend_data, valuation_models,
+                          yield_history=None, trend=None, compact=True, token_budget=None):
+    """把行情、估值与财报数据渲染成研报提示词，返回 chat messages 列表
+    （yield_history 为历史股息率序列，trend 为滚动高低点 / 均线 / ATR 趋势信号，均可选；其余参数见 compose_report_messages）"""
+    return compose_report_messages(stock_name, data_string, current_date, current_price, current_pe,
+                                   current_change_pct, price_range_data, dividend_data, valuation_models,
+                                   yield_history, trend, compact, token_budget)[0]
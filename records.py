@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+结果记录 - 价格区间、分红、估值等结果的定长记录（__slots__ 数据类，字段显式列出，可选字段默认为 None），
+以及批量场景下按列存储的记录数组（每个字段一个 numpy 数组，与 DataFrame 互转）
+
+记录不可变：同一份结果会被多个会话 / 请求共享（见 engine.AnalysisEngine.fetch）。
+"""
+
+import math
+from dataclasses import dataclass, fields
+from typing import ClassVar, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class _Record:
+    """记录公共方法（不引入实例 __dict__）"""
+
+    __slots__ = ()
+
+    def to_dict(self):
+        """转为普通字典（JSON 输出、展示用）"""
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+
+# ============================================================================
+# 数据记录
+# ============================================================================
+
+@dataclass(frozen=True, slots=True)
+class PriceRange(_Record):
+    """近一年（52 周）价格区间"""
+
+    high_52w: Optional[float] = None
+    low_52w: Optional[float] = None
+    range: Optional[float] = None
+    ratio: Optional[float] = None   # 波动幅度（%）
+
+    @property
+    def available(self):
+        return self.high_52w is not None and self.low_52w is not None
+
+
+@dataclass(frozen=True, slots=True)
+class TrendSignals(_Record):
+    """最新一根 K 线的趋势指标：20 / 60 / 250 日高低点与均线、ATR(14)，
+    breakout_N 为 1 表示收盘突破此前 N 日最高价，-1 表示跌破此前 N 日最低价（见 trend.py）"""
+
+    date: Optional[object] = None
+    close: Optional[float] = None
+    bars: int = 0
+    high_20: Optional[float] = None
+    low_20: Optional[float] = None
+    high_60: Optional[float] = None
+    low_60: Optional[float] = None
+    high_250: Optional[float] = None
+    low_250: Optional[float] = None
+    ma_20: Optional[float] = None
+    ma_60: Optional[float] = None
+    ma_250: Optional[float] = None
+    atr_14: Optional[float] = None
+    breakout_20: int = 0
+    breakout_60: int = 0
+    breakout_250: int = 0
+
+    @property
+    def available(self):
+        return self.close is not None
+
+    def distance_from_high(self, window, price=None):
+        """价格距 N 日最高价的幅度（%），price 缺省时用最新收盘价"""
+        high = getattr(self, f"high_{window}")
+        price = self.close if price is None else price
+        if not high or price is None:
+            return None
+        return (price / high - 1) * 100
+
+    def distance_from_low(self, window, price=None):
+        low = getattr(self, f"low_{window}")
+        price = self.close if price is None else price
+        if not low or price is None:
+            return None
+        return (price / low - 1) * 100
+
+    @property
+    def alignment(self):
+        """均线排列：多头（20 > 60 > 250）/ 空头（20 < 60 < 250）/ 交织；250 日均线不足时为 None"""
+        if self.ma_20 is None or self.ma_60 is None or self.ma_250 is None:
+            return None
+        if self.ma_20 > self.ma_60 > self.ma_250:
+            return "多头排列"
+        if self.ma_20 < self.ma_60 < self.ma_250:
+            return "空头排列"
+        return "均线交织"
+
+    @property
+    def breakout_label(self):
+        """最长窗口的突破信号，例如“收盘突破 60 日新高”；没有突破时为 None"""
+        for window in (250, 60, 20):
+            flag = getattr(self, f"breakout_{window}")
+            if flag:
+                return f"收盘{'突破' if flag > 0 else '跌破'} {window} 日{'新高' if flag > 0 else '新低'}"
+        return None
+
+
+@dataclass(frozen=True, slots=True)
+class DividendInfo(_Record):
+    """最新一期派息与近 10 次历史派息（元 / 股，巨潮的每 10 股派息已换算；按公告日期倒序），history_dates 为对应的除权日"""
+
+    dividend_per_share: Optional[float] = None
+    transfer_share: Optional[float] = None
+    payout_ratio: Optional[float] = None
+    record_date: Optional[object] = None
+    history: tuple = ()
+    history_dates: tuple = ()   # pd.Timestamp，缺失为 None
+
+    @property
+    def history_years(self):
+        return len(self.history)
+
+    def to_dict(self):
+        return {**_Record.to_dict(self), "history": list(self.history), "history_dates": list(self.history_dates),
+                "history_years": self.history_years}
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class YieldHistory(_Record):
+    """历史股息率：每个除权日的近 12 个月派息 / 除权日收盘价（%），按除权日升序"""
+
+    code: str
+    ex_dates: tuple = ()
+    yields: tuple = ()
+    ttm_dividend: Optional[float] = None   # 最近一个除权日的近 12 个月派息（元 / 股）
+
+    def current_yield(self, price):
+        """以最近 12 个月派息计算的当前股息率（%）"""
+        if not self.ttm_dividend or price is None or not price > 0:
+            return None
+        return self.ttm_dividend / price * 100
+
+    def to_dict(self):
+        return {**_Record.to_dict(self), "ex_dates": list(self.ex_dates), "yields": list(self.yields)}
+
+
+@dataclass(frozen=True, slots=True)
+class DividendPercentile(_Record):
+    """当前股息率在历史股息率序列中的位置"""
+
+    current_yield: float
+    percentile: float        # 历史上不高于当前股息率的比例（%）
+    samples: int
+    mean_yield: float
+    median_yield: float
+    q25_yield: float
+    q75_yield: float
+    max_yield: float
+    min_yield: float
+
+
+@dataclass(frozen=True, slots=True)
+class PromptStats(_Record):
+    """研报提示词的输入 token 数（本地估算）：紧凑化之前 / 之后，以及为满足预算被精简或省略的段落"""
+
+    tokens_before: int
+    tokens_after: int
+    budget: Optional[int] = None
+    trimmed: tuple = ()
+
+    @property
+    def over_budget(self):
+        """必需段落本身已超出预算"""
+        return bool(self.budget) and self.tokens_after > self.budget
+
+    def to_dict(self):
+        return {**_Record.to_dict(self), "trimmed": list(self.trimmed)}
+
+
+# ============================================================================
+# 估值记录（model 为类属性，不占实例空间）
+# ============================================================================
+
+class _Valuation(_Record):
+    __slots__ = ()
+
+    def to_dict(self):
+        return {"model": self.model, **_Record.to_dict(self)}
+
+    @property
+    def summary(self):
+        """页面 / 命令行展示的结论"""
+        return self.assessment
+
+
+@dataclass(frozen=True, slots=True)
+class PEValuation(_Valuation):
+    model: ClassVar[str] = "PE倍数法"
+
+    current_pe: float
+    assessment: str
+    market_avg: float
+    premium: float
+    reference_range: str = "低估<15 | 合理15-25 | 偏高25-35 | 高估>35"
+
+
+@dataclass(frozen=True, slots=True)
+class PBValuation(_Valuation):
+    model: ClassVar[str] = "PB倍数法"
+
+    current_pb: float
+    assessment: str
+
+
+@dataclass(frozen=True, slots=True)
+class ROEValuation(_Valuation):
+    model: ClassVar[str] = "ROE倍数法"
+
+    roe: float
+    reasonable_pe: float
+    reasonable_price: float
+    discount_or_premium: float
+    assessment: Optional[str] = None
+
+    @property
+    def summary(self):
+        # 没有分档标准，直接给出合理价与溢价
+        return self.assessment or f"合理价 {self.reasonable_price:.2f}（溢价 {self.discount_or_premium:+.1f}%）"
+
+
+@dataclass(frozen=True, slots=True)
+class PEGValuation(_Valuation):
+    model: ClassVar[str] = "PEG模型"
+
+    peg: float
+    growth_rate: float
+    growth_source: str
+    assessment: str
+    reference: str = "低估<1 | 合理1-1.5 | 偏高1.5-2 | 高估>2"
+
+
+# ============================================================================
+# 列式记录数组
+# ============================================================================
+
+def _is_number(value):
+    return value is None or (isinstance(value, (int, float, np.number)) and not isinstance(value, bool))
+
+
+class RecordArray:
+    """同一类记录按列存储：数值字段为 float64 数组（缺失为 NaN），其余字段为 object 数组；
+    None 表示该位置没有记录（例如某只股票没有 PE 估值）
+
+        arr = RecordArray.from_records(PriceRange, ranges)
+        df = arr.to_frame(index=codes)
+        arr[0]  # -> PriceRange(...)
+    """
+
+    __slots__ = ("record_type", "columns", "present")
+
+    def __init__(self, record_type, columns, present):
+        self.record_type = record_type
+        self.columns = columns
+        self.present = present
+
+    @classmethod
+    def from_records(cls, record_type, records):
+        records = list(records)
+        present = np.fromiter((r is not None for r in records), dtype=bool, count=len(records))
+        columns = {}
+        for f in fields(record_type):
+            values = [getattr(r, f.name) if r is not None else None for r in records]
+            if all(_is_number(v) for v in values):
+                columns[f.name] = np.array([np.nan if v is None else v for v in values], dtype=float)
+            else:
+                column = np.empty(len(values), dtype=object)
+                column[:] = values
+                columns[f.name] = column
+        return cls(record_type, columns, present)
+
+    @classmethod
+    def from_frame(cls, record_type, df):
+        """按字段名取列（缺少的列视为缺失），整行字段都缺失的视为没有记录"""
+        columns = {}
+        for f in fields(record_type):
+            if f.name in df.columns and pd.api.types.is_numeric_dtype(df[f.name]):
+                columns[f.name] = df[f.name].to_numpy(dtype=float)
+            elif f.name in df.columns:
+                columns[f.name] = df[f.name].to_numpy(dtype=object)
+            else:
+                columns[f.name] = np.full(len(df), np.nan)
+        present = ~pd.DataFrame(columns).isna().all(axis=1).to_numpy()
+        return cls(record_type, columns, present)
+
+    def to_frame(self, index=None):
+        return pd.DataFrame(self.columns, index=index)
+
+    def __len__(self):
+        return len(self.present)
+
+    def __getitem__(self, i):
+        if not self.present[i]:
+            return None
+        values = {}
+        for name, column in self.columns.items():
+            value = column[i]
+            if column.dtype == float:
+                value = None if math.isnan(value) else float(value)
+            values[name] = value
+        return self.record_type(**values)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def nbytes(self):
+        """数组本身占用的字节数（object 列只计指针）"""
+        return self.present.nbytes + sum(column.nbytes for column in self.columns.values())
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+离线录制与回放 - 把 4 个 akshare 接口的返回录制为本地 Parquet，回放时按需模拟网络延迟，不访问外网
+
+用法：
+    python replay.py record 600519 000858 --dir fixtures    # 录制（需要联网）
+    python replay.py synthetic --dir fixtures               # 生成同结构的合成数据（离线）
+回放：在 .env 中设置 STOCKAGENT_REPLAY_DIR=fixtures（可选 STOCKAGENT_REPLAY_LATENCY=0.3）后启动应用
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# 录制 / 回放的接口
+ENDPOINTS = ["stock_zh_a_spot_em", "stock_zh_a_hist", "stock_dividend_cninfo", "stock_financial_abstract_ths"]
+
+# 录制日线时抓取的历史长度（天），覆盖 52 周区间、滚动指标与近 10 年除权日的历史股息率
+HIST_DAYS = 11 * 365
+
+MANIFEST_NAME = "manifest.json"
+
+
+def _fixture_path(fixtures_dir, endpoint, name):
+    return os.path.join(fixtures_dir, endpoint, f"{name}.parquet")
+
+
+def _write_fixture(fixtures_dir, endpoint, name, df):
+    path = _fixture_path(fixtures_dir, endpoint, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 混合类型的文本列（如分红里的日期对象）统一转为字符串，保证能写入 Parquet；缺失值保持缺失，不写成 "None"
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object and df[col].map(type).nunique() > 1:
+            df[col] = df[col].map(lambda v: None if v is None or pd.isna(v) else str(v))
+    df.to_parquet(path, index=False)
+    return path
+
+
+def _write_manifest(fixtures_dir, codes, source):
+    with open(os.path.join(fixtures_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump({"codes": list(codes), "source": source,
+                   "recorded_at": datetime.now().isoformat(timespec="seconds")}, f, ensure_ascii=False, indent=2)
+
+
+def load_manifest(fixtures_dir):
+    """读取录制清单 {"codes","source","recorded_at"}"""
+    with open(os.path.join(fixtures_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ============================================================================
+# 录制
+# ============================================================================
+
+def record_fixtures(codes, fixtures_dir, hist_days=HIST_DAYS):
+    """联网抓取全市场快照与 codes 中每只股票的日线 / 分红 / 财报，保存为回放数据"""
+    import akshare as ak
+
+    _write_fixture(fixtures_dir, "stock_zh_a_spot_em", "all", ak.stock_zh_a_spot_em())
+    end = date.today()
+    start = end - timedelta(days=hist_days)
+    for code in codes:
+        print(f"📥 录制 {code} ...")
+        _write_fixture(fixtures_dir, "stock_zh_a_hist", code,
+                       ak.stock_zh_a_hist(symbol=code, period="daily", start_date=start.strftime("%Y%m%d"),
+                                          end_date=end.strftime("%Y%m%d"), adjust=""))
+        _write_fixture(fixtures_dir, "stock_dividend_cninfo", code, ak.stock_dividend_cninfo(symbol=code))
+        _write_fixture(fixtures_dir, "stock_financial_abstract_ths", code,
+                       ak.stock_financial_abstract_ths(symbol=code, indicator="主要指标"))
+    _write_manifest(fixtures_dir, codes, "akshare")
+
+
+# ============================================================================
+# 合成数据（与接口同结构，供没有录制数据的环境跑基准）
+# ============================================================================
+
+def make_dividend_history(rows, text_values=False, seed=0, end=date(2024, 6, 1), interval_days=1):
+    """合成与 stock_dividend_cninfo 同结构的分红记录；text_values=True 时派息为“x.xx元”字符串
+
+    “派息比例”与巨潮一致为每 10 股派息（0.5-30 元，对应快照 2-200 元的股价）。
+    最新一条的日期为 end，之后每条往前推 interval_days 天（年度分红用 365）。
+    """
+    rng = np.random.default_rng(seed)
+    dates = [end - timedelta(days=i * interval_days) for i in range(rows)]
+    payout = np.round(rng.uniform(0.5, 30, rows), 2)
+    payout[rng.random(rows) < 0.1] = np.nan
+    notes = ["不分配不转增" if np.isnan(v) else f"10派{v:g}元" for v in payout]
+
+    if text_values:
+        payout = [None if np.isnan(v) else f"{v}元" for v in payout]
+
+    return pd.DataFrame({
+        "实施方案公告日期": pd.to_datetime(dates),
+        "分红类型": "年度分红",
+        "送股比例": np.nan,
+        "转增比例": np.nan,
+        "派息比例": payout,
+        "股权登记日": pd.to_datetime(dates),
+        "除权日": dates,
+        "派息日": dates,
+        "实施方案分红说明": notes,
+    })
+
+
+# 合成快照中使用真实名称的股票，便于检索
+KNOWN_NAMES = {"600519": "贵州茅台", "000858": "五粮液", "601318": "中国平安", "600036": "招商银行", "000001": "平安银行"}
+
+
+def make_spot_snapshot(rows=5000, codes=(), seed=0):
+    """合成与 stock_zh_a_spot_em 同结构的全市场快照，codes 中的股票排在最前面"""
+    rng = np.random.default_rng(seed)
+    fixed = list(dict.fromkeys(list(codes) + list(KNOWN_NAMES)))
+    generated = (f"{600000 + i:06d}" if i % 2 else f"{i:06d}" for i in range(rows * 2))
+    codes = (fixed + [c for c in generated if c not in fixed])[:rows]
+    names = [KNOWN_NAMES.get(code, f"合成{i:04d}") for i, code in enumerate(codes)]
+    price = np.round(rng.uniform(2, 200, rows), 2)
+    return pd.DataFrame({
+        "序号": np.arange(1, rows + 1),
+        "代码": codes,
+        "名称": names,
+        "最新价": price,
+        "涨跌幅": np.round(rng.normal(0, 2, rows), 2),
+        "涨跌额": np.round(rng.normal(0, 1, rows), 2),
+        "成交量": rng.integers(1_000, 10_000_000, rows).astype(float),
+        "成交额": rng.uniform(1e6, 1e10, rows),
+        "最高": price * 1.02,
+        "最低": price * 0.98,
+        "今开": price,
+        "昨收": price,
+        "市盈率-动态": np.round(rng.uniform(-20, 120, rows), 2),
+        "市净率": np.round(rng.uniform(0.3, 15, rows), 2),
+        "总市值": rng.uniform(1e9, 2e12, rows),
+        "流通市值": rng.uniform(1e9, 2e12, rows),
+    })
+
+
+def make_price_history(code, days=HIST_DAYS, seed=0, last_close=None):
+    """合成与 stock_zh_a_hist 同结构的日线（几何随机游走）；last_close 指定最后一天的收盘价（与快照现价一致）"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=int(days * 5 / 7))
+    close = 50 * np.exp(np.cumsum(rng.normal(0, 0.015, len(dates))))
+    if last_close:
+        close *= last_close / close[-1]
+    open_ = close * (1 + rng.normal(0, 0.005, len(dates)))
+    return pd.DataFrame({
+        "日期": dates.date,
+        "股票代码": code,
+        "开盘": open_,
+        "收盘": close,
+        "最高": np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, len(dates))),
+        "最低": np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, len(dates))),
+        "成交量": rng.integers(10_000, 1_000_000, len(dates)),
+        "成交额": rng.uniform(1e6, 1e9, len(dates)),
+        "振幅": rng.uniform(0, 5, len(dates)),
+        "涨跌幅": rng.normal(0, 1.5, len(dates)),
+        "涨跌额": rng.normal(0, 0.5, len(dates)),
+        "换手率": rng.uniform(0, 3, len(dates)),
+    })
+
+
+def make_financial_abstract(years=12, seed=0):
+    """合成与 stock_financial_abstract_ths（主要指标）同结构的年报摘要，数值为“亿 / %”字符串"""
+    rng = np.random.default_rng(seed)
+    profit = 100 * np.cumprod(1 + rng.uniform(-0.1, 0.3, years))
+    revenue = profit * rng.uniform(2, 4, years)
+    return pd.DataFrame({
+        "报告期": [str(2024 - years + 1 + i) for i in range(years)],
+        "净利润": [f"{v:.2f}亿" for v in profit],
+        "净利润同比增长率": [f"{v:.2f}%" for v in rng.uniform(-10, 30, years)],
+        "扣非净利润": [f"{v * 0.95:.2f}亿" for v in profit],
+        "扣非净利润同比增长率": [f"{v:.2f}%" for v in rng.uniform(-10, 30, years)],
+        "营业总收入": [f"{v:.2f}亿" for v in revenue],
+        "营业总收入同比增长率": [f"{v:.2f}%" for v in rng.uniform(-5, 25, years)],
+        "基本每股收益": [f"{v:.2f}" for v in rng.uniform(0.5, 50, years)],
+        "每股净资产": [f"{v:.2f}" for v in rng.uniform(5, 200, years)],
+        "销售净利率": [f"{v:.2f}%" for v in rng.uniform(5, 50, years)],
+        "销售毛利率": [f"{v:.2f}%" for v in rng.uniform(20, 92, years)],
+        "净资产收益率": [f"{v:.2f}%" for v in rng.uniform(5, 35, years)],
+        "流动比率": [f"{v:.2f}" for v in rng.uniform(0.8, 5, years)],
+        "资产负债率": [f"{v:.2f}%" for v in rng.uniform(10, 70, years)],
+    })
+
+
+def write_synthetic_fixtures(fixtures_dir, codes=("600519", "000858", "601318"), seed=0):
+    """生成与录制数据同布局的合成回放数据"""
+    spot = make_spot_snapshot(codes=codes, seed=seed)
+    _write_fixture(fixtures_dir, "stock_zh_a_spot_em", "all", spot)
+    prices = dict(zip(spot["代码"], spot["最新价"]))
+    for i, code in enumerate(codes):
+        _write_fixture(fixtures_dir, "stock_zh_a_hist", code,
+                       make_price_history(code, seed=seed + i, last_close=prices.get(code)))
+        # 每年 6 月派息一次，最近一次在去年（日线覆盖全部除权日）
+        dividends = make_dividend_history(10, seed=seed + i, end=date(date.today().year - 1, 6, 14), interval_days=365)
+        _write_fixture(fixtures_dir, "stock_dividend_cninfo", code, dividends.iloc[::-1].reset_index(drop=True))
+        _write_fixture(fixtures_dir, "stock_financial_abstract_ths", code, make_financial_abstract(seed=seed + i))
+    _write_manifest(fixtures_dir, codes, "synthetic")
+
+
+# ============================================================================
+# 回放
+# ============================================================================
+
+class ReplaySource:
+    """按 akshare 接口签名返回录制数据；latency / jitter（秒）模拟每次调用的网络耗时"""
+
+    def __init__(self, fixtures_dir, latency=0.0, jitter=0.0, seed=None):
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._frames = {}
+        self._lock = threading.Lock()
+        self.calls = {endpoint: 0 for endpoint in ENDPOINTS}
+
+    def _load(self, endpoint, name):
+        with self._lock:
+            self.calls[endpoint] += 1
+            key = (endpoint, name)
+            if key not in self._frames:
+                path = _fixture_path(self.fixtures_dir, endpoint, name)
+                if not os.path.exists(path):
+                    raise KeyError(f"回放数据中没有 {endpoint}({name})")
+                self._frames[key] = pd.read_parquet(path)
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        if delay:
+            time.sleep(delay)
+        # 返回副本，调用方修改不会影响后续回放
+        return self._frames[key].copy()
+
+    def stock_zh_a_spot_em(self):
+        return self._load("stock_zh_a_spot_em", "all")
+
+    def stock_zh_a_hist(self, symbol, period="daily", start_date="19700101", end_date="20500101", adjust=""):
+        df = self._load("stock_zh_a_hist", symbol)
+        dates = pd.to_datetime(df["日期"])
+        mask = (dates >= pd.Timestamp(start_date)) & (dates <= pd.Timestamp(end_date))
+        return df.loc[mask].reset_index(drop=True)
+
+    def stock_dividend_cninfo(self, symbol):
+        return self._load("stock_dividend_cninfo", symbol)
+
+    def stock_financial_abstract_ths(self, symbol, indicator="按报告期"):
+        return self._load("stock_financial_abstract_ths", symbol)
+
+
+def install_replay(source):
+    """把 akshare 的 4 个接口替换为回放数据，返回用于恢复的原函数表"""
+    import akshare as ak
+
+    originals = {endpoint: getattr(ak, endpoint) for endpoint in ENDPOINTS}
+    for endpoint in ENDPOINTS:
+        setattr(ak, endpoint, getattr(source, endpoint))
+    return originals
+
+
+def uninstall_replay(originals):
+    import akshare as ak
+
+    for endpoint, func in originals.items():
+        setattr(ak, endpoint, func)
+
+
+@contextmanager
+def replaying(fixtures_dir, latency=0.0, jitter=0.0):
+    """在 with 块内用回放数据代替 akshare 接口"""
+    source = ReplaySource(fixtures_dir, latency=latency, jitter=jitter)
+    originals = install_replay(source)
+    try:
+        yield source
+    finally:
+        uninstall_replay(originals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="录制 / 生成离线回放数据")
+    parser.add_argument("command", choices=["record", "synthetic"])
+    parser.add_argument("codes", nargs="*", default=["600519", "000858", "601318"])
+    parser.add_argument("--dir", default="fixtures", help="回放数据目录")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_fixtures(args.codes, args.dir)
+    else:
+        write_synthetic_fixtures(args.dir, args.codes)
+    print(f"✅ 已保存到 {os.path.abspath(args.dir)}（{len(args.codes)} 只股票）")
+
+
+if __name__ == "__main__":
+    main()
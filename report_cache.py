@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+研报缓存 - 以 (模型, 提示词, 温度) 的哈希为键把生成完的报告存到磁盘，带过期时间与按容量的 LRU 淘汰
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from config import REPORTS_DIR, REPORT_CACHE_TTL, REPORT_CACHE_MAX_BYTES
+
+# 回放缓存报告时每段的字符数
+REPLAY_CHUNK_SIZE = 200
+
+
+def report_key(model, messages, temperature):
+    """报告指纹：模型、system / user 消息与温度完全相同才视为同一份报告"""
+    payload = json.dumps({"model": model, "messages": messages, "temperature": temperature},
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def replay_report(content, chunk_size=REPLAY_CHUNK_SIZE):
+    """把缓存的整份报告切成若干段，按与流式生成相同的方式逐段产出"""
+    for i in range(0, len(content), chunk_size):
+        yield content[i:i + chunk_size]
+
+
+class ReportCache:
+    """报告磁盘缓存：每份报告一个 JSON 文件，文件 mtime 记录最近一次访问时间，用于 LRU 淘汰"""
+
+    def __init__(self, cache_dir=REPORTS_DIR, ttl=REPORT_CACHE_TTL, max_bytes=REPORT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """返回缓存的报告 {"content","model","created_at","usage"}，不存在或已过期时返回 None"""
+        path = self._path(key)
+        entry = None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        if entry is not None and time.time() - entry.get("created_at", 0) > self.ttl:
+            self._remove(path)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        try:
+            os.utime(path)  # 刷新访问时间
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, content, model=None, usage=None):
+        """保存一份完整报告，写入后按容量上限淘汰最久未访问的报告"""
+        if not content:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        entry = {"content": content, "model": model, "created_at": time.time(), "usage": usage}
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _entries(self):
+        """[(mtime, size, path)]，按最近访问时间升序"""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def _evict(self):
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        """删除全部缓存报告"""
+        with self._lock:
+            for _, _, path in self._entries():
+                self._remove(path)
+
+    def stats(self):
+        """命中 / 未命中次数与当前缓存的报告数、占用字节数"""
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_report_cache():
+    """进程内共享的研报缓存"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ReportCache()
+        return _default_cache
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+异步研报引擎 - 共用一个带连接池的 HTTP 客户端，在并发上限与每分钟 token 预算内同时生成多份报告，每份流式写入各自的输出
+"""
+
+import asyncio
+import inspect
+import json
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+from config import REPORT_CONCURRENCY, REPORT_TPM
+from prompts import REPORT_TEMPERATURE, estimate_tokens, estimate_message_tokens
+from report_cache import report_key, replay_report
+
+# 预扣额度时假设的单份报告输出长度（token），实际用量在生成结束后按 usage 修正
+EXPECTED_COMPLETION_TOKENS = 2000
+
+
+# ============================================================================
+# 每分钟 token 预算
+# ============================================================================
+
+class TokenBudget:
+    """令牌桶：容量为每分钟 token 数，按时间匀速恢复；额度不足时异步等待，形成背压"""
+
+    def __init__(self, tokens_per_minute=REPORT_TPM, clock=time.monotonic):
+        self.capacity = float(tokens_per_minute)
+        self.available = float(tokens_per_minute)
+        self._clock = clock
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+        self.wait_seconds = 0.0
+
+    def _refill(self):
+        now = self._clock()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.capacity / 60)
+        self._updated = now
+
+    async def acquire(self, tokens):
+        """预扣 tokens 个额度（超过容量时按容量计），返回实际预扣数"""
+        tokens = min(float(tokens), self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return tokens
+                delay = (tokens - self.available) * 60 / self.capacity
+                self.wait_seconds += delay
+                await asyncio.sleep(delay)
+
+    def settle(self, reserved, used):
+        """按实际用量修正预扣：少用的返还，多用的从后续额度里扣除"""
+        self._refill()
+        self.available = min(self.capacity, self.available + reserved - used)
+
+
+# ============================================================================
+# 报告引擎
+# ============================================================================
+
+async def _emit(sink, delta):
+    """把增量文本写入输出；sink 可以是普通函数或协程函数"""
+    if sink is None:
+        return
+    result = sink(delta)
+    if inspect.isawaitable(result):
+        await result
+
+
+class ReportEngine:
+    """异步研报引擎，需在同一个事件循环内以 async with 使用（连接池绑定事件循环）
+
+        async with ReportEngine(api_key, base_url) as engine:
+            results = await engine.run_many(jobs)
+    """
+
+    def __init__(self, api_key, base_url, concurrency=REPORT_CONCURRENCY, tokens_per_minute=REPORT_TPM,
+                 timeout=120, max_retries=2, cache=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.concurrency = max(1, int(concurrency))
+        self.tokens_per_minute = tokens_per_minute
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.cache = cache
+        self.budget = None
+        self._http = None
+        self._client = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        # 所有生成共用一个连接池，连接数与并发上限一致，长连接在报告之间复用
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        self._http = httpx.AsyncClient(limits=limits, timeout=self.timeout)
+        self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url,
+                                   http_client=self._http, max_retries=self.max_retries)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.budget = TokenBudget(self.tokens_per_minute)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._http.aclose()
+
+    async def generate(self, messages, sink=None, model="deepseek-chat", temperature=REPORT_TEMPERATURE,
+                       force_refresh=False):
+        """生成一份报告并逐段写入 sink，返回 {"content","usage","ttft","elapsed","cached"}
+
+        设置了 cache 时，相同提示词的报告直接从缓存回放，不占用并发与 token 额度；force_refresh=True 时跳过缓存。
+        """
+        cache_key = report_key(model, messages, temperature) if self.cache is not None else None
+        cached = self.cache.get(cache_key) if cache_key and not force_refresh else None
+        if cached is not None:
+            start = time.perf_counter()
+            for piece in replay_report(cached["content"]):
+                await _emit(sink, piece)
+            return {
+                "content": cached["content"],
+                "usage": cached.get("usage"),
+                "ttft": 0.0,
+                "elapsed": time.perf_counter() - start,
+                "cached": True,
+            }
+
+        prompt_tokens = estimate_message_tokens(messages)
+        async with self._semaphore:
+            reserved = await self.budget.acquire(prompt_tokens + EXPECTED_COMPLETION_TOKENS)
+            start = time.perf_counter()
+            parts, usage, ttft = [], None, None
+            try:
+                # 自行解析 SSE 并读完整个响应体：SDK 的流在 [DONE] 处提前关闭响应，连接无法放回连接池
+                async with self._client.chat.completions.with_streaming_response.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ) as response:
+                    async for line in response.iter_lines():
+                        if not line.startswith("data:") or line[5:].strip() == "[DONE]":
+                            continue
+                        chunk = json.loads(line[5:])
+                        if chunk.get("usage"):
+                            usage = chunk["usage"]
+                        delta = chunk["choices"][0].get("delta", {}).get("content") if chunk.get("choices") else None
+                        if delta:
+                            if ttft is None:
+                                ttft = time.perf_counter() - start
+                            parts.append(delta)
+                            await _emit(sink, delta)
+            finally:
+                content = "".join(parts)
+                used = usage["total_tokens"] if usage else prompt_tokens + estimate_tokens(content)
+                self.budget.settle(reserved, used)
+
+        if cache_key:
+            self.cache.put(cache_key, content, model=model, usage=usage)
+        return {
+            "content": content,
+            "usage": usage,
+            "ttft": ttft,
+            "elapsed": time.perf_counter() - start,
+            "cached": False,
+        }
+
+    async def run_many(self, jobs, model="deepseek-chat", force_refresh=False):
+        """并发生成多份报告
+
+        jobs 为 [{"key", "messages", "sink"(可选)}]，按输入顺序返回
+        [{"key","content","usage","ttft","elapsed","cached","error"}]；单份失败不影响其它报告。
+        """
+        async def run_one(job):
+            try:
+                result = await self.generate(job["messages"], sink=job.get("sink"), model=job.get("model", model),
+                                             force_refresh=force_refresh)
+                result["error"] = None
+            except Exception as e:
+                result = {"content": "", "usage": None, "ttft": None, "elapsed": None, "cached": False,
+                          "error": str(e)}
+            result["key"] = job["key"]
+            return result
+
+        return await asyncio.gather(*(run_one(job) for job in jobs))
+
+
+def generate_reports(jobs, api_key, base_url, model="deepseek-chat", force_refresh=False, **engine_kwargs):
+    """同步入口：在新的事件循环里并发生成 jobs 中的全部报告（供 Streamlit 脚本等同步代码调用）"""
+    async def main():
+        async with ReportEngine(api_key, base_url, **engine_kwargs) as engine:
+            return await engine.run_many(jobs, model=model, force_refresh=force_refresh)
+
+    return asyncio.run(main())
@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+上游容错 - akshare 四个接口的统一调用层：超时、带抖动的指数退避重试、按接口熔断，
+上游不可用时返回最近一次成功的数据并标记为过期；可注入故障序列，不联网即可验证
+
+    upstream = get_upstream()
+    df = upstream.call("stock_dividend_cninfo", "600519", lambda: ak.stock_dividend_cninfo(symbol="600519"))
+    upstream.is_stale("stock_dividend_cninfo", "600519")   # True 表示返回的是旧数据
+"""
+
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from config import (
+    UPSTREAM_DIR, UPSTREAM_TIMEOUT, UPSTREAM_RETRIES, UPSTREAM_BACKOFF,
+    BREAKER_THRESHOLD, BREAKER_RESET, UPSTREAM_STALE_MAX_AGE, UPSTREAM_FAULTS,
+)
+from tracing import annotate
+
+# 受保护的 akshare 接口（与 replay.ENDPOINTS 一致）
+ENDPOINTS = ("stock_zh_a_spot_em", "stock_zh_a_hist", "stock_dividend_cninfo", "stock_financial_abstract_ths")
+
+
+class UpstreamTimeout(TimeoutError):
+    """上游在规定时间内没有返回"""
+
+
+class CircuitOpenError(ConnectionError):
+    """接口处于熔断状态（不再发出请求），且没有可用的旧数据"""
+
+
+def is_transient(error):
+    """网络类错误（连接失败、超时、返回了非 JSON 页面）值得重试；其余错误说明上游已应答，重试无益"""
+    return isinstance(error, (OSError, json.JSONDecodeError))
+
+
+# ============================================================================
+# 重试与熔断
+# ============================================================================
+
+class RetryPolicy:
+    """指数退避 + 全抖动：第 n 次重试前等待 uniform(0, min(cap, base * 2^n)) 秒"""
+
+    def __init__(self, retries=UPSTREAM_RETRIES, base=UPSTREAM_BACKOFF, cap=8.0, rng=None):
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+        self._random = rng or random.Random()
+
+    def delay(self, attempt):
+        return self._random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """单个接口的熔断器：连续 threshold 次网络错误后打开，reset_after 秒后放行一次试探请求（半开），
+    试探成功则关闭，失败则重新打开"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_after=BREAKER_RESET, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_after:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """是否放行本次请求；半开状态下同一时间只放行一个试探请求"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._clock() - self._opened_at < self.reset_after or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state, self._failures, self._opened_at, self._probing = self.CLOSED, 0, None, False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._state == self.CLOSED and self.threshold and self._failures >= self.threshold):
+                self._state, self._opened_at, self._probing = self.OPEN, self._clock(), False
+                self.trips += 1
+
+    def retry_in(self):
+        """距离下一次试探的秒数（未熔断时为 0）"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return 0.0
+            return max(0.0, self.reset_after - (self._clock() - self._opened_at))
+
+
+# ============================================================================
+# 故障注入
+# ============================================================================
+
+class FaultSchedule:
+    """按接口注入故障，用于不联网地验证重试 / 熔断 / 过期回退
+
+    scripted：接口 -> 依次取用的结果，"ok" 正常调用，"error" 抛出连接错误，"timeout" 直接按超时处理，
+              数字表示先等待这么多秒再调用（经过真实的超时判断）；用完后按 rates 随机失败
+    rates：接口 -> 失败概率（0~1）
+
+        FaultSchedule({"stock_dividend_cninfo": ["error", "error", "ok"]})
+        FaultSchedule.parse("stock_dividend_cninfo=0.3;stock_zh_a_hist=error,timeout,ok")
+    """
+
+    def __init__(self, scripted=None, rates=None, seed=None):
+        self._scripted = {endpoint: list(actions) for endpoint, actions in (scripted or {}).items()}
+        self.rates = dict(rates or {})
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.injected = {}
+
+    @classmethod
+    def parse(cls, spec, seed=None):
+        """解析环境变量格式：接口=失败概率 或 接口=结果1,结果2,...，多个接口用分号分隔"""
+        scripted, rates = {}, {}
+        for part in filter(None, (p.strip() for p in (spec or "").split(";"))):
+            endpoint, _, value = part.partition("=")
+            endpoint, value = endpoint.strip(), value.strip()
+            if endpoint not in ENDPOINTS:
+                raise ValueError(f"未知接口：{endpoint}")
+            try:
+                rates[endpoint] = float(value)
+            except ValueError:
+                scripted[endpoint] = [cls._parse_action(a.strip()) for a in value.split(",") if a.strip()]
+        return cls(scripted, rates, seed=seed)
+
+    @staticmethod
+    def _parse_action(text):
+        if text in ("ok", "error", "timeout"):
+            return text
+        return float(text)
+
+    def next(self, endpoint):
+        """本次调用的结果"""
+        with self._lock:
+            actions = self._scripted.get(endpoint)
+            if actions:
+                action = actions.pop(0)
+            elif self._random.random() < self.rates.get(endpoint, 0.0):
+                action = "error"
+            else:
+                action = "ok"
+            if action != "ok":
+                self.injected[endpoint] = self.injected.get(endpoint, 0) + 1
+            return action
+
+
+# ============================================================================
+# 最近一次成功的数据
+# ============================================================================
+
+class LastGoodStore:
+    """按 (接口, 键) 保留最近一次成功返回的数据：DataFrame 写入磁盘（重启后仍可回退，也不常驻内存），
+    其余类型或未设置目录时保存在内存"""
+
+    def __init__(self, root_dir=UPSTREAM_DIR, clock=time.time):
+        self.root_dir = root_dir
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def put(self, endpoint, key, value):
+        if self.root_dir and isinstance(value, pd.DataFrame):
+            path = self._path(endpoint, key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                value.to_parquet(path + ".tmp")
+                os.replace(path + ".tmp", path)
+                with self._lock:
+                    self._entries.pop((endpoint, key), None)
+                return
+            except Exception:
+                # 个别表含无法序列化的混合类型列：改为保存在内存
+                pass
+        with self._lock:
+            self._entries[(endpoint, key)] = (self._clock(), value)
+
+    def get(self, endpoint, key):
+        """返回 (成功时间, 数据)，没有时返回 None；返回的 DataFrame 是副本"""
+        with self._lock:
+            entry = self._entries.get((endpoint, key))
+        if entry is not None:
+            fetched_at, value = entry
+            return fetched_at, value.copy() if isinstance(value, pd.DataFrame) else value
+        path = self._path(endpoint, key) if self.root_dir else None
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            return os.path.getmtime(path), pd.read_parquet(path)
+        except Exception:
+            return None
+
+    def fetched_at(self, endpoint, key):
+        """最近一次成功的时间（只看文件时间，不读取数据），没有时返回 None"""
+        with self._lock:
+            entry = self._entries.get((endpoint, key))
+        if entry is not None:
+            return entry[0]
+        path = self._path(endpoint, key) if self.root_dir else None
+        return os.path.getmtime(path) if path is not None and os.path.exists(path) else None
+
+    def _path(self, endpoint, key):
+        return os.path.join(self.root_dir, endpoint, f"{key}.parquet")
+
+
+# ============================================================================
+# 统一调用层
+# ============================================================================
+
+_refreshing = contextvars.ContextVar("upstream_refreshing", default=False)
+
+
+@contextmanager
+def refreshing():
+    """块内的调用总是访问上游、不直接使用落盘数据（缓存预热与基准用）"""
+    token = _refreshing.set(True)
+    try:
+        yield
+    finally:
+        _refreshing.reset(token)
+
+
+_retry_counter = contextvars.ContextVar("upstream_retry_counter", default=None)
+
+
+@contextmanager
+def counting_retries():
+    """块内所有上游调用的重试次数累加到返回的计数中（批量分析按数据源记录重试次数用）
+
+        with counting_retries() as counter:
+            fetch_dividend_data("600519")
+        counter["retries"]
+    """
+    counter = {"retries": 0}
+    token = _retry_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _retry_counter.reset(token)
+
+
+class Upstream:
+    """akshare 接口的容错调用（线程安全）：每次尝试限时，网络错误按 RetryPolicy 重试，
+    每个接口一个 CircuitBreaker；重试用尽或熔断时返回最近一次成功的数据，并把 (接口, 键) 标记为过期，
+    直到下一次成功调用为止
+
+    超时的调用无法强行中止，留在后台线程里跑完；它迟到的结果仍会写入 LastGoodStore。
+    """
+
+    def __init__(self, timeout=UPSTREAM_TIMEOUT, retry=None, faults=None, last_good=None,
+                 stale_max_age=UPSTREAM_STALE_MAX_AGE, breaker_factory=CircuitBreaker,
+                 sleep=time.sleep, clock=time.time):
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        self.faults = faults
+        self.last_good = last_good if last_good is not None else LastGoodStore()
+        self.stale_max_age = stale_max_age
+        self.breakers = {endpoint: breaker_factory() for endpoint in ENDPOINTS}
+        self._sleep = sleep
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stale = {}
+        self._counters = {endpoint: dict.fromkeys(
+            ("calls", "persisted", "failures", "retries", "timeouts", "rejected", "stale_served"), 0)
+                          for endpoint in ENDPOINTS}
+
+    def call(self, endpoint, key, fn, fallback=True, max_age=None):
+        """调用 fn()（无参，内部访问 akshare）；fallback=False 时失败直接抛出（调用方自己有本地副本）
+
+        max_age（秒）：最近一次成功的数据不超过这个时长时直接返回，不访问上游（预热的结果由此生效）；
+        在 refreshing() 块内忽略，总是访问上游。
+        """
+        key = str(key)
+        if max_age and not _refreshing.get():
+            fetched_at = self.last_good.fetched_at(endpoint, key)
+            if fetched_at is not None and self._clock() - fetched_at <= max_age:
+                entry = self.last_good.get(endpoint, key)
+                if entry is not None:
+                    self._count(endpoint, "persisted")
+                    with self._lock:
+                        self._stale.pop((endpoint, key), None)
+                    annotate(persisted=True)
+                    return entry[1]
+        breaker = self.breakers[endpoint]
+        self._count(endpoint, "calls")
+        error = None
+        retries = 0
+        while True:
+            if not breaker.allow():
+                self._count(endpoint, "rejected")
+                error = error or CircuitOpenError(f"{endpoint} 已熔断，{breaker.retry_in():.0f} 秒后重试")
+                break
+            try:
+                value = self._attempt(endpoint, key, fn, fallback)
+            except Exception as e:
+                if not is_transient(e):
+                    # 上游已应答（例如代码不存在），不计入熔断
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                self._count(endpoint, "failures")
+                if isinstance(e, UpstreamTimeout):
+                    self._count(endpoint, "timeouts")
+                error = e
+                if retries >= self.retry.retries:
+                    break
+                retries += 1
+                self._count(endpoint, "retries")
+                counter = _retry_counter.get()
+                if counter is not None:
+                    counter["retries"] += 1
+                self._sleep(self.retry.delay(retries - 1))
+                continue
+            breaker.record_success()
+            with self._lock:
+                self._stale.pop((endpoint, key), None)
+            if retries:
+                annotate(retries=retries)
+            return value
+
+        if retries:
+            annotate(retries=retries)
+        if fallback:
+            entry = self.last_good.get(endpoint, key)
+            if entry is not None and (not self.stale_max_age or self._clock() - entry[0] <= self.stale_max_age):
+                self.mark_stale(endpoint, key, entry[0])
+                return entry[1]
+        raise error
+
+    def _attempt(self, endpoint, key, fn, keep):
+        action = self.faults.next(endpoint) if self.faults is not None else "ok"
+        if action == "error":
+            raise ConnectionError(f"注入故障：{endpoint}")
+        if action == "timeout":
+            raise UpstreamTimeout(f"注入超时：{endpoint}")
+        delay = action if isinstance(action, float) else 0.0
+
+        def run():
+            if delay:
+                time.sleep(delay)
+            value = fn()
+            if keep:
+                self.last_good.put(endpoint, key, value)
+            return value
+
+        if not self.timeout:
+            return run()
+
+        # 在独立线程中执行，调用方最多等待 timeout 秒
+        outcome = {}
+        done = threading.Event()
+
+        def target():
+            try:
+                outcome["value"] = run()
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=target, daemon=True, name=f"upstream-{endpoint}").start()
+        if not done.wait(self.timeout):
+            raise UpstreamTimeout(f"{endpoint}({key}) 超过 {self.timeout:g} 秒未响应")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["value"]
+
+    # ------------------------------------------------------------------
+    # 过期标记
+    # ------------------------------------------------------------------
+
+    def mark_stale(self, endpoint, key, fetched_at=None):
+        """记录 (接口, 键) 当前用的是旧数据；fetched_at 为旧数据的获取时间（未知时为 None）"""
+        with self._lock:
+            self._stale[(endpoint, str(key))] = fetched_at
+        self._count(endpoint, "stale_served")
+        annotate(stale=True)
+
+    def is_stale(self, endpoint, key):
+        with self._lock:
+            return (endpoint, str(key)) in self._stale
+
+    def stale_age(self, endpoint, key):
+        """旧数据距今的秒数；未过期或获取时间未知时为 None"""
+        with self._lock:
+            fetched_at = self._stale.get((endpoint, str(key)))
+        return None if fetched_at is None else max(0.0, self._clock() - fetched_at)
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+
+    def _count(self, endpoint, name):
+        with self._lock:
+            self._counters[endpoint][name] += 1
+
+    def stats(self):
+        """每个接口的调用 / 直接使用落盘数据 / 失败 / 重试 / 超时 / 熔断拒绝 / 返回旧数据次数与熔断状态"""
+        with self._lock:
+            counters = {endpoint: dict(c) for endpoint, c in self._counters.items()}
+            stale = len(self._stale)
+        for endpoint, breaker in self.breakers.items():
+            counters[endpoint].update(breaker=breaker.state, trips=breaker.trips)
+            if self.faults is not None:
+                counters[endpoint]["injected"] = self.faults.injected.get(endpoint, 0)
+        return {"endpoints": counters, "stale_keys": stale}
+
+
+_default_upstream = None
+_default_upstream_lock = threading.Lock()
+
+
+def get_upstream():
+    """进程内共享的上游调用层（STOCKAGENT_FAULTS 非空时注入故障）"""
+    global _default_upstream
+    with _default_upstream_lock:
+        if _default_upstream is None:
+            _default_upstream = Upstream(faults=FaultSchedule.parse(UPSTREAM_FAULTS) if UPSTREAM_FAULTS else None)
+        return _default_upstream
+
+
+def set_upstream(upstream):
+    """替换进程内共享的调用层（测试 / 基准注入故障用），返回原来的实例"""
+    global _default_upstream
+    with _default_upstream_lock:
+        previous, _default_upstream = _default_upstream, upstream
+        return previous
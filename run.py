@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
-一键启动脚本 - 双击运行应用
+一键启动脚本 - 双击运行应用；python run.py analyze 600519 在命令行做无界面分析，python run.py serve 启动本地 HTTP 接口，
+python run.py warm 按自选股列表定时预热缓存，python run.py fundamentals 管理财务数据仓库（入库 / 多年条件筛选），
+python run.py backtest 用本地日线与财报回测估值信号
 """
 
 import subprocess
@@ -9,6 +11,23 @@ import sys
 import os
 
 def main():
+    # 命令行分析 / 本地 HTTP 接口 / 缓存预热 / 财务数据仓库 / 回测：不启动 Streamlit，也不导入它
+    if len(sys.argv) > 1 and sys.argv[1] == "analyze":
+        from engine import main as analyze_main
+        sys.exit(analyze_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        from api_server import main as serve_main
+        sys.exit(serve_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "warm":
+        from warmer import main as warm_main
+        sys.exit(warm_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "fundamentals":
+        from fundamentals import main as fundamentals_main
+        sys.exit(fundamentals_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "backtest":
+        from backtest import main as backtest_main
+        sys.exit(backtest_main(sys.argv[2:]))
+    
     # 获取当前脚本所在目录
     script_dir = os.path.dirname(os.path.abspath(__file__))
     app_path = os.path.join(script_dir, "app_v2_enhanced.py")
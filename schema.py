@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+列名映射 - 把 akshare 返回表的源列名解析为规范字段名，按 (接口, 列集合) 指纹缓存，并提示上游表结构变化
+"""
+
+import hashlib
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# 字段规则
+# ============================================================================
+# 每个字段的 match 为候选规则列表：字符串表示列名包含该子串，元组表示需同时包含全部子串；
+# 按列顺序取第一个命中的列（multiple=True 时按列顺序保留全部命中列）。
+# exclude 中任一子串出现在列名里则跳过；required=True 的字段缺失时会输出诊断。
+
+SCHEMAS = {
+    # ak.stock_financial_abstract_ths（同花顺财务摘要）
+    "financial_abstract": {
+        "report_date": {"match": ["报告期", "日期"], "required": True},
+        "roe": {"match": ["ROE", "净资产收益率"], "required": True},
+        "net_profit": {"match": ["净利润"], "exclude": ["增长率", "扣非"], "required": True},
+        "revenue": {"match": ["营业收入", "营业总收入"], "exclude": ["增长率"]},
+        "gross_margin": {"match": ["毛利率"]},
+        "net_margin": {"match": ["净利率"]},
+        "debt_ratio": {"match": ["资产负债率"]},
+        "eps": {"match": ["每股收益", "EPS"]},
+        "bvps": {"match": ["每股净资产"]},
+        "net_profit_growth": {"match": [("净利润", "增长率")], "exclude": ["扣非"], "required": True},
+        "revenue_growth": {"match": [("营收", "增长率"), ("营业", "收入", "增长率")]},
+        "current_ratio": {"match": ["流动比率"]},
+    },
+    # ak.stock_zh_a_hist（东方财富日线行情）
+    "price_history": {
+        "date": {"match": ["日期"], "required": True},
+        "open": {"match": ["开盘"], "required": True},
+        "close": {"match": ["收盘"], "required": True},
+        "high": {"match": ["最高"], "required": True},
+        "low": {"match": ["最低"], "required": True},
+        "volume": {"match": ["成交量"]},
+        "amount": {"match": ["成交额"]},
+    },
+    # ak.stock_dividend_cninfo（巨潮资讯分红记录）
+    "dividend": {
+        "announce_date": {"match": ["公告日期"], "required": True},
+        "per_share": {"match": ["派息"], "exclude": ["转增"], "multiple": True, "required": True},
+        "transfer": {"match": [("转增", "派息"), ("转增", "每股")], "multiple": True},
+        "payout_ratio": {"match": ["派息率", "分配率"], "multiple": True},
+        "record_date": {"match": ["记录日", "除权日"], "multiple": True},
+        "ex_date": {"match": ["除权日", "除息日"]},
+    },
+}
+
+# 发给 AI 的财报关键指标（按显示顺序）
+KEY_FINANCE_FIELDS = [
+    "roe", "net_profit", "revenue", "gross_margin", "net_margin", "debt_ratio",
+    "eps", "net_profit_growth", "revenue_growth", "current_ratio",
+]
+
+
+class SchemaMapping(dict):
+    """规范字段名 -> 源列名（multiple 字段为列名列表），未命中的字段不出现在映射中"""
+
+    def __init__(self, endpoint, fingerprint, mapping, missing):
+        super().__init__(mapping)
+        self.endpoint = endpoint
+        self.fingerprint = fingerprint
+        self.missing = missing
+
+    def columns(self, fields):
+        """按字段顺序返回命中的源列名（去重）"""
+        result = []
+        for field in fields:
+            value = self.get(field)
+            for col in (value if isinstance(value, list) else [value]):
+                if col is not None and col not in result:
+                    result.append(col)
+        return result
+
+
+def _matches(column, rule, exclude):
+    if any(word in column for word in exclude):
+        return False
+    words = rule if isinstance(rule, tuple) else (rule,)
+    return all(word in column for word in words)
+
+
+def fingerprint(columns):
+    """列集合指纹（列名及顺序的短哈希）"""
+    return hashlib.md5("|".join(map(str, columns)).encode("utf-8")).hexdigest()[:12]
+
+
+# 每个接口最近一次见到的列集合，用于发现上游表结构变化
+_last_seen_columns = {}
+
+
+@lru_cache(maxsize=256)
+def _resolve(endpoint, columns):
+    schema = SCHEMAS[endpoint]
+    mapping, missing = {}, []
+
+    for field, spec in schema.items():
+        exclude = spec.get("exclude", [])
+        if spec.get("multiple"):
+            hits = [c for c in columns if any(_matches(c, rule, exclude) for rule in spec["match"])]
+        else:
+            # 候选规则有先后：先找满足第一条规则的列，找不到再看下一条
+            hits = next(
+                ([c] for rule in spec["match"] for c in columns if _matches(c, rule, exclude)), []
+            )
+        if hits:
+            mapping[field] = hits if spec.get("multiple") else hits[0]
+        elif spec.get("required"):
+            missing.append(field)
+
+    result = SchemaMapping(endpoint, fingerprint(columns), mapping, missing)
+    _diagnose(endpoint, columns, result)
+    return result
+
+
+def _diagnose(endpoint, columns, mapping):
+    """新指纹首次出现时执行：记录列变化与缺失的必需字段"""
+    previous = _last_seen_columns.get(endpoint)
+    _last_seen_columns[endpoint] = columns
+    if previous is not None and set(previous) != set(columns):
+        added = [c for c in columns if c not in previous]
+        removed = [c for c in previous if c not in columns]
+        logger.warning("[%s] 上游表结构发生变化：新增列 %s，移除列 %s", endpoint, added, removed)
+    if mapping.missing:
+        logger.warning("[%s] 未能识别必需字段 %s，当前列：%s", endpoint, mapping.missing, list(columns))
+
+
+def resolve_columns(endpoint, columns):
+    """解析规范字段对应的源列，同一 (接口, 列集合) 只解析一次"""
+    return _resolve(endpoint, tuple(str(c) for c in columns))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+请求合并 - 同一个键同时只执行一次上游调用，其余并发请求等待并共享这次调用的结果（singleflight）
+"""
+
+import threading
+import time
+
+
+class _Call:
+    """一次进行中的调用：领头者执行并写入结果，跟随者等待"""
+
+    __slots__ = ("_done", "value", "error", "followers")
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.value = None
+        self.error = None
+        self.followers = 0
+
+    def resolve(self, value=None, error=None):
+        self.value = value
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """等待领头者完成，返回其结果；领头者失败时抛出同一个异常"""
+        if not self._done.wait(timeout):
+            raise TimeoutError("等待合并请求超时")
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SingleFlight:
+    """按键合并并发调用（线程安全）
+
+        flight = SingleFlight()
+        value, shared = flight.do(("finance", "600519"), lambda: fetch_financial_abstract("600519"))
+
+    不能用一次函数调用表达的场景（如流式生成）可使用 join / forget：
+    join 返回 (call, 是否领头)，领头者完成后调用 call.resolve(...) 与 forget(key)。
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        # 统计：实际执行次数、合并掉的请求数
+        self.executed = 0
+        self.shared = 0
+
+    def join(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self.shared += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.executed += 1
+            return call, True
+
+    def forget(self, key):
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key, fn, timeout=None):
+        """执行 fn 或等待进行中的同键调用，返回 (结果, 是否共享了他人的结果)"""
+        call, leader = self.join(key)
+        if not leader:
+            return call.wait(timeout), True
+        try:
+            value = fn()
+        except BaseException as e:
+            # KeyboardInterrupt 等也要让跟随者结束等待，跟随者收到普通异常
+            call.resolve(error=e if isinstance(e, Exception) else RuntimeError("合并的调用已中断"))
+            raise
+        else:
+            call.resolve(value)
+            return value, False
+        finally:
+            self.forget(key)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        return {"executed": self.executed, "shared": self.shared, "in_flight": self.in_flight()}
+
+
+class TTLCache:
+    """进程内短期缓存：键 -> (写入时间, 值)，过期后视为不存在（线程安全）"""
+
+    def __init__(self, ttl, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            now = self._clock()
+            self._entries[key] = (now, value)
+            # 顺带清理已过期的条目，避免长期运行时无限增长
+            expired = [k for k, (t, _) in self._entries.items() if now - t >= self.ttl]
+            for k in expired:
+                del self._entries[k]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+行情快照存储 - 全市场实时行情的磁盘持久化、内存常驻与后台增量刷新
+
+内存中只保留主流程用到的列（紧凑表示：Arrow 字符串、按两位小数无损时用 float32，只读），
+进程内所有会话共用同一份，不复制；数值计算前用 decode_snapshot 换回 float64。
+
+取行直接读各列底层数组（数组引用按快照缓存），与原始整表的 .loc 耗时相当；建检索索引不慢于原始整表。
+代价：全市场筛选每次要 decode_snapshot（5000 只约 0.5ms），且 Arrow 字符串列的建索引与拼接比 object 慢，
+整体比原始整表慢约 2-3ms（5000 只约 10ms -> 12.5ms）；换来的是不常驻一份 float64 / object 副本（单份内存约 1/4）。
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import CACHE_DIR, SNAPSHOT_REFRESH_INTERVAL, SNAPSHOT_MAX_AGE
+from resilience import get_upstream
+from tracing import frame_bytes
+
+# 主流程用到的列：检索（代码 / 名称）、单股与批量分析（最新价 / 涨跌幅 / 市盈率）、全市场筛选（市净率）
+SNAPSHOT_COLUMNS = ["代码", "名称", "最新价", "涨跌幅", "市盈率-动态", "市净率"]
+# 行情数值为两位小数：float32 按两位小数取整后与原值一致时才降精度存储，读出时按同样的位数取整还原
+SNAPSHOT_DECIMALS = 2
+
+
+def format_age(seconds):
+    """把秒数格式化为“x分钟”之类的可读时长"""
+    if seconds is None:
+        return "未知"
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}秒"
+    if seconds < 3600:
+        return f"{seconds // 60}分钟"
+    if seconds < 86400:
+        return f"{seconds // 3600}小时{seconds % 3600 // 60}分钟"
+    return f"{seconds // 86400}天"
+
+
+# ============================================================================
+# 紧凑表示
+# ============================================================================
+
+def _read_only(values):
+    values = np.array(values, copy=True)
+    values.flags.writeable = False
+    return values
+
+
+def compact_snapshot(df, columns=SNAPSHOT_COLUMNS, key="代码"):
+    """原始快照 -> 紧凑只读快照：只保留 columns 中存在的列，以代码为索引
+
+    字符串列转为 Arrow 字符串；数值列转为 float64，按 SNAPSHOT_DECIMALS 位小数往返无损时再降为 float32（已是 float32 的列原样保留）。
+    数值列底层数组不可写，原地修改会抛出 ValueError（多个会话共用同一份，不能被任何一方改动）。
+    """
+    data = {}
+    for column in [c for c in columns if c in df.columns]:
+        series = df[column]
+        if column == key or not pd.api.types.is_numeric_dtype(series):
+            data[column] = series.astype("string[pyarrow]").array
+            continue
+        if series.dtype == np.float32:
+            # 已是紧凑快照（合并、从磁盘加载），再转一次 float64 会带出 float32 的尾数
+            values = series.to_numpy()
+        else:
+            values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64)
+            narrow = values.astype(np.float32)
+            if np.array_equal(narrow.astype(np.float64).round(SNAPSHOT_DECIMALS), values, equal_nan=True):
+                values = narrow
+        data[column] = _read_only(values)
+    index = pd.Index(data[key], name=None) if key in data else None
+    return pd.DataFrame(data, index=index, copy=False)
+
+
+def decode_snapshot(df):
+    """紧凑快照 -> 计算用的表：float32 列换回 float64 并按 SNAPSHOT_DECIMALS 取整（与源数据一致），返回新表"""
+    # 按列直接在 numpy 数组上换型取整，比整表 astype + round 少一轮块合并与复制
+    data = {c: np.round(df[c].to_numpy(dtype=np.float64), SNAPSHOT_DECIMALS) if df[c].dtype == np.float32
+            else df[c].array.copy() for c in df.columns}
+    return pd.DataFrame(data, index=df.index.copy(), copy=False)
+
+
+def _fetch_spot_snapshot():
+    """默认数据源：东方财富 A 股实时行情（旧快照由 SnapshotStore 自己保留，失败时直接抛出）"""
+    import akshare as ak
+    return get_upstream().call("stock_zh_a_spot_em", "all", ak.stock_zh_a_spot_em, fallback=False)
+
+
+class SnapshotStore:
+    """全市场行情快照：磁盘上保留最近一份快照（只含 columns 中的列），进程内只加载一次并由所有会话共用，
+    后台定时增量刷新"""
+
+    KEY_COLUMN = "代码"
+
+    def __init__(self, fetch_func=None, cache_dir=CACHE_DIR,
+                 refresh_interval=SNAPSHOT_REFRESH_INTERVAL, max_age=SNAPSHOT_MAX_AGE, columns=SNAPSHOT_COLUMNS):
+        self._fetch_func = fetch_func or _fetch_spot_snapshot
+        # 序号只是接口返回时的排名，每次都会变化，与其余未用到的列一样不进内存
+        self.columns = list(dict.fromkeys([self.KEY_COLUMN, *columns]))
+        self.path = os.path.join(cache_dir, "spot_snapshot.parquet")
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+
+        self._df = None
+        self._row_cache = None
+        self._updated_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # version 只在快照内容变化时递增，下游（如索引）据此判断是否需要重建
+        self.version = 0
+        self.last_changed_rows = 0
+        self.last_error = None
+        self.source_bytes = None    # 最近一次拉取的原始快照（全部列）占用的内存
+
+        self._load_from_disk()
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def get(self, max_age=None):
+        """返回当前快照（紧凑只读表，数值计算前先 decode_snapshot）；已有本地副本时从不阻塞网络，过期只触发后台刷新"""
+        max_age = self.max_age if max_age is None else max_age
+
+        if self._df is None:
+            # 冷启动且磁盘无副本，只能同步拉取一次
+            self.refresh()
+        elif self.age_seconds() > max_age:
+            self.refresh_async()
+
+        return self._df
+
+    def row(self, code, max_age=None):
+        """一只股票的快照行（数值为 float64），没有该代码时返回 None"""
+        df = self.get(max_age)
+        columns, arrays = self._row_arrays(df)
+        try:
+            i = df.index.get_loc(str(code))
+        except KeyError:
+            return None
+        # 单行直接从各列底层数组取值，不经过整表的 decode_snapshot
+        values = [round(float(a[i]), SNAPSHOT_DECIMALS) if narrow else a[i] for a, narrow in arrays]
+        return pd.Series(values, index=columns, dtype=object, name=str(code))
+
+    def _row_arrays(self, df):
+        """取行用的列名与各列底层数组（每份快照只取一次；只是对快照内数组的引用，不占额外内存）"""
+        cached = self._row_cache
+        if cached is None or cached[0] is not df:
+            arrays = [(np.asarray(df[c].array), True) if df[c].dtype == np.float32 else (df[c].array, False)
+                      for c in df.columns]
+            cached = self._row_cache = (df, pd.Index(df.columns), arrays)
+        return cached[1], cached[2]
+
+    def age_seconds(self):
+        """距离最近一次成功刷新的秒数，没有数据时返回 None"""
+        if self._updated_at is None:
+            return None
+        return max(0.0, time.time() - self._updated_at)
+
+    def is_stale(self, max_age=None):
+        """快照是否已超过可用时长"""
+        age = self.age_seconds()
+        max_age = self.max_age if max_age is None else max_age
+        return age is None or age > max_age
+
+    def status(self):
+        """快照状态：行数、内存占用（紧凑表 / 原始快照）、更新时间、数据年龄、最近一次变化行数及错误"""
+        return {
+            "rows": 0 if self._df is None else len(self._df),
+            "bytes": frame_bytes(self._df),
+            "source_bytes": self.source_bytes,
+            "updated_at": self._updated_at,
+            "age_seconds": self.age_seconds(),
+            "version": self.version,
+            "last_changed_rows": self.last_changed_rows,
+            "last_error": self.last_error,
+        }
+
+    # ------------------------------------------------------------------
+    # 刷新
+    # ------------------------------------------------------------------
+
+    def refresh(self):
+        """同步拉取最新快照，只替换发生变化的行，返回变化行数"""
+        # 同一时间只允许一个刷新任务；已有数据时其余调用直接返回，冷启动时等待首个结果
+        cold_start = self._df is None
+        if not self._refresh_lock.acquire(blocking=cold_start):
+            return 0
+
+        try:
+            if cold_start and self._df is not None:
+                return 0
+            new_df = self._normalize(self._fetch_func())
+            with self._lock:
+                merged, changed = self._merge(self._df, new_df)
+                self._updated_at = time.time()
+                self.last_changed_rows = changed
+                self.last_error = None
+                if changed:
+                    self._df = merged
+                    self.version += 1
+
+            if changed:
+                self._save_to_disk(merged)
+            elif os.path.exists(self.path):
+                # 内容未变，只更新文件时间戳，重启后仍能得到正确的数据年龄
+                os.utime(self.path, None)
+            return changed
+        except Exception as e:
+            self.last_error = str(e)
+            if self._df is None:
+                raise
+            return 0
+        finally:
+            self._refresh_lock.release()
+
+    def refresh_async(self):
+        """在后台线程中刷新一次"""
+        threading.Thread(target=self._safe_refresh, daemon=True).start()
+
+    def start_background_refresh(self):
+        """启动定时刷新线程（重复调用无副作用）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止定时刷新线程"""
+        self._stop_event.set()
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            self._safe_refresh()
+
+    def _safe_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            self.last_error = str(e)
+
+    # ------------------------------------------------------------------
+    # 内部工具
+    # ------------------------------------------------------------------
+
+    def _normalize(self, df):
+        """只保留用到的列并转为紧凑只读表，以股票代码为索引"""
+        if df is None or df.empty or self.KEY_COLUMN not in df.columns:
+            raise ValueError("行情快照为空或缺少代码列")
+        self.source_bytes = frame_bytes(df)
+        df = df.drop_duplicates(subset=self.KEY_COLUMN, keep="last")
+        return compact_snapshot(df, self.columns, self.KEY_COLUMN)
+
+    def _merge(self, old_df, new_df):
+        """按代码对齐新旧快照，只替换有变化的行；返回 (合并结果, 变化行数)"""
+        # 列或存储类型变化（例如某列本次不能无损降为 float32）时整表替换
+        if old_df is None or not old_df.dtypes.equals(new_df.dtypes):
+            return new_df, len(new_df)
+
+        common = old_df.index.intersection(new_df.index)
+        old_common = old_df.loc[common]
+        new_common = new_df.loc[common]
+        # NaN 与 NaN 视为相同
+        diff = old_common.ne(new_common) & ~(old_common.isna() & new_common.isna())
+        changed_codes = common[diff.any(axis=1).to_numpy()]
+
+        added_codes = new_df.index.difference(old_df.index)
+        removed_codes = old_df.index.difference(new_df.index)
+        changed = len(changed_codes) + len(added_codes) + len(removed_codes)
+        if changed == 0:
+            return old_df, 0
+
+        # 未变化的行新旧相同：按旧顺序（新增的排在最后）从新快照取行，不在共用的旧表上原地修改
+        order = old_df.index.drop(removed_codes).append(added_codes)
+        return compact_snapshot(new_df.loc[order], self.columns, self.KEY_COLUMN), changed
+
+    def _load_from_disk(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            # 旧版本保存的全列快照也在这里收窄
+            self._df = compact_snapshot(pd.read_parquet(self.path), self.columns, self.KEY_COLUMN)
+            self._updated_at = os.path.getmtime(self.path)
+            self.version = 1
+        except Exception as e:
+            # 磁盘文件损坏时忽略，下次刷新会重新写入
+            self.last_error = f"读取本地快照失败: {e}"
+
+    def _save_to_disk(self, df):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        df.reset_index(drop=True).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
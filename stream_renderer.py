@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+流式报告渲染 - 把模型返回的增量文本攒批后再刷新占位符，避免每个分片都重发、重渲染整篇报告
+"""
+
+import time
+
+# 默认刷新条件：距上次刷新超过 0.15 秒，或积攒的新文本超过 400 字符
+RENDER_INTERVAL = 0.15
+RENDER_MAX_PENDING = 400
+# 每次刷新都会重发整篇内容：报告越长刷新间隔越大，使发送量不超过约 128KB/秒
+RENDER_MAX_BYTES_PER_SECOND = 128 * 1024
+CURSOR = "▌"
+
+
+class StreamRenderer:
+    """攒批渲染器：write() 只追加到列表缓冲，满足时间或长度条件时才调用一次 placeholder.markdown
+
+        renderer = StreamRenderer(st.empty())
+        for delta in stream:
+            renderer.write(delta)
+        renderer.close()
+    """
+
+    def __init__(self, placeholder, interval=RENDER_INTERVAL, max_pending=RENDER_MAX_PENDING,
+                 max_bytes_per_second=RENDER_MAX_BYTES_PER_SECOND, cursor=CURSOR, clock=time.monotonic):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_bytes_per_second = max_bytes_per_second
+        self._budget_interval = 0.0
+        self.cursor = cursor
+        self._clock = clock
+        self._parts = []
+        self._pending = 0
+        self._last_render = clock()
+        # 统计：刷新次数、累计发送到前端的字符数（每次刷新都会发送整篇内容）
+        self.render_count = 0
+        self.bytes_sent = 0
+
+    def write(self, delta):
+        """追加一段增量文本，必要时刷新"""
+        if not delta:
+            return
+        self._parts.append(delta)
+        self._pending += len(delta)
+        elapsed = self._clock() - self._last_render
+        due = elapsed >= self.interval or self._pending >= self.max_pending
+        if due and elapsed >= self._budget_interval:
+            self._render(self.cursor)
+
+    __call__ = write
+
+    def close(self):
+        """输出最终内容（不带光标），返回完整报告"""
+        self._render("")
+        return self.text
+
+    @property
+    def text(self):
+        if len(self._parts) > 1:
+            # 合并缓冲，后续 join 只需处理新增分片
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def _render(self, suffix):
+        body = self.text + suffix
+        self.placeholder.markdown(body)
+        size = len(body.encode("utf-8"))
+        self.render_count += 1
+        self.bytes_sent += size
+        self._budget_interval = size / self.max_bytes_per_second
+        self._pending = 0
+        self._last_render = self._clock()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+股票检索索引 - 基于行情快照一次性构建，支持代码/名称/前缀/拼音首字母/子串匹配
+"""
+
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:  # 未安装 pypinyin 时不提供拼音首字母检索
+    lazy_pinyin = None
+
+# 匹配类型（按优先级从高到低排列）
+MATCH_TYPES = ["代码精确", "名称精确", "代码前缀", "名称前缀", "拼音首字母", "名称包含"]
+
+# 兼容 sh600519 / 600519.SH / SZ000001 等写法
+_CODE_PATTERN = re.compile(r"^(?:sh|sz|bj)?(\d{1,6})(?:\.(?:sh|sz|bj))?$", re.IGNORECASE)
+
+
+def _normalize(text):
+    """统一大小写并去掉空白，便于 “*ST” “Ｎ” 等名称的比较"""
+    return re.sub(r"\s+", "", str(text)).upper()
+
+
+def pinyin_initials(name):
+    """名称的拼音首字母（如 贵州茅台 -> GZMT），未安装 pypinyin 时返回空串"""
+    if lazy_pinyin is None:
+        return ""
+    letters = lazy_pinyin(name, style=Style.FIRST_LETTER, errors="default")
+    return _normalize("".join(letters))
+
+
+class SymbolIndex:
+    """股票检索索引：构建一次，查询为哈希 / 二分 / 倒排查找，不再逐行扫描"""
+
+    def __init__(self, codes, names):
+        self.codes = [str(c) for c in codes]
+        self.names = [str(n) for n in names]
+        keys = [_normalize(n) for n in self.names]
+        self._name_keys = keys
+
+        self._by_code = {c: i for i, c in enumerate(self.codes)}
+        self._by_name = {k: i for i, k in enumerate(keys)}
+
+        # 有序数组 + 二分查找实现前缀匹配
+        self._code_sorted = sorted((c, i) for i, c in enumerate(self.codes))
+        self._name_sorted = sorted((k, i) for i, k in enumerate(keys))
+        self._pinyin_sorted = sorted(
+            (p, i) for i, p in ((i, pinyin_initials(n)) for i, n in enumerate(self.names)) if p
+        )
+
+        # 单字倒排表：子串查询先按字求交集，再做一次确认
+        self._char_postings = defaultdict(set)
+        for i, k in enumerate(keys):
+            for ch in set(k):
+                self._char_postings[ch].add(i)
+
+    @classmethod
+    def from_snapshot(cls, stock_df):
+        """从行情快照（需含 代码 / 名称 列）构建索引"""
+        return cls(stock_df["代码"].tolist(), stock_df["名称"].tolist())
+
+    def __len__(self):
+        return len(self.codes)
+
+    def search(self, query, limit=10):
+        """按优先级返回候选列表 [{"code", "name", "match"}]，最多 limit 条"""
+        query = _normalize(query)
+        if not query or limit <= 0:
+            return []
+
+        results = []
+        seen = set()
+
+        def add(ids, match_type):
+            for i in ids:
+                if len(results) >= limit:
+                    return
+                if i not in seen:
+                    seen.add(i)
+                    results.append({"code": self.codes[i], "name": self.names[i], "match": match_type})
+
+        code_match = _CODE_PATTERN.match(query)
+        code = code_match.group(1) if code_match else None
+
+        if code in self._by_code:
+            add([self._by_code[code]], "代码精确")
+        if query in self._by_name:
+            add([self._by_name[query]], "名称精确")
+        if code:
+            add(self._prefix(self._code_sorted, code, limit), "代码前缀")
+        add(self._prefix(self._name_sorted, query, limit), "名称前缀")
+        if query.isascii() and query.isalpha():
+            add(self._prefix(self._pinyin_sorted, query, limit), "拼音首字母")
+        if len(results) < limit:
+            add(self._substring(query), "名称包含")
+
+        return results
+
+    def resolve(self, query):
+        """返回最佳匹配，没有命中时返回 None"""
+        hits = self.search(query, limit=1)
+        return hits[0] if hits else None
+
+    @staticmethod
+    def _prefix(sorted_pairs, prefix, limit):
+        lo = bisect_left(sorted_pairs, (prefix,))
+        ids = []
+        for key, i in sorted_pairs[lo:lo + limit]:
+            if not key.startswith(prefix):
+                break
+            ids.append(i)
+        return ids
+
+    def _substring(self, query):
+        postings = [self._char_postings.get(ch) for ch in set(query)]
+        if not postings or any(p is None for p in postings):
+            return []
+        candidates = set.intersection(*sorted(postings, key=len))
+        # 名称越短越接近用户意图
+        return sorted(
+            (i for i in candidates if query in self._name_keys[i]),
+            key=lambda i: (len(self._name_keys[i]), self.codes[i]),
+        )
@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试配置 - 项目为平铺模块，测试从仓库根目录导入；缓存目录指向临时目录，不读写项目下的 .cache/
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("STOCKAGENT_CACHE_DIR", tempfile.mkdtemp(prefix="stockagent-tests-"))
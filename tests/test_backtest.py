@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+估值信号回测 - 财报只在法定披露截止日之后可用、同一天可用时以较新一期为准；停牌的调仓日跳过，
+退市后的远期收益为 NaN；单进程与多进程结果一致；分档汇总的收益、超额与胜率与手算一致
+"""
+
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import available_dates, chunk_observations, point_in_time, run_backtest, summarize
+
+LISTED, DELISTED = "600000", "600001"
+SUSPENDED_DAY = pd.Timestamp("2023-02-28")    # 2 月最后一个交易日
+LAST_BAR = pd.Timestamp("2023-04-14")
+
+
+def _reports(code):
+    """2021 年报、2022 三季报、2022 年报、2023 一季报（后两期都在 2023-04-30 可用）"""
+    return pd.DataFrame({
+        "code": code,
+        "report_date": pd.to_datetime(["2021-12-31", "2022-09-30", "2022-12-31", "2023-03-31"]),
+        "annual": [True, False, True, False],
+        "eps": [4.0, 3.6, 5.0, 1.5],
+        "roe": [20.0, 15.0, 22.0, 6.0],
+        "bvps": [20.0, 22.0, 23.0, 24.0],
+        "net_profit_growth": [10.0, 12.0, 15.0, 30.0],
+    })
+
+
+@pytest.fixture
+def price_dir(tmp_path):
+    """两只股票的不复权日线：LISTED 每个交易日都有；DELISTED 在 SUSPENDED_DAY 停牌、LAST_BAR 之后退市"""
+    calendar = pd.bdate_range("2023-01-02", "2023-06-30")
+    os.makedirs(tmp_path / "none")
+    for code, dates in ((LISTED, calendar),
+                        (DELISTED, calendar[(calendar != SUSPENDED_DAY) & (calendar <= LAST_BAR)])):
+        close = 10 * 1.001 ** np.arange(len(dates))
+        pd.DataFrame({"date": dates, "close": close}).to_parquet(tmp_path / "none" / f"{code}.parquet", index=False)
+    return str(tmp_path)
+
+
+def test_available_dates_follow_disclosure_deadlines():
+    """一季报 4-30、半年报 8-31、三季报 10-31、年报次年 4-30；非季末的报告期按 120 天"""
+    got = available_dates(pd.to_datetime(["2023-03-31", "2023-06-30", "2023-09-30", "2022-12-31", "2023-05-15"]))
+    expected = pd.to_datetime(["2023-04-30", "2023-08-31", "2023-10-31", "2023-04-30", "2023-09-12"])
+    assert list(got) == list(expected)
+
+
+def test_point_in_time_has_no_look_ahead():
+    """4-29 还看不到一季报与 2022 年报；4-30 两期同时可用，最近一期取一季报，年报指标取 2022 年报"""
+    keys = pd.DataFrame({"date": pd.to_datetime(["2023-04-29", "2023-04-30"]), "code": LISTED})
+    facts = point_in_time(_reports(LISTED), keys)
+
+    before, on = facts.iloc[0], facts.iloc[1]
+    assert before["eps_annualized"] == pytest.approx(3.6 * 12 / 9)
+    assert before["net_profit_growth"] == 12.0
+    assert (before["roe"], before["eps"], before["bvps"]) == (20.0, 4.0, 20.0)
+    assert on["eps_annualized"] == pytest.approx(1.5 * 12 / 3)
+    assert on["net_profit_growth"] == 30.0
+    assert (on["roe"], on["eps"], on["bvps"]) == (22.0, 5.0, 23.0)
+
+
+def test_suspended_day_is_skipped_and_returns_end_at_delisting(price_dir):
+    """停牌的调仓日不产生观测；持有期越过最后一根日线时远期收益为 NaN，未越过的照常计算"""
+    reports = pd.concat([_reports(LISTED), _reports(DELISTED)], ignore_index=True)
+    observations = chunk_observations([LISTED, DELISTED], reports, horizons=(5, 20), price_dir=price_dir)
+    periods = observations.groupby("code")["period"].apply(lambda p: [d.strftime("%Y-%m") for d in p]).to_dict()
+
+    assert periods[LISTED] == ["2023-01", "2023-02", "2023-03", "2023-04", "2023-05", "2023-06"]
+    assert periods[DELISTED] == ["2023-01", "2023-03"]
+
+    march = observations[(observations["code"] == DELISTED) & (observations["period"] == "2023-03-31")].iloc[0]
+    assert march["fwd_5"] == pytest.approx(1.001 ** 5 - 1, rel=1e-5)
+    assert np.isnan(march["fwd_20"])
+    june = observations[observations["code"] == LISTED].iloc[-1]
+    assert np.isnan(june["fwd_5"])  # 数据截止
+
+
+def test_serial_and_multiprocess_agree(price_dir):
+    """workers=1（一批）与 workers=2（每批一只）的观测完全一致：停牌、退市的股票单独成批时也按共用的交易日历调仓"""
+    reports = pd.concat([_reports(LISTED), _reports(DELISTED)], ignore_index=True)
+    options = dict(codes=[LISTED, DELISTED], horizons=(5, 20), price_dir=price_dir,
+                   warehouse=SimpleNamespace(table=lambda: reports))
+    stats = {}
+    serial = run_backtest(workers=1, **options)
+    parallel = run_backtest(workers=2, chunk_size=1, stats=stats, **options)
+    assert stats["workers"] == 2 and stats["chunks"] == 2
+    pd.testing.assert_frame_equal(serial, parallel)
+    assert len(serial) == 8
+
+
+def test_summarize_matches_hand_computation():
+    """两期、两档：等权收益平均、相对同期全部股票的超额、胜率、期数与观测数"""
+    labels = ("低估", "合理", "偏高", "高估")
+    observations = pd.DataFrame({
+        "period": pd.to_datetime(["2023-01-31", "2023-01-31", "2023-02-28", "2023-02-28"]),
+        "code": [LISTED, DELISTED, LISTED, DELISTED],
+        "pe_assessment": pd.Categorical(["低估", "高估", "低估", "高估"], categories=labels),
+        "fwd_20": np.array([0.10, -0.10, 0.30, 0.10], dtype=np.float32),
+    })
+    summary = summarize(observations, models=["PE倍数法"]).set_index("assessment")
+
+    assert list(summary.index) == ["低估", "高估"]
+    assert summary.loc["低估", ["mean_return", "excess_return", "win_rate"]].tolist() == pytest.approx([20, 10, 100])
+    assert summary.loc["高估", ["mean_return", "excess_return", "win_rate"]].tolist() == pytest.approx([0, -10, 50])
+    assert summary[["periods", "observations"]].to_numpy().tolist() == [[2, 2], [2, 2]]
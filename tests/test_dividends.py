@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+分红与股息率 - 巨潮“派息比例”（每 10 股派息）换算为每股派息后，股息率与手算一致
+"""
+
+import pandas as pd
+import pytest
+
+from fetchers import dividend_events, parse_dividend_data
+from records import YieldHistory
+from valuation import calculate_dividend_yield, historical_dividend_yields
+
+
+def _cninfo(payouts, ex_dates):
+    """与 stock_dividend_cninfo 同结构的分红记录（按公告日期升序）"""
+    return pd.DataFrame({
+        "实施方案公告日期": pd.to_datetime(ex_dates) - pd.Timedelta(days=7),
+        "分红类型": "年度分红",
+        "送股比例": float("nan"),
+        "转增比例": float("nan"),
+        "派息比例": payouts,
+        "股权登记日": pd.to_datetime(ex_dates) - pd.Timedelta(days=1),
+        "除权日": pd.to_datetime(ex_dates),
+        "实施方案分红说明": [f"10派{p}元" for p in payouts],
+    })
+
+
+@pytest.mark.parametrize("payout", [5.0, "5元", "5.00 元"])
+def test_per_ten_shares_payout_is_converted(payout):
+    """10派5元 -> 每股派息 0.5 元（数值与“元”字符串一致）"""
+    dividend = parse_dividend_data(_cninfo([payout], ["2023-06-20"]))
+    assert dividend.dividend_per_share == pytest.approx(0.5)
+    assert dividend.history == pytest.approx((0.5,))
+
+
+def test_dividend_yield_from_known_payout_and_close():
+    """10派5元、收盘价 25 元 -> 股息率 2%（当前值、历史序列与现价计算一致）"""
+    dividend = parse_dividend_data(_cninfo([4.0, 5.0], ["2022-06-20", "2023-06-20"]))
+    assert dividend.dividend_per_share == pytest.approx(0.5)
+    assert calculate_dividend_yield(dividend.dividend_per_share, 25.0) == pytest.approx(2.0)
+
+    bars = pd.DataFrame({"code": "600000", "date": pd.to_datetime(["2022-06-17", "2023-06-19"]), "close": [20.0, 25.0]})
+    yields = historical_dividend_yields(dividend_events("600000", dividend), bars)
+    # 2022-06-20：0.4 / 20；2023-06-20：近 12 个月只有本次 0.5 / 25
+    assert yields["ttm_dividend"].tolist() == pytest.approx([0.4, 0.5])
+    assert yields["yield"].tolist() == pytest.approx([2.0, 2.0])
+
+    history = YieldHistory(code="600000", yields=tuple(yields["yield"]), ttm_dividend=float(yields["ttm_dividend"].iloc[-1]))
+    assert history.current_yield(25.0) == pytest.approx(2.0)
+
+
+def test_per_share_columns_are_not_scaled():
+    """列名本身是每股派息的（非巨潮“派息比例”）按原值使用"""
+    df = pd.DataFrame({"公告日期": pd.to_datetime(["2023-06-13"]), "每股派息": [0.5], "除权日": pd.to_datetime(["2023-06-20"])})
+    assert parse_dividend_data(df).dividend_per_share == pytest.approx(0.5)
+
+
+def test_history_follows_announce_date_order():
+    """公告日期乱序、同一天两条、日期无法识别：按日期倒序，同一天保持原顺序，无法识别的排最后"""
+    df = pd.DataFrame({
+        "实施方案公告日期": ["2021-06-13", "待定", "2023-06-13", "2022-06-13", "2023-06-13"],
+        "派息比例": [1.0, 9.0, 3.0, 2.0, "4元"],
+        "除权日": ["2021-06-20", None, "2023-06-20", "2022-06-20", "2023-06-21"],
+    })
+    dividend = parse_dividend_data(df)
+    assert dividend.dividend_per_share == pytest.approx(0.3)
+    assert dividend.history == pytest.approx((0.3, 0.4, 0.2, 0.1, 0.9))
+    assert [None if d is None else str(d.date()) for d in dividend.history_dates] == [
+        "2023-06-20", "2023-06-21", "2022-06-20", "2021-06-20", None]
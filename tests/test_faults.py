@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+故障注入 - FaultSchedule 按脚本 / 概率产生故障，Upstream 据此重试、熔断并回退到最近一次成功的数据
+"""
+
+import random
+
+import pytest
+
+from resilience import (
+    CircuitBreaker, CircuitOpenError, FaultSchedule, LastGoodStore, RetryPolicy, Upstream, UpstreamTimeout,
+    counting_retries,
+)
+
+ENDPOINT = "stock_dividend_cninfo"
+
+
+def _upstream(tmp_path, faults, retries=2, threshold=5):
+    return Upstream(timeout=0, retry=RetryPolicy(retries=retries, base=0.0, rng=random.Random(0)), faults=faults,
+                    last_good=LastGoodStore(str(tmp_path)), sleep=lambda seconds: None,
+                    breaker_factory=lambda: CircuitBreaker(threshold=threshold, reset_after=60))
+
+
+def test_parse_scripted_and_rates():
+    """接口=结果序列 与 接口=失败概率 两种写法；脚本用完后按概率（这里为 0）正常返回"""
+    schedule = FaultSchedule.parse("stock_dividend_cninfo=error,timeout,0.5,ok;stock_zh_a_hist=0")
+    assert [schedule.next(ENDPOINT) for _ in range(5)] == ["error", "timeout", 0.5, "ok", "ok"]
+    assert schedule.rates == {"stock_zh_a_hist": 0.0}
+    assert schedule.injected == {ENDPOINT: 3}
+
+
+def test_parse_rejects_unknown_endpoint():
+    with pytest.raises(ValueError):
+        FaultSchedule.parse("stock_unknown=error")
+
+
+def test_rates_are_reproducible_with_seed():
+    """相同种子的概率故障序列相同，失败比例接近设定值"""
+    schedules = [FaultSchedule(rates={ENDPOINT: 0.3}, seed=7) for _ in range(2)]
+    runs = [[schedule.next(ENDPOINT) for _ in range(1000)] for schedule in schedules]
+    assert runs[0] == runs[1]
+    assert 0.25 < runs[0].count("error") / 1000 < 0.35
+
+
+def test_retries_until_success(tmp_path):
+    """error, error, ok：重试两次后成功，重试次数计入 counting_retries 与统计"""
+    upstream = _upstream(tmp_path, FaultSchedule({ENDPOINT: ["error", "error", "ok"]}))
+    with counting_retries() as counter:
+        assert upstream.call(ENDPOINT, "600519", lambda: "fresh") == "fresh"
+    assert counter["retries"] == 2
+    assert upstream.stats()["endpoints"][ENDPOINT]["retries"] == 2
+    assert not upstream.is_stale(ENDPOINT, "600519")
+
+
+def test_falls_back_to_last_good(tmp_path):
+    """首次成功之后上游一直失败：重试用尽时返回最近一次成功的数据并标记为过期；fallback=False 时抛出原错误"""
+    upstream = _upstream(tmp_path, FaultSchedule({ENDPOINT: ["ok"]}, rates={ENDPOINT: 1.0}))
+    assert upstream.call(ENDPOINT, "600519", lambda: "first") == "first"
+    assert upstream.call(ENDPOINT, "600519", lambda: "second") == "first"
+    assert upstream.is_stale(ENDPOINT, "600519")
+    with pytest.raises(ConnectionError):
+        upstream.call(ENDPOINT, "600519", lambda: "third", fallback=False)
+
+
+def test_timeout_without_last_good_raises(tmp_path):
+    upstream = _upstream(tmp_path, FaultSchedule({ENDPOINT: ["timeout"]}), retries=0)
+    with pytest.raises(UpstreamTimeout):
+        upstream.call(ENDPOINT, "600519", lambda: "never")
+
+
+def test_breaker_opens_and_rejects(tmp_path):
+    """连续失败达到阈值后熔断，之后的调用不再访问上游"""
+    upstream = _upstream(tmp_path, FaultSchedule(rates={ENDPOINT: 1.0}), retries=0, threshold=3)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            upstream.call(ENDPOINT, "600519", lambda: "never")
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        upstream.call(ENDPOINT, "600519", lambda: calls.append(1))
+    assert not calls
+    stats = upstream.stats()["endpoints"][ENDPOINT]
+    assert (stats["breaker"], stats["trips"], stats["rejected"], stats["injected"]) == ("open", 1, 1, 3)
+
+
+def test_non_transient_error_is_not_retried(tmp_path):
+    """上游已应答的错误（如代码不存在）直接抛出，不重试也不计入熔断"""
+    upstream = _upstream(tmp_path, None, retries=3, threshold=1)
+    attempts = []
+
+    def missing():
+        attempts.append(1)
+        raise KeyError("600000")
+
+    with counting_retries() as counter, pytest.raises(KeyError):
+        upstream.call(ENDPOINT, "600000", missing)
+    assert (len(attempts), counter["retries"]) == (1, 0)
+    assert upstream.stats()["endpoints"][ENDPOINT]["breaker"] == "closed"
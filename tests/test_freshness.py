@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+落盘数据有效期 - 只有预热器本轮完整预热过的股票放宽到预热的有效期，其余交互读取用 FETCH_MAX_AGE
+"""
+
+from types import SimpleNamespace
+
+import fetchers
+import warmer
+from config import FETCH_MAX_AGE
+
+
+def test_only_warmed_codes_use_warm_max_age():
+    """登记 600519 后它按预热有效期读取；未登记的股票、取消登记后都回到 FETCH_MAX_AGE"""
+    assert fetchers._max_age("600519") == FETCH_MAX_AGE
+    fetchers.set_warm_codes(["600519"], max_age=86400)
+    try:
+        assert fetchers._max_age("600519") == 86400
+        assert fetchers._max_age("000001") == FETCH_MAX_AGE
+    finally:
+        fetchers.set_warm_codes([])
+    assert fetchers._max_age("600519") == FETCH_MAX_AGE
+
+
+def test_interrupted_round_covers_only_completed_codes(tmp_path, monkeypatch):
+    """预热中途停止、某项抓取失败：只有各项都成功的股票记入覆盖并放宽有效期"""
+    codes = ["600519", "000002", "000858"]
+    cache_warmer = warmer.CacheWarmer(engine=SimpleNamespace(snapshot_store=SimpleNamespace(refresh=lambda: None)),
+                                      spread=0, limiter=SimpleNamespace(acquire=lambda host: None),
+                                      state_path=str(tmp_path / "warm_state.json"))
+    fetched = []
+
+    def finance(code):
+        fetched.append(code)
+        if code == "000002":
+            raise ConnectionError("上游超时")
+
+    def bars(code):
+        if code == "000002":
+            cache_warmer.stop()  # 000858 没轮到
+
+    monkeypatch.setattr(warmer, "fetch_dividend_data", lambda code: None)
+    monkeypatch.setattr(warmer, "fetch_financial_abstract", finance)
+    monkeypatch.setattr(warmer, "fetch_trend_signals", bars)
+    monkeypatch.setattr(warmer, "fetch_yield_history", lambda code, dividend=None: None)
+    cache_warmer._thread = SimpleNamespace()  # 视为已启动定时预热，本轮结束时登记覆盖的股票
+    try:
+        record = cache_warmer.run_once(codes)
+        assert fetched == ["600519", "000002"]
+        assert record["covered"] == ["600519"]
+        assert fetchers._max_age("600519") == cache_warmer.max_age
+        assert fetchers._max_age("000002") == fetchers._max_age("000858") == FETCH_MAX_AGE
+    finally:
+        fetchers.set_warm_codes([])
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+财务数据仓库 - 原表指纹随桶落盘，重启后内容未变的入库不读整个仓库、不重写桶；后台入库在 flush 后可查询
+"""
+
+import pandas as pd
+
+from fundamentals import FundamentalsWarehouse
+
+
+def _abstract(roe):
+    """与 stock_financial_abstract_ths 同结构的财务摘要（按报告期倒序）"""
+    return pd.DataFrame({
+        "报告期": ["2023", "2022", "2021"],
+        "净利润": ["115.48亿", "100.2亿", "90.1亿"],
+        "净资产收益率": [f"{roe}%", "20.10%", "19.50%"],
+        "资产负债率": ["20.1%", "21.3%", "22.0%"],
+    })
+
+
+def test_fingerprints_survive_restart(tmp_path):
+    """同一份原表在新实例（模拟进程重启）中再次入库时直接跳过，只读元数据"""
+    first = FundamentalsWarehouse(str(tmp_path), buckets=4)
+    assert first.ingest("600519", _abstract(25.3)) == 3
+    assert first.bucket_writes == 1
+
+    restarted = FundamentalsWarehouse(str(tmp_path), buckets=4)
+    assert restarted.ingest("600519", _abstract(25.3)) == 0
+    assert (restarted.skipped, restarted.bucket_writes) == (1, 0)
+    assert not restarted._frames
+
+    # 内容变了：只读写所在的桶
+    assert restarted.ingest("600519", _abstract(26.0)) == 3
+    assert restarted.bucket_writes == 1
+    assert list(restarted._frames) == [restarted._bucket_of("600519")]
+    assert restarted.history("600519")["roe"].iloc[-1] == 26.0
+
+
+def test_submit_ingests_in_background(tmp_path):
+    """submit 立即返回，flush 之后仓库中可以查到；同一股票多次提交只保留最新一份"""
+    warehouse = FundamentalsWarehouse(str(tmp_path), buckets=4)
+    warehouse.submit("000858", _abstract(22.0))
+    warehouse.submit("000858", _abstract(23.5))
+    assert warehouse.flush(timeout=10)
+    history = warehouse.history("000858")
+    assert history["fiscal_year"].tolist() == [2021, 2022, 2023]
+    assert history["roe"].iloc[-1] == 23.5
+    assert history["net_profit"].iloc[-1] == 1.1548e10
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+模拟大模型服务 - mock_openai_server 的流式 / 非流式应答与用量，研报引擎在其上并发生成时复用连接
+"""
+
+import json
+
+import httpx
+import pytest
+
+from mock_openai_server import DEFAULT_REPORT, start_mock_server
+from report_engine import generate_reports
+
+MESSAGES = [{"role": "user", "content": "分析贵州茅台"}]
+
+
+@pytest.fixture
+def mock_server():
+    server, base_url = start_mock_server(chunk_count=8, chunk_delay=0, first_token_delay=0)
+    yield server, base_url
+    server.shutdown()
+    server.server_close()
+
+
+def test_non_stream_response(mock_server):
+    """非流式请求返回完整报告与用量"""
+    server, base_url = mock_server
+    response = httpx.post(f"{base_url}/chat/completions", json={"model": "m", "messages": MESSAGES})
+    body = response.json()
+    assert response.status_code == 200
+    assert body["choices"][0]["message"]["content"] == DEFAULT_REPORT
+    assert body["usage"]["completion_tokens"] == len(DEFAULT_REPORT)
+    assert server.requests == 1
+
+
+def test_stream_events(mock_server):
+    """流式请求按 SSE 分块返回，拼起来是完整报告；要求用量时最后一个事件带 usage，以 [DONE] 结束"""
+    _, base_url = mock_server
+    payload = {"model": "m", "messages": MESSAGES, "stream": True, "stream_options": {"include_usage": True}}
+    with httpx.stream("POST", f"{base_url}/chat/completions", json=payload) as response:
+        lines = [line[5:].strip() for line in response.iter_lines() if line.startswith("data:")]
+    assert lines[-1] == "[DONE]"
+    events = [json.loads(line) for line in lines[:-1]]
+    content = "".join(e["choices"][0]["delta"].get("content", "") for e in events if e["choices"])
+    assert content == DEFAULT_REPORT
+    assert events[-1]["usage"]["total_tokens"] > 0
+    assert len([e for e in events if e["choices"]]) == 8 + 1  # 8 个分块 + 结束事件
+
+
+def test_unknown_path_is_404(mock_server):
+    _, base_url = mock_server
+    assert httpx.post(f"{base_url}/embeddings", json={}).status_code == 404
+
+
+def test_report_engine_reuses_connections(mock_server):
+    """6 份报告、并发 2：全部生成完整报告，新建连接数不超过并发数"""
+    server, base_url = mock_server
+    received = {}
+    jobs = [{"key": i, "messages": MESSAGES, "sink": lambda delta, i=i: received.setdefault(i, []).append(delta)}
+            for i in range(6)]
+    results = generate_reports(jobs, api_key="mock", base_url=base_url, concurrency=2)
+    assert [r["key"] for r in results] == list(range(6))
+    assert all(r["error"] is None and r["content"] == DEFAULT_REPORT for r in results)
+    assert all("".join(received[i]) == DEFAULT_REPORT for i in range(6))
+    assert server.requests == 6
+    assert server.connections <= 2
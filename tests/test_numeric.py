@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数值换算 - numeric.py 在多组合成表上的性质：与期望值一致、整表 / 逐列 / 单个值一致、负号对称、幂等、
+无法识别的列保留、限定单位
+"""
+
+import numpy as np
+import pytest
+
+from numeric import MISSING_TEXT, make_unit_frame, normalize_frame, parse_number, parse_numbers
+
+SEEDS = range(10)
+ROWS, COLUMNS = 300, 8
+
+
+def _scalar(values):
+    return [np.nan if (v := parse_number(x)) is None else v for x in values]
+
+
+@pytest.fixture(params=SEEDS, ids=lambda seed: f"seed{seed}")
+def unit_frame(request):
+    return make_unit_frame(ROWS, COLUMNS, seed=request.param)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("115.48亿", 1.1548e10), ("3.2万", 3.2e4), ("1.5万亿", 1.5e12), ("25.60%", 25.6), ("20.53元", 20.53),
+    ("-14.62%", -14.62), ("1,234.5", 1234.5), (" 7 ", 7.0), (12, 12.0),
+])
+def test_parse_number_examples(text, expected):
+    """常见写法：亿 / 万 / 万亿 / % / 元、负数、千分位、首尾空白、已是数值"""
+    assert parse_number(text) == pytest.approx(expected, rel=1e-12)
+
+
+@pytest.mark.parametrize("text", ["--", "-", "", None, np.nan, "abc", "1.2.3", "10派3元"])
+def test_parse_number_missing_or_junk(text):
+    """占位符与无法识别的文本返回 None"""
+    assert parse_number(text) is None
+
+
+def test_matches_expected(unit_frame):
+    """按文本精确换算（占位符为 NaN），所有列都变成 float64"""
+    text, expected = unit_frame
+    got = normalize_frame(text)
+    assert all(got[c].dtype == np.float64 for c in got.columns)
+    assert np.allclose(got.to_numpy(), expected.to_numpy(), rtol=1e-12, equal_nan=True)
+
+
+def test_block_column_scalar_agree(unit_frame):
+    """整表一次换算与逐列、逐单元格换算一致"""
+    text, _ = unit_frame
+    block = parse_numbers(text)
+    column_wise = np.column_stack([parse_numbers(text[c]) for c in text.columns])
+    scalar = np.array([_scalar(row) for row in text.to_numpy()])
+    assert np.array_equal(block, column_wise, equal_nan=True)
+    assert np.array_equal(block, scalar, equal_nan=True)
+
+
+def test_sign_symmetry(unit_frame):
+    """文本前加负号（或去掉负号），结果取反"""
+    text, _ = unit_frame
+    negated = text.apply(lambda col: col.map(lambda v: v[1:] if isinstance(v, str) and v.startswith("-")
+                                             else f"-{v}" if isinstance(v, str) and v[:1].isdigit() else v))
+    assert np.array_equal(parse_numbers(negated), -parse_numbers(text), equal_nan=True)
+
+
+def test_numeric_frame_is_idempotent(unit_frame):
+    """已是数值的表再换算一次不变"""
+    got = normalize_frame(unit_frame[0])
+    assert normalize_frame(got).equals(got)
+
+
+def test_unit_restriction(unit_frame):
+    """限定单位：不在 units 中的单位为 NaN"""
+    text, _ = unit_frame
+    only_yuan = parse_numbers(text, units=("元",))
+    yuan_or_plain = np.isin(np.strings.lstrip(text.to_numpy(dtype=str), "0123456789.-"), ["元", ""])
+    assert np.all(np.isnan(only_yuan[~yuan_or_plain]))
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_junk_columns_kept_or_coerced(seed):
+    """含无法识别文本的列整列保留；coerce=True 时换算为 NaN，并与单个值换算一致"""
+    dirty, _ = make_unit_frame(ROWS, COLUMNS, seed=seed, junk=0.05)
+    kept = normalize_frame(dirty)
+    coerced = normalize_frame(dirty, coerce=True)
+    for c in dirty.columns:
+        has_junk = any(parse_number(v) is None and str(v).strip() not in MISSING_TEXT for v in dirty[c])
+        assert (kept[c].dtype == object) == has_junk
+        assert np.array_equal(coerced[c].to_numpy(dtype=float), _scalar(dirty[c]), equal_nan=True)
+
+
+def test_small_inputs_match_vectorized(unit_frame):
+    """逐个解析的小输入（一行、一列的前几个值）与整表向量化换算一致"""
+    text, _ = unit_frame
+    block = parse_numbers(text)
+    assert np.array_equal(np.vstack([parse_numbers(row) for row in text.to_numpy()]), block, equal_nan=True)
+    assert np.array_equal(parse_numbers(text.iloc[:5]), block[:5], equal_nan=True)
+    assert np.array_equal(parse_numbers(text, units=("元",))[:5], parse_numbers(text.iloc[:5], units=("元",)), equal_nan=True)
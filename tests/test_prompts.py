@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+提示词预算与紧凑财报 - 超出预算时按优先级逐级精简段落，required 段落保留最精简版本，无可精简时停止；
+财报列亿 / 万混用时统一为亿，含无法识别的值时整列原样保留
+"""
+
+import numpy as np
+import pandas as pd
+
+from prompts import (
+    PromptSection, _compact_column, _messages, _render_user_prompt, compact_finance_csv, estimate_message_tokens,
+    fit_sections,
+)
+
+SECTIONS = (
+    PromptSection("行情", (["价" * 200], ["价" * 20]), priority=0),
+    PromptSection("财报", (["财" * 300], ["财" * 50]), priority=1),
+    PromptSection("要求", (["要" * 100], ["要" * 10]), priority=2, required=True),
+)
+
+
+def _tokens(levels):
+    """指定各段落版本时的消息 token 数"""
+    return estimate_message_tokens(_messages(_render_user_prompt(SECTIONS, levels, compact=True)))
+
+
+def _prompt(messages):
+    return messages[-1]["content"]
+
+
+def test_no_budget_keeps_full_versions():
+    """budget 为 None / 0 或足够时不精简"""
+    for budget in (None, 0, _tokens([0, 0, 0])):
+        messages, trimmed = fit_sections(SECTIONS, budget)
+        assert trimmed == ()
+        assert _prompt(messages) == _render_user_prompt(SECTIONS, [0, 0, 0], compact=True)
+
+
+def test_sections_are_trimmed_in_priority_order():
+    """priority 小的段落先降级、再整段省略，之后才轮到下一个段落"""
+    messages, trimmed = fit_sections(SECTIONS, _tokens([1, 0, 0]))
+    assert trimmed == ("行情",)
+    assert "价" * 20 in _prompt(messages) and "价" * 21 not in _prompt(messages)
+
+    messages, trimmed = fit_sections(SECTIONS, _tokens([2, 0, 0]))
+    assert trimmed == ("行情",) and "【行情】" not in _prompt(messages)
+
+    messages, trimmed = fit_sections(SECTIONS, _tokens([2, 1, 0]))
+    assert trimmed == ("行情", "财报")
+    assert _prompt(messages) == _render_user_prompt(SECTIONS, [2, 1, 0], compact=True)
+
+
+def test_required_section_is_never_dropped():
+    """预算小到放不下任何内容：可省略的段落全部省略，required 段落保留最精简版本后停止（不会死循环）"""
+    messages, trimmed = fit_sections(SECTIONS, 1)
+    assert trimmed == ("行情", "财报", "要求")
+    assert _prompt(messages) == "【要求】\n" + "要" * 10
+    assert estimate_message_tokens(messages) > 1
+
+
+def test_trimming_stops_when_nothing_is_trimmable():
+    """全部是 required 段落且都已是最精简版本时直接返回，即使仍超出预算"""
+    sections = (PromptSection("要求", (["要" * 10],), required=True),)
+    messages, trimmed = fit_sections(sections, 1)
+    assert trimmed == ()
+    assert _prompt(messages) == "【要求】\n" + "要" * 10
+
+
+def test_mixed_units_are_rescaled_to_yi():
+    """亿 / 万混用统一换算为亿；只有万时保留万；数值单元格按 4 位有效数字；缺失留空"""
+    assert _compact_column(["1.5亿", "3000万", None, "2.25亿"]) == ("亿", ["1.5", "0.3", "", "2.25"])
+    assert _compact_column(["3000万", "200万"]) == ("万", ["3000", "200"])
+    assert _compact_column(["12.5%", "--", "8%"]) == ("%", ["12.5", "", "8"])
+    assert _compact_column([1.23456, 2.0, np.nan]) == (None, ["1.235", "2", ""])
+
+
+def test_unparseable_column_is_kept_verbatim():
+    """含无法识别的值（或单位不能合并）时不提取单位，整列原样输出"""
+    assert _compact_column(["1.5亿", "待披露", " 2亿 "]) == (None, ["1.5亿", "待披露", "2亿"])
+    assert _compact_column(["1.5亿", "12%"]) == (None, ["1.5亿", "12%"])
+
+
+def test_compact_finance_csv():
+    """第一行为报告期，单位写在指标名后；periods 只取最近几期"""
+    df = pd.DataFrame({
+        "报告期": ["2024-12-31", "2023-12-31"],
+        "净利润": ["1.5亿", "3000万"],
+        "ROE": ["12%", "8%"],
+        "备注": ["待披露", None],
+    })
+    assert compact_finance_csv(df) == "指标,2024-12-31,2023-12-31\n净利润(亿),1.5,0.3\nROE(%),12,8\n备注,待披露,"
+    assert compact_finance_csv(df, periods=1) == "指标,2024-12-31\n净利润(亿),1.5\nROE(%),12\n备注,待披露"
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+录制与回放 - 录制的 4 个 akshare 接口返回在回放时原样取回（日线按日期区间过滤），退出回放后恢复原接口
+"""
+
+from datetime import date
+
+import akshare as ak
+import pandas as pd
+import pytest
+
+from replay import (
+    ENDPOINTS, ReplaySource, load_manifest, make_dividend_history, make_financial_abstract, make_price_history,
+    make_spot_snapshot, record_fixtures, replaying, write_synthetic_fixtures,
+)
+
+CODES = ("600519", "000858")
+
+
+@pytest.fixture
+def fake_akshare(monkeypatch):
+    """用合成数据代替联网接口，记录每次调用的参数"""
+    calls = []
+    spot = make_spot_snapshot(rows=50, codes=CODES)
+    dividends = make_dividend_history(3, end=date(2024, 6, 14), interval_days=365)
+    # 巨潮返回的日期列混有 date 对象与 None
+    dividends["股份到账日"] = [date(2022, 6, 20), None, date(2024, 6, 20)]
+
+    def hist(symbol, period="daily", start_date="19700101", end_date="20500101", adjust=""):
+        calls.append(("stock_zh_a_hist", symbol, start_date, end_date))
+        return make_price_history(symbol, days=60)
+
+    monkeypatch.setattr(ak, "stock_zh_a_spot_em", lambda: spot.copy())
+    monkeypatch.setattr(ak, "stock_zh_a_hist", hist)
+    monkeypatch.setattr(ak, "stock_dividend_cninfo", lambda symbol: dividends.copy())
+    monkeypatch.setattr(ak, "stock_financial_abstract_ths",
+                        lambda symbol, indicator="按报告期": make_financial_abstract(years=5, seed=int(symbol)))
+    return {"spot": spot, "dividends": dividends, "calls": calls}
+
+
+def test_record_then_replay_round_trip(tmp_path, fake_akshare):
+    """录制后回放，取回的数据与录制时一致；混合类型的文本列按字符串保存，缺失值仍是缺失"""
+    record_fixtures(CODES, str(tmp_path), hist_days=60)
+    assert load_manifest(str(tmp_path))["codes"] == list(CODES)
+    assert {call[1] for call in fake_akshare["calls"]} == set(CODES)
+
+    with replaying(str(tmp_path)) as source:
+        pd.testing.assert_frame_equal(ak.stock_zh_a_spot_em(), fake_akshare["spot"])
+        finance = ak.stock_financial_abstract_ths(symbol="600519", indicator="主要指标")
+        pd.testing.assert_frame_equal(finance, make_financial_abstract(years=5, seed=600519))
+        dividends = ak.stock_dividend_cninfo(symbol="000858")
+        assert dividends["股份到账日"].tolist() == ["2022-06-20", None, "2024-06-20"]
+        assert dividends["股份到账日"].isna().tolist() == fake_akshare["dividends"]["股份到账日"].isna().tolist()
+        pd.testing.assert_frame_equal(dividends.drop(columns="股份到账日"),
+                                      fake_akshare["dividends"].drop(columns="股份到账日"))
+        assert source.calls["stock_financial_abstract_ths"] == 1
+
+
+def test_replay_restores_akshare(tmp_path):
+    """with 块内接口被替换，退出后恢复原函数"""
+    write_synthetic_fixtures(str(tmp_path), codes=CODES)
+    originals = {endpoint: getattr(ak, endpoint) for endpoint in ENDPOINTS}
+    with replaying(str(tmp_path)):
+        assert all(getattr(ak, endpoint) is not originals[endpoint] for endpoint in ENDPOINTS)
+    assert all(getattr(ak, endpoint) is originals[endpoint] for endpoint in ENDPOINTS)
+
+
+def test_replay_filters_hist_by_date(tmp_path):
+    """日线按 start_date / end_date 过滤；返回副本，修改不影响下一次回放"""
+    write_synthetic_fixtures(str(tmp_path), codes=CODES)
+    source = ReplaySource(str(tmp_path))
+    full = source.stock_zh_a_hist("600519")
+    start, end = pd.to_datetime(full["日期"]).iloc[[10, 20]]
+    part = source.stock_zh_a_hist("600519", start_date=start.strftime("%Y%m%d"), end_date=end.strftime("%Y%m%d"))
+    assert len(part) == 11
+    part["收盘"] = 0.0
+    assert (source.stock_zh_a_hist("600519")["收盘"] > 0).all()
+    assert source.calls["stock_zh_a_hist"] == 3
+
+
+def test_missing_fixture_raises(tmp_path):
+    write_synthetic_fixtures(str(tmp_path), codes=CODES)
+    with pytest.raises(KeyError):
+        ReplaySource(str(tmp_path)).stock_dividend_cninfo("601318")
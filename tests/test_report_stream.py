@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+研报流合并 - 模型输出在后台线程中生成：发起生成的请求中途断开，跟随者仍读到完整报告并写入缓存；生成失败时所有读取方收到同一个异常
+"""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from engine import ReportStream
+from report_cache import ReportCache
+from singleflight import SingleFlight
+
+PARTS = ["贵州茅台", "估值", "合理", "。"]
+MESSAGES = [{"role": "user", "content": "分析贵州茅台"}]
+
+
+class _FakeModel:
+    """按分片产出的假模型：发出第一段后等 release 再发其余分片；fail=True 时发完第一段就报错"""
+
+    def __init__(self, fail=False):
+        self.release = threading.Event()
+        self.calls = 0
+        self.fail = fail
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.calls += 1
+        return self._chunks()
+
+    def _chunks(self):
+        yield _chunk(PARTS[0])
+        assert self.release.wait(5)
+        if self.fail:
+            raise ConnectionError("上游断开")
+        for part in PARTS[1:]:
+            yield _chunk(part)
+        yield SimpleNamespace(choices=[], usage=SimpleNamespace(model_dump=lambda: {"prompt_tokens": 10,
+                                                                                   "completion_tokens": 4}))
+
+
+def _chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))], usage=None)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    model = _FakeModel()
+    return SimpleNamespace(report_cache=ReportCache(cache_dir=str(tmp_path)), report_flight=SingleFlight(),
+                           openai_client=lambda api_key: model, model=model)
+
+
+def test_leader_disconnect_does_not_stop_followers(engine):
+    """领头请求读到第一段后断开（生成器被关闭），跟随者读到完整报告，报告写入缓存，模型只调用一次"""
+    leader = ReportStream(engine, MESSAGES, "key", "deepseek-chat")
+    deltas = iter(leader)
+    assert next(deltas) == PARTS[0]
+
+    follower = ReportStream(engine, MESSAGES, "key", "deepseek-chat")
+    assert not follower.cached
+    received = []
+    reader = threading.Thread(target=lambda: received.extend(follower))
+    reader.start()
+
+    deltas.close()  # 客户端断开
+    engine.model.release.set()
+    reader.join(5)
+
+    assert "".join(received) == "".join(PARTS)
+    assert follower.content == "".join(PARTS) and follower.usage["completion_tokens"] == 4
+    assert engine.model.calls == 1
+    cached = ReportStream(engine, MESSAGES, "key", "deepseek-chat")
+    assert cached.cached and "".join(cached) == "".join(PARTS)
+    assert engine.report_flight.in_flight() == 0
+
+
+def test_generation_error_reaches_every_reader_and_is_not_cached(engine):
+    """模型中途报错：领头者与跟随者都收到同一个异常，不写缓存，之后可以重新生成"""
+    engine.model.fail = True
+    leader = iter(ReportStream(engine, MESSAGES, "key", "deepseek-chat"))
+    assert next(leader) == PARTS[0]
+    follower = iter(ReportStream(engine, MESSAGES, "key", "deepseek-chat"))
+    assert next(follower) == PARTS[0]
+
+    engine.model.release.set()
+    for stream in (leader, follower):
+        with pytest.raises(ConnectionError):
+            list(stream)
+    assert not ReportStream(engine, MESSAGES, "key", "deepseek-chat").cached
+    assert engine.report_flight.in_flight() == 0
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+请求合并 - 领头者的结果 / 异常传给全部跟随者；领头者被 BaseException 中断时跟随者也不会一直等待
+"""
+
+import threading
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def _follow(flight, key, started, results):
+    """等领头者开始执行后加入同一个键，把结果或异常记入 results"""
+    started.wait()
+    try:
+        results.append(flight.do(key, lambda: "follower ran", timeout=5))
+    except BaseException as e:
+        results.append(e)
+
+
+@pytest.mark.parametrize("error, expected", [
+    (ValueError("上游出错"), ValueError),
+    (KeyboardInterrupt(), RuntimeError),
+    (SystemExit(1), RuntimeError),
+])
+def test_leader_failure_releases_followers(error, expected):
+    """领头者抛出的异常（含 BaseException）立即传给跟随者；非 Exception 的中断以 RuntimeError 传出"""
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    results = []
+    followers = [threading.Thread(target=_follow, args=(flight, "k", started, results)) for _ in range(3)]
+    for t in followers:
+        t.start()
+
+    def leader():
+        started.set()
+        # 等跟随者都加入后再失败
+        release.wait(5)
+        raise error
+
+    threading.Timer(0.2, release.set).start()
+    with pytest.raises(type(error)):
+        flight.do("k", leader)
+    for t in followers:
+        t.join(5)
+    assert not any(t.is_alive() for t in followers)
+    assert len(results) == 3 and all(isinstance(r, expected) for r in results)
+    assert flight.stats() == {"executed": 1, "shared": 3, "in_flight": 0}
+
+
+def test_followers_share_value():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    results = []
+    follower = threading.Thread(target=_follow, args=(flight, "k", started, results))
+    follower.start()
+
+    def leader():
+        started.set()
+        release.wait(5)
+        return 42
+
+    threading.Timer(0.2, release.set).start()
+    assert flight.do("k", leader) == (42, False)
+    follower.join(5)
+    assert results == [(42, True)]
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+行情快照存储 - decode_snapshot 与整表换型取整一致且不共用底层数组；取行与解码后整表的 .loc 一致，刷新后读到新值
+"""
+
+import numpy as np
+import pandas as pd
+
+from replay import make_spot_snapshot
+from snapshot_store import SNAPSHOT_DECIMALS, SnapshotStore, compact_snapshot, decode_snapshot
+
+CODES = ("600519", "000858")
+
+
+def test_decode_matches_astype_round_and_is_a_new_frame():
+    """逐列解码的结果与整表 astype + round 相同；改动解码结果不影响共用的紧凑快照"""
+    compact = compact_snapshot(make_spot_snapshot(rows=200, codes=CODES))
+    narrow = [c for c in compact.columns if compact[c].dtype == np.float32]
+    expected = compact.astype(dict.fromkeys(narrow, np.float64)).round(dict.fromkeys(narrow, SNAPSHOT_DECIMALS))
+
+    decoded = decode_snapshot(compact)
+    pd.testing.assert_frame_equal(decoded, expected)
+
+    decoded.loc[CODES[0], "最新价"] = -1.0
+    decoded.loc[CODES[0], "名称"] = "改动"
+    assert compact.loc[CODES[0], "最新价"] != -1.0
+    assert compact.loc[CODES[0], "名称"] != "改动"
+
+
+def test_row_matches_decoded_frame_and_follows_refresh(tmp_path):
+    """取行与解码后整表的 .loc 逐项相等，没有的代码返回 None；刷新换了快照后读到新价格"""
+    feed = {"df": make_spot_snapshot(rows=200, codes=CODES)}
+    store = SnapshotStore(fetch_func=lambda: feed["df"], cache_dir=str(tmp_path))
+    decoded = decode_snapshot(store.get())
+
+    for code in (*CODES, decoded.index[-1]):
+        pd.testing.assert_series_equal(store.row(code), decoded.loc[code].astype(object))
+    assert store.row("999999") is None
+
+    feed["df"] = feed["df"].assign(最新价=feed["df"]["最新价"] + 1)
+    store.refresh()
+    assert store.row(CODES[0])["最新价"] == decode_snapshot(store.get()).loc[CODES[0], "最新价"]
+    assert store.row(CODES[0])["最新价"] == round(decoded.loc[CODES[0], "最新价"] + 1, SNAPSHOT_DECIMALS)
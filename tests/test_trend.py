@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+趋势指标 - 分块滚动最值、整段向量化指标与逐根增量状态，都与朴素的 pandas rolling 实现逐值一致
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from trend import TREND_WINDOWS, TrendState, TrendTracker, latest_signals, rolling_max, rolling_min, trend_frame
+
+FIELDS = [f"{kind}_{w}" for w in TREND_WINDOWS for kind in ("high", "low", "ma")] + ["atr_14"]
+BREAKOUTS = [f"breakout_{w}" for w in TREND_WINDOWS]
+
+
+def _bars(days=300, seed=7):
+    """随机游走日线；夹杂缺收盘价（整根丢弃）与缺最高 / 最低价（用收盘价代替）的 K 线"""
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(rng.normal(0, 0.02, days).cumsum())
+    spread = rng.uniform(0, 0.03, days)
+    bars = pd.DataFrame({"date": pd.bdate_range("2022-01-03", periods=days),
+                         "high": close * (1 + spread), "low": close * (1 - spread), "close": close})
+    bars.loc[bars.index.isin([5, 40, 41, 270]), "close"] = np.nan
+    bars.loc[bars.index.isin([12, 100]), "high"] = np.nan
+    bars.loc[bars.index.isin([13, 260]), "low"] = np.nan
+    return bars
+
+
+def _reference(bars):
+    """朴素参考：pandas rolling 求高低点与均线，shift 后比较突破，ewm 求 Wilder ATR"""
+    bars = bars.dropna(subset=["close"]).reset_index(drop=True)
+    high, low, close = bars["high"].fillna(bars["close"]), bars["low"].fillna(bars["close"]), bars["close"]
+    ref = pd.DataFrame({"close": close})
+    for w in TREND_WINDOWS:
+        ref[f"high_{w}"] = high.rolling(w, min_periods=1).max()
+        ref[f"low_{w}"] = low.rolling(w, min_periods=1).min()
+        ref[f"ma_{w}"] = close.rolling(w).mean()
+        full = ref.index >= w
+        up, down = close > ref[f"high_{w}"].shift(), close < ref[f"low_{w}"].shift()
+        ref[f"breakout_{w}"] = np.where(full & up, 1, np.where(full & down, -1, 0))
+    prev_close = close.shift()
+    tr = pd.concat([high - low, (high - prev_close).abs(), (low - prev_close).abs()], axis=1).max(axis=1)
+    ref["atr_14"] = tr.ewm(alpha=1 / 14, adjust=False).mean().mask(ref.index < 13)
+    return ref
+
+
+def _assert_signals_match(signals, row):
+    """增量状态的信号与整段计算的某一行一致（NaN 对应 None）"""
+    for field in FIELDS:
+        got = getattr(signals, field)
+        if np.isnan(row[field]):
+            assert got is None, field
+        else:
+            assert got == pytest.approx(row[field]), field
+    assert [getattr(signals, f) for f in BREAKOUTS] == [row[f] for f in BREAKOUTS]
+    assert signals.close == pytest.approx(row["close"])
+
+
+def _assert_same_signals(got, expected):
+    """两份趋势信号一致：浮点指标允许累加顺序带来的舍入差异"""
+    assert (got.date, got.bars) == (expected.date, expected.bars)
+    for field in FIELDS + ["close"]:
+        a, b = getattr(got, field), getattr(expected, field)
+        assert (a is None and b is None) or a == pytest.approx(b), field
+    assert [getattr(got, f) for f in BREAKOUTS] == [getattr(expected, f) for f in BREAKOUTS]
+
+
+@pytest.mark.parametrize("window", [1, 3, 20, 64, 250, 1000])
+def test_rolling_extremes_match_pandas(window):
+    """含 NaN 的序列：与 pandas rolling(min_periods=1) 一致，窗口超过序列长度时退化为前缀最值"""
+    values = np.random.default_rng(window).normal(0, 1, 500).cumsum()
+    values[[0, 17, 18, 19, 250, 499]] = np.nan
+    series = pd.Series(values)
+    np.testing.assert_allclose(rolling_max(values, window), series.rolling(window, min_periods=1).max())
+    np.testing.assert_allclose(rolling_min(values, window), series.rolling(window, min_periods=1).min())
+
+
+def test_rolling_extremes_short_and_empty_inputs():
+    """序列比窗口短、全为 NaN、长度为 0"""
+    np.testing.assert_allclose(rolling_max(np.array([3.0, 1.0, 2.0]), 250), [3.0, 3.0, 3.0])
+    np.testing.assert_allclose(rolling_min(np.array([3.0, 1.0, 2.0]), 250), [3.0, 1.0, 1.0])
+    assert np.isnan(rolling_max(np.array([np.nan, np.nan]), 2)).all()
+    assert len(rolling_min(np.array([]), 20)) == 0
+
+
+def test_trend_frame_matches_naive_reference():
+    """整段向量化指标与朴素参考逐值一致；缺收盘价的 K 线被丢弃"""
+    bars = _bars()
+    frame = trend_frame(bars)
+    ref = _reference(bars)
+    assert len(frame) == len(bars) - 4
+    for col in FIELDS:
+        np.testing.assert_allclose(frame[col], ref[col], err_msg=col)
+    for col in BREAKOUTS:
+        assert frame[col].tolist() == ref[col].tolist(), col
+    assert np.isnan(frame["atr_14"].iloc[:13]).all() and not np.isnan(frame["atr_14"].iloc[13])
+
+
+def test_trend_frame_shorter_than_windows():
+    """K 线少于窗口：高低点按已有 K 线计算，均线为 NaN，不产生突破信号"""
+    frame = trend_frame(_bars(days=30))
+    ref = _reference(_bars(days=30))
+    np.testing.assert_allclose(frame["high_250"], ref["high_250"])
+    assert frame["ma_60"].isna().all() and (frame["breakout_250"] == 0).all()
+
+
+def test_state_matches_trend_frame_after_each_bar():
+    """逐根追加 K 线：每一步的状态信号都与整段计算的对应行一致，缺收盘价的 K 线不改变状态"""
+    bars = _bars()
+    frame = trend_frame(bars).set_index("date")
+    state = TrendState()
+    for day, high, low, close in bars[["date", "high", "low", "close"]].itertuples(index=False):
+        state.update(day, high, low, close)
+        if np.isnan(close):
+            assert state.last_date != day
+            continue
+        assert state.signals().bars == frame.index.get_loc(day) + 1
+        _assert_signals_match(state.signals(), frame.loc[day])
+
+
+def test_tracker_appends_match_latest_signals():
+    """按天把日线喂给追踪器：每次只追加新 K 线，结果与整段重算一致；未收盘的当天不写回状态"""
+    bars = _bars()
+    tracker = TrendTracker()
+    settled = pd.Timestamp("2030-01-01")
+    for end in [200, 201, 207, 230]:
+        got = tracker.update("600519", bars.iloc[:end], today=settled)
+        _assert_same_signals(got, latest_signals(bars.iloc[:end]))
+
+    # 盘中：最后一根 K 线尚未收盘，只在状态副本上计算；收盘价变化后再传入时直接追加，不整段重算
+    today = bars["date"].iloc[-1]
+    intraday = bars.copy()
+    intraday.loc[intraday.index[-1], "close"] *= 1.05
+    _assert_same_signals(tracker.update("600519", intraday, today=today), latest_signals(intraday))
+    _assert_same_signals(tracker.update("600519", bars, today=settled), latest_signals(bars))
+    assert tracker.stats() == {"codes": 1, "rebuilds": 1, "appended_bars": len(bars) - 200}
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+估值模型 - 阈值上的取值按严格小于分档（标量 < 与 searchsorted(side="right") 一致）；
+全市场列式筛选与逐只估值在阈值、负 PE、缺失或非正增长率、缺失 ROE / 现价时结论一致；
+注册表的逐只一趟估值（evaluate_models）与整批向量化估值（screen_models）逐个模型一致
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from valuation import (
+    PB_LABELS, PB_THRESHOLDS, PE_THRESHOLDS, PEG_THRESHOLDS, VALUATION_MODELS, _assess, _assess_array,
+    estimate_by_pb_model, estimate_by_pe_model, estimate_by_peg_model, estimate_by_roe_model, evaluate_models,
+    screen_market, screen_models,
+)
+
+NAN = np.nan
+
+# 代码: (现价, 动态PE, 市净率, 净利润增长率, ROE, EPS)
+CASES = {
+    "600000": (10.0, 15.0, 0.8, 15.0, 8.0, 1.0),     # PE 恰为 15、PEG 恰为 1、PB 恰为 0.8
+    "600001": (12.0, 25.0, 1.2, NAN, 3.0, 1.0),      # 缺增长率用默认 10%；ROE 3% 时合理 PE 为 0
+    "600002": (20.0, 35.0, 2.0, -35.0, 20.0, 2.0),   # 负增长率取绝对值
+    "600003": (30.0, 30.0, 3.0, 20.0, NAN, 1.5),     # PEG 恰为 1.5；缺 ROE
+    "600004": (15.0, 20.0, 0.5, 10.0, 15.0, 0.8),    # PEG 恰为 2
+    "600005": (5.0, -5.0, -1.0, 0.0, 10.0, -0.2),    # 亏损：负 PE、负市净率、零增长、负 EPS
+    "600006": (NAN, NAN, 0.0, NAN, 12.0, 1.0),       # 停牌没有现价与 PE
+    "600007": (8.0, 14.99, 1.19, 10.0, 0.0, 1.0),    # 阈值之下；ROE 为 0
+}
+
+
+def _snapshot():
+    """行情快照（字符串代码、中文列名）与按代码索引的财报增长率 / ROE / EPS"""
+    codes = list(CASES)
+    price, pe, pb, growth, roe, eps = (list(col) for col in zip(*CASES.values()))
+    df = pd.DataFrame({"代码": codes, "名称": [f"股票{c}" for c in codes], "最新价": price,
+                       "市盈率-动态": pe, "市净率": pb})
+    as_series = lambda values: pd.Series(values, index=codes, dtype=float)
+    return df, as_series(growth), as_series(roe), as_series(eps)
+
+
+def _value(record, attr):
+    return None if record is None else getattr(record, attr)
+
+
+def _same(scalar, vector):
+    """标量结果与向量化结果一致：None 对应 NaN / None，浮点按近似比较"""
+    if scalar is None:
+        return vector is None or pd.isna(vector)
+    if isinstance(scalar, str):
+        return scalar == vector
+    return scalar == pytest.approx(vector)
+
+
+@pytest.mark.parametrize("thresholds, labels", [
+    (PE_THRESHOLDS, None), (PEG_THRESHOLDS, None), (PB_THRESHOLDS, PB_LABELS),
+])
+def test_threshold_values_fall_into_upper_band(thresholds, labels):
+    """恰为阈值时归入上一档（15 属于“合理”）；阈值两侧、负值、缺失与标量版本一致"""
+    kwargs = {"labels": labels} if labels else {}
+    values = [t + d for t in thresholds for d in (-1e-9, 0.0, 1e-9)] + [-3.0, 0.0, 1e6]
+    expected = [_assess(v, thresholds, **kwargs) for v in values]
+    assert list(_assess_array(values + [NAN], thresholds, **kwargs)) == expected + [None]
+    all_labels = labels or ["低估", "合理", "偏高", "高估"]
+    assert [_assess(t, thresholds, **kwargs) for t in thresholds] == all_labels[1:]
+
+
+def test_screen_market_matches_scalar_models():
+    """全市场列式估值与逐只调用 estimate_by_* 的结果逐项一致"""
+    df, growth, roe, eps = _snapshot()
+    screened = screen_market(df, growth_rate=growth, roe=roe, eps=eps)
+    assert list(screened.index) == list(CASES)
+
+    for code, (price, pe, pb, g, r, e) in CASES.items():
+        row = screened.loc[code]
+        pe_record = estimate_by_pe_model(pe, price)
+        assert _same(_value(pe_record, "assessment"), row["pe_assessment"]), code
+        assert _same(_value(pe_record, "premium"), row["pe_premium"]), code
+
+        peg_record = estimate_by_peg_model(pe, reported_growth=g)
+        for attr, column in (("peg", "peg"), ("assessment", "peg_assessment")):
+            assert _same(_value(peg_record, attr), row[column]), (code, attr)
+        if peg_record is not None:
+            assert (peg_record.growth_rate, peg_record.growth_source) == (row["growth_rate"], row["growth_source"]), code
+
+        pb_record = estimate_by_pb_model(pb * 10, 10)
+        assert _same(_value(pb_record, "assessment"), row["pb_assessment"]), code
+
+        roe_record = estimate_by_roe_model(r, e, price)
+        for attr in ("reasonable_pe", "reasonable_price", "discount_or_premium"):
+            assert _same(_value(roe_record, attr), row[attr]), (code, attr)
+
+
+def test_screen_market_boundary_conclusions():
+    """阈值上的具体结论：PE 15/25/35 依次为合理/偏高/高估，PEG 1/1.5/2 依次为合理/偏高/高估"""
+    df, growth, roe, eps = _snapshot()
+    screened = screen_market(df, growth_rate=growth, roe=roe, eps=eps)
+
+    assert screened.loc[["600000", "600001", "600002", "600007"], "pe_assessment"].tolist() == ["合理", "偏高", "高估", "低估"]
+    assert screened.loc[["600000", "600003", "600004"], "peg_assessment"].tolist() == ["合理", "偏高", "高估"]
+    assert screened.loc[["600000", "600001", "600002"], "pb_assessment"].tolist() == PB_LABELS[1:]
+    # 负 PE：PE 档位为低估、溢价记 0，PEG 不适用；零增长与缺失增长率都按默认增长率、来源为预估值
+    loss = screened.loc["600005"]
+    assert (loss["pe_assessment"], loss["pe_premium"]) == ("低估", 0.0)
+    assert np.isnan(loss["peg"]) and loss["peg_assessment"] is None
+    assert screened.loc[["600001", "600005"], "growth_source"].tolist() == ["预估值", "预估值"]
+    assert screened.loc["600002", "growth_source"] == "财报数据"
+    # 非正市净率、合理 PE 非正、缺 ROE / 现价、负 EPS 时没有结果
+    assert screened.loc[["600005", "600006"], "pb_assessment"].tolist() == [None, None]
+    assert screened.loc[["600001", "600003", "600005", "600006", "600007"], "reasonable_price"].isna().all()
+
+
+def test_scalar_models_treat_nan_as_missing():
+    """NaN 增长率按缺失处理（默认增长率、来源为预估值）；NaN 或非正的现价、ROE 不产生 ROE 估值"""
+    peg = estimate_by_peg_model(20.0, reported_growth=NAN)
+    assert (peg.growth_rate, peg.growth_source, peg.assessment) == (10, "预估值", "高估")
+    assert estimate_by_roe_model(15.0, 1.0, NAN) is None
+    assert estimate_by_roe_model(15.0, 1.0, -3.0) is None
+    assert estimate_by_roe_model(NAN, 1.0, 10.0) is None
+
+
+def _inputs_frame():
+    """CASES 对应的估值输入表（列名为注册表的估值输入）"""
+    columns = ["price", "pe", "pb", "net_profit_growth", "roe", "eps"]
+    return pd.DataFrame(list(CASES.values()), index=list(CASES), columns=columns, dtype=float)
+
+
+@pytest.mark.parametrize("missing", [None, NAN])
+def test_evaluate_models_matches_screen_models(missing):
+    """逐只一趟估值与整批向量化估值逐个模型一致；缺失输入为 None（单股解析结果）或 NaN（回测输入表）都一样"""
+    inputs = _inputs_frame()
+    screened = screen_models(inputs)
+    for code, row in inputs.iterrows():
+        values = {name: missing if pd.isna(v) else v for name, v in row.items()}
+        records = dict(zip(VALUATION_MODELS, evaluate_models(values)))
+        for name, model in VALUATION_MODELS.items():
+            if model.assessment:
+                assert _same(_value(records[name], "assessment"), screened.loc[code, model.assessment]), (code, name)
+        for attr in ("reasonable_pe", "reasonable_price", "discount_or_premium"):
+            assert _same(_value(records["ROE倍数法"], attr), screened.loc[code, attr]), (code, attr)
+        assert _same(_value(records["PEG模型"], "peg"), screened.loc[code, "peg"]), code
+
+
+def test_screen_models_skips_models_without_inputs():
+    """缺少某个估值输入列时只跳过用到它的模型；models 指定名称时只算这些模型并分别计时"""
+    inputs = _inputs_frame().drop(columns=["roe"])
+    timings = {}
+    screened = screen_models(inputs, timings=timings)
+    assert "reasonable_price" not in screened.columns
+    assert set(timings) == set(VALUATION_MODELS) - {"ROE倍数法"}
+    assert screened["pe_assessment"].tolist() == screen_models(_inputs_frame())["pe_assessment"].tolist()
+
+    timings = {}
+    only_peg = screen_models(inputs, models=["PEG模型"], timings=timings)
+    assert list(only_peg.columns) == ["peg", "growth_rate", "growth_source", "peg_assessment"]
+    assert list(timings) == ["PEG模型"]
+    assert [r.assessment for r in evaluate_models({"pe": 30.0, "net_profit_growth": 20.0}, models=["PEG模型"])] == ["偏高"]
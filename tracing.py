@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+分阶段计时 - 记录每次分析各阶段的耗时、抓取字节数、缓存命中与大模型首字延迟 / 生成速度，
+输出为 JSON Lines，并可选以 Prometheus 文本格式暴露
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import TRACE_LOG_PATH
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """一个阶段：名称、开始时间、耗时与附加属性（bytes / cache / ttft / tokens_per_second 等）"""
+
+    __slots__ = ("name", "started_at", "wall", "attrs")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.started_at = time.time()
+        self.wall = None
+        self.attrs = dict(attrs)
+
+
+def annotate(**attrs):
+    """给当前阶段附加属性；不在任何阶段内时忽略"""
+    span = _current_span.get()
+    if span is not None:
+        span.attrs.update(attrs)
+
+
+def add_to_span(key, value):
+    """给当前阶段的数值属性累加（例如同一阶段内多次抓取的字节数）"""
+    span = _current_span.get()
+    if span is not None:
+        span.attrs[key] = span.attrs.get(key, 0) + value
+
+
+def mark_cache_miss():
+    """在被缓存的函数体内调用：函数体执行了，说明当前阶段没有命中缓存"""
+    annotate(cache="miss")
+
+
+def frame_bytes(df):
+    """DataFrame 的内存占用（字节），作为抓取数据量的近似"""
+    if df is None:
+        return 0
+    return int(df.memory_usage(deep=True).sum())
+
+
+class Trace:
+    """一次分析运行的全部阶段
+
+        trace = Trace("单股深度分析", code="600519")
+        with trace.span("财报抓取") as span:
+            ...
+        trace.finish()
+    """
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.attrs = attrs
+        self.spans = []
+        self._finished = False
+
+    @contextmanager
+    def span(self, name, **attrs):
+        span = Span(name, attrs)
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            span.wall = time.perf_counter() - start
+            _current_span.reset(token)
+            self.spans.append(span)
+
+    def records(self):
+        """每个阶段一条记录（dict），字段固定在前、附加属性在后"""
+        return [
+            {
+                "trace_id": self.trace_id,
+                "trace": self.name,
+                "span": span.name,
+                "start": datetime.fromtimestamp(span.started_at).isoformat(timespec="milliseconds"),
+                "wall_ms": round(span.wall * 1000, 2),
+                **self.attrs,
+                **span.attrs,
+            }
+            for span in self.spans
+        ]
+
+    def finish(self, log_path=TRACE_LOG_PATH, registry=None):
+        """写入 JSON Lines 并汇总到指标；重复调用只生效一次"""
+        if self._finished:
+            return
+        self._finished = True
+        records = self.records()
+        if log_path:
+            write_jsonl(records, log_path)
+        (registry or default_registry).observe(records)
+
+
+_log_lock = threading.Lock()
+
+
+def write_jsonl(records, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with _log_lock, open(path, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+# ============================================================================
+# Prometheus 文本格式指标
+# ============================================================================
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """按阶段累计的耗时 / 字节数 / 缓存命中，以及最近一次大模型首字延迟与生成速度"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_seconds = {}     # span -> [sum, count]
+        self.stage_bytes = {}       # span -> bytes
+        self.cache_results = {}     # (span, hit/miss) -> count
+        self.llm = {}               # 最近一次：ttft / tokens_per_second
+
+    def observe(self, records):
+        with self._lock:
+            for record in records:
+                stage = record["span"]
+                total = self.stage_seconds.setdefault(stage, [0.0, 0])
+                total[0] += record["wall_ms"] / 1000
+                total[1] += 1
+                if record.get("bytes"):
+                    self.stage_bytes[stage] = self.stage_bytes.get(stage, 0) + record["bytes"]
+                if record.get("cache"):
+                    key = (stage, record["cache"])
+                    self.cache_results[key] = self.cache_results.get(key, 0) + 1
+                for field in ("ttft", "tokens_per_second"):
+                    if record.get(field) is not None:
+                        self.llm[field] = record[field]
+
+    def render(self):
+        """Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            lines += ["# HELP stockagent_stage_seconds 各阶段累计耗时（秒）",
+                      "# TYPE stockagent_stage_seconds summary"]
+            for stage, (total, count) in sorted(self.stage_seconds.items()):
+                lines.append(f'stockagent_stage_seconds_sum{{stage="{_label(stage)}"}} {total:.6f}')
+                lines.append(f'stockagent_stage_seconds_count{{stage="{_label(stage)}"}} {count}')
+            lines += ["# HELP stockagent_stage_bytes_total 各阶段累计抓取字节数",
+                      "# TYPE stockagent_stage_bytes_total counter"]
+            for stage, value in sorted(self.stage_bytes.items()):
+                lines.append(f'stockagent_stage_bytes_total{{stage="{_label(stage)}"}} {value}')
+            lines += ["# HELP stockagent_cache_total 各阶段缓存命中 / 未命中次数",
+                      "# TYPE stockagent_cache_total counter"]
+            for (stage, result), value in sorted(self.cache_results.items()):
+                lines.append(f'stockagent_cache_total{{stage="{_label(stage)}",result="{_label(result)}"}} {value}')
+            lines += ["# HELP stockagent_llm_ttft_seconds 最近一次大模型首字延迟（秒）",
+                      "# TYPE stockagent_llm_ttft_seconds gauge",
+                      f"stockagent_llm_ttft_seconds {self.llm.get('ttft', 0):.6f}",
+                      "# HELP stockagent_llm_tokens_per_second 最近一次大模型生成速度",
+                      "# TYPE stockagent_llm_tokens_per_second gauge",
+                      f"stockagent_llm_tokens_per_second {self.llm.get('tokens_per_second', 0):.3f}"]
+        return "\n".join(lines) + "\n"
+
+
+default_registry = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, registry=None, host="127.0.0.1"):
+    """在后台线程提供 http://host:port/metrics，返回 server"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry or default_registry
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+趋势指标 - 滚动 20 / 60 / 250 日高低点、均线、ATR 与突破信号（利弗莫尔趋势面板与研报共用）
+
+两种算法，结果一致：
+- trend_frame：整段日线一次性计算，滚动最值用分块前缀 / 后缀最值（van Herk / Gil-Werman），O(n) 且全部在 numpy 内完成
+- TrendState：单调队列逐根更新，新到一根 K 线只做 O(1) 均摊的工作；TrendTracker 按代码保存状态，新日线到达时只补算新增部分
+"""
+
+import math
+import threading
+from collections import deque
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from records import TrendSignals
+
+# 高低点 / 均线 / 突破的窗口（交易日），与 TrendSignals 的字段一一对应
+TREND_WINDOWS = (20, 60, 250)
+ATR_PERIOD = 14
+# 计算趋势需要的日线区间（自然日）：覆盖 250 个交易日并留出 ATR 的预热
+TREND_LOOKBACK_DAYS = 420
+
+
+# ============================================================================
+# 向量化计算（整段日线）
+# ============================================================================
+
+def _rolling_extreme(values, window, accumulate):
+    """滚动最值（包含当前值，不足 window 个时取已有的全部）；accumulate 为 np.fmax / np.fmin 的 accumulate"""
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n == 0:
+        return values.copy()
+    # 前面补 window - 1 个 NaN，使前几根的窗口自然变短；再补齐到 window 的整数倍后分块
+    blocks = -(-(n + window - 1) // window)
+    padded = np.full(blocks * window, np.nan)
+    padded[window - 1:window - 1 + n] = values
+    padded = padded.reshape(blocks, window)
+    prefix = accumulate(padded, axis=1).ravel()
+    suffix = accumulate(padded[:, ::-1], axis=1)[:, ::-1].ravel()
+    # 窗口 [i, i + window) 横跨至多两块：左块的后缀最值与右块的前缀最值
+    out = np.stack([suffix[:n], prefix[window - 1:window - 1 + n]])
+    return accumulate(out, axis=0)[-1]
+
+
+def rolling_max(values, window):
+    return _rolling_extreme(values, window, np.fmax.accumulate)
+
+
+def rolling_min(values, window):
+    return _rolling_extreme(values, window, np.fmin.accumulate)
+
+
+def rolling_mean(values, window):
+    """滚动均值（不足 window 个时为 NaN）"""
+    values = np.asarray(values, dtype=float)
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        cumsum = np.concatenate([[0.0], np.cumsum(values)])
+        out[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return out
+
+
+def wilder_atr(high, low, close, period=ATR_PERIOD):
+    """平均真实波幅：真实波幅按 Wilder 平滑（首根以 high - low 起算）"""
+    high, low, close = (np.asarray(a, dtype=float) for a in (high, low, close))
+    prev_close = np.concatenate([[np.nan], close[:-1]])
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    return pd.Series(tr).ewm(alpha=1 / period, adjust=False).mean().to_numpy()
+
+
+def _clean_bars(bars):
+    """丢弃没有收盘价的 K 线；缺失的最高 / 最低价用收盘价代替"""
+    bars = bars.dropna(subset=["close"])
+    return bars.assign(high=bars["high"].fillna(bars["close"]), low=bars["low"].fillna(bars["close"]))
+
+
+def trend_frame(bars):
+    """逐根 K 线的趋势指标：high_N / low_N / ma_N / breakout_N（N 见 TREND_WINDOWS）与 atr_14
+
+    breakout_N：收盘价高于此前 N 日最高价为 1，低于此前 N 日最低价为 -1，此前不足 N 根时为 0。
+    """
+    bars = _clean_bars(bars)
+    high, low, close = (bars[col].to_numpy(dtype=float) for col in ("high", "low", "close"))
+    columns = {"date": bars["date"].to_numpy(), "close": close}
+    enough = np.arange(len(close)) >= np.array(TREND_WINDOWS)[:, None]
+    for w, full in zip(TREND_WINDOWS, enough):
+        columns[f"high_{w}"] = rolling_max(high, w)
+        columns[f"low_{w}"] = rolling_min(low, w)
+        columns[f"ma_{w}"] = rolling_mean(close, w)
+        prev_high = np.concatenate([[np.nan], columns[f"high_{w}"][:-1]])
+        prev_low = np.concatenate([[np.nan], columns[f"low_{w}"][:-1]])
+        columns[f"breakout_{w}"] = np.where(full & (close > prev_high), 1, np.where(full & (close < prev_low), -1, 0))
+    atr = wilder_atr(high, low, close)
+    atr[:ATR_PERIOD - 1] = np.nan
+    columns[f"atr_{ATR_PERIOD}"] = atr
+    return pd.DataFrame(columns)
+
+
+def latest_signals(bars):
+    """整段日线计算后取最后一根的趋势信号；没有日线时返回空信号"""
+    frame = trend_frame(bars)
+    if frame.empty:
+        return TrendSignals()
+    row = frame.iloc[-1]
+    values = {name: row[name] for name in frame.columns}
+    values = {k: (None if isinstance(v, float) and math.isnan(v) else v) for k, v in values.items()}
+    return TrendSignals(
+        date=pd.Timestamp(values.pop("date")),
+        bars=len(frame),
+        **{k: int(v) if k.startswith("breakout_") else (None if v is None else float(v)) for k, v in values.items()},
+    )
+
+
+# ============================================================================
+# 增量计算（逐根更新）
+# ============================================================================
+
+def _push(window_deque, index, value, window, better):
+    """单调队列：队首为窗口内最值；better(a, b) 为 True 表示 a 不劣于 b，b 可以出队"""
+    if not math.isnan(value):
+        while window_deque and better(value, window_deque[-1][1]):
+            window_deque.pop()
+        window_deque.append((index, value))
+    while window_deque and window_deque[0][0] <= index - window:
+        window_deque.popleft()
+
+
+def _ge(a, b):
+    return a >= b
+
+
+def _le(a, b):
+    return a <= b
+
+
+class TrendState:
+    """一只股票的增量趋势状态：每个窗口一对单调队列（最高 / 最低价）、均线的滚动和与 ATR"""
+
+    __slots__ = ("count", "last_date", "last_close", "atr", "breakouts", "_highs", "_lows", "_closes", "_sums")
+
+    def __init__(self):
+        self.count = 0
+        self.last_date = None
+        self.last_close = None
+        self.atr = None
+        self.breakouts = dict.fromkeys(TREND_WINDOWS, 0)
+        self._highs = {w: deque() for w in TREND_WINDOWS}
+        self._lows = {w: deque() for w in TREND_WINDOWS}
+        self._closes = deque(maxlen=max(TREND_WINDOWS))
+        self._sums = dict.fromkeys(TREND_WINDOWS, 0.0)
+
+    def update(self, day, high, low, close):
+        """追加一根 K 线（日期须晚于已有的 K 线）；没有收盘价的 K 线被忽略"""
+        if close is None or math.isnan(close):
+            return
+        high = close if high is None or math.isnan(high) else high
+        low = close if low is None or math.isnan(low) else low
+        index = self.count
+
+        # 突破：与加入本根之前的 N 日最值比较
+        for w in TREND_WINDOWS:
+            highs, lows = self._highs[w], self._lows[w]
+            if index >= w and highs and close > highs[0][1]:
+                self.breakouts[w] = 1
+            elif index >= w and lows and close < lows[0][1]:
+                self.breakouts[w] = -1
+            else:
+                self.breakouts[w] = 0
+            _push(highs, index, high, w, _ge)
+            _push(lows, index, low, w, _le)
+            self._sums[w] += close
+            if len(self._closes) >= w:
+                self._sums[w] -= self._closes[-w]
+
+        tr = high - low
+        if self.last_close is not None:
+            tr = max(tr, abs(high - self.last_close), abs(low - self.last_close))
+        self.atr = tr if self.atr is None else self.atr + (tr - self.atr) / ATR_PERIOD
+
+        self._closes.append(close)
+        self.count += 1
+        self.last_date = day
+        self.last_close = close
+
+    def extend(self, bars):
+        """按顺序追加一段规范化日线（date / high / low / close 列）"""
+        self.extend_arrays(bars["date"].to_numpy(dtype="datetime64[ns]"),
+                           *(bars[col].to_numpy(dtype=float) for col in ("high", "low", "close")))
+
+    def extend_arrays(self, dates, highs, lows, closes):
+        for day, high, low, close in zip(dates, highs.tolist(), lows.tolist(), closes.tolist()):
+            self.update(day, high, low, close)
+
+    def copy(self):
+        other = TrendState.__new__(TrendState)
+        other.count, other.last_date, other.last_close, other.atr = self.count, self.last_date, self.last_close, self.atr
+        other.breakouts = dict(self.breakouts)
+        other._highs = {w: deque(q) for w, q in self._highs.items()}
+        other._lows = {w: deque(q) for w, q in self._lows.items()}
+        other._closes = deque(self._closes, maxlen=self._closes.maxlen)
+        other._sums = dict(self._sums)
+        return other
+
+    def signals(self):
+        """当前状态对应的趋势信号"""
+        if self.count == 0:
+            return TrendSignals()
+        values = {}
+        for w in TREND_WINDOWS:
+            values[f"high_{w}"] = self._highs[w][0][1] if self._highs[w] else None
+            values[f"low_{w}"] = self._lows[w][0][1] if self._lows[w] else None
+            values[f"ma_{w}"] = self._sums[w] / w if self.count >= w else None
+            values[f"breakout_{w}"] = self.breakouts[w]
+        values[f"atr_{ATR_PERIOD}"] = self.atr if self.count >= ATR_PERIOD else None
+        return TrendSignals(date=pd.Timestamp(self.last_date), close=self.last_close, bars=self.count, **values)
+
+
+class TrendTracker:
+    """按代码保存已收盘日线的趋势状态（线程安全）
+
+    每次传入该股票的日线：只补算上次之后的新 K 线；当天尚未收盘的 K 线在状态副本上计算，不写回。
+    日线与已有状态衔接不上（区间有缺口、状态最后一根 K 线的收盘价对不上）时整段重算。
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+        # 统计：整段重算次数、增量追加的 K 线数
+        self.rebuilds = 0
+        self.appended_bars = 0
+
+    def update(self, code, bars, today=None):
+        """传入规范化日线（date 升序），返回最新一根 K 线的趋势信号"""
+        # 只在 numpy 数组上定位，避免每次调用都做 DataFrame 过滤
+        dates = bars["date"].to_numpy(dtype="datetime64[ns]")
+        highs, lows, closes = (bars[col].to_numpy(dtype=float) for col in ("high", "low", "close"))
+        settled_end = int(np.searchsorted(dates, np.datetime64(pd.Timestamp(today or date.today()), "ns")))
+
+        with self._lock:
+            state = self._states.get(code)
+            start = self._resume_at(state, dates, closes, settled_end)
+            if start is None:
+                state, start = TrendState(), 0
+                self.rebuilds += 1
+            else:
+                self.appended_bars += settled_end - start
+            state.extend_arrays(dates[start:settled_end], highs[start:settled_end],
+                                lows[start:settled_end], closes[start:settled_end])
+            self._states[code] = state
+            if settled_end == len(dates):
+                return state.signals()
+            state = state.copy()
+        state.extend_arrays(dates[settled_end:], highs[settled_end:], lows[settled_end:], closes[settled_end:])
+        return state.signals()
+
+    @staticmethod
+    def _resume_at(state, dates, closes, settled_end):
+        """日线包含状态的最后一根 K 线且收盘价一致时，返回之后第一根的位置；否则返回 None（需要整段重算）"""
+        if state is None or state.last_date is None:
+            return None
+        pos = int(np.searchsorted(dates[:settled_end], np.datetime64(state.last_date, "ns")))
+        if pos >= settled_end or dates[pos] != np.datetime64(state.last_date, "ns"):
+            return None
+        if abs(closes[pos] - state.last_close) > 1e-9:
+            return None
+        return pos + 1
+
+    def forget(self, code):
+        with self._lock:
+            self._states.pop(code, None)
+
+    def stats(self):
+        with self._lock:
+            return {"codes": len(self._states), "rebuilds": self.rebuilds, "appended_bars": self.appended_bars}
+
+
+_default_tracker = None
+_default_tracker_lock = threading.Lock()
+
+
+def get_trend_tracker():
+    """进程内共享的趋势状态"""
+    global _default_tracker
+    with _default_tracker_lock:
+        if _default_tracker is None:
+            _default_tracker = TrendTracker()
+        return _default_tracker
@@ -0,0 +1,487 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+估值模型 - 单只股票的标量版本与全市场列式（向量化）版本，共用同一套阈值；
+模型在注册表中声明所需输入，单股分析、批量分析、全市场筛选与提示词都按注册表使用全部模型
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from numeric import parse_number, parse_numbers
+from records import (
+    PEValuation, PBValuation, ROEValuation, PEGValuation, DividendPercentile,
+)
+from schema import resolve_columns
+
+# ============================================================================
+# 估值阈值（标量与向量化版本共用）
+# ============================================================================
+
+# A股市场PE阈值：参考历史数据和价值投资理念
+# 低估：<15（格雷厄姆标准）
+# 合理：15-25（巴菲特可接受范围）
+# 偏高：25-35（成长股可接受）
+# 高估：>35（需要高成长支撑）
+PE_THRESHOLDS = [15, 25, 35]
+PE_MARKET_AVG = 25  # A股市场平均PE约25
+
+# PEG判断标准：<1优秀，1-1.5合理，1.5-2偏高，>2高估
+PEG_THRESHOLDS = [1, 1.5, 2]
+PEG_DEFAULT_GROWTH = 10  # 没有增长率数据时默认10%
+
+ASSESSMENT_LABELS = ["低估", "合理", "偏高", "高估"]
+
+PB_THRESHOLDS = [0.8, 1.2, 2]
+PB_LABELS = ["极低", "低", "中", "高"]
+
+
+def _assess(value, thresholds, labels=ASSESSMENT_LABELS):
+    """按阈值分档：value < thresholds[i] 时返回 labels[i]，都不满足时返回最后一档"""
+    for threshold, label in zip(thresholds, labels):
+        if value < threshold:
+            return label
+    return labels[-1]
+
+
+def _assess_array(values, thresholds, labels=ASSESSMENT_LABELS):
+    """_assess 的向量化版本，缺失值返回 None"""
+    values = np.asarray(values, dtype=float)
+    # side="right" 与标量版本的严格小于保持一致（15 属于“合理”）
+    codes = np.searchsorted(np.asarray(thresholds, dtype=float), values, side="right")
+    result = np.asarray(labels, dtype=object)[np.minimum(codes, len(labels) - 1)]
+    result[np.isnan(values)] = None
+    return result
+
+
+# ============================================================================
+# 单只股票估值模型
+# ============================================================================
+
+def estimate_by_pe_model(current_pe, current_price):
+    """PE 倍数估值（调整阈值适配A股市场），没有 PE 时返回 None"""
+    if current_pe is None or pd.isna(current_pe):
+        return None
+    assessment = _assess(current_pe, PE_THRESHOLDS)
+
+    return PEValuation(
+        current_pe=current_pe,
+        assessment=assessment,
+        market_avg=PE_MARKET_AVG,
+        premium=((current_pe - PE_MARKET_AVG) / PE_MARKET_AVG * 100) if current_pe > 0 else 0,
+    )
+
+def estimate_by_pb_model(current_price, book_value_per_share=None):
+    """PB 倍数估值（每股净资产可以是财报中的“元”字符串）"""
+    book_value_per_share = parse_number(book_value_per_share)
+    if book_value_per_share is None or book_value_per_share <= 0 or not current_price:
+        return None
+    return _estimate_by_pb(current_price / book_value_per_share)
+
+def _estimate_by_pb(pb):
+    """已知市净率时的 PB 倍数估值，非正或缺失时返回 None"""
+    if pb is None or not pb > 0:
+        return None
+    return PBValuation(current_pb=pb, assessment=_assess(pb, PB_THRESHOLDS, PB_LABELS))
+
+def estimate_by_roe_model(roe, eps, current_price):
+    """ROE 倍数估值（roe 为百分数，可以是财报中的“15.2%”字符串；eps 为每股收益）"""
+    roe, eps = parse_number(roe), parse_number(eps)
+    # NaN 与非正值同样视为缺失（与 screen_roe 一致）
+    if not all(v is not None and v > 0 for v in (roe, eps, current_price)):
+        return None
+
+    reasonable_pe = 10 + (roe - 8) * 2
+    if reasonable_pe <= 0:
+        return None
+    reasonable_price = eps * reasonable_pe
+    premium = (current_price - reasonable_price) / reasonable_price * 100
+
+    return ROEValuation(
+        roe=roe,
+        reasonable_pe=reasonable_pe,
+        reasonable_price=reasonable_price,
+        discount_or_premium=premium,
+    )
+
+
+def estimate_by_peg_model(current_pe, growth_rate=None, finance_df=None, reported_growth=None):
+    """PEG 估值（优先使用财报中最近一期的净利润增长率：reported_growth，或从 finance_df 提取）"""
+    if current_pe is None or pd.isna(current_pe):
+        return None
+    # 财报增长率（“14.62%” -> 14.62）取绝对值
+    if reported_growth is None and finance_df is not None:
+        reported_growth = latest_finance_values(finance_df, ("net_profit_growth",), annual=False)["net_profit_growth"]
+    calculated_growth = abs(reported_growth) if reported_growth and not pd.isna(reported_growth) else None
+
+    # 使用计算出的增长率，如果没有则使用传入的growth_rate，都没有则默认10%
+    final_growth = calculated_growth if calculated_growth and calculated_growth > 0 else (growth_rate if growth_rate else PEG_DEFAULT_GROWTH)
+
+    if current_pe <= 0 or final_growth <= 0:
+        return None
+
+    peg = current_pe / final_growth
+
+    return PEGValuation(
+        peg=peg,
+        growth_rate=final_growth,
+        growth_source="财报数据" if calculated_growth else "预估值",
+        assessment=_assess(peg, PEG_THRESHOLDS),
+    )
+
+
+def latest_finance_values(finance_df, fields=("roe", "eps", "bvps"), annual=True):
+    """财报（按报告期倒序）最近一期的指标数值 {字段: float 或 None}
+
+    annual=True 时优先取最近一份年报（报告期为年份或 12-31），避免把季报的累计 ROE / EPS 当成全年。
+    """
+    values = dict.fromkeys(fields)
+    if finance_df is None or finance_df.empty:
+        return values
+    columns = resolve_columns("financial_abstract", finance_df.columns)
+    row = 0
+    if annual and "report_date" in columns:
+        # 只有几十行，逐个判断比整列字符串运算快
+        for i, date in enumerate(finance_df[columns["report_date"]].tolist()):
+            date = str(date).strip()
+            if (len(date) == 4 and date.isdigit()) or date.endswith(("12-31", "1231")):
+                row = i
+                break
+    for f in fields:
+        if f in columns:
+            values[f] = parse_number(finance_df[columns[f]].iat[row])
+    return values
+
+
+# ============================================================================
+# 股息率模型
+# ============================================================================
+
+def calculate_dividend_yield(dividend_per_share, current_price):
+    """计算股息率（年度分红 / 现价）"""
+    # 类型检查和转换
+    if dividend_per_share is None or current_price is None:
+        return None
+    
+    try:
+        div_value = float(dividend_per_share)
+        price_value = float(current_price)
+        
+        if price_value > 0:
+            return (div_value / price_value) * 100
+    except (ValueError, TypeError):
+        pass
+    
+    return None
+
+
+YIELD_TTM_DAYS = 365  # 股息率按除权日前 12 个月的累计派息计算
+
+
+def historical_dividend_yields(events, bars):
+    """按除权日把派息与收盘价做 as-of 对齐，计算每个除权日的历史股息率
+
+    events: [code, ex_date, dividend]，bars: [code, date, close]，可同时包含多只股票。
+    每个除权日取当日（非交易日取之前最近一个交易日）的收盘价，派息取该日之前 12 个月的累计值，
+    返回 [code, ex_date, dividend, ttm_dividend, close, yield]，按 (code, ex_date) 升序；没有收盘价的除权日被丢弃。
+    """
+    events = events.dropna(subset=["ex_date", "dividend"]).sort_values(["ex_date", "code"], kind="mergesort")
+    bars = bars[["code", "date", "close"]].dropna().sort_values("date", kind="mergesort")
+    if events.empty or bars.empty:
+        return pd.DataFrame(columns=["code", "ex_date", "dividend", "ttm_dividend", "close", "yield"])
+
+    # 近 12 个月累计派息 = 截至本次的累计和 - 截至窗口起点的累计和（第二次 as-of 对齐）
+    events = events.assign(cum_dividend=events.groupby("code")["dividend"].cumsum())
+    window = events.assign(window_start=events["ex_date"] - pd.Timedelta(days=YIELD_TTM_DAYS))
+    window = pd.merge_asof(
+        window, events[["code", "ex_date", "cum_dividend"]].rename(columns={"ex_date": "window_start", "cum_dividend": "cum_before"}),
+        on="window_start", by="code", direction="backward",
+    )
+    events = events.assign(ttm_dividend=window["cum_dividend"].to_numpy() - window["cum_before"].fillna(0).to_numpy())
+
+    joined = pd.merge_asof(events, bars.rename(columns={"date": "ex_date"}), on="ex_date", by="code", direction="backward")
+    joined = joined[joined["close"] > 0]
+    joined = joined.assign(**{"yield": joined["ttm_dividend"] / joined["close"] * 100})
+    return (joined[["code", "ex_date", "dividend", "ttm_dividend", "close", "yield"]]
+            .sort_values(["code", "ex_date"], kind="mergesort").reset_index(drop=True))
+
+
+def analyze_dividend_percentile(yield_history, current_yield):
+    """当前股息率在历史股息率序列中的分位（历史上不高于当前值的比例）"""
+    if yield_history is None or len(yield_history) < 3 or current_yield is None:
+        return None
+
+    yields = np.sort(np.asarray(yield_history, dtype=float))
+    return DividendPercentile(
+        current_yield=float(current_yield),
+        percentile=float(np.searchsorted(yields, current_yield, side="right") / len(yields) * 100),
+        samples=len(yields),
+        mean_yield=float(np.mean(yields)),
+        median_yield=float(np.median(yields)),
+        q25_yield=float(np.percentile(yields, 25)),
+        q75_yield=float(np.percentile(yields, 75)),
+        max_yield=float(yields[-1]),
+        min_yield=float(yields[0]),
+    )
+
+
+def rank_dividend_yields(histories, prices, min_samples=3):
+    """自选股股息率分位排名：histories 为 YieldHistory 列表，prices 为按代码索引的现价
+
+    一次性展开所有股票的历史序列，向量化比较后按代码汇总；历史样本不足 min_samples 的股票不参与排名。
+    返回以代码为索引的 [current_yield, percentile, samples, median_yield]，按分位从高到低排列。
+    """
+    histories = [h for h in histories if len(h.yields) >= min_samples and h.ttm_dividend]
+    if not histories:
+        return pd.DataFrame(columns=["current_yield", "percentile", "samples", "median_yield"])
+
+    codes = np.array([h.code for h in histories], dtype=object)
+    ttm = np.array([h.ttm_dividend for h in histories], dtype=float)
+    price = pd.Series(prices).reindex(codes).to_numpy(dtype=float)
+    current = np.where(price > 0, ttm / price * 100, np.nan)
+
+    counts = np.array([len(h.yields) for h in histories])
+    owner = np.repeat(np.arange(len(histories)), counts)
+    values = np.concatenate([np.asarray(h.yields, dtype=float) for h in histories])
+    below = np.bincount(owner, weights=values <= current[owner], minlength=len(histories))
+
+    result = pd.DataFrame({
+        "current_yield": current,
+        "percentile": below / counts * 100,
+        "samples": counts,
+        "median_yield": pd.Series(values).groupby(owner).median().to_numpy(),
+    }, index=codes)
+    return result.dropna(subset=["current_yield"]).sort_values("percentile", ascending=False)
+
+
+# ============================================================================
+# 全市场向量化估值（列式版本，一次处理整张行情快照）
+# ============================================================================
+
+def _as_float_series(values, index):
+    """把标量 / 数组 / Series 统一成与 index 对齐的 float Series（“15.2%”、“3.5亿”等字符串按 numeric 换算）"""
+    if values is None:
+        return pd.Series(np.nan, index=index, dtype=float)
+    if isinstance(values, pd.Series):
+        return pd.Series(parse_numbers(values), index=values.index).reindex(index).astype(float)
+    return pd.Series(values, index=index, dtype=float)
+
+
+def screen_pe(pe):
+    """向量化 PE 倍数法：返回 pe / pe_assessment / pe_premium 三列"""
+    pe = _as_float_series(pe, getattr(pe, "index", None))
+    premium = np.where(pe > 0, (pe - PE_MARKET_AVG) / PE_MARKET_AVG * 100, 0.0)
+    return pd.DataFrame({
+        "pe": pe,
+        "pe_assessment": _assess_array(pe, PE_THRESHOLDS),
+        "pe_premium": np.where(pe.isna(), np.nan, premium),
+    }, index=pe.index)
+
+
+def screen_peg(pe, growth_rate=None):
+    """向量化 PEG 模型：growth_rate 缺失或非正时使用默认增长率，规则与 estimate_by_peg_model 一致"""
+    pe = _as_float_series(pe, getattr(pe, "index", None))
+    growth = _as_float_series(growth_rate, pe.index).abs()
+    from_report = growth > 0
+    final_growth = growth.where(from_report, PEG_DEFAULT_GROWTH)
+
+    peg = (pe / final_growth).where(pe > 0)
+    return pd.DataFrame({
+        "peg": peg,
+        "growth_rate": final_growth,
+        "growth_source": np.where(from_report, "财报数据", "预估值"),
+        "peg_assessment": _assess_array(peg, PEG_THRESHOLDS),
+    }, index=pe.index)
+
+
+def screen_pb(pb):
+    """向量化 PB 倍数法（直接使用快照中的市净率，非正值视为缺失）"""
+    pb = _as_float_series(pb, getattr(pb, "index", None))
+    pb = pb.where(pb > 0)
+    return pd.DataFrame({
+        "pb": pb,
+        "pb_assessment": _assess_array(pb, PB_THRESHOLDS, PB_LABELS),
+    }, index=pb.index)
+
+
+def screen_roe(roe, eps, price):
+    """向量化 ROE 倍数法，规则与 estimate_by_roe_model 一致：roe / eps 缺失或非正、合理PE非正时结果为空"""
+    roe = _as_float_series(roe, getattr(roe, "index", None))
+    eps = _as_float_series(eps, roe.index)
+    price = _as_float_series(price, roe.index)
+
+    reasonable_pe = 10 + (roe - 8) * 2
+    valid = (roe > 0) & (eps > 0) & (reasonable_pe > 0) & (price > 0)
+    reasonable_pe = reasonable_pe.where(valid)
+    reasonable_price = eps * reasonable_pe
+    premium = (price - reasonable_price) / reasonable_price * 100
+    return pd.DataFrame({
+        "roe": roe,
+        "reasonable_pe": reasonable_pe,
+        "reasonable_price": reasonable_price,
+        "discount_or_premium": premium,
+    }, index=roe.index)
+
+
+def screen_market(stock_df, growth_rate=None, roe=None, eps=None):
+    """对整张行情快照做一次列式估值，返回以代码为索引的评估表
+
+    growth_rate / roe / eps 为可选的按代码索引的 Series（例如来自财报），缺失时对应模型按默认规则处理或跳过。
+    结果可直接用 DataFrame.query 筛选，例如：
+        screen_market(df).query("pe_assessment == '低估' and peg < 1")
+    """
+    df = stock_df.set_index(stock_df["代码"].astype(str), drop=False).rename_axis(None)
+    price = pd.to_numeric(df["最新价"], errors="coerce")
+
+    inputs = pd.DataFrame({
+        "price": price,
+        "pe": pd.to_numeric(df["市盈率-动态"], errors="coerce"),
+        "net_profit_growth": _as_float_series(growth_rate, df.index),
+    }, index=df.index)
+    if "市净率" in df.columns:
+        inputs["pb"] = df["市净率"]
+    if roe is not None and eps is not None:
+        inputs["roe"], inputs["eps"] = roe.reindex(df.index), eps.reindex(df.index)
+    return pd.concat([pd.DataFrame({"code": df["代码"], "name": df["名称"], "price": price}), screen_models(inputs)], axis=1)
+
+
+# ============================================================================
+# 估值模型注册表
+# ============================================================================
+
+# 估值输入 -> 说明（单股由 resolve_valuation_inputs 一次解析，全市场筛选为同名的列）
+VALUATION_INPUTS = {
+    "price": "现价",
+    "pe": "市盈率（动态）",
+    "pb": "市净率（单股为现价 / 每股净资产）",
+    "net_profit_growth": "最近一期净利润增长率（%）",
+    "roe": "最近一份年报的净资产收益率（%）",
+    "eps": "最近一份年报的基本每股收益",
+    "bvps": "最近一份年报的每股净资产",
+}
+
+
+@dataclass(frozen=True, slots=True)
+class ValuationModel:
+    """一个估值模型：estimate 按 inputs 的顺序接收标量，返回估值记录或 None；
+    screen 按同样顺序接收与代码对齐的 Series，返回以代码为索引的结果列"""
+
+    name: str                          # 与估值记录的 model 一致
+    inputs: tuple
+    estimate: Callable
+    screen: Optional[Callable] = None
+    columns: tuple = ()                # 批量汇总表的列：((列名, 记录属性), ...)
+    standard: Optional[str] = None     # 提示词中的估值标准说明
+    assessment: Optional[str] = None   # screen 结果中的分档列（回测按它分组）
+    labels: tuple = tuple(ASSESSMENT_LABELS)  # 分档从低到高
+
+
+VALUATION_MODELS = {}
+
+
+def register_model(model):
+    """注册估值模型（同名覆盖），按注册顺序参与估值；新增模型（如 DCF、股利贴现）无需改动页面与命令行"""
+    unknown = set(model.inputs) - set(VALUATION_INPUTS)
+    if unknown:
+        raise ValueError(f"未知的估值输入：{'、'.join(sorted(unknown))}")
+    VALUATION_MODELS[model.name] = model
+    return model
+
+
+def _selected(models):
+    return list(VALUATION_MODELS.values()) if models is None else [VALUATION_MODELS[name] for name in models]
+
+
+def resolve_valuation_inputs(pe, price, finance_df=None):
+    """单只股票的估值输入（全部模型共用，只解析一次）：PE、现价、最近一份年报的 ROE / 每股收益 / 每股净资产、
+    最近一期的净利润增长率，以及由现价与每股净资产算出的市净率；缺失为 None"""
+    inputs = {"pe": parse_number(pe), "price": parse_number(price)}
+    inputs.update(latest_finance_values(finance_df, ("roe", "eps", "bvps")))
+    inputs.update(latest_finance_values(finance_df, ("net_profit_growth",), annual=False))
+    bvps = inputs["bvps"]
+    inputs["pb"] = inputs["price"] / bvps if inputs["price"] and bvps and bvps > 0 else None
+    return inputs
+
+
+def evaluate_models(inputs, models=None, timings=None):
+    """一趟算完注册表中的全部（或 models 指定名称的）模型，返回估值记录列表（按注册顺序，无结果为 None）
+
+    timings 为 dict 时写入 {模型名: 耗时秒}。
+    """
+    records = []
+    for model in _selected(models):
+        start = time.perf_counter()
+        records.append(model.estimate(*(inputs.get(name) for name in model.inputs)))
+        if timings is not None:
+            timings[model.name] = time.perf_counter() - start
+    return records
+
+
+def screen_models(inputs, models=None, timings=None):
+    """整批向量化估值：inputs 为以代码为索引、列名为估值输入的 DataFrame，缺少输入列的模型跳过
+
+    返回各模型结果列横向拼接的 DataFrame；timings 为 dict 时写入 {模型名: 耗时秒}。
+    """
+    parts = []
+    for model in _selected(models):
+        if model.screen is None or not set(model.inputs) <= set(inputs.columns):
+            continue
+        start = time.perf_counter()
+        parts.append(model.screen(*(inputs[name] for name in model.inputs)))
+        if timings is not None:
+            timings[model.name] = time.perf_counter() - start
+    return pd.concat(parts, axis=1) if parts else pd.DataFrame(index=inputs.index)
+
+
+def valuation_columns(records):
+    """估值记录（evaluate_models 的结果）-> 批量汇总表的列 {列名: 值}"""
+    row = {}
+    for model, record in zip(VALUATION_MODELS.values(), records):
+        for column, attr in model.columns:
+            row[column] = getattr(record, attr) if record else None
+    return row
+
+
+def valuation_standards():
+    """提示词中的估值标准说明（按注册顺序）"""
+    return [model.standard for model in VALUATION_MODELS.values() if model.standard]
+
+
+register_model(ValuationModel(
+    name=PEValuation.model,
+    inputs=("pe", "price"),
+    estimate=estimate_by_pe_model,
+    screen=lambda pe, price: screen_pe(pe),
+    columns=(("PE估值", "assessment"),),
+    assessment="pe_assessment",
+    standard="- PE估值: A股市场调整后标准 (低估<15 | 合理15-25 | 偏高25-35 | 高估>35)",
+))
+register_model(ValuationModel(
+    name=PEGValuation.model,
+    inputs=("pe", "net_profit_growth"),
+    estimate=lambda pe, growth: estimate_by_peg_model(pe, reported_growth=growth),
+    screen=screen_peg,
+    columns=(("PEG", "peg"), ("PEG估值", "assessment")),
+    assessment="peg_assessment",
+    standard="- PEG估值: 基于真实财报增长率或预估值 (低估<1 | 合理1-1.5 | 偏高1.5-2 | 高估>2)",
+))
+register_model(ValuationModel(
+    name=ROEValuation.model,
+    inputs=("roe", "eps", "price"),
+    estimate=estimate_by_roe_model,
+    screen=screen_roe,
+    columns=(("ROE合理价", "reasonable_price"), ("ROE溢价%", "discount_or_premium")),
+))
+register_model(ValuationModel(
+    name=PBValuation.model,
+    inputs=("pb",),
+    estimate=_estimate_by_pb,
+    screen=screen_pb,
+    columns=(("PB估值", "assessment"),),
+    assessment="pb_assessment",
+    labels=tuple(PB_LABELS),
+))
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+缓存预热 - 按自选股列表定时（默认工作日收盘后）抓取行情快照、日线、分红与财报并落盘，
+新进程启动后直接使用落盘数据，不必等第一位用户付出全部上游延迟
+
+一轮预热的请求在 WARM_SPREAD 秒内均匀摊开，且与批量分析共用按主机限速。
+只有启动了定时预热的进程才放宽落盘数据的有效期：预热覆盖的股票用 WARM_MAX_AGE，其余仍用 FETCH_MAX_AGE。
+
+用法：python run.py warm [--once] [--status] [--watchlist watchlist.txt]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from batch_analysis import DATA_SOURCES, default_limiter, parse_code_list, read_codes_from_csv
+from config import CACHE_DIR, REPLAY_DIR, REPLAY_LATENCY, WATCHLIST_PATH, WARM_TIMES, WARM_SPREAD, WARM_MAX_AGE
+from fetchers import (
+    fetch_dividend_data, fetch_financial_abstract, fetch_trend_signals, fetch_yield_history, set_warm_codes,
+)
+from fundamentals import get_fundamentals
+from price_store import get_price_store
+from resilience import get_upstream, refreshing
+from snapshot_store import format_age
+
+# 预热项 -> (所在主机, 说明)；日线一项同时补齐趋势与历史股息率需要的区间
+WARM_ITEMS = {
+    "dividend": (DATA_SOURCES["dividend"][0], "分红"),
+    "finance": (DATA_SOURCES["finance"][0], "财报"),
+    "bars": (DATA_SOURCES["price_range"][0], "日线"),
+}
+
+
+def load_watchlist(path=WATCHLIST_PATH):
+    """读取自选股列表：.csv 读取“代码”列，其余按逗号 / 空格 / 换行分隔（# 开头为注释）；文件不存在时返回空列表"""
+    if not path or not os.path.exists(path):
+        return []
+    if path.lower().endswith(".csv"):
+        return read_codes_from_csv(path)
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.split("#", 1)[0] for line in f]
+    return parse_code_list("\n".join(lines))
+
+
+def parse_warm_times(text):
+    """“15:45,20:00” -> [time(15, 45), time(20, 0)]（升序）"""
+    return sorted(datetime.strptime(t.strip(), "%H:%M").time() for t in (text or "").split(",") if t.strip())
+
+
+def scheduled_slots(now, times, forward=True):
+    """工作日的预热时间点：forward=True 返回 now 之后的第一个，否则返回 now 之前（含）的最近一个"""
+    day = now.date()
+    step = timedelta(days=1 if forward else -1)
+    for _ in range(8):
+        if day.weekday() < 5:
+            candidates = [datetime.combine(day, t) for t in times]
+            candidates = [c for c in candidates if (c > now if forward else c <= now)]
+            if candidates:
+                return candidates[0] if forward else candidates[-1]
+        day += step
+    return None
+
+
+class CacheWarmer:
+    """自选股缓存预热：run_once() 跑一轮，start() 在后台按 WARM_TIMES 定时运行
+
+    结果都落在各自的存储里（日线 -> PriceStore，分红 / 财报 -> resilience.LastGoodStore，
+    行情快照 -> SnapshotStore），本类只额外记录每轮的执行情况（warm_state.json）。
+    """
+
+    def __init__(self, engine=None, watchlist_path=WATCHLIST_PATH, times=WARM_TIMES, spread=WARM_SPREAD,
+                 max_age=WARM_MAX_AGE, limiter=None, state_path=None):
+        self._engine = engine
+        self.watchlist_path = watchlist_path
+        self.times = parse_warm_times(times)
+        self.spread = spread
+        self.max_age = max_age
+        self.limiter = limiter or default_limiter
+        self.state_path = state_path or os.path.join(CACHE_DIR, "warm_state.json")
+        self.last_run = self._load_state()
+        self.running = False
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from engine import get_engine
+            self._engine = get_engine()
+        return self._engine
+
+    # ------------------------------------------------------------------
+    # 预热
+    # ------------------------------------------------------------------
+
+    def watchlist(self):
+        """自选股代码（名称 / 拼音按行情快照解析，未匹配的输入被忽略）"""
+        codes = []
+        for query in load_watchlist(self.watchlist_path):
+            if query.isdigit() and len(query) == 6:
+                codes.append(query)
+                continue
+            hit = self.engine.symbol_index().resolve(query)
+            if hit:
+                codes.append(hit["code"])
+        return list(dict.fromkeys(codes))
+
+    def run_once(self, codes=None, spread=None):
+        """预热一轮：先刷新行情快照，再逐只抓取分红 / 财报 / 日线；返回本轮记录"""
+        with self._lock:
+            if self.running:
+                return None
+            self.running = True
+        try:
+            return self._run(codes, self.spread if spread is None else spread)
+        finally:
+            self.running = False
+
+    def _run(self, codes, spread):
+        started_at = time.time()
+        errors = {}
+        try:
+            self.engine.snapshot_store.refresh()
+        except Exception as e:
+            errors["snapshot"] = str(e)
+        codes = self.watchlist() if codes is None else list(codes)
+
+        tasks = [(code, item) for code in codes for item in WARM_ITEMS]
+        # 请求在 spread 秒内均匀摊开；按主机限速仍然生效
+        interval = spread / len(tasks) if tasks else 0.0
+        dividends = {}
+        # 本轮各股票成功完成的预热项；中途停止时没轮到的股票不算覆盖
+        done = {code: set() for code in codes}
+        for i, (code, item) in enumerate(tasks):
+            if self._stop_event.wait(max(0.0, started_at + i * interval - time.time())):
+                break
+            self.limiter.acquire(WARM_ITEMS[item][0])
+            try:
+                with refreshing():
+                    if item == "dividend":
+                        dividends[code] = fetch_dividend_data(code)
+                    elif item == "finance":
+                        fetch_financial_abstract(code)
+                    else:
+                        # 日线只补抓缺失区间：趋势需要近 TREND_LOOKBACK_DAYS 天，历史股息率需要覆盖全部除权日
+                        fetch_trend_signals(code)
+                        fetch_yield_history(code, dividends.get(code))
+            except Exception as e:
+                errors[f"{code}/{item}"] = str(e)
+            else:
+                done[code].add(item)
+        # 财报在后台入库，本轮结束前等它写完（--once 的进程随后就退出）
+        get_fundamentals().flush()
+
+        # 只有各项都抓取成功的股票才放宽落盘数据的有效期
+        covered = [code for code in codes if len(done[code]) == len(WARM_ITEMS)]
+        record = {
+            "started_at": started_at,
+            "finished_at": time.time(),
+            "codes": len(codes),
+            "covered": covered,
+            "tasks": len(tasks),
+            "failed": len(errors),
+            "errors": errors,
+        }
+        self.last_run = record
+        self._save_state(record)
+        if self._thread is not None:
+            set_warm_codes(covered, self.max_age)
+        return record
+
+    # ------------------------------------------------------------------
+    # 定时运行
+    # ------------------------------------------------------------------
+
+    def next_run(self, now=None):
+        return scheduled_slots(now or datetime.now(), self.times) if self.times else None
+
+    def is_due(self, now=None):
+        """上一个预热时间点之后还没有跑过（新进程启动时据此补跑一轮）"""
+        now = now or datetime.now()
+        previous = scheduled_slots(now, self.times, forward=False) if self.times else None
+        if self.last_run is None:
+            return True
+        return previous is not None and self.last_run["started_at"] < previous.timestamp()
+
+    def start(self):
+        """启动后台定时预热（重复调用无副作用）；错过了最近一次预热时立即补跑
+
+        启动后预热覆盖的股票读取落盘的分红 / 财报时放宽到 max_age（见 fetchers.set_warm_codes）。
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        # 上一轮（可能是之前的进程）预热过的股票，落盘数据可以直接使用
+        set_warm_codes((self.last_run or {}).get("covered", []), self.max_age)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="cache-warmer")
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            if self.is_due():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    self.last_run = {"started_at": time.time(), "finished_at": time.time(), "codes": 0,
+                                     "tasks": 0, "failed": 1, "errors": {"run": str(e)}}
+            next_run = self.next_run()
+            if next_run is None:
+                return
+            self._stop_event.wait(max(1.0, next_run.timestamp() - time.time()))
+
+    # ------------------------------------------------------------------
+    # 覆盖率与数据年龄
+    # ------------------------------------------------------------------
+
+    def coverage(self, codes=None):
+        """每只股票各项落盘数据的年龄（秒，没有数据为 None），各项都不超过 max_age 时视为已预热"""
+        codes = self.watchlist() if codes is None else list(codes)
+        now = time.time()
+        last_good = get_upstream().last_good
+        price_store = get_price_store()
+        rows = []
+        for code in codes:
+            fetched = {
+                "dividend": last_good.fetched_at("stock_dividend_cninfo", code),
+                "finance": last_good.fetched_at("stock_financial_abstract_ths", code),
+                "bars": price_store.saved_at(code),
+            }
+            ages = {item: None if t is None else now - t for item, t in fetched.items()}
+            rows.append({"code": code, **{f"{item}_age": age for item, age in ages.items()},
+                         "warm": all(age is not None and age <= self.max_age for age in ages.values())})
+        return pd.DataFrame(rows, columns=["code", "dividend_age", "finance_age", "bars_age", "warm"])
+
+    def status(self, codes=None):
+        """预热概况：自选股数、已预热数、覆盖率、最旧数据年龄、行情快照年龄、上一轮 / 下一轮时间"""
+        coverage = self.coverage(codes)
+        ages = coverage[["dividend_age", "finance_age", "bars_age"]].stack().dropna()
+        next_run = self.next_run()
+        return {
+            "watchlist": len(coverage),
+            "warm": int(coverage["warm"].sum()),
+            "coverage": float(coverage["warm"].mean()) if len(coverage) else None,
+            "oldest_age": float(ages.max()) if len(ages) else None,
+            "snapshot_age": self.engine.snapshot_store.age_seconds(),
+            "running": self.running,
+            "last_run": self.last_run,
+            "next_run": next_run.isoformat(timespec="minutes") if next_run else None,
+        }
+
+    # ------------------------------------------------------------------
+    # 读写
+    # ------------------------------------------------------------------
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_state(self, record):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with open(self.state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+
+def format_warm_status(status):
+    """预热概况的一行说明"""
+    if not status["watchlist"]:
+        return "🔥 自选股预热：未配置自选股列表"
+    line = f"🔥 自选股预热：{status['warm']}/{status['watchlist']} 只已预热"
+    if status["oldest_age"] is not None:
+        line += f"，最旧数据 {format_age(status['oldest_age'])}前"
+    if status["running"]:
+        line += "，正在预热"
+    elif status["next_run"]:
+        line += f"，下次 {status['next_run'].replace('T', ' ')}"
+    return line
+
+
+def _format_entry_age(age):
+    return "无" if age is None or pd.isna(age) else f"{format_age(age)}前"
+
+
+_default_warmer = None
+_default_warmer_lock = threading.Lock()
+
+
+def get_warmer():
+    """进程内共享的预热器"""
+    global _default_warmer
+    with _default_warmer_lock:
+        if _default_warmer is None:
+            _default_warmer = CacheWarmer()
+        return _default_warmer
+
+
+# ============================================================================
+# 命令行
+# ============================================================================
+
+def main(argv=None):
+    """命令行入口：python run.py warm [--once] [--status] [--watchlist 文件] [--spread 秒]"""
+    parser = argparse.ArgumentParser(prog="run.py warm", description="自选股缓存预热")
+    parser.add_argument("--watchlist", default=WATCHLIST_PATH, help="自选股列表文件（txt / csv）")
+    parser.add_argument("--once", action="store_true", help="立即预热一轮后退出")
+    parser.add_argument("--status", action="store_true", help="只输出预热覆盖率与各项数据年龄")
+    parser.add_argument("--spread", type=float, default=None, help="一轮请求摊开的秒数（默认 WARM_SPREAD）")
+    args = parser.parse_args(argv)
+
+    if REPLAY_DIR:
+        from replay import ReplaySource, install_replay
+        install_replay(ReplaySource(REPLAY_DIR, latency=REPLAY_LATENCY))
+    warmer = CacheWarmer(watchlist_path=args.watchlist)
+    codes = warmer.watchlist()
+    if not codes:
+        print(f"❌ 自选股列表为空或不存在：{args.watchlist}", file=sys.stderr)
+        return 1
+
+    if not args.status:
+        if args.once:
+            print(f"🔥 预热 {len(codes)} 只股票...")
+            record = warmer.run_once(codes, spread=args.spread)
+            print(f"   用时 {record['finished_at'] - record['started_at']:.1f} 秒，失败 {record['failed']} 项")
+            for key, error in record["errors"].items():
+                print(f"   ⚠️ {key}：{error}")
+        else:
+            if args.spread is not None:
+                warmer.spread = args.spread
+            if warmer.next_run() is None:
+                print("❌ 没有配置预热时间（WARM_TIMES）", file=sys.stderr)
+                return 1
+            warmer.start()
+            print(f"🔥 定时预热已启动（{WARM_TIMES}），下次 {warmer.next_run():%Y-%m-%d %H:%M}（Ctrl+C 退出）")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                warmer.stop()
+                return 0
+
+    print(format_warm_status(warmer.status(codes)))
+    for row in warmer.coverage(codes).to_dict(orient="records"):
+        ages = "，".join(f"{label} {_format_entry_age(row[f'{item}_age'])}" for item, (_, label) in WARM_ITEMS.items())
+        print(f"   {'✅' if row['warm'] else '❄️'} {row['code']}：{ages}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())